@@ -1,3 +1,232 @@
-from django.test import TestCase
+import gzip
+import io
+from unittest.mock import Mock, patch
 
-# Create your tests here.
+from django.test import RequestFactory, SimpleTestCase, override_settings
+from requests import PreparedRequest
+from requests.adapters import HTTPAdapter
+from urllib3 import HTTPResponse
+from urllib3._collections import HTTPHeaderDict
+
+from gateway.proxy import RequestBody, build_response, forward_headers, proxy_request, request_body
+from gateway.resilience import (
+    CLOSED, DEFAULT_BREAKER_SETTINGS, HALF_OPEN, OPEN, CircuitBreaker, HealthChecker
+)
+
+
+class FakeClock:
+    """Управляемое время вместо time.monotonic"""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+    def advance(self, seconds):
+        self.now += seconds
+
+
+class CircuitBreakerTest(SimpleTestCase):
+    """Тесты переходов предохранителя closed → open → half-open → closed"""
+
+    def setUp(self):
+        self.clock = FakeClock()
+        self.breaker = self._breaker()
+
+    def _breaker(self, **config):
+        config = {
+            **DEFAULT_BREAKER_SETTINGS,
+            'WINDOW_SIZE': 4, 'MIN_CALLS': 4, 'ERROR_RATE': 0.5,
+            'SLOW_CALL_SECONDS': 1.0, 'SLOW_RATE': 0.75, 'OPEN_SECONDS': 10, 'HALF_OPEN_CALLS': 1,
+            **config,
+        }
+        return CircuitBreaker('users', config=config, clock=self.clock)
+
+    def _calls(self, *results):
+        for failed, duration in results:
+            self.assertTrue(self.breaker.allow())
+            self.breaker.record(failed, duration)
+
+    def _open(self):
+        self._calls((True, 0.1), (True, 0.1), (False, 0.1), (False, 0.1))
+        self.assertEqual(self.breaker.state, OPEN)
+
+    def test_opens_at_error_rate(self):
+        self._calls((True, 0.1), (False, 0.1), (False, 0.1))
+        self.assertEqual(self.breaker.state, CLOSED)
+        self._calls((True, 0.1))
+        self.assertEqual(self.breaker.state, OPEN)
+        self.assertEqual(self.breaker.snapshot()['opened'], 1)
+
+    def test_below_min_calls_stays_closed(self):
+        self._calls((True, 0.1), (True, 0.1), (True, 0.1))
+        self.assertEqual(self.breaker.state, CLOSED)
+
+    def test_opens_at_slow_rate(self):
+        self._calls((False, 2.0), (False, 2.0), (False, 0.1))
+        self.assertEqual(self.breaker.state, CLOSED)
+        self._calls((False, 1.0))
+        self.assertEqual(self.breaker.state, OPEN)
+
+    def test_rejects_while_open(self):
+        self._open()
+        self.clock.advance(9)
+        self.assertFalse(self.breaker.allow())
+        self.assertFalse(self.breaker.allow())
+        self.assertEqual(self.breaker.snapshot()['rejected'], 2)
+        self.assertEqual(self.breaker.retry_after(), 2)
+
+    def test_successful_trial_closes(self):
+        self._open()
+        self.clock.advance(10)
+        self.assertTrue(self.breaker.allow())
+        self.assertEqual(self.breaker.state, HALF_OPEN)
+        self.breaker.record(False, 0.1)
+        self.assertEqual(self.breaker.state, CLOSED)
+        # Окно очищено: одна ошибка после замыкания не размыкает цепь
+        self._calls((True, 0.1))
+        self.assertEqual(self.breaker.state, CLOSED)
+
+    def test_failed_or_slow_trial_reopens(self):
+        for failed, duration in ((True, 0.1), (False, 5.0)):
+            with self.subTest(failed=failed, duration=duration):
+                self.breaker = self._breaker()
+                self._open()
+                self.clock.advance(10)
+                self.assertTrue(self.breaker.allow())
+                self.breaker.record(failed, duration)
+                self.assertEqual(self.breaker.state, OPEN)
+                self.assertEqual(self.breaker.retry_after(), 11)
+                self.assertFalse(self.breaker.allow())
+
+    def test_half_open_calls_limit(self):
+        self.breaker = self._breaker(HALF_OPEN_CALLS=2)
+        self._open()
+        self.clock.advance(10)
+        self.assertTrue(self.breaker.allow())
+        self.assertTrue(self.breaker.allow())
+        self.assertFalse(self.breaker.allow())
+        self.assertEqual(self.breaker.state, HALF_OPEN)
+        self.breaker.record(False, 0.1)
+        self.assertEqual(self.breaker.state, CLOSED)
+        self.assertTrue(self.breaker.allow())
+
+
+@override_settings(GATEWAY_CIRCUIT_BREAKER={'HEALTH_CACHE_SECONDS': 5, 'HEALTH_TIMEOUT': 1})
+class HealthCheckerTest(SimpleTestCase):
+    """Тесты кэширования health check"""
+
+    def setUp(self):
+        self.clock = FakeClock()
+        self.checker = HealthChecker(clock=self.clock)
+        patcher = patch.object(HealthChecker, '_probe', return_value='healthy')
+        self.probe = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.services = {'users': 'http://users:8000', 'zayavki': 'http://zayavki:8000'}
+
+    def test_result_is_cached(self):
+        self.assertEqual(self.checker.check(self.services), {'users': 'healthy', 'zayavki': 'healthy'})
+        self.assertEqual(self.probe.call_count, 2)
+        self.clock.advance(4.9)
+        self.checker.check(self.services)
+        self.assertEqual(self.probe.call_count, 2)
+
+    def test_cache_expires(self):
+        self.checker.check(self.services)
+        self.clock.advance(5)
+        self.probe.return_value = 'unreachable'
+        self.assertEqual(self.checker.check(self.services)['users'], 'unreachable')
+        self.assertEqual(self.probe.call_count, 4)
+        self.probe.assert_any_call('http://zayavki:8000', 1)
+
+
+def upstream_response(status=200, body=b'', headers=()):
+    """Ответ requests поверх сырого urllib3-ответа, как его собирает HTTPAdapter"""
+    raw = HTTPResponse(
+        body=io.BytesIO(body), headers=HTTPHeaderDict(headers), status=status,
+        reason='OK', preload_content=False, decode_content=False,
+    )
+    prepared = PreparedRequest()
+    prepared.prepare(method='GET', url='http://users:8000/api/v1/')
+    return HTTPAdapter().build_response(prepared, raw)
+
+
+class ProxyTest(SimpleTestCase):
+    """Тесты передачи заголовков, тела и ответа через прокси"""
+
+    def setUp(self):
+        self.factory = RequestFactory()
+
+    def test_forward_headers_drop_hop_by_hop(self):
+        request = self.factory.post(
+            '/api/users/', data=b'{}', content_type='application/json',
+            HTTP_CONNECTION='keep-alive', HTTP_KEEP_ALIVE='timeout=5', HTTP_TE='trailers',
+            HTTP_UPGRADE='websocket', HTTP_PROXY_AUTHORIZATION='Basic x',
+            HTTP_AUTHORIZATION='Bearer token', HTTP_ACCEPT_ENCODING='gzip',
+            REMOTE_ADDR='10.0.0.5',
+        )
+        headers = forward_headers(request)
+        for name in ('Connection', 'Keep-Alive', 'Te', 'Upgrade', 'Proxy-Authorization', 'Host', 'Content-Length'):
+            self.assertNotIn(name, headers)
+        self.assertEqual(headers['Authorization'], 'Bearer token')
+        self.assertEqual(headers['Accept-Encoding'], 'gzip')
+        self.assertEqual(headers['Content-Type'], 'application/json')
+        self.assertEqual(headers['X-Forwarded-For'], '10.0.0.5')
+        self.assertEqual(headers['X-Forwarded-Proto'], 'http')
+        self.assertEqual(headers['X-Forwarded-Host'], 'testserver')
+
+    def test_forward_headers_append_to_forwarded_for(self):
+        request = self.factory.get('/api/users/', HTTP_X_FORWARDED_FOR='1.2.3.4', REMOTE_ADDR='10.0.0.5')
+        request.user_id = 7
+        headers = forward_headers(request)
+        self.assertEqual(headers['X-Forwarded-For'], '1.2.3.4, 10.0.0.5')
+        self.assertEqual(headers['X-User-ID'], '7')
+
+    def test_request_body_streamed(self):
+        request = self.factory.post('/api/files/', data=b'x' * 10, content_type='application/octet-stream')
+        body = request_body(request, chunk_size=4)
+        self.assertIsInstance(body, RequestBody)
+        self.assertEqual(len(body), 10)
+        self.assertEqual(list(body), [b'xxxx', b'xxxx', b'xx'])
+
+    def test_request_body_already_read(self):
+        """Тело прочитано раньше (middleware, DRF) — передаётся байтами, а не пустым потоком"""
+        request = self.factory.post('/api/users/', data=b'{"a": 1}', content_type='application/json')
+        self.assertEqual(request.body, b'{"a": 1}')
+        self.assertEqual(request_body(request, chunk_size=4), b'{"a": 1}')
+
+    def test_request_body_empty(self):
+        self.assertIsNone(request_body(self.factory.get('/api/users/'), chunk_size=4))
+
+    def test_build_response_keeps_cookies_and_encoding(self):
+        body = gzip.compress(b'{"ok": true}')
+        upstream = upstream_response(body=body, headers=[
+            ('Content-Type', 'application/json'),
+            ('Content-Encoding', 'gzip'),
+            ('Set-Cookie', 'jwt=abc; Path=/; HttpOnly'),
+            ('Set-Cookie', 'csrftoken=def; Path=/'),
+            ('Connection', 'keep-alive'),
+        ])
+        response = build_response(upstream, chunk_size=4)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(response['Content-Type'], 'application/json')
+        self.assertFalse(response.has_header('Connection'))
+        self.assertEqual(response.cookies['jwt'].value, 'abc')
+        self.assertTrue(response.cookies['jwt']['httponly'])
+        self.assertEqual(response.cookies['csrftoken'].value, 'def')
+        # Сжатое тело передаётся как есть
+        self.assertEqual(b''.join(response.streaming_content), body)
+
+    def test_query_string_is_forwarded(self):
+        session = Mock()
+        session.request.return_value = upstream_response(body=b'[]')
+        request = self.factory.get('/api/zayavki/', {'status': 'new', 'page': '2'})
+        with patch('gateway.proxy.upstream_pool.session', return_value=session):
+            response = proxy_request(request, 'http://zayavki:8000', 'zayavki/', route='zayavki-query')
+        self.assertEqual(response.status_code, 200)
+        method, url = session.request.call_args.args
+        self.assertEqual(method, 'GET')
+        self.assertEqual(url, 'http://zayavki:8000/api/v1/zayavki/?status=new&page=2')
+        self.assertIsNone(session.request.call_args.kwargs['data'])
@@ -229,6 +229,29 @@ USER_SERVICE_URL = os.getenv('USER_SERVICE_URL', 'http://user-service:8001')
 ZAYAVKI_SERVICE_URL = os.getenv('ZAYAVKI_SERVICE_URL', 'http://zayavki-service:8002')
 FINANCE_SERVICE_URL = os.getenv('FINANCE_SERVICE_URL', 'http://finance-service:8003')
 
+# Прокси к микросервисам: пул keep-alive соединений и таймауты (подключение, чтение) по маршруту
+GATEWAY_PROXY = {
+    'POOL_MAXSIZE': int(os.getenv('GATEWAY_POOL_MAXSIZE', '50')),
+    'TIMEOUT': (3.05, 30),
+    'ROUTE_TIMEOUTS': {
+        'users': (3.05, 10),
+        'zayavki': (3.05, 60),  # Выгрузки и файлы заявок
+        'finance': (3.05, 30),
+    },
+}
+
+# Предохранители upstream: размыкаются при доле ошибок/медленных ответов в окне
+GATEWAY_CIRCUIT_BREAKER = {
+    'WINDOW_SIZE': 20,
+    'MIN_CALLS': 5,
+    'ERROR_RATE': 0.5,
+    'SLOW_CALL_SECONDS': 5.0,
+    'SLOW_RATE': 0.8,
+    'OPEN_SECONDS': int(os.getenv('GATEWAY_BREAKER_OPEN_SECONDS', '15')),
+    'HEALTH_TIMEOUT': 2,
+    'HEALTH_CACHE_SECONDS': 5,
+}
+
 # Logging
 LOGGING = {
     'version': 1,
@@ -19,7 +19,7 @@ from django.urls import path, include
 from rest_framework import permissions
 from drf_yasg.views import get_schema_view
 from drf_yasg import openapi
-from gateway.views import home_page
+from gateway.views import home_page, metrics
 
 schema_view = get_schema_view(
     openapi.Info(
@@ -38,6 +38,9 @@ urlpatterns = [
     path('', home_page, name='home'),
     path('admin/', admin.site.urls),
     
+    # Метрики предохранителей upstream (Prometheus)
+    path('metrics/', metrics, name='metrics'),
+    
     # Swagger документация
     path('swagger/', schema_view.with_ui('swagger', cache_timeout=0), name='schema-swagger-ui'),
     path('redoc/', schema_view.with_ui('redoc', cache_timeout=0), name='schema-redoc'),
@@ -0,0 +1,240 @@
+"""
+Прокси API Gateway к микросервисам.
+
+Для каждого upstream держится свой requests.Session с пулом keep-alive
+соединений, поэтому запрос не платит за установку TCP/TLS. Тело запроса
+и ответа передаётся потоком без разбора JSON: сохраняются Content-Type,
+сжатие и бинарные данные (файлы, multipart). Таймауты задаются по маршруту,
+недоступный upstream отсекается предохранителем (resilience.CircuitBreaker).
+"""
+
+import logging
+import threading
+import time
+
+import requests
+from django.conf import settings
+from django.http import JsonResponse, StreamingHttpResponse
+from requests.adapters import HTTPAdapter
+
+from .resilience import breakers
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PROXY_SETTINGS = {
+    'POOL_MAXSIZE': 50,          # Соединений в пуле одного upstream
+    'POOL_BLOCK': False,         # При исчерпании пула открывать дополнительные соединения
+    'CHUNK_SIZE': 64 * 1024,     # Размер блока при потоковой передаче
+    'TIMEOUT': (3.05, 30),       # (подключение, чтение) по умолчанию
+    'ROUTE_TIMEOUTS': {},        # {'zayavki': (3.05, 60)}
+}
+
+# Заголовки соединения (RFC 7230) не передаются через прокси
+HOP_BY_HOP_HEADERS = {
+    'connection', 'keep-alive', 'proxy-authenticate', 'proxy-authorization',
+    'te', 'trailer', 'trailers', 'transfer-encoding', 'upgrade',
+}
+# Заголовки запроса, которые выставляет сам прокси
+SKIP_REQUEST_HEADERS = HOP_BY_HOP_HEADERS | {'host', 'content-length', 'content-type'}
+SKIP_RESPONSE_HEADERS = HOP_BY_HOP_HEADERS | {'set-cookie'}
+
+
+def proxy_settings():
+    return {**DEFAULT_PROXY_SETTINGS, **getattr(settings, 'GATEWAY_PROXY', {})}
+
+
+class UpstreamPool:
+    """Сессии с пулами соединений, по одной на upstream"""
+
+    def __init__(self):
+        self._sessions = {}
+        self._lock = threading.Lock()
+
+    def session(self, service_url):
+        session = self._sessions.get(service_url)
+        if session is not None:
+            return session
+        with self._lock:
+            session = self._sessions.get(service_url)
+            if session is None:
+                config = proxy_settings()
+                session = requests.Session()
+                # Повторы не делаем: небезопасные методы нельзя отправлять дважды
+                adapter = HTTPAdapter(
+                    pool_connections=1,
+                    pool_maxsize=config['POOL_MAXSIZE'],
+                    pool_block=config['POOL_BLOCK'],
+                    max_retries=0,
+                )
+                session.mount('http://', adapter)
+                session.mount('https://', adapter)
+                # Переменные окружения (прокси, .netrc) не читаются на каждый запрос
+                session.trust_env = False
+                self._sessions[service_url] = session
+        return session
+
+    def close(self):
+        with self._lock:
+            for session in self._sessions.values():
+                session.close()
+            self._sessions.clear()
+
+
+upstream_pool = UpstreamPool()
+
+
+class RequestBody:
+    """Тело входящего запроса как поток известной длины (без буферизации)"""
+
+    def __init__(self, request, length, chunk_size):
+        self.request = request
+        self.length = length
+        self.chunk_size = chunk_size
+
+    def __len__(self):
+        return self.length
+
+    def read(self, size=-1):
+        return self.request.read(size)
+
+    def __iter__(self):
+        while True:
+            chunk = self.request.read(self.chunk_size)
+            if not chunk:
+                return
+            yield chunk
+
+
+def route_timeout(route):
+    config = proxy_settings()
+    return config['ROUTE_TIMEOUTS'].get(route, config['TIMEOUT'])
+
+
+def build_target_url(service_url, path, query_string):
+    target_url = f"{service_url}/api/v1/{path}"
+    if query_string:
+        target_url = f"{target_url}?{query_string}"
+    return target_url
+
+
+def forward_headers(request):
+    """Заголовки для upstream: входящие без hop-by-hop + X-Forwarded-*"""
+    headers = {}
+    for key, value in request.META.items():
+        if not key.startswith('HTTP_'):
+            continue
+        name = key[5:].replace('_', '-').title()
+        if name.lower() not in SKIP_REQUEST_HEADERS:
+            headers[name] = value
+    if request.META.get('CONTENT_TYPE'):
+        headers['Content-Type'] = request.META['CONTENT_TYPE']
+
+    client_ip = request.META.get('REMOTE_ADDR', '')
+    forwarded_for = request.META.get('HTTP_X_FORWARDED_FOR')
+    headers['X-Forwarded-For'] = f"{forwarded_for}, {client_ip}" if forwarded_for else client_ip
+    headers['X-Forwarded-Proto'] = request.scheme
+    headers['X-Forwarded-Host'] = request.get_host()
+
+    # Добавляем информацию о пользователе, если аутентифицирован
+    if hasattr(request, 'user_id'):
+        headers['X-User-ID'] = str(request.user_id)
+    return headers
+
+
+def request_body(request, chunk_size):
+    """Тело запроса: уже прочитанное — байтами, иначе потоком"""
+    if getattr(request, '_read_started', False):
+        return request.body
+    try:
+        length = int(request.META.get('CONTENT_LENGTH') or 0)
+    except ValueError:
+        length = 0
+    if not length:
+        return None
+    return RequestBody(request, length, chunk_size)
+
+
+def stream_upstream(upstream, chunk_size):
+    """Передаёт тело ответа без распаковки; соединение возвращается в пул"""
+    completed = False
+    try:
+        for chunk in upstream.raw.stream(chunk_size, decode_content=False):
+            yield chunk
+        completed = True
+    finally:
+        if completed:
+            upstream.raw.release_conn()
+        else:
+            # Клиент оборвал загрузку — недочитанное соединение не переиспользуем
+            upstream.close()
+
+
+def build_response(upstream, chunk_size):
+    response = StreamingHttpResponse(
+        stream_upstream(upstream, chunk_size),
+        status=upstream.status_code,
+        reason=upstream.reason,
+    )
+    for name, value in upstream.headers.items():
+        if name.lower() not in SKIP_RESPONSE_HEADERS:
+            response[name] = value
+    # Несколько Set-Cookie нельзя передать одним заголовком
+    for value in upstream.raw.headers.getlist('Set-Cookie'):
+        response.cookies.load(value)
+    return response
+
+
+def proxy_request(request, service_url, path='', route=None):
+    """Проксирует запрос в upstream и потоково возвращает его ответ"""
+    config = proxy_settings()
+    target_url = build_target_url(service_url, path, request.META.get('QUERY_STRING', ''))
+    breaker = breakers.get(route or service_url)
+    if not breaker.allow():
+        logger.warning(f"Цепь {breaker.name} разомкнута, запрос {request.method} {target_url} отклонён")
+        response = JsonResponse({
+            'error': 'Сервис недоступен',
+            'detail': 'Микросервис временно отключён после серии ошибок'
+        }, status=503)
+        response['Retry-After'] = str(breaker.retry_after())
+        return response
+
+    started = time.monotonic()
+    try:
+        upstream = upstream_pool.session(service_url).request(
+            request.method,
+            target_url,
+            headers=forward_headers(request),
+            data=request_body(request, config['CHUNK_SIZE']),
+            stream=True,
+            allow_redirects=False,
+            timeout=route_timeout(route),
+        )
+    except requests.exceptions.Timeout:
+        breaker.record(True, time.monotonic() - started)
+        logger.error(f"Таймаут при обращении к {target_url}")
+        return JsonResponse({
+            'error': 'Таймаут сервиса',
+            'detail': 'Микросервис не отвечает'
+        }, status=503)
+    except requests.exceptions.ConnectionError:
+        breaker.record(True, time.monotonic() - started)
+        logger.error(f"Ошибка подключения к {target_url}")
+        return JsonResponse({
+            'error': 'Сервис недоступен',
+            'detail': 'Не удается подключиться к микросервису'
+        }, status=503)
+    except Exception as e:
+        breaker.record(True, time.monotonic() - started)
+        logger.error(f"Ошибка проксирования: {e}")
+        return JsonResponse({
+            'error': 'Внутренняя ошибка',
+            'detail': str(e)
+        }, status=500)
+
+    elapsed = time.monotonic() - started
+    breaker.record(upstream.status_code >= 500, elapsed)
+    logger.info(
+        f"Прокси запрос: {request.method} {target_url} -> {upstream.status_code} "
+        f"({elapsed * 1000:.0f} мс до заголовков)"
+    )
+    return build_response(upstream, config['CHUNK_SIZE'])
@@ -0,0 +1,199 @@
+"""
+Устойчивость API Gateway к отказам микросервисов.
+
+CircuitBreaker (по одному на upstream) следит за долей ошибок и медленных
+ответов в скользящем окне последних вызовов. При превышении порога цепь
+размыкается (open) и прокси сразу отвечает 503, не дожидаясь таймаута;
+через OPEN_SECONDS пропускается пробный запрос (half-open), и по его
+результату цепь замыкается или снова размыкается.
+
+Health check опрашивает сервисы параллельно и кэширует результат на
+несколько секунд, поэтому его время не превышает одного таймаута.
+"""
+
+import logging
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BREAKER_SETTINGS = {
+    'WINDOW_SIZE': 20,         # Последних вызовов в окне
+    'MIN_CALLS': 5,            # Меньше вызовов в окне — цепь не размыкается
+    'ERROR_RATE': 0.5,         # Доля ошибок (исключения и 5xx) для размыкания
+    'SLOW_CALL_SECONDS': 5.0,  # Ответ дольше — считается медленным
+    'SLOW_RATE': 0.8,          # Доля медленных ответов для размыкания
+    'OPEN_SECONDS': 15,        # Сколько цепь разомкнута до пробного запроса
+    'HALF_OPEN_CALLS': 1,      # Одновременных пробных запросов в half-open
+    'HEALTH_TIMEOUT': 2,       # Таймаут одной проверки health
+    'HEALTH_CACHE_SECONDS': 5, # Сколько держать результат health check
+}
+
+CLOSED, OPEN, HALF_OPEN = 'closed', 'open', 'half_open'
+STATE_CODES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+
+def breaker_settings():
+    return {**DEFAULT_BREAKER_SETTINGS, **getattr(settings, 'GATEWAY_CIRCUIT_BREAKER', {})}
+
+
+class CircuitBreaker:
+    """Предохранитель одного upstream (closed → open → half-open → closed)"""
+
+    def __init__(self, name, config=None, clock=time.monotonic):
+        self.name = name
+        self.config = config or breaker_settings()
+        self.clock = clock
+        self.state = CLOSED
+        self.opened_at = None
+        self.trial_calls = 0
+        self.window = deque(maxlen=self.config['WINDOW_SIZE'])
+        self.stats = {'calls': 0, 'failures': 0, 'slow_calls': 0, 'rejected': 0, 'opened': 0}
+        self._lock = threading.Lock()
+
+    def retry_after(self):
+        """Секунд до пробного запроса (для заголовка Retry-After)"""
+        if self.state != OPEN:
+            return 0
+        return max(0, int(self.opened_at + self.config['OPEN_SECONDS'] - self.clock()) + 1)
+
+    def allow(self):
+        """Можно ли отправить запрос в upstream"""
+        with self._lock:
+            if self.state == OPEN:
+                if self.clock() - self.opened_at < self.config['OPEN_SECONDS']:
+                    self.stats['rejected'] += 1
+                    return False
+                self.state = HALF_OPEN
+                self.trial_calls = 0
+                logger.info(f"Circuit {self.name}: half-open")
+            if self.state == HALF_OPEN:
+                if self.trial_calls >= self.config['HALF_OPEN_CALLS']:
+                    self.stats['rejected'] += 1
+                    return False
+                self.trial_calls += 1
+            return True
+
+    def record(self, failed, duration):
+        """Результат вызова: ошибка и время до ответа (секунды)"""
+        slow = duration >= self.config['SLOW_CALL_SECONDS']
+        with self._lock:
+            self.stats['calls'] += 1
+            self.stats['failures'] += int(failed)
+            self.stats['slow_calls'] += int(slow)
+            if self.state == HALF_OPEN:
+                self.trial_calls = max(0, self.trial_calls - 1)
+                if failed or slow:
+                    self._open()
+                else:
+                    self.state = CLOSED
+                    self.window.clear()
+                    logger.info(f"Circuit {self.name}: closed")
+                return
+            if self.state == OPEN:
+                return
+            self.window.append((failed, slow))
+            if len(self.window) < self.config['MIN_CALLS']:
+                return
+            error_rate = sum(f for f, _ in self.window) / len(self.window)
+            slow_rate = sum(s for _, s in self.window) / len(self.window)
+            if error_rate >= self.config['ERROR_RATE'] or slow_rate >= self.config['SLOW_RATE']:
+                self._open()
+
+    def _open(self):
+        self.state = OPEN
+        self.opened_at = self.clock()
+        self.window.clear()
+        self.stats['opened'] += 1
+        logger.warning(f"Circuit {self.name}: open for {self.config['OPEN_SECONDS']} s")
+
+    def snapshot(self):
+        with self._lock:
+            return {'state': self.state, **self.stats}
+
+
+class BreakerRegistry:
+    def __init__(self):
+        self._breakers = {}
+        self._lock = threading.Lock()
+
+    def get(self, name):
+        breaker = self._breakers.get(name)
+        if breaker is None:
+            with self._lock:
+                breaker = self._breakers.setdefault(name, CircuitBreaker(name))
+        return breaker
+
+    def all(self):
+        return dict(self._breakers)
+
+
+breakers = BreakerRegistry()
+
+
+def render_metrics():
+    """Состояние предохранителей в текстовом формате Prometheus"""
+    lines = [
+        '# HELP gateway_circuit_state Состояние предохранителя (0 closed, 1 half-open, 2 open)',
+        '# TYPE gateway_circuit_state gauge',
+    ]
+    snapshots = {name: breaker.snapshot() for name, breaker in sorted(breakers.all().items())}
+    for name, snapshot in snapshots.items():
+        lines.append(f'gateway_circuit_state{{upstream="{name}"}} {STATE_CODES[snapshot["state"]]}')
+    counters = [
+        ('calls', 'Вызовы upstream'),
+        ('failures', 'Ошибки upstream (исключения и 5xx)'),
+        ('slow_calls', 'Медленные ответы upstream'),
+        ('rejected', 'Запросы, отклонённые разомкнутой цепью'),
+        ('opened', 'Размыкания цепи'),
+    ]
+    for key, description in counters:
+        lines.append(f'# HELP gateway_upstream_{key}_total {description}')
+        lines.append(f'# TYPE gateway_upstream_{key}_total counter')
+        for name, snapshot in snapshots.items():
+            lines.append(f'gateway_upstream_{key}_total{{upstream="{name}"}} {snapshot[key]}')
+    return '\n'.join(lines) + '\n'
+
+
+class HealthChecker:
+    """Параллельная проверка сервисов с кэшированием результата"""
+
+    def __init__(self, clock=time.monotonic):
+        self.clock = clock
+        self._executor = None
+        self._lock = threading.Lock()
+        self._cached = None
+        self._cached_at = 0
+
+    def _probe(self, service_url, timeout):
+        from .proxy import upstream_pool
+        try:
+            response = upstream_pool.session(service_url).get(f"{service_url}/health/", timeout=timeout)
+            response.close()
+            return 'healthy' if response.status_code == 200 else 'unhealthy'
+        except requests.exceptions.RequestException:
+            return 'unreachable'
+
+    def check(self, services):
+        """{имя: статус} для {имя: url}; повторные вызовы в пределах кэша бесплатны"""
+        config = breaker_settings()
+        with self._lock:
+            if self._cached is not None and self.clock() - self._cached_at < config['HEALTH_CACHE_SECONDS']:
+                return self._cached
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix='gateway-health')
+            futures = {
+                name: self._executor.submit(self._probe, url, config['HEALTH_TIMEOUT'])
+                for name, url in services.items()
+            }
+            self._cached = {name: future.result() for name, future in futures.items()}
+            self._cached_at = self.clock()
+            return self._cached
+
+
+health_checker = HealthChecker()
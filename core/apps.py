@@ -4,3 +4,19 @@ from django.apps import AppConfig
 class CoreConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'core'
+
+    def ready(self):
+        from .cache import connect_cache_invalidation
+        from .authentication import connect_principal_invalidation
+        from .rollups import connect_rollup_updates
+        from .reports import connect_report_invalidation
+        from .ledger import connect_balance_updates
+        from .data_versions import connect_data_versions
+        from .live_feed import connect_zayavki_feed
+        connect_cache_invalidation()
+        connect_principal_invalidation()
+        connect_rollup_updates()
+        connect_report_invalidation()
+        connect_balance_updates()
+        connect_data_versions()
+        connect_zayavki_feed()
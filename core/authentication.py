@@ -3,68 +3,181 @@ from rest_framework.exceptions import AuthenticationFailed
 import jwt
 import logging
 from django.conf import settings
+from django.db import transaction
+from .cache import CacheManager
 from .models import Polzovateli, Master
 
 logger = logging.getLogger(__name__)
 
+PRINCIPAL_CACHE_TYPE = 'principal'
+
+
+class AuthPrincipal:
+    """
+    Лёгкий неизменяемый субъект аутентификации (пользователь или мастер).
+
+    Содержит только то, что нужно для проверки прав, поэтому его можно
+    хранить в кэше и не обращаться к БД на каждый запрос.
+    """
+
+    __slots__ = ('kind', 'id', 'login', 'name', 'role', 'gorod_id', 'is_active')
+
+    is_authenticated = True
+    is_anonymous = False
+
+    def __init__(self, kind, id, login, name, role, gorod_id, is_active):
+        for field, value in zip(self.__slots__, (kind, id, login, name, role, gorod_id, is_active)):
+            object.__setattr__(self, field, value)
+
+    def __setattr__(self, name, value):
+        raise AttributeError('AuthPrincipal неизменяем')
+
+    def __delattr__(self, name):
+        raise AttributeError('AuthPrincipal неизменяем')
+
+    def __reduce__(self):
+        return (self.__class__, tuple(getattr(self, field) for field in self.__slots__))
+
+    def __eq__(self, other):
+        return (
+            isinstance(other, AuthPrincipal)
+            and other.kind == self.kind and other.id == self.id
+        )
+
+    def __hash__(self):
+        return hash((self.kind, self.id))
+
+    def __str__(self):
+        return f"{self.name} ({self.login})"
+
+    @property
+    def pk(self):
+        return self.id
+
+    @property
+    def username(self):
+        return self.login
+
+    @property
+    def is_master(self):
+        return self.kind == 'master'
+
+    @property
+    def model(self):
+        return Master if self.is_master else Polzovateli
+
+    def get_instance(self):
+        """Загружает модель из БД (только если она действительно нужна)"""
+        return self.model.objects.select_related('gorod').get(pk=self.id)
+
+    def with_role(self, role):
+        return AuthPrincipal(
+            self.kind, self.id, self.login, self.name, role, self.gorod_id, self.is_active
+        )
+
+
+def get_principal_cache_key(kind, principal_id, issued_at=None):
+    """Ключ кэша субъекта; время выпуска токена делает ключ уникальным для токена"""
+    return f"principal:{kind}:{principal_id}:{issued_at or 0}"
+
+
+def principal_cache_enabled():
+    """
+    Кэш субъектов включён только с общим кэшем (Redis): инвалидация при
+    деактивации пользователя должна дойти до всех воркеров. С LocMem у
+    каждого процесса своя копия, и отключённый пользователь оставался бы
+    авторизован в других воркерах до истечения TTL.
+    """
+    config = getattr(settings, 'AUTH_PRINCIPAL_CACHE', {})
+    return config.get('ENABLED', bool(getattr(settings, 'REDIS_URL', None)))
+
+
+def invalidate_principal(kind, principal_id):
+    """Сбрасывает кэш субъекта для всех его токенов"""
+    CacheManager.clear_pattern(f"principal:{kind}:{principal_id}")
+
+
+def load_principal(kind, principal_id, role):
+    """Загружает субъекта из БД (без связанных объектов)"""
+    model = Master if kind == 'master' else Polzovateli
+    row = model.objects.values('id', 'login', 'name', 'gorod_id', 'is_active').get(id=principal_id)
+    return AuthPrincipal(
+        kind, row['id'], row['login'], row['name'], role, row['gorod_id'], row['is_active']
+    )
+
+
+def _principal_post_save(sender, instance, **kwargs):
+    kind = 'master' if sender is Master else 'user'
+    transaction.on_commit(lambda: invalidate_principal(kind, instance.pk))
+
+
+def connect_principal_invalidation():
+    """Сбрасывает кэш субъекта при изменении/удалении пользователя или мастера"""
+    from django.db.models.signals import post_save, post_delete
+    for model in (Polzovateli, Master):
+        post_save.connect(_principal_post_save, sender=model, dispatch_uid=f'crm_principal_save_{model.__name__}')
+        post_delete.connect(_principal_post_save, sender=model, dispatch_uid=f'crm_principal_delete_{model.__name__}')
+
+
 class JWTCookieAuthentication(authentication.BaseAuthentication):
     """
     Кастомная аутентификация через JWT токены в cookies.
+
+    Субъект (id, роль, город, активность) кэшируется на короткое время
+    (только с общим кэшем, см. principal_cache_enabled), поэтому проверка
+    личности не требует запросов к БД.
     """
-    
+
     def authenticate(self, request):
         token = request.COOKIES.get('jwt')
         if not token:
             logger.debug('No JWT token found in cookies')
             return None
-        
+
         try:
             # Декодируем JWT токен
             payload = jwt.decode(
-                token, 
-                getattr(settings, 'SECRET_KEY', 'devsecret'), 
+                token,
+                getattr(settings, 'SECRET_KEY', 'devsecret'),
                 algorithms=['HS256']
             )
-            
+
             logger.debug(f'JWT payload: {payload}')
-            
+
             # Проверяем, есть ли user_id (пользователь) или master_id (мастер)
             if 'user_id' in payload:
-                # Это пользователь
-                user = Polzovateli.objects.get(id=payload['user_id'])
-                
-                # Проверяем активность пользователя
-                if not user.is_active:
-                    logger.warning(f'Inactive user: {user.login}')
-                    raise AuthenticationFailed('Пользователь неактивен')
-                
-                # Добавляем роль в объект пользователя для удобства
-                user.role = payload.get('role', '')
-                
-                logger.debug(f'Authenticated user: {user.login}, role: {user.role}')
-                
-                return (user, None)
-                
+                kind, principal_id, role = 'user', payload['user_id'], payload.get('role', '')
             elif 'master_id' in payload:
-                # Это мастер
-                master = Master.objects.get(id=payload['master_id'])
-                
-                # Проверяем активность мастера
-                if not master.is_active:
-                    logger.warning(f'Inactive master: {master.login}')
-                    raise AuthenticationFailed('Мастер неактивен')
-                
-                # Добавляем роль в объект мастера для удобства
-                master.role = payload.get('role', 'master')
-                
-                logger.debug(f'Authenticated master: {master.login}, role: {master.role}')
-                
-                return (master, None)
-                
+                kind, principal_id, role = 'master', payload['master_id'], payload.get('role', 'master')
             else:
                 logger.warning(f'No user_id or master_id in JWT payload: {payload}')
                 raise AuthenticationFailed('Невалидный токен: отсутствует идентификатор пользователя')
-            
+
+            principal = None
+            if principal_cache_enabled():
+                principal = CacheManager.get_or_set(
+                    get_principal_cache_key(kind, principal_id, payload.get('iat')),
+                    lambda: load_principal(kind, principal_id, role),
+                    cache_type=PRINCIPAL_CACHE_TYPE
+                )
+            if principal is None:
+                # get_or_set проглатывает ошибки загрузки и возвращает None —
+                # загружаем напрямую, чтобы DoesNotExist и ошибки БД дошли до обработчиков ниже
+                principal = load_principal(kind, principal_id, role)
+            if principal.role != role:
+                principal = principal.with_role(role)
+
+            # Проверяем активность пользователя/мастера
+            if not principal.is_active:
+                logger.warning(f'Inactive {kind}: {principal.login}')
+                raise AuthenticationFailed('Мастер неактивен' if kind == 'master' else 'Пользователь неактивен')
+
+            logger.debug(f'Authenticated {kind}: {principal.login}, role: {principal.role}')
+
+            return (principal, None)
+
+        except AuthenticationFailed:
+            raise
         except jwt.ExpiredSignatureError:
             logger.warning('JWT token expired')
             raise AuthenticationFailed('Токен истёк')
@@ -80,6 +193,6 @@ class JWTCookieAuthentication(authentication.BaseAuthentication):
         except Exception as e:
             logger.error(f'Authentication error: {e}')
             raise AuthenticationFailed(f'Ошибка аутентификации: {str(e)}')
-    
+
     def authenticate_header(self, request):
-        return 'JWT' 
\ No newline at end of file
+        return 'JWT'
@@ -1,21 +1,195 @@
 from django.core.cache import cache
 from django.conf import settings
+from django.db import connections
+from collections import OrderedDict
+from prometheus_client import Counter
 import logging
+import os
+import threading
+import time
 from typing import List, Dict, Any, Optional
 import json
 
 logger = logging.getLogger(__name__)
 
+# Канал Redis pub/sub для межпроцессной инвалидации локального кэша
+INVALIDATION_CHANNEL = 'crm:cache:invalidate'
+
+CACHE_REQUESTS = Counter(
+    'crm_cache_requests_total',
+    'Обращения к CacheManager.get_or_set по результату (hit, stale, miss)',
+    ['namespace', 'result'],
+)
+CACHE_REFRESHES = Counter(
+    'crm_cache_refreshes_total',
+    'Пересчёты значений кэша (sync, background, error)',
+    ['namespace', 'mode'],
+)
+
+
+class CacheEntry:
+    """
+    Значение в кэше с «мягким» сроком жизни. После soft_expires запись
+    считается устаревшей, но ещё может отдаваться, пока один воркер
+    пересчитывает её в фоне (stale-while-revalidate). Жёсткий срок
+    задаётся TTL самого ключа в кэше.
+    """
+    __slots__ = ('value', 'soft_expires')
+
+    def __init__(self, value: Any, soft_expires: float):
+        self.value = value
+        self.soft_expires = soft_expires
+
+    @property
+    def is_stale(self) -> bool:
+        return time.time() >= self.soft_expires
+
+
+class LocalLRUCache:
+    """
+    Локальный (in-process) LRU кэш первого уровня с коротким TTL.
+    Хранит значения по логическому ключу, чтобы их можно было
+    сбросить по префиксу при получении сообщения об инвалидации.
+    """
+
+    def __init__(self, max_entries: int = 1000):
+        self.max_entries = max_entries
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Any:
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            value, expires_at = item
+            if expires_at < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: Any, timeout: float):
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + timeout)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def delete(self, key: str):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def delete_prefix(self, prefix: str):
+        """Удаляет ключ prefix и все ключи вида prefix:..."""
+        nested = f"{prefix}:"
+        with self._lock:
+            for key in [k for k in self._data if k == prefix or k.startswith(nested)]:
+                del self._data[key]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+class CacheInvalidationBus:
+    """
+    Рассылка инвалидаций L1 между воркерами через Redis pub/sub.
+    Без REDIS_URL работает только в пределах текущего процесса.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._client = None
+        self._listener_pid = None
+
+    def _get_client(self):
+        redis_url = getattr(settings, 'REDIS_URL', None)
+        if not redis_url:
+            return None
+        if self._client is None:
+            import redis
+            self._client = redis.Redis.from_url(redis_url)
+        return self._client
+
+    def publish(self, prefix: str):
+        try:
+            client = self._get_client()
+            if client is not None:
+                client.publish(INVALIDATION_CHANNEL, prefix)
+        except Exception as e:
+            logger.warning(f"Cache invalidation publish failed for {prefix}: {e}")
+
+    def ensure_listener(self, on_message):
+        """Запускает фоновый подписчик (один на процесс, перезапускается после fork)."""
+        pid = os.getpid()
+        if self._listener_pid == pid:
+            return
+        with self._lock:
+            if self._listener_pid == pid:
+                return
+            try:
+                if self._get_client() is None:
+                    self._listener_pid = pid
+                    return
+                thread = threading.Thread(
+                    target=self._listen, args=(on_message,),
+                    name='crm-cache-invalidation', daemon=True
+                )
+                thread.start()
+                self._listener_pid = pid
+            except Exception as e:
+                logger.warning(f"Cache invalidation listener not started: {e}")
+
+    def _listen(self, on_message):
+        import redis
+        while True:
+            try:
+                pubsub = redis.Redis.from_url(settings.REDIS_URL).pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(INVALIDATION_CHANNEL)
+                for message in pubsub.listen():
+                    data = message.get('data')
+                    if isinstance(data, bytes):
+                        data = data.decode('utf-8')
+                    if data:
+                        on_message(data)
+            except Exception as e:
+                logger.warning(f"Cache invalidation listener error: {e}")
+                # Пока подписчик не работает, L1 может устареть — сбрасываем его целиком
+                on_message(None)
+                time.sleep(5)
+
+
+local_cache = LocalLRUCache(max_entries=getattr(settings, 'CACHE_L1', {}).get('MAX_ENTRIES', 1000))
+invalidation_bus = CacheInvalidationBus()
+
+
+def _on_invalidation_message(prefix: Optional[str]):
+    if prefix is None:
+        local_cache.clear()
+    else:
+        local_cache.delete(CacheManager._generation_key(prefix))
+        local_cache.delete_prefix(prefix)
+
+
 class CacheManager:
     """
     Менеджер кэширования для справочных данных CRM системы.
+
+    Двухуровневый кэш: локальный LRU (L1, короткий TTL) перед общим
+    кэшем Django/Redis (L2). Ключи версионируются счётчиками поколений
+    для каждого префикса (``reference``, ``reference:rk``,
+    ``reference:rk:gorod:5`` ...), поэтому инвалидация по префиксу — это
+    один INCR вместо поиска ключей. Старые версии просто истекают по TTL.
     """
     
     # Время жизни кэша для разных типов данных (в секундах)
     CACHE_TIMEOUTS = {
-        'reference_data': 3600,  # 1 час для справочников
+        'reference_data': 21600, # 6 часов для справочников (инвалидируются сигналами)
         'user_data': 1800,       # 30 минут для данных пользователей
+        'principal': 300,        # 5 минут для субъекта аутентификации (инвалидируется сигналами)
         'query_results': 300,    # 5 минут для результатов запросов
+        'finance_report': 2592000,  # 30 дней для отчётов за закрытые периоды (инвалидируются сигналами)
         'session_data': 86400,   # 24 часа для сессий
     }
     
@@ -24,6 +198,73 @@ class CacheManager:
         """Генерирует ключ кэша с префиксом."""
         return f"{prefix}:{identifier}"
     
+    @classmethod
+    def _l1_settings(cls) -> Dict[str, Any]:
+        return getattr(settings, 'CACHE_L1', {})
+    
+    @classmethod
+    def _l1_enabled(cls) -> bool:
+        enabled = cls._l1_settings().get('ENABLED', False)
+        if enabled:
+            invalidation_bus.ensure_listener(_on_invalidation_message)
+        return enabled
+    
+    @classmethod
+    def _l1_timeout(cls, timeout: Optional[int] = None) -> float:
+        l1_timeout = cls._l1_settings().get('TIMEOUT', 30)
+        return l1_timeout if timeout is None else min(timeout, l1_timeout)
+    
+    @staticmethod
+    def _key_prefixes(key: str) -> List[str]:
+        """'reference:rk:gorod:5' -> ['reference', 'reference:rk', 'reference:rk:gorod', 'reference:rk:gorod:5']"""
+        parts = key.split(':')
+        return [':'.join(parts[:i]) for i in range(1, len(parts) + 1)]
+    
+    @staticmethod
+    def _generation_key(prefix: str) -> str:
+        return f"crm:gen:{prefix}"
+    
+    @classmethod
+    def _get_generations(cls, prefixes: List[str]) -> List[int]:
+        """Возвращает поколения префиксов (L1, затем одним get_many из L2)."""
+        use_l1 = cls._l1_enabled()
+        generation_keys = [cls._generation_key(p) for p in prefixes]
+        generations = {}
+        missing = []
+        for gen_key in generation_keys:
+            value = local_cache.get(gen_key) if use_l1 else None
+            if value is None:
+                missing.append(gen_key)
+            else:
+                generations[gen_key] = value
+        if missing:
+            found = cache.get_many(missing)
+            for gen_key in missing:
+                value = found.get(gen_key)
+                if value is None:
+                    # Начальное поколение берём от времени, чтобы после вытеснения
+                    # счётчика из Redis не «воскресить» старые версии ключей
+                    cache.add(gen_key, time.time_ns() // 1000, None)
+                    value = cache.get(gen_key) or 0
+                generations[gen_key] = value
+                if use_l1:
+                    local_cache.set(gen_key, value, cls._l1_timeout())
+        return [generations[k] for k in generation_keys]
+    
+    @classmethod
+    def get_version(cls, *keys: str) -> str:
+        """
+        Текущая версия ключей: поколения всех их префиксов (одним get_many).
+        Меняется при clear_pattern любого из них.
+        """
+        prefixes = list(dict.fromkeys(p for key in keys for p in cls._key_prefixes(key)))
+        generations = cls._get_generations(prefixes)
+        return '.'.join(str(g) for g in generations)
+    
+    @classmethod
+    def _versioned_key(cls, key: str) -> str:
+        return f"{cls.get_cache_key('crm', key)}:v{cls.get_version(key)}"
+    
     @classmethod
     def set_data(cls, key: str, data: Any, timeout: Optional[int] = None, cache_type: str = 'reference_data') -> bool:
         """
@@ -42,8 +283,11 @@ class CacheManager:
             if timeout is None:
                 timeout = cls.CACHE_TIMEOUTS.get(cache_type, 300)
             
-            cache_key = cls.get_cache_key('crm', key)
-            cache.set(cache_key, data, timeout)
+            entry = CacheEntry(data, time.time() + timeout)
+            # Жёсткий TTL больше мягкого на окно, в котором отдаём устаревшие данные
+            cache.set(cls._versioned_key(key), entry, timeout + cls._stampede_settings()['STALE_TTL'])
+            if cls._l1_enabled():
+                local_cache.set(key, entry, cls._l1_timeout(timeout))
             
             logger.debug(f"Data cached successfully: {key}, timeout: {timeout}s")
             return True
@@ -52,6 +296,25 @@ class CacheManager:
             logger.error(f"Error caching data {key}: {e}")
             return False
     
+    @classmethod
+    def _get_entry(cls, key: str) -> Optional[CacheEntry]:
+        """Возвращает запись кэша (в том числе устаревшую) или None."""
+        use_l1 = cls._l1_enabled()
+        if use_l1:
+            entry = local_cache.get(key)
+            if entry is not None:
+                logger.debug(f"L1 cache hit: {key}")
+                return entry
+        
+        entry = cache.get(cls._versioned_key(key))
+        if entry is None:
+            return None
+        if not isinstance(entry, CacheEntry):
+            entry = CacheEntry(entry, float('inf'))
+        if use_l1 and not entry.is_stale:
+            local_cache.set(key, entry, cls._l1_timeout())
+        return entry
+    
     @classmethod
     def get_data(cls, key: str) -> Any:
         """
@@ -61,18 +324,17 @@ class CacheManager:
             key: Ключ кэша
             
         Returns:
-            Any: Данные из кэша или None если не найдены
+            Any: Данные из кэша или None если не найдены или устарели
         """
         try:
-            cache_key = cls.get_cache_key('crm', key)
-            data = cache.get(cache_key)
+            entry = cls._get_entry(key)
             
-            if data is not None:
+            if entry is not None and not entry.is_stale:
                 logger.debug(f"Cache hit: {key}")
-            else:
-                logger.debug(f"Cache miss: {key}")
-                
-            return data
+                return entry.value
+            
+            logger.debug(f"Cache miss: {key}")
+            return None
             
         except Exception as e:
             logger.error(f"Error getting cached data {key}: {e}")
@@ -90,8 +352,9 @@ class CacheManager:
             bool: True если данные удалены успешно
         """
         try:
-            cache_key = cls.get_cache_key('crm', key)
-            cache.delete(cache_key)
+            cache.delete(cls._versioned_key(key))
+            local_cache.delete(key)
+            invalidation_bus.publish(key)
             
             logger.debug(f"Data deleted from cache: {key}")
             return True
@@ -103,33 +366,95 @@ class CacheManager:
     @classmethod
     def clear_pattern(cls, pattern: str) -> bool:
         """
-        Очищает все ключи, соответствующие паттерну.
+        Инвалидирует все ключи с указанным префиксом за O(1):
+        увеличивает поколение префикса, после чего все ранее записанные
+        версии ключей перестают читаться.
         
         Args:
-            pattern: Паттерн для поиска ключей
+            pattern: Префикс ключей (например, "reference:rk:gorod:5")
             
         Returns:
             bool: True если очистка прошла успешно
         """
         try:
-            # Получаем все ключи, соответствующие паттерну
-            keys = cache.keys(f"crm:{pattern}*")
+            prefix = pattern.rstrip(':*')
+            gen_key = cls._generation_key(prefix)
+            try:
+                cache.incr(gen_key)
+            except ValueError:
+                # Счётчика ещё нет: создаём заново с новым значением
+                if not cache.add(gen_key, time.time_ns() // 1000, None):
+                    cache.incr(gen_key)
             
-            if keys:
-                cache.delete_many(keys)
-                logger.info(f"Cleared {len(keys)} cache keys matching pattern: {pattern}")
+            _on_invalidation_message(prefix)
+            invalidation_bus.publish(prefix)
             
+            logger.info(f"Cache namespace invalidated: {prefix}")
             return True
             
         except Exception as e:
             logger.error(f"Error clearing cache pattern {pattern}: {e}")
             return False
     
+    @classmethod
+    def _stampede_settings(cls) -> Dict[str, Any]:
+        defaults = {
+            'STALE_TTL': 300,            # сколько секунд после мягкого TTL можно отдавать устаревшие данные
+            'LOCK_TIMEOUT': 30,          # время жизни блокировки пересчёта
+            'LOCK_WAIT': 5,              # сколько ждать чужого пересчёта при пустом кэше
+            'BACKGROUND_REFRESH': True,  # пересчитывать устаревшие данные в фоновом потоке
+        }
+        defaults.update(getattr(settings, 'CACHE_STAMPEDE', {}))
+        return defaults
+    
+    @staticmethod
+    def _namespace(key: str) -> str:
+        """Метка для метрик с ограниченной кардинальностью: 'reference:rk'"""
+        return ':'.join(key.split(':')[:2])
+    
+    @classmethod
+    def _lock_key(cls, key: str) -> str:
+        return f"crm:lock:{key}"
+    
+    @classmethod
+    def _refresh(cls, key: str, getter_func, timeout, cache_type, mode: str, release_lock: bool = True) -> Any:
+        """Пересчитывает значение и снимает свою блокировку."""
+        try:
+            data = getter_func()
+            if data is not None:
+                cls.set_data(key, data, timeout, cache_type)
+            CACHE_REFRESHES.labels(cls._namespace(key), mode).inc()
+            return data
+        except Exception:
+            CACHE_REFRESHES.labels(cls._namespace(key), 'error').inc()
+            raise
+        finally:
+            if release_lock:
+                cache.delete(cls._lock_key(key))
+    
+    @classmethod
+    def _refresh_in_background(cls, key: str, getter_func, timeout, cache_type):
+        def run():
+            try:
+                cls._refresh(key, getter_func, timeout, cache_type, 'background')
+            except Exception as e:
+                logger.error(f"Background cache refresh failed for key {key}: {e}")
+            finally:
+                # Соединения с БД привязаны к потоку — закрываем их
+                connections.close_all()
+        threading.Thread(target=run, name='crm-cache-refresh', daemon=True).start()
+    
     @classmethod
     def get_or_set(cls, key: str, getter_func, timeout: Optional[int] = None, cache_type: str = 'reference_data') -> Any:
         """
         Получает данные из кэша или создает их с помощью функции.
         
+        Защита от «набегов» при истечении ключа:
+        - пересчитывает значение только тот процесс, который взял блокировку
+          (single-flight), остальные ждут результат;
+        - устаревшее значение продолжает отдаваться, пока один процесс
+          обновляет его в фоне (stale-while-revalidate).
+        
         Args:
             key: Ключ кэша
             getter_func: Функция для получения данных если их нет в кэше
@@ -139,21 +464,50 @@ class CacheManager:
         Returns:
             Any: Данные из кэша или полученные функцией
         """
-        # Пытаемся получить из кэша
-        cached_data = cls.get_data(key)
+        namespace = cls._namespace(key)
+        options = cls._stampede_settings()
+        lock_key = cls._lock_key(key)
+        
+        try:
+            entry = cls._get_entry(key)
+        except Exception as e:
+            logger.error(f"Error getting cached data {key}: {e}")
+            entry = None
         
-        if cached_data is not None:
-            return cached_data
+        if entry is not None and not entry.is_stale:
+            CACHE_REQUESTS.labels(namespace, 'hit').inc()
+            return entry.value
+        
+        if entry is not None:
+            CACHE_REQUESTS.labels(namespace, 'stale').inc()
+            if cache.add(lock_key, 1, options['LOCK_TIMEOUT']):
+                if options['BACKGROUND_REFRESH']:
+                    cls._refresh_in_background(key, getter_func, timeout, cache_type)
+                else:
+                    try:
+                        return cls._refresh(key, getter_func, timeout, cache_type, 'sync')
+                    except Exception as e:
+                        logger.error(f"Error in get_or_set for key {key}: {e}")
+            return entry.value
+        
+        CACHE_REQUESTS.labels(namespace, 'miss').inc()
+        
+        # Если пересчёт уже идёт в другом процессе, ждём его результат
+        acquired = cache.add(lock_key, 1, options['LOCK_TIMEOUT'])
+        if not acquired:
+            deadline = time.monotonic() + options['LOCK_WAIT']
+            while time.monotonic() < deadline:
+                time.sleep(0.05)
+                data = cls.get_data(key)
+                if data is not None:
+                    return data
+                acquired = cache.add(lock_key, 1, options['LOCK_TIMEOUT'])
+                if acquired:
+                    break
         
         # Если данных нет в кэше, получаем их функцией
         try:
-            data = getter_func()
-            
-            if data is not None:
-                cls.set_data(key, data, timeout, cache_type)
-            
-            return data
-            
+            return cls._refresh(key, getter_func, timeout, cache_type, 'sync', release_lock=acquired)
         except Exception as e:
             logger.error(f"Error in get_or_set for key {key}: {e}")
             return None
@@ -204,17 +558,19 @@ class ReferenceDataCache:
     
     @staticmethod
     def invalidate_rk_cache(gorod_id: Optional[int] = None):
-        """Инвалидирует кэш РК."""
+        """Инвалидирует кэш РК города и общий список РК."""
         if gorod_id:
             CacheManager.clear_pattern(f"reference:rk:gorod:{gorod_id}")
+            CacheManager.clear_pattern("reference:rk:all")
         else:
             CacheManager.clear_pattern("reference:rk")
     
     @staticmethod
     def invalidate_master_cache(gorod_id: Optional[int] = None):
-        """Инвалидирует кэш мастеров."""
+        """Инвалидирует кэш мастеров города и общий список мастеров."""
         if gorod_id:
             CacheManager.clear_pattern(f"reference:master:gorod:{gorod_id}")
+            CacheManager.clear_pattern("reference:master:all")
         else:
             CacheManager.clear_pattern("reference:master")
     
@@ -225,12 +581,87 @@ class ReferenceDataCache:
     
     @staticmethod
     def invalidate_phonegoroda_cache(gorod_id: Optional[int] = None):
-        """Инвалидирует кэш телефонов городов."""
+        """Инвалидирует кэш телефонов города и общий список телефонов."""
         if gorod_id:
             CacheManager.clear_pattern(f"reference:phonegoroda:gorod:{gorod_id}")
+            CacheManager.clear_pattern("reference:phonegoroda:all")
         else:
             CacheManager.clear_pattern("reference:phonegoroda")
 
+
+def _invalidate_goroda(gorod_ids):
+    ReferenceDataCache.invalidate_goroda_cache()
+    # Название города входит в сериализованные списки мастеров (gorod_name)
+    ReferenceDataCache.invalidate_master_cache()
+
+
+def _per_city(invalidate):
+    def handler(gorod_ids):
+        for gorod_id in gorod_ids:
+            invalidate(gorod_id)
+    return handler
+
+
+# Реестр автоматической инвалидации справочников:
+# модель -> функция, получающая id затронутых городов (старый и новый)
+CACHE_INVALIDATION_REGISTRY = {
+    'core.Gorod': _invalidate_goroda,
+    'core.TipZayavki': lambda gorod_ids: ReferenceDataCache.invalidate_tipzayavki_cache(),
+    'core.TipTranzakcii': lambda gorod_ids: ReferenceDataCache.invalidate_tiptranzakcii_cache(),
+    'core.RK': _per_city(ReferenceDataCache.invalidate_rk_cache),
+    'core.Master': _per_city(ReferenceDataCache.invalidate_master_cache),
+    'core.PhoneGoroda': _per_city(ReferenceDataCache.invalidate_phonegoroda_cache),
+}
+
+
+def register_cache_invalidation(model_label: str, handler):
+    """Регистрирует функцию инвалидации кэша для модели ('app.Model')."""
+    CACHE_INVALIDATION_REGISTRY[model_label] = handler
+
+
+def _schedule_invalidation(instance, gorod_ids):
+    handler = CACHE_INVALIDATION_REGISTRY.get(instance._meta.label)
+    if handler is None:
+        return
+    gorod_ids = {gorod_id for gorod_id in gorod_ids if gorod_id}
+    # Инвалидируем после коммита, чтобы параллельный запрос не закэшировал
+    # данные, прочитанные до фиксации транзакции
+    from django.db import transaction
+    transaction.on_commit(lambda: handler(gorod_ids))
+
+
+def _cache_pre_save(sender, instance, raw=False, **kwargs):
+    if raw or instance._meta.label not in CACHE_INVALIDATION_REGISTRY:
+        return
+    instance._cache_previous_gorod_id = None
+    if instance.pk and hasattr(instance, 'gorod_id'):
+        instance._cache_previous_gorod_id = (
+            sender._default_manager.filter(pk=instance.pk).values_list('gorod_id', flat=True).first()
+        )
+
+
+def _cache_post_save(sender, instance, raw=False, **kwargs):
+    if raw or instance._meta.label not in CACHE_INVALIDATION_REGISTRY:
+        return
+    _schedule_invalidation(instance, {
+        getattr(instance, 'gorod_id', None),
+        getattr(instance, '_cache_previous_gorod_id', None),
+    })
+
+
+def _cache_post_delete(sender, instance, **kwargs):
+    if instance._meta.label not in CACHE_INVALIDATION_REGISTRY:
+        return
+    _schedule_invalidation(instance, {getattr(instance, 'gorod_id', None)})
+
+
+def connect_cache_invalidation():
+    """Подключает сигналы инвалидации (вызывается из CoreConfig.ready)."""
+    from django.db.models.signals import pre_save, post_save, post_delete
+    pre_save.connect(_cache_pre_save, dispatch_uid='crm_cache_pre_save')
+    post_save.connect(_cache_post_save, dispatch_uid='crm_cache_post_save')
+    post_delete.connect(_cache_post_delete, dispatch_uid='crm_cache_post_delete')
+
 # Функции для кэширования пользовательских данных
 class UserDataCache:
     """Кэширование данных пользователей."""
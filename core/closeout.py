@@ -0,0 +1,236 @@
+"""
+Закрытие и пакетное изменение заявок: смена статуса/мастера, выплата
+мастеру и приход в кассу города.
+
+Всё выполняется в одной транзакции и пачкой: несколько запросов на любое
+число заявок. Повторное закрытие идемпотентно — выплата уникальна по
+заявке (OneToOne), приход — по паре (заявка, тип транзакции).
+"""
+
+import logging
+
+from django.db import transaction
+
+from .models import Master, MasterPayout, TipTranzakcii, Tranzakcii, Zayavki
+from .data_versions import schedule_data_version_bump
+from .live_feed import schedule_feed_publish
+from .ledger import add_delta, apply_deltas
+from .reports import schedule_report_invalidation
+from .rollups import schedule_refresh_for
+
+logger = logging.getLogger(__name__)
+
+# Статусы, при которых мастеру начисляется выплата
+PAYOUT_STATUSES = ('Готово', 'Модерн')
+# Статус, при котором в кассу города записывается приход
+INCOME_STATUS = 'Готово'
+INCOME_TIP_NAME = 'Приход'
+CLOSE_FIELDS = ('status', 'itog', 'rashod', 'comment_master')
+MAX_BULK_CLOSE = 500
+MAX_BULK_UPDATE = 500
+
+
+def needs_payout(zayavka):
+    return (
+        zayavka.status in PAYOUT_STATUSES
+        and zayavka.master_id is not None
+        and zayavka.chistymi is not None
+        and zayavka.chistymi > 0
+    )
+
+
+def needs_income(zayavka):
+    return (
+        zayavka.status == INCOME_STATUS
+        and zayavka.master_id is not None
+        and zayavka.itog is not None
+        and zayavka.rashod is not None
+        and zayavka.chistymi is not None
+        and zayavka.sdacha_mastera is not None
+    )
+
+
+def sync_payouts(zayavki):
+    """
+    Создаёт или обновляет выплаты мастерам по закрытым заявкам.
+    Не более трёх запросов: выборка, вставка новых, обновление сумм.
+    """
+    due = {z.id: z.chistymi for z in zayavki if needs_payout(z)}
+    if not due:
+        return 0
+    existing = {p.zayavka_id: p for p in MasterPayout.objects.filter(zayavka_id__in=due)}
+
+    to_create = [
+        MasterPayout(zayavka_id=zayavka_id, summa=summa, status='pending')
+        for zayavka_id, summa in due.items() if zayavka_id not in existing
+    ]
+    to_update = []
+    for zayavka_id, payout in existing.items():
+        if payout.summa != due[zayavka_id]:
+            payout.summa = due[zayavka_id]
+            to_update.append(payout)
+
+    if to_create:
+        MasterPayout.objects.bulk_create(to_create, ignore_conflicts=True)
+    if to_update:
+        MasterPayout.objects.bulk_update(to_update, ['summa'])
+    return len(to_create) + len(to_update)
+
+
+def get_income_tip_id():
+    return TipTranzakcii.objects.filter(name=INCOME_TIP_NAME).values_list('id', flat=True).first()
+
+
+def record_income(zayavki, tip_id=None):
+    """
+    Записывает приход по закрытым заявкам (сумма — сдача мастера).
+    Существующий приход по заявке обновляется, а не дублируется.
+    """
+    due = {z.id: z for z in zayavki if needs_income(z)}
+    if not due:
+        return 0
+    tip_id = tip_id or get_income_tip_id()
+    if tip_id is None:
+        logger.warning(f'Тип транзакции "{INCOME_TIP_NAME}" не найден, приход не записан')
+        return 0
+
+    existing = {
+        t.zayavka_id: t
+        for t in Tranzakcii.objects.filter(zayavka_id__in=due, tip_tranzakcii_id=tip_id)
+    }
+    to_create = [
+        Tranzakcii(
+            gorod_id=zayavka.gorod_id,
+            tip_tranzakcii_id=tip_id,
+            summa=zayavka.sdacha_mastera,
+            note=f'Приход по Заявке "{zayavka.id}"',
+            zayavka_id=zayavka.id,
+        )
+        for zayavka_id, zayavka in due.items() if zayavka_id not in existing
+    ]
+    to_update = []
+    # bulk-операции не вызывают сигналы — дельты баланса кассы считаем сами
+    deltas = {}
+    for tranzakciya in to_create:
+        add_delta(deltas, tranzakciya.gorod_id, 'income', tranzakciya.summa)
+    for zayavka_id, tranzakciya in existing.items():
+        if tranzakciya.summa != due[zayavka_id].sdacha_mastera:
+            add_delta(deltas, tranzakciya.gorod_id, 'income', due[zayavka_id].sdacha_mastera - tranzakciya.summa)
+            tranzakciya.summa = due[zayavka_id].sdacha_mastera
+            to_update.append(tranzakciya)
+
+    if to_create:
+        Tranzakcii.objects.bulk_create(to_create, ignore_conflicts=True)
+    if to_update:
+        Tranzakcii.objects.bulk_update(to_update, ['summa'])
+        # Сумма прихода могла измениться в закрытом периоде — сбрасываем отчёты
+        schedule_report_invalidation({t.gorod_id for t in to_update})
+    apply_deltas(deltas)
+    return len(to_create) + len(to_update)
+
+
+def lock_zayavki(ids, queryset=None):
+    """Блокирует заявки из выборки (права по городу — одним запросом)"""
+    queryset = queryset if queryset is not None else Zayavki.objects.all()
+    return list(
+        queryset.select_related(None).prefetch_related(None)
+        .select_for_update()
+        .filter(id__in=ids).order_by('id')
+    )
+
+
+def close_zayavki(items, queryset=None):
+    """
+    Закрывает пачку заявок.
+
+    Args:
+        items: список словарей {'id', 'status', 'itog', 'rashod', 'comment_master'};
+            отсутствующие ключи не меняют поле заявки
+        queryset: базовая выборка заявок (например, ограниченная городом)
+
+    Returns:
+        dict: {'closed': [id], 'not_found': [id], 'payouts': n, 'income': n}
+    """
+    changes = {item['id']: item for item in items}
+
+    with transaction.atomic():
+        zayavki = lock_zayavki(changes, queryset)
+        for zayavka in zayavki:
+            for field in CLOSE_FIELDS:
+                if field in changes[zayavka.id]:
+                    setattr(zayavka, field, changes[zayavka.id][field])
+            zayavka.recalculate_totals()
+
+        if zayavki:
+            Zayavki.objects.bulk_update(
+                zayavki, list(CLOSE_FIELDS) + ['chistymi', 'sdacha_mastera']
+            )
+            # bulk_update не вызывает сигналы — агрегаты и версию данных обновляем явно
+            schedule_refresh_for(zayavki)
+            schedule_data_version_bump({zayavka.gorod_id for zayavka in zayavki})
+            schedule_feed_publish(zayavki)
+        payouts = sync_payouts(zayavki)
+        income = record_income(zayavki)
+
+    closed = [zayavka.id for zayavka in zayavki]
+    return {
+        'closed': closed,
+        'not_found': sorted(set(changes) - set(closed)),
+        'payouts': payouts,
+        'income': income,
+    }
+
+
+def update_zayavki(items, queryset=None):
+    """
+    Пакетная смена статуса и/или мастера.
+
+    Args:
+        items: список словарей {'id', 'status', 'master'}; master=None снимает
+            мастера, отсутствующий ключ поле не меняет
+        queryset: базовая выборка заявок (например, ограниченная городом)
+
+    Мастер должен быть активен и работать в городе заявки, иначе заявка
+    пропускается и попадает в invalid_master.
+
+    Returns:
+        dict: {'updated': [id], 'not_found': [id], 'invalid_master': [id],
+               'payouts': n, 'income': n}
+    """
+    changes = {item['id']: item for item in items}
+    master_ids = {item['master'] for item in items if item.get('master')}
+
+    with transaction.atomic():
+        zayavki = lock_zayavki(changes, queryset)
+        master_cities = dict(
+            Master.objects.filter(id__in=master_ids, is_active=True).values_list('id', 'gorod_id')
+        ) if master_ids else {}
+
+        updated, invalid_master = [], []
+        for zayavka in zayavki:
+            change = changes[zayavka.id]
+            if change.get('master') and master_cities.get(change['master']) != zayavka.gorod_id:
+                invalid_master.append(zayavka.id)
+                continue
+            if 'status' in change:
+                zayavka.status = change['status']
+            if 'master' in change:
+                zayavka.master_id = change['master']
+            updated.append(zayavka)
+
+        if updated:
+            Zayavki.objects.bulk_update(updated, ['status', 'master'])
+            schedule_refresh_for(updated)
+            schedule_data_version_bump({zayavka.gorod_id for zayavka in updated})
+            schedule_feed_publish(updated)
+        payouts = sync_payouts(updated)
+        income = record_income(updated)
+
+    found = {zayavka.id for zayavka in zayavki}
+    return {
+        'updated': [zayavka.id for zayavka in updated],
+        'not_found': sorted(set(changes) - found),
+        'invalid_master': invalid_master,
+        'payouts': payouts,
+        'income': income,
+    }
@@ -0,0 +1,65 @@
+"""
+Версии данных городов для условных GET-запросов.
+
+Версия города — поколения префикса ``data:gorod:<id>`` в CacheManager и
+справочников, названия из которых попадают в ответы (мастера, РК, типы
+заявок). Она поднимается после коммита при записи Zayavki и MasterPayout,
+поэтому ETag списка вычисляется без запросов к БД и сериализации
+(см. views.base.ConditionalListMixin).
+"""
+
+from django.db import transaction
+
+from .cache import CacheManager, ReferenceDataCache, register_cache_invalidation
+from .models import MasterPayout, Zayavki
+
+
+def data_scope_key(gorod_id=None):
+    """Префикс данных города (None — пользователи без города видят все города)"""
+    return f"data:gorod:{gorod_id}" if gorod_id else "data:all"
+
+
+def data_version(gorod_id=None):
+    """Текущая версия данных, видимых пользователю города"""
+    return CacheManager.get_version(
+        data_scope_key(gorod_id),
+        ReferenceDataCache.get_master_cache_key(gorod_id),
+        ReferenceDataCache.get_rk_cache_key(gorod_id),
+        ReferenceDataCache.get_tipzayavki_cache_key(),
+    )
+
+
+def bump_data_version(gorod_ids):
+    """Поднимает версию городов и общую версию (для пользователей без города)"""
+    for gorod_id in gorod_ids:
+        CacheManager.clear_pattern(data_scope_key(gorod_id))
+    CacheManager.clear_pattern(data_scope_key())
+
+
+def schedule_data_version_bump(gorod_ids):
+    """Версия поднимается после коммита — для путей без сигналов (bulk_update)"""
+    gorod_ids = {gorod_id for gorod_id in gorod_ids if gorod_id}
+    if gorod_ids:
+        transaction.on_commit(lambda: bump_data_version(gorod_ids))
+
+
+def _payout_gorod_id(payout):
+    if MasterPayout.zayavka.is_cached(payout):
+        return payout.zayavka.gorod_id
+    return Zayavki.objects.filter(pk=payout.zayavka_id).values_list('gorod_id', flat=True).first()
+
+
+def _payout_changed(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    schedule_data_version_bump({_payout_gorod_id(instance)})
+
+
+def connect_data_versions():
+    """Поднимает версию при записи заявок и выплат (вызывается из CoreConfig.ready)"""
+    from django.db.models.signals import post_save, post_delete
+    # Заявка: старый и новый город передаёт реестр инвалидации core.cache
+    register_cache_invalidation('core.Zayavki', bump_data_version)
+    # У выплаты нет gorod_id — город берётся из заявки
+    post_save.connect(_payout_changed, sender=MasterPayout, dispatch_uid='crm_data_version_payout_save')
+    post_delete.connect(_payout_changed, sender=MasterPayout, dispatch_uid='crm_data_version_payout_delete')
@@ -0,0 +1,88 @@
+"""
+Потоковая выгрузка данных в CSV / NDJSON с постоянным потреблением памяти
+"""
+
+import csv
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+
+# Размер порции, которую server-side курсор забирает из БД за один раз
+EXPORT_CHUNK_SIZE = 2000
+
+ZAYAVKI_EXPORT_FIELDS = [
+    ('id', 'ID'),
+    ('meeting_date', 'Дата встречи'),
+    ('status', 'Статус'),
+    ('gorod__name', 'Город'),
+    ('rk__rk_name', 'РК'),
+    ('tip_zayavki__name', 'Тип заявки'),
+    ('master__name', 'Мастер'),
+    ('client_name', 'Имя клиента'),
+    ('phone_client', 'Телефон клиента'),
+    ('phone_atc', 'Телефон ATC'),
+    ('address', 'Адрес'),
+    ('tip_techniki', 'Тип техники'),
+    ('problema', 'Проблема'),
+    ('itog', 'Итог'),
+    ('rashod', 'Расход'),
+    ('chistymi', 'Чистыми'),
+    ('sdacha_mastera', 'Сдача мастера'),
+    ('comment_master', 'Комментарий мастера'),
+    ('kc_name', 'Имя КЦ'),
+    ('comment_kc', 'Комментарий КЦ'),
+]
+
+
+class _Echo:
+    """Псевдо-буфер: csv.writer пишет строку и сразу получает её обратно"""
+
+    def write(self, value):
+        return value
+
+
+def _iter_rows(queryset, fields):
+    """Итерирует строки через server-side курсор, без создания моделей"""
+    rows = queryset.values(*fields).iterator(chunk_size=EXPORT_CHUNK_SIZE)
+    for row in rows:
+        for key, value in row.items():
+            if hasattr(value, 'tzinfo') and value.tzinfo is not None:
+                row[key] = timezone.localtime(value)
+        yield row
+
+
+def iter_csv(queryset, fields):
+    writer = csv.writer(_Echo())
+    # BOM, чтобы Excel корректно открывал кириллицу
+    yield '\ufeff' + writer.writerow([title for _, title in fields])
+    names = [name for name, _ in fields]
+    for row in _iter_rows(queryset, names):
+        yield writer.writerow([
+            '' if row[name] is None else (row[name].isoformat() if hasattr(row[name], 'isoformat') else row[name])
+            for name in names
+        ])
+
+
+def iter_ndjson(queryset, fields):
+    names = [name for name, _ in fields]
+    for row in _iter_rows(queryset, names):
+        yield json.dumps(row, cls=DjangoJSONEncoder, ensure_ascii=False) + '\n'
+
+
+EXPORT_FORMATS = {
+    'csv': (iter_csv, 'text/csv; charset=utf-8'),
+    'ndjson': (iter_ndjson, 'application/x-ndjson; charset=utf-8'),
+}
+
+
+def streaming_export_response(queryset, fields, export_format, filename):
+    """
+    Возвращает StreamingHttpResponse, который начинает отдавать данные сразу,
+    не загружая всю выборку в память.
+    """
+    generator, content_type = EXPORT_FORMATS[export_format]
+    response = StreamingHttpResponse(generator(queryset, fields), content_type=content_type)
+    response['Content-Disposition'] = f'attachment; filename="{filename}.{export_format}"'
+    return response
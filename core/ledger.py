@@ -0,0 +1,185 @@
+"""
+Баланс кассы городов (GorodBalance) и его снимки на конец дня.
+
+Баланс меняется в той же транзакции, что и запись Tranzakcii: сигналы
+сохранения/удаления применяют дельту к строке города через F-выражения,
+поэтому чтение баланса — один запрос по индексу, независимо от истории.
+Баланс = Приход − Расход, остальные типы транзакций на него не влияют.
+"""
+
+import logging
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db import IntegrityError, transaction
+from django.db.models import F, Max, Q, Sum
+from django.utils import timezone
+
+from .models import GorodBalance, GorodBalanceSnapshot, TipTranzakcii, Tranzakcii
+
+logger = logging.getLogger(__name__)
+
+INCOME_TIP_NAME = 'Приход'
+EXPENSE_TIP_NAME = 'Расход'
+ZERO = Decimal('0')
+
+
+def _tip_kinds(tip_ids):
+    """{tip_id: 'income' | 'expense'} для типов, влияющих на баланс"""
+    names = dict(TipTranzakcii.objects.filter(id__in=set(tip_ids)).values_list('id', 'name'))
+    kinds = {INCOME_TIP_NAME: 'income', EXPENSE_TIP_NAME: 'expense'}
+    return {tip_id: kinds[name] for tip_id, name in names.items() if name in kinds}
+
+
+def add_delta(deltas, gorod_id, kind, amount):
+    """Добавляет сумму к дельте города (kind — 'income' или 'expense')"""
+    delta = deltas.setdefault(gorod_id, {'income': ZERO, 'expense': ZERO})
+    delta[kind] += Decimal(amount)
+
+
+def collect_deltas(rows):
+    """
+    Дельты балансов по строкам (gorod_id, tip_id, summa, sign).
+    Returns: {gorod_id: {'income': Decimal, 'expense': Decimal}}
+    """
+    rows = [row for row in rows if row[0] and row[1]]
+    kinds = _tip_kinds(row[1] for row in rows)
+    deltas = {}
+    for gorod_id, tip_id, summa, sign in rows:
+        kind = kinds.get(tip_id)
+        if kind is not None and summa:
+            add_delta(deltas, gorod_id, kind, Decimal(summa) * sign)
+    return deltas
+
+
+def apply_deltas(deltas, create=True):
+    """
+    Применяет дельты к балансам (вызывать внутри транзакции записи).
+    create=False — не создавать отсутствующую строку (удаление, в том числе
+    каскадное при удалении города).
+    """
+    for gorod_id, delta in deltas.items():
+        income, expense = delta['income'], delta['expense']
+        if not income and not expense:
+            continue
+        changes = dict(
+            income=F('income') + income,
+            expense=F('expense') + expense,
+            balance=F('balance') + income - expense,
+            updated_at=timezone.now(),
+        )
+        if GorodBalance.objects.filter(gorod_id=gorod_id).update(**changes) or not create:
+            continue
+        # Строки ещё нет — считаем баланс по всей истории (включая текущую запись)
+        try:
+            with transaction.atomic():
+                rebuild_balance(gorod_id)
+        except IntegrityError:
+            # Строку создал параллельный запрос, не видевший нашей записи
+            GorodBalance.objects.filter(gorod_id=gorod_id).update(**changes)
+
+
+def _totals(queryset):
+    """{gorod_id: {'income', 'expense'}} по выборке транзакций одним запросом"""
+    rows = queryset.order_by().values('gorod_id').annotate(
+        income=Sum('summa', filter=Q(tip_tranzakcii__name=INCOME_TIP_NAME)),
+        expense=Sum('summa', filter=Q(tip_tranzakcii__name=EXPENSE_TIP_NAME)),
+    )
+    return {
+        row['gorod_id']: {'income': row['income'] or ZERO, 'expense': row['expense'] or ZERO}
+        for row in rows
+    }
+
+
+def rebuild_balance(gorod_id=None):
+    """Пересчитывает баланс города (или всех городов) по истории транзакций"""
+    queryset = Tranzakcii.objects.all()
+    if gorod_id:
+        queryset = queryset.filter(gorod_id=gorod_id)
+    totals = _totals(queryset)
+    if gorod_id:
+        totals.setdefault(gorod_id, {'income': ZERO, 'expense': ZERO})
+    for city_id, total in totals.items():
+        GorodBalance.objects.update_or_create(
+            gorod_id=city_id,
+            defaults={**total, 'balance': total['income'] - total['expense']},
+        )
+    return len(totals)
+
+
+def take_snapshots(day=None):
+    """
+    Снимки баланса на конец дня (по умолчанию — вчера) для всех городов:
+    последний предыдущий снимок города плюс движения после него.
+    """
+    day = day or timezone.localdate() - timedelta(days=1)
+    last_dates = dict(
+        GorodBalanceSnapshot.objects.filter(date__lt=day)
+        .values('gorod_id').annotate(last=Max('date')).values_list('gorod_id', 'last')
+    )
+    previous = {}
+    if last_dates:
+        condition = Q()
+        for gorod_id, last in last_dates.items():
+            condition |= Q(gorod_id=gorod_id, date=last)
+        previous = dict(GorodBalanceSnapshot.objects.filter(condition).values_list('gorod_id', 'balance'))
+
+    # Движения каждого города после его последнего снимка — одним запросом
+    since = ~Q(gorod_id__in=list(last_dates))
+    for gorod_id, last in last_dates.items():
+        since |= Q(gorod_id=gorod_id, date__gt=last)
+    movements = _totals(Tranzakcii.objects.filter(since, date__lte=day))
+    day_totals = _totals(Tranzakcii.objects.filter(date=day))
+
+    empty = {'income': ZERO, 'expense': ZERO}
+    snapshots = []
+    for gorod_id in set(previous) | set(movements):
+        movement = movements.get(gorod_id, empty)
+        snapshots.append(GorodBalanceSnapshot(
+            gorod_id=gorod_id,
+            date=day,
+            income=day_totals.get(gorod_id, empty)['income'],
+            expense=day_totals.get(gorod_id, empty)['expense'],
+            balance=previous.get(gorod_id, ZERO) + movement['income'] - movement['expense'],
+        ))
+    GorodBalanceSnapshot.objects.bulk_create(
+        snapshots,
+        update_conflicts=True,
+        unique_fields=['gorod', 'date'],
+        update_fields=['income', 'expense', 'balance', 'created_at'],
+    )
+    return len(snapshots)
+
+
+def _remember_old_row(sender, instance, raw=False, **kwargs):
+    if raw or instance.pk is None:
+        return
+    instance._ledger_old_row = (
+        Tranzakcii.objects.filter(pk=instance.pk)
+        .values_list('gorod_id', 'tip_tranzakcii_id', 'summa').first()
+    )
+
+
+def _tranzakciya_saved(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    rows = [(instance.gorod_id, instance.tip_tranzakcii_id, instance.summa, 1)]
+    old_row = instance.__dict__.pop('_ledger_old_row', None)
+    if old_row:
+        rows.append((*old_row, -1))
+    apply_deltas(collect_deltas(rows))
+
+
+def _tranzakciya_deleted(sender, instance, **kwargs):
+    apply_deltas(
+        collect_deltas([(instance.gorod_id, instance.tip_tranzakcii_id, instance.summa, -1)]),
+        create=False,
+    )
+
+
+def connect_balance_updates():
+    """Ведёт баланс городов при сохранении/удалении транзакций"""
+    from django.db.models.signals import pre_save, post_save, post_delete
+    pre_save.connect(_remember_old_row, sender=Tranzakcii, dispatch_uid='crm_ledger_pre_save')
+    post_save.connect(_tranzakciya_saved, sender=Tranzakcii, dispatch_uid='crm_ledger_save')
+    post_delete.connect(_tranzakciya_deleted, sender=Tranzakcii, dispatch_uid='crm_ledger_delete')
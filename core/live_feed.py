@@ -0,0 +1,279 @@
+"""
+Лента изменений заявок для операторов КЦ (server-sent events).
+
+После коммита запись заявки (сигналы, создание из Mango, пакетные
+closeout) публикуется одним событием в поток города: Redis Stream
+``crm:feed:zayavki:gorod:<id>`` (XADD с ограничением длины). Каждое
+SSE-подключение читает поток через XREAD BLOCK, поэтому подключённые
+операторы не создают запросов к БД, а переподключение с Last-Event-ID
+продолжает с пропущенного события. Без REDIS_URL поток хранится в памяти
+процесса (разработка и тесты).
+
+Ответ потоковый и асинхронный — эндпоинт нужно обслуживать через ASGI
+(panel.asgi); при запуске через WSGI он отвечает 501.
+"""
+
+import asyncio
+import json
+import logging
+import threading
+from collections import deque
+
+from django.conf import settings
+from django.db import transaction
+from rest_framework.utils.encoders import JSONEncoder
+
+from .models import Zayavki
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_FEED_SETTINGS = {
+    'ENABLED': True,
+    'MAXLEN': 1000,        # Событий в потоке города (глубина возобновления)
+    'BLOCK_SECONDS': 15,   # Ожидание события до heartbeat-комментария
+    'READ_COUNT': 100,     # Событий за одно чтение
+    'POLL_INTERVAL': 0.5,  # Период опроса потока в памяти, секунд
+    'RETRY_MS': 3000,      # Пауза перед переподключением EventSource
+    'SOCKET_TIMEOUT': 2,   # Таймаут подключения и команд Redis, секунд
+}
+FEED_RELATED = ('gorod', 'master', 'rk', 'tip_zayavki')
+START_ID = '0-0'
+
+
+def feed_settings():
+    return {**DEFAULT_FEED_SETTINGS, **getattr(settings, 'ZAYAVKI_FEED', {})}
+
+
+def stream_key(gorod_id):
+    return f"crm:feed:zayavki:gorod:{gorod_id}"
+
+
+def parse_event_id(event_id):
+    """'1700000000000-3' -> (1700000000000, 3); некорректный id -> None"""
+    ms, _, seq = str(event_id or '').partition('-')
+    try:
+        return int(ms), int(seq or 0)
+    except ValueError:
+        return None
+
+
+def format_event(event_id, event, data):
+    """Событие в формате text/event-stream"""
+    lines = [f"id: {event_id}", f"event: {event}"]
+    lines.extend(f"data: {line}" for line in data.splitlines() or [''])
+    return ('\n'.join(lines) + '\n\n').encode('utf-8')
+
+
+def dump_payload(data):
+    return json.dumps(data, cls=JSONEncoder, ensure_ascii=False)
+
+
+class MemoryFeedBackend:
+    """Потоки в памяти процесса: события видны только его подключениям"""
+
+    def __init__(self):
+        self._streams = {}
+        self._counter = 0
+        self._lock = threading.Lock()
+
+    def add(self, key, events, maxlen):
+        with self._lock:
+            stream = self._streams.setdefault(key, deque(maxlen=maxlen))
+            for event, data in events:
+                self._counter += 1
+                stream.append((f"{self._counter}-0", event, data))
+
+    def first_id(self, key):
+        with self._lock:
+            stream = self._streams.get(key)
+            return stream[0][0] if stream else None
+
+    def last_id(self, key):
+        with self._lock:
+            stream = self._streams.get(key)
+            return stream[-1][0] if stream else START_ID
+
+    def _after(self, key, after, count):
+        position = parse_event_id(after)
+        with self._lock:
+            events = [item for item in self._streams.get(key, ()) if parse_event_id(item[0]) > position]
+        return events[:count]
+
+    def reader(self):
+        return self
+
+    async def read(self, key, after, block_seconds, count):
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + block_seconds
+        while True:
+            events = self._after(key, after, count)
+            if events or loop.time() >= deadline:
+                return events
+            await asyncio.sleep(feed_settings()['POLL_INTERVAL'])
+
+    async def aclose(self):
+        pass
+
+
+class RedisFeedBackend:
+    """Redis Streams: общий поток для всех воркеров"""
+
+    def __init__(self, url):
+        self.url = url
+        self._client = None
+
+    def _get_client(self):
+        if self._client is None:
+            import redis
+            timeout = feed_settings()['SOCKET_TIMEOUT']
+            # Зависший Redis не держит запись заявки: publish получит ошибку и пропустит событие
+            self._client = redis.Redis.from_url(
+                self.url, decode_responses=True, socket_timeout=timeout, socket_connect_timeout=timeout
+            )
+        return self._client
+
+    def add(self, key, events, maxlen):
+        pipe = self._get_client().pipeline(transaction=False)
+        for event, data in events:
+            pipe.xadd(key, {'event': event, 'data': data}, maxlen=maxlen, approximate=True)
+        pipe.execute()
+
+    def first_id(self, key):
+        entries = self._get_client().xrange(key, count=1)
+        return entries[0][0] if entries else None
+
+    def last_id(self, key):
+        entries = self._get_client().xrevrange(key, count=1)
+        return entries[0][0] if entries else START_ID
+
+    def reader(self):
+        return RedisFeedReader(self.url)
+
+
+class RedisFeedReader:
+    """Чтение потока одним подключением (своё соединение на время XREAD BLOCK)"""
+
+    def __init__(self, url):
+        import redis.asyncio
+        config = feed_settings()
+        # XREAD BLOCK законно молчит до BLOCK_SECONDS, поэтому таймаут чтения больше него
+        self.client = redis.asyncio.Redis.from_url(
+            url,
+            decode_responses=True,
+            socket_timeout=config['BLOCK_SECONDS'] + config['SOCKET_TIMEOUT'],
+            socket_connect_timeout=config['SOCKET_TIMEOUT'],
+        )
+
+    async def read(self, key, after, block_seconds, count):
+        response = await self.client.xread({key: after}, count=count, block=int(block_seconds * 1000))
+        return [
+            (event_id, fields.get('event', 'updated'), fields.get('data', ''))
+            for _, entries in response or []
+            for event_id, fields in entries
+        ]
+
+    async def aclose(self):
+        await self.client.aclose()
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_backend():
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                redis_url = getattr(settings, 'REDIS_URL', None)
+                _backend = RedisFeedBackend(redis_url) if redis_url else MemoryFeedBackend()
+    return _backend
+
+
+def publish(gorod_id, events):
+    """Добавляет события [(тип, json)] в поток города"""
+    if not gorod_id or not events:
+        return
+    try:
+        get_backend().add(stream_key(gorod_id), events, feed_settings()['MAXLEN'])
+    except Exception as e:
+        # Лента вспомогательная: её сбой не должен ломать запись заявки
+        logger.error(f"Ошибка публикации в ленту заявок города {gorod_id}: {e}")
+
+
+def publish_zayavki(ids, event):
+    """Публикует заявки (одним запросом) в потоки их городов"""
+    from .serializers import ZayavkiSerializer
+    by_city = {}
+    for zayavka in Zayavki.objects.select_related(*FEED_RELATED).filter(id__in=ids).order_by('id'):
+        payload = dump_payload({'id': zayavka.id, 'zayavka': ZayavkiSerializer(zayavka).data})
+        by_city.setdefault(zayavka.gorod_id, []).append((event, payload))
+    for gorod_id, events in by_city.items():
+        publish(gorod_id, events)
+
+
+def schedule_feed_publish(zayavki, event='updated'):
+    """Публикация после коммита — для путей без сигналов (bulk_update)"""
+    if not feed_settings()['ENABLED']:
+        return
+    ids = [zayavka.id for zayavka in zayavki]
+    if ids:
+        transaction.on_commit(lambda: publish_zayavki(ids, event))
+
+
+def resume_id(gorod_id, last_event_id):
+    """
+    Позиция, с которой продолжить поток, или None, если клиенту нужен
+    снимок: id не передан, некорректен, уже вытеснен из потока или поток
+    начат заново (перезапуск хранилища).
+    """
+    position = parse_event_id(last_event_id)
+    if position is None:
+        return None
+    backend = get_backend()
+    key = stream_key(gorod_id)
+    first_id = backend.first_id(key)
+    if first_id is not None and position < parse_event_id(first_id):
+        return None
+    if position > parse_event_id(backend.last_id(key)):
+        return None
+    return last_event_id
+
+
+async def event_stream(gorod_id, after, initial=b''):
+    """SSE-поток города: initial, затем события после after и heartbeat"""
+    config = feed_settings()
+    yield f"retry: {config['RETRY_MS']}\n\n".encode('utf-8') + initial
+    reader = get_backend().reader()
+    key = stream_key(gorod_id)
+    try:
+        while True:
+            events = await reader.read(key, after, config['BLOCK_SECONDS'], config['READ_COUNT'])
+            if not events:
+                yield b': ping\n\n'
+                continue
+            for event_id, event, data in events:
+                after = event_id
+                yield format_event(event_id, event, data)
+    finally:
+        await reader.aclose()
+
+
+def _zayavka_saved(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    schedule_feed_publish([instance], 'created' if created else 'updated')
+
+
+def _zayavka_deleted(sender, instance, **kwargs):
+    if not feed_settings()['ENABLED']:
+        return
+    gorod_id, payload = instance.gorod_id, dump_payload({'id': instance.id})
+    transaction.on_commit(lambda: publish(gorod_id, [('deleted', payload)]))
+
+
+def connect_zayavki_feed():
+    """Публикует изменения заявок в ленту (вызывается из CoreConfig.ready)"""
+    from django.db.models.signals import post_save, post_delete
+    post_save.connect(_zayavka_saved, sender=Zayavki, dispatch_uid='crm_feed_zayavka_save')
+    post_delete.connect(_zayavka_deleted, sender=Zayavki, dispatch_uid='crm_feed_zayavka_delete')
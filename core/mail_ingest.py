@@ -0,0 +1,467 @@
+"""
+Инкрементальная загрузка аудиозаписей Mango Office из почты (IMAP).
+
+Одно долгоживущее соединение на процесс, новые письма определяются по
+UID относительно сохранённой в БД позиции (MailSyncCheckpoint). Сначала
+запрашиваются только ENVELOPE и BODYSTRUCTURE, затем — лишь аудиочасти
+нужных писем, без скачивания писем целиком.
+"""
+
+import base64
+import binascii
+import imaplib
+import logging
+import quopri
+import re
+import select
+import threading
+import time
+from datetime import datetime, timedelta
+from email.header import decode_header, make_header
+from email.utils import collapse_rfc2231_value, decode_rfc2231
+
+from django.conf import settings
+from django.db import close_old_connections
+
+from .models import MailSyncCheckpoint
+
+logger = logging.getLogger(__name__)
+
+AUDIO_EXTENSIONS = ('.wav', '.mp3', '.ogg', '.m4a', '.aac')
+
+# Сервер разрывает IDLE через 30 минут — переподписываемся раньше
+IDLE_TIMEOUT = 25 * 60
+FETCH_BATCH_SIZE = 50
+# Сколько раз повторять письмо, обработчик которого упал, прежде чем пропустить
+MAX_MESSAGE_ATTEMPTS = 5
+
+
+# --- Разбор ответов FETCH -------------------------------------------------
+
+_OPEN = object()
+_CLOSE = object()
+_TOKEN_RE = re.compile(rb'\s*(?:(\()|(\))|"((?:[^"\\]|\\.)*)"|([^\s()"]+))')
+_LITERAL_RE = re.compile(rb'^\{(\d+)\}$')
+
+
+def _tokenize_line(line):
+    tokens = []
+    position = 0
+    while position < len(line):
+        match = _TOKEN_RE.match(line, position)
+        if not match or match.end() == position:
+            break
+        position = match.end()
+        if match.group(1):
+            tokens.append(_OPEN)
+        elif match.group(2):
+            tokens.append(_CLOSE)
+        elif match.group(3) is not None:
+            tokens.append(re.sub(rb'\\(.)', rb'\1', match.group(3)))
+        elif match.group(4):
+            atom = match.group(4)
+            tokens.append(None if atom.upper() == b'NIL' else atom)
+    return tokens
+
+
+def parse_fetch_response(data):
+    """
+    Разбирает ответ imaplib на FETCH в список (uid, {атрибут: значение}).
+    Литералы {n} подставляются как строки.
+    """
+    tokens = []
+    for item in data:
+        if item is None:
+            continue
+        if isinstance(item, tuple):
+            head, literal = item
+            head_tokens = _tokenize_line(head)
+            if head_tokens and isinstance(head_tokens[-1], bytes) and _LITERAL_RE.match(head_tokens[-1]):
+                head_tokens[-1] = literal
+            tokens.extend(head_tokens)
+        else:
+            tokens.extend(_tokenize_line(item))
+
+    stack = [[]]
+    for token in tokens:
+        if token is _OPEN:
+            stack.append([])
+        elif token is _CLOSE:
+            if len(stack) > 1:
+                closed = stack.pop()
+                stack[-1].append(closed)
+        else:
+            stack[-1].append(token)
+
+    messages = []
+    for item in stack[0]:
+        if not isinstance(item, list):
+            continue
+        attributes = {}
+        for i in range(0, len(item) - 1, 2):
+            if isinstance(item[i], bytes):
+                attributes[item[i].decode('ascii', 'replace').upper()] = item[i + 1]
+        if 'UID' in attributes:
+            messages.append((int(attributes['UID']), attributes))
+    return messages
+
+
+def _text(value):
+    if value is None:
+        return ''
+    if isinstance(value, bytes):
+        return value.decode('utf-8', 'replace')
+    return str(value)
+
+
+def decode_mime_text(value):
+    """Декодирует RFC 2047 (=?utf-8?b?...?=)"""
+    try:
+        return str(make_header(decode_header(value)))
+    except Exception:
+        return value
+
+
+def _params(value):
+    """Список параметров IMAP ("name" "x.mp3" ...) -> dict"""
+    if not isinstance(value, list):
+        return {}
+    return {
+        _text(value[i]).lower(): _text(value[i + 1])
+        for i in range(0, len(value) - 1, 2)
+    }
+
+
+def _filename(params):
+    if 'filename*' in params:
+        return collapse_rfc2231_value(decode_rfc2231(params['filename*']))
+    for key in ('filename', 'name'):
+        if params.get(key):
+            return decode_mime_text(params[key])
+    return ''
+
+
+def find_audio_parts(structure, section=''):
+    """
+    Ищет аудиочасти в BODYSTRUCTURE.
+    Возвращает список (номер части, имя файла, кодировка передачи).
+    """
+    if not isinstance(structure, list) or not structure:
+        return []
+
+    if isinstance(structure[0], list):
+        # multipart: дочерние части идут первыми, затем подтип
+        parts = []
+        for index, child in enumerate(structure):
+            if not isinstance(child, list):
+                break
+            child_section = f'{section}.{index + 1}' if section else str(index + 1)
+            parts.extend(find_audio_parts(child, child_section))
+        return parts
+
+    main_type = _text(structure[0]).lower()
+    if main_type == 'message' or len(structure) < 7:
+        return []
+
+    params = _params(structure[2])
+    for extension in structure[7:]:
+        # Параметры Content-Disposition: ("attachment" ("filename" "..."))
+        if isinstance(extension, list) and len(extension) == 2 and isinstance(extension[1], list):
+            params = {**params, **_params(extension[1])}
+            break
+
+    filename = _filename(params)
+    if main_type == 'audio' or filename.lower().endswith(AUDIO_EXTENSIONS):
+        return [(section or '1', filename, _text(structure[5]).lower())]
+    return []
+
+
+def decode_part(payload, encoding):
+    """Декодирует содержимое части по Content-Transfer-Encoding"""
+    if encoding == 'base64':
+        try:
+            return base64.b64decode(payload)
+        except binascii.Error:
+            return base64.b64decode(payload + b'==')
+    if encoding == 'quoted-printable':
+        return quopri.decodestring(payload)
+    return payload
+
+
+class MailMessage:
+    """Сводка письма: отправитель, тема и аудиочасти (без тела)"""
+
+    def __init__(self, uid, sender, subject, audio_parts):
+        self.uid = uid
+        self.sender = sender
+        self.subject = subject
+        self.audio_parts = audio_parts
+
+    @classmethod
+    def from_fetch(cls, uid, attributes):
+        envelope = attributes.get('ENVELOPE') or []
+        subject = decode_mime_text(_text(envelope[1])) if len(envelope) > 1 else ''
+        sender = ''
+        if len(envelope) > 2 and isinstance(envelope[2], list) and envelope[2]:
+            address = envelope[2][0]
+            if isinstance(address, list) and len(address) >= 4:
+                sender = f'{_text(address[2])}@{_text(address[3])}'
+        return cls(uid, sender, subject, find_audio_parts(attributes.get('BODYSTRUCTURE')))
+
+    @property
+    def is_mango(self):
+        subject = self.subject.lower()
+        return 'mango' in self.sender.lower() or 'recording' in subject or 'запись' in subject
+
+
+# --- Соединение -----------------------------------------------------------
+
+class IMAPMailbox:
+    """Долгоживущее IMAP-соединение с переподключением при обрыве"""
+
+    def __init__(self, email_address, password, imap_server, imap_port=993, folder='INBOX'):
+        self.email_address = email_address
+        self.password = password
+        self.imap_server = imap_server
+        self.imap_port = imap_port
+        self.folder = folder
+        self.conn = None
+        self.lock = threading.RLock()
+
+    @property
+    def name(self):
+        return f'{self.email_address}@{self.imap_server}/{self.folder}'
+
+    @property
+    def supports_idle(self):
+        return self.conn is not None and 'IDLE' in self.conn.capabilities
+
+    def connect(self):
+        logger.info(f'Подключение к {self.imap_server}:{self.imap_port}')
+        self.conn = imaplib.IMAP4_SSL(self.imap_server, self.imap_port)
+        self.conn.login(self.email_address, self.password)
+
+    def reset(self):
+        """Закрывает соединение; следующее обращение переподключится"""
+        if self.conn is not None:
+            try:
+                self.conn.logout()
+            except Exception:
+                pass
+        self.conn = None
+
+    def ensure_connected(self):
+        if self.conn is not None:
+            try:
+                self.conn.noop()
+                return self.conn
+            except (imaplib.IMAP4.error, OSError):
+                logger.warning('IMAP соединение потеряно, переподключаемся')
+                self.reset()
+        self.connect()
+        return self.conn
+
+    def select(self):
+        """Выбирает папку и возвращает её UIDVALIDITY"""
+        conn = self.ensure_connected()
+        typ, _ = conn.select(self.folder, readonly=True)
+        if typ != 'OK':
+            raise imaplib.IMAP4.error(f'Не удалось открыть папку {self.folder}')
+        _, data = conn.response('UIDVALIDITY')
+        return int(data[0]) if data and data[0] else None
+
+    def _uid_search(self, *criteria):
+        typ, data = self.conn.uid('SEARCH', None, *criteria)
+        if typ != 'OK' or not data or not data[0]:
+            return []
+        return sorted(int(uid) for uid in data[0].split())
+
+    def search_uids_after(self, last_uid):
+        # "n:*" всегда возвращает хотя бы последнее письмо, поэтому фильтруем
+        return [uid for uid in self._uid_search('UID', f'{last_uid + 1}:*') if uid > last_uid]
+
+    def search_since(self, since):
+        return self._uid_search('SINCE', since.strftime('%d-%b-%Y'))
+
+    def fetch_messages(self, uids):
+        """ENVELOPE и BODYSTRUCTURE для пачки писем одним запросом"""
+        if not uids:
+            return []
+        typ, data = self.conn.uid('FETCH', ','.join(str(uid) for uid in uids), '(UID ENVELOPE BODYSTRUCTURE)')
+        if typ != 'OK':
+            return []
+        return sorted(
+            (MailMessage.from_fetch(uid, attributes) for uid, attributes in parse_fetch_response(data)),
+            key=lambda message: message.uid
+        )
+
+    def fetch_parts(self, message, parts=None):
+        """Скачивает только указанные части письма. Возвращает [(имя файла, bytes)]."""
+        parts = parts if parts is not None else message.audio_parts
+        if not parts:
+            return []
+        items = ' '.join(f'BODY.PEEK[{section}]' for section, _, _ in parts)
+        typ, data = self.conn.uid('FETCH', str(message.uid), f'(UID {items})')
+        if typ != 'OK':
+            return []
+        fetched = dict(parse_fetch_response(data)).get(message.uid, {})
+        attachments = []
+        for section, filename, encoding in parts:
+            payload = fetched.get(f'BODY[{section}]')
+            if payload:
+                attachments.append((filename, decode_part(payload, encoding)))
+        return attachments
+
+    def idle(self, timeout=IDLE_TIMEOUT):
+        """
+        IMAP IDLE (RFC 2177): ждёт уведомления о новых письмах.
+        Возвращает True, если сервер сообщил об изменениях.
+        """
+        conn = self.conn
+        tag = conn._new_tag()
+        conn.send(tag + b' IDLE\r\n')
+        if not conn.readline().startswith(b'+'):
+            self._read_until_tagged(tag)
+            return False
+
+        changed = False
+        deadline = time.monotonic() + timeout
+        try:
+            while not changed:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                readable, _, _ = select.select([conn.sock], [], [], remaining)
+                if not readable and not conn.sock.pending():
+                    break
+                line = conn.readline()
+                if not line:
+                    raise imaplib.IMAP4.abort('Соединение закрыто во время IDLE')
+                changed = b'EXISTS' in line or b'RECENT' in line
+        finally:
+            conn.send(b'DONE\r\n')
+            self._read_until_tagged(tag)
+        return changed
+
+    def _read_until_tagged(self, tag):
+        while True:
+            line = self.conn.readline()
+            if not line or line.startswith(tag):
+                return
+
+
+# --- Синхронизация --------------------------------------------------------
+
+class MailIngestor:
+    """
+    Инкрементальная синхронизация: обрабатывает письма с UID больше
+    сохранённого и передаёт аудиовложения в handler(filename, content, message).
+    Письма, на которых handler упал, запоминаются в checkpoint.failed_uids и
+    повторяются в следующих проходах (до MAX_MESSAGE_ATTEMPTS раз).
+    """
+
+    def __init__(self, mailbox, handler, lookback_hours=2, batch_size=FETCH_BATCH_SIZE):
+        self.mailbox = mailbox
+        self.handler = handler
+        self.lookback_hours = lookback_hours
+        self.batch_size = batch_size
+
+    def sync_once(self):
+        """Один проход синхронизации. Возвращает число обработанных писем Mango."""
+        with self.mailbox.lock:
+            uidvalidity = self.mailbox.select()
+            checkpoint, _ = MailSyncCheckpoint.objects.get_or_create(mailbox=self.mailbox.name)
+
+            if checkpoint.uidvalidity != uidvalidity:
+                # UID из другой «эпохи» ящика недействительны — начинаем с недавних писем
+                logger.info(f'UIDVALIDITY изменился ({checkpoint.uidvalidity} -> {uidvalidity}), начальная синхронизация')
+                uids = self.mailbox.search_since(datetime.now() - timedelta(hours=self.lookback_hours))
+                checkpoint.uidvalidity = uidvalidity
+                checkpoint.last_uid = 0
+                checkpoint.failed_uids = {}
+                checkpoint.save()
+            else:
+                uids = self.mailbox.search_uids_after(checkpoint.last_uid)
+
+            failed = {int(uid): attempts for uid, attempts in checkpoint.failed_uids.items()}
+            retry = sorted(failed)
+            uids = retry + [uid for uid in uids if uid not in failed]
+            processed = 0
+            for start in range(0, len(uids), self.batch_size):
+                batch = uids[start:start + self.batch_size]
+                fetched = set()
+                for message in self.mailbox.fetch_messages(batch):
+                    fetched.add(message.uid)
+                    processed += self._handle(message, failed)
+                    checkpoint.last_uid = max(checkpoint.last_uid, message.uid)
+                # Письма для повтора, удалённые из ящика, больше не ждём
+                for uid in set(batch) - fetched:
+                    failed.pop(uid, None)
+                # Позицию сохраняем после каждой пачки: при падении повторится не больше пачки
+                checkpoint.failed_uids = {str(uid): attempts for uid, attempts in failed.items()}
+                checkpoint.save()
+            return processed
+
+    def _handle(self, message, failed):
+        """Передаёт аудио письма Mango в handler. Возвращает 1, если письмо обработано."""
+        if not (message.audio_parts and message.is_mango):
+            failed.pop(message.uid, None)
+            return 0
+        try:
+            for filename, content in self.mailbox.fetch_parts(message):
+                self.handler(filename, content, message)
+        except (imaplib.IMAP4.abort, OSError):
+            raise
+        except Exception as e:
+            attempts = failed.get(message.uid, 0) + 1
+            if attempts >= MAX_MESSAGE_ATTEMPTS:
+                failed.pop(message.uid, None)
+                logger.error(f'Ошибка обработки письма UID {message.uid}: {e}, попытки исчерпаны')
+            else:
+                failed[message.uid] = attempts
+                logger.error(f'Ошибка обработки письма UID {message.uid}: {e}, будет повтор ({attempts})')
+            return 0
+        failed.pop(message.uid, None)
+        return 1
+
+    def run_forever(self, poll_interval=10, idle_timeout=IDLE_TIMEOUT):
+        """Цикл: синхронизация, затем ожидание через IDLE (или опрос)"""
+        backoff = poll_interval
+        while True:
+            try:
+                close_old_connections()
+                processed = self.sync_once()
+                if processed:
+                    logger.info(f'Обработано писем: {processed}')
+                backoff = poll_interval
+                with self.mailbox.lock:
+                    if self.mailbox.supports_idle:
+                        self.mailbox.idle(idle_timeout)
+                        continue
+                time.sleep(poll_interval)
+            except (imaplib.IMAP4.error, OSError) as e:
+                logger.error(f'Ошибка IMAP: {e}, повтор через {backoff} с')
+                self.mailbox.reset()
+                time.sleep(backoff)
+                backoff = min(backoff * 2, 300)
+
+
+_shared_mailbox = None
+_shared_mailbox_lock = threading.Lock()
+
+
+def get_shared_mailbox():
+    """Общее для процесса соединение с ящиком Mango (из MANGO_EMAIL_SETTINGS)"""
+    global _shared_mailbox
+    with _shared_mailbox_lock:
+        if _shared_mailbox is None:
+            email_settings = getattr(settings, 'MANGO_EMAIL_SETTINGS', {})
+            if not email_settings.get('email') or not email_settings.get('password'):
+                return None
+            _shared_mailbox = IMAPMailbox(
+                email_settings['email'],
+                email_settings['password'],
+                email_settings.get('imap_server', 'imap.gmail.com'),
+                email_settings.get('imap_port', 993),
+            )
+        return _shared_mailbox
@@ -0,0 +1,44 @@
+from django.core.management.base import BaseCommand
+from core.models import Zayavki
+import logging
+
+logger = logging.getLogger(__name__)
+
+class Command(BaseCommand):
+    help = 'Заполняет канонические номера phone_norm / phone_atc_norm у существующих заявок'
+    
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=2000,
+            help='Заявок за один проход (по умолчанию 2000)',
+        )
+    
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        fields = ('id', 'phone_client', 'phone_atc', 'phone_norm', 'phone_atc_norm')
+        last_id = 0
+        scanned = updated = 0
+        while True:
+            # Проход по первичному ключу без OFFSET
+            batch = list(
+                Zayavki.objects.filter(id__gt=last_id).order_by('id').only(*fields)[:batch_size]
+            )
+            if not batch:
+                break
+            last_id = batch[-1].id
+            scanned += len(batch)
+            
+            changed = []
+            for zayavka in batch:
+                old = (zayavka.phone_norm, zayavka.phone_atc_norm)
+                zayavka.normalize_phones()
+                if (zayavka.phone_norm, zayavka.phone_atc_norm) != old:
+                    changed.append(zayavka)
+            if changed:
+                Zayavki.objects.bulk_update(changed, ['phone_norm', 'phone_atc_norm'])
+                updated += len(changed)
+        
+        logger.info(f'Phone numbers normalized: {updated}/{scanned}')
+        self.stdout.write(self.style.SUCCESS(f'Номера нормализованы: {updated} из {scanned} заявок'))
@@ -1,6 +1,6 @@
 from django.core.management.base import BaseCommand
 from django.core.cache import cache
-from core.cache import CacheManager, ReferenceDataCache
+from core.cache import CacheManager, ReferenceDataCache, local_cache
 import logging
 
 logger = logging.getLogger(__name__)
@@ -48,6 +48,7 @@ class Command(BaseCommand):
         """Очищает весь кэш."""
         try:
             cache.clear()
+            local_cache.clear()
             self.stdout.write(
                 self.style.SUCCESS('Весь кэш успешно очищен')
             )
@@ -8,6 +8,7 @@ from email.header import decode_header
 from django.core.management.base import BaseCommand
 from django.conf import settings
 from core.models import Zayavki, Tranzakcii
+from core.phones import find_phone, to_e164
 import requests
 from pathlib import Path
 
@@ -297,10 +298,7 @@ class Command(BaseCommand):
         }
         
         # Попытка извлечь номер телефона из имени файла
-        phone_pattern = r'(\+?7\d{10})'
-        phone_match = re.search(phone_pattern, filename)
-        if phone_match:
-            call_info['phone_number'] = phone_match.group(1)
+        call_info['phone_number'] = find_phone(filename)
         
         # Попытка извлечь дату и время
         date_pattern = r'(\d{4}-\d{2}-\d{2})'
@@ -338,8 +336,8 @@ class Command(BaseCommand):
             zayavka = None
             if call_info['phone_number']:
                 zayavka = Zayavki.objects.filter(
-                    phone_client__icontains=call_info['phone_number']
-                ).first()
+                    phone_norm=to_e164(call_info['phone_number'])
+                ).order_by('-meeting_date').first()
                 
                 if zayavka:
                     self.stdout.write(f'Найдена заявка: {zayavka.id} для номера {call_info["phone_number"]}')
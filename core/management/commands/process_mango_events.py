@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+from core.mango_events import MangoEventWorker
+import logging
+
+logger = logging.getLogger(__name__)
+
+class Command(BaseCommand):
+    help = 'Обрабатывает входящие события Mango Office из inbox и создаёт заявки'
+    
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Обработать накопившиеся события и завершиться',
+        )
+    
+    def handle(self, *args, **options):
+        worker = MangoEventWorker()
+        if options['once']:
+            worker.run(once=True)
+            self.stdout.write(self.style.SUCCESS('События Mango обработаны'))
+            return
+        
+        self.stdout.write('Воркер событий Mango запущен')
+        try:
+            worker.run()
+        except KeyboardInterrupt:
+            self.stdout.write('Воркер событий Mango остановлен')
@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+from core.rollups import rebuild_daily_stats
+import logging
+
+logger = logging.getLogger(__name__)
+
+class Command(BaseCommand):
+    help = 'Пересобирает дневные агрегаты заявок (ZayavkiDailyStat)'
+    
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--date-from',
+            help='Начало периода (YYYY-MM-DD, по дате встречи)',
+        )
+        parser.add_argument(
+            '--date-to',
+            help='Конец периода включительно (YYYY-MM-DD)',
+        )
+        parser.add_argument(
+            '--gorod',
+            type=int,
+            help='ID города',
+        )
+    
+    def handle(self, *args, **options):
+        dates = {}
+        for option in ('date_from', 'date_to'):
+            value = options[option]
+            if value:
+                dates[option] = parse_date(value)
+                if dates[option] is None:
+                    raise CommandError(f'Неверный формат даты: {value}')
+        
+        rows = rebuild_daily_stats(gorod_id=options['gorod'], **dates)
+        logger.info(f'Daily rollups rebuilt: {rows} rows')
+        self.stdout.write(self.style.SUCCESS(f'Агрегаты пересобраны: {rows} строк'))
@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand
+from core.notifications import TelegramDeliveryWorker
+import logging
+
+logger = logging.getLogger(__name__)
+
+class Command(BaseCommand):
+    help = 'Отправляет уведомления из очереди (outbox) в Telegram'
+    
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Отправить накопившиеся сообщения и завершиться',
+        )
+        parser.add_argument(
+            '--purge',
+            action='store_true',
+            help='Только удалить старые отправленные и неотправленные сообщения',
+        )
+    
+    def handle(self, *args, **options):
+        worker = TelegramDeliveryWorker()
+        if options['purge']:
+            deleted = worker.purge()
+            self.stdout.write(self.style.SUCCESS(f'Удалено сообщений: {deleted}'))
+            return
+        if options['once']:
+            worker.run(once=True)
+            self.stdout.write(self.style.SUCCESS('Очередь уведомлений обработана'))
+            return
+        
+        self.stdout.write('Воркер уведомлений запущен')
+        try:
+            worker.run()
+        except KeyboardInterrupt:
+            self.stdout.write('Воркер уведомлений остановлен')
@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+from core.ledger import rebuild_balance, take_snapshots
+import logging
+
+logger = logging.getLogger(__name__)
+
+class Command(BaseCommand):
+    help = 'Сохраняет балансы городов на конец дня (GorodBalanceSnapshot)'
+    
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--date',
+            help='День снимка (YYYY-MM-DD), по умолчанию вчера',
+        )
+        parser.add_argument(
+            '--rebuild',
+            action='store_true',
+            help='Пересчитать текущие балансы по всей истории транзакций',
+        )
+    
+    def handle(self, *args, **options):
+        day = None
+        if options['date']:
+            day = parse_date(options['date'])
+            if day is None:
+                raise CommandError(f"Неверный формат даты: {options['date']}")
+        
+        if options['rebuild']:
+            cities = rebuild_balance()
+            logger.info(f'Balances rebuilt: {cities} cities')
+            self.stdout.write(f'Балансы пересчитаны: {cities} городов')
+        
+        rows = take_snapshots(day)
+        logger.info(f'Balance snapshots saved: {rows} rows')
+        self.stdout.write(self.style.SUCCESS(f'Снимки балансов сохранены: {rows} строк'))
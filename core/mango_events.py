@@ -0,0 +1,279 @@
+"""
+Входящие события Mango Office (webhook inbox).
+
+Приём (асинхронное представление ``mango_webhook``) только проверяет подпись
+и записывает сырое событие в MangoWebhookEvent с ключом идемпотентности
+(звонок + тип события), после чего сразу отвечает Mango. Повторы Mango при
+медленных ответах попадают в тот же ключ и отбрасываются базой.
+
+Обработку выполняет воркер ``manage.py process_mango_events``: забирает
+пачку событий, группирует их по звонку (entry_id) и создаёт не более одной
+заявки на звонок — события call, summary и recording одного звонка
+привязываются к ней же. Перед созданием заявки события звонка блокируются
+(SELECT FOR UPDATE), поэтому параллельные воркеры, забравшие разные события
+одного звонка, не создают дубликатов.
+"""
+
+import hashlib
+import hmac
+import json
+import logging
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .models import MangoWebhookEvent, PhoneGoroda, Zayavki
+from .notifications import enqueue_telegram_message
+from .phones import normalize_phone, phone_variants
+
+logger = logging.getLogger(__name__)
+
+EVENT_TYPES = ('call', 'summary', 'recording', 'record_added')
+# События, по которым можно создать заявку (содержат номера from/to)
+CALL_EVENT_TYPES = ('call', 'summary')
+
+DEFAULT_INBOX_SETTINGS = {
+    'BATCH_SIZE': 200,        # Событий за один проход воркера
+    'MAX_ATTEMPTS': 5,        # После стольких ошибок событие помечается failed
+    'RETRY_BASE': 5,          # Базовая задержка повтора (секунды), растёт как 2**n
+    'RETRY_MAX': 600,         # Максимальная задержка повтора
+    'LEASE': 60,              # На сколько секунд воркер «забирает» пачку
+    'POLL_INTERVAL': 1,       # Пауза воркера при пустой очереди
+    'VERIFY_SIGNATURE': True, # Проверять подпись vpbx_api_key/sign
+}
+
+
+def inbox_settings():
+    return {**DEFAULT_INBOX_SETTINGS, **getattr(settings, 'MANGO_WEBHOOK_INBOX', {})}
+
+
+class MangoEventError(Exception):
+    """Ошибка обработки, которую не исправит повтор"""
+
+
+def make_signature(json_text):
+    """Подпись Mango: sha256(api_key + json + api_salt)"""
+    sign_string = f'{settings.MANGO_API_KEY}{json_text}{settings.MANGO_API_SALT}'
+    return hashlib.sha256(sign_string.encode('utf-8')).hexdigest()
+
+
+def verify_signature(api_key, sign, json_text):
+    if not api_key or not sign:
+        return False
+    return (
+        hmac.compare_digest(str(api_key), str(settings.MANGO_API_KEY))
+        and hmac.compare_digest(str(sign), make_signature(json_text))
+    )
+
+
+def call_id_of(payload):
+    """Идентификатор звонка: entry_id объединяет все плечи одного звонка"""
+    return str(payload.get('entry_id') or payload.get('call_id') or '')
+
+
+def make_idempotency_key(event_type, payload, json_text):
+    """
+    Ключ события: звонок + тип. Для событий call добавляется seq (смены
+    состояния звонка), для записей — recording_id. Повтор того же запроса
+    даёт тот же ключ. Без идентификатора звонка — хеш тела.
+    """
+    call_id = call_id_of(payload)
+    if not call_id:
+        base = f'{event_type}:raw:{json_text}'
+    else:
+        parts = [call_id, event_type]
+        for field in ('seq', 'recording_id'):
+            if payload.get(field) not in (None, ''):
+                parts.append(str(payload[field]))
+        base = ':'.join(parts)
+    return hashlib.sha256(base.encode('utf-8')).hexdigest()
+
+
+def build_event(event_type, json_text):
+    """
+    Разбирает тело события. Returns: несохранённый MangoWebhookEvent.
+    Raises: ValueError для некорректного JSON.
+    """
+    payload = json.loads(json_text)
+    if not isinstance(payload, dict):
+        raise ValueError('Ожидался JSON-объект')
+    return MangoWebhookEvent(
+        event_type=event_type,
+        call_id=call_id_of(payload)[:128],
+        idempotency_key=make_idempotency_key(event_type, payload, json_text),
+        payload=payload,
+    )
+
+
+async def store_event(event):
+    """Записывает событие; дубликат по ключу идемпотентности молча отбрасывается"""
+    await MangoWebhookEvent.objects.abulk_create([event], ignore_conflicts=True)
+
+
+def _numbers(events):
+    """Номер клиента и линии из первых событий звонка, где они есть"""
+    client = line = None
+    for event in events:
+        if event.event_type not in CALL_EVENT_TYPES:
+            continue
+        source = event.payload.get('from') or {}
+        target = event.payload.get('to') or {}
+        if source.get('extension'):
+            # Звонок от сотрудника (исходящий) — заявку не создаём
+            return None, None
+        client = client or normalize_phone(source.get('number'))
+        line = line or normalize_phone(target.get('line_number') or target.get('number'))
+    return client, line
+
+
+def resolve_gorod_id(line):
+    """Город по номеру линии, на которую звонил клиент (PhoneGoroda)"""
+    if not line:
+        return None
+    return (
+        PhoneGoroda.objects.filter(phone__in=phone_variants(line))
+        .values_list('gorod_id', flat=True).first()
+    )
+
+
+def create_incoming_zayavka(phone, gorod_id, line=None):
+    """Заявка по входящему звонку и уведомление в Telegram (через outbox)"""
+    zayavka = Zayavki.objects.create(
+        gorod_id=gorod_id,
+        phone_client=phone,
+        phone_atc=line,
+        client_name='Звонок с Mango',
+        address='Не указан',
+        meeting_date=timezone.now(),
+        tip_techniki='Не указано',
+        problema='Входящий звонок',
+        status='Ожидает',
+        kc_name='Mango'
+    )
+    message = f"📞 Новый входящий звонок\nНомер: {phone}\nЗаявка: {zayavka.id}"
+    enqueue_telegram_message(
+        message,
+        bot='notify',
+        parse_mode='',
+        dedup_key=f'incoming_call:{zayavka.id}'
+    )
+    return zayavka
+
+
+class MangoEventWorker:
+    """Обработка inbox: дедупликация и объединение событий одного звонка"""
+
+    def __init__(self, config=None):
+        self.config = config or inbox_settings()
+
+    def claim_batch(self):
+        """Забирает пачку необработанных событий (аренда на LEASE секунд)"""
+        now = timezone.now()
+        with transaction.atomic():
+            ids = list(
+                MangoWebhookEvent.objects
+                .select_for_update(skip_locked=True)
+                .filter(status='pending', next_attempt_at__lte=now)
+                .order_by('id')
+                .values_list('id', flat=True)[:self.config['BATCH_SIZE']]
+            )
+            if ids:
+                MangoWebhookEvent.objects.filter(id__in=ids).update(
+                    next_attempt_at=now + timedelta(seconds=self.config['LEASE'])
+                )
+        return list(MangoWebhookEvent.objects.filter(id__in=ids).order_by('id'))
+
+    @staticmethod
+    def group_by_call(events):
+        """{call_id: [события]}; события без звонка обрабатываются по одному"""
+        groups = {}
+        for event in events:
+            groups.setdefault(event.call_id or f'event:{event.id}', []).append(event)
+        return groups
+
+    @staticmethod
+    def lock_call(call_id):
+        """
+        Блокирует все события звонка до конца транзакции и возвращает уже
+        созданную по нему заявку. События одного звонка могут попасть в
+        пачки разных воркеров — блокировка не даёт создать вторую заявку.
+        """
+        if call_id.startswith('event:'):
+            return None
+        zayavka_ids = (
+            MangoWebhookEvent.objects.select_for_update()
+            .filter(call_id=call_id).order_by('id')
+            .values_list('zayavka_id', flat=True)
+        )
+        return next((zayavka_id for zayavka_id in zayavka_ids if zayavka_id), None)
+
+    def _process_call(self, events, zayavka_id):
+        """Обрабатывает события одного звонка. Returns: (статус, zayavka_id)."""
+        if zayavka_id:
+            return 'processed', zayavka_id
+        phone, line = _numbers(events)
+        if not phone:
+            # Исходящий звонок или запись без события звонка
+            return 'skipped', None
+        gorod_id = resolve_gorod_id(line)
+        if gorod_id is None:
+            raise MangoEventError(f'Не найден город для линии {line}')
+        return 'processed', create_incoming_zayavka(phone, gorod_id, line).id
+
+    def _mark_retry(self, events, error, permanent=False):
+        now = timezone.now()
+        for event in events:
+            event.attempts += 1
+            event.last_error = error
+            if permanent or event.attempts >= self.config['MAX_ATTEMPTS']:
+                event.status = 'failed'
+                logger.error(f'Mango event {event.id} failed: {error}')
+            else:
+                delay = min(self.config['RETRY_BASE'] * 2 ** (event.attempts - 1), self.config['RETRY_MAX'])
+                event.next_attempt_at = now + timedelta(seconds=delay)
+        MangoWebhookEvent.objects.bulk_update(events, ['attempts', 'last_error', 'status', 'next_attempt_at'])
+
+    def process_batch(self):
+        """Один проход. Returns: (забрано событий, создано заявок)."""
+        return self.process_events(self.claim_batch())
+
+    def process_events(self, events):
+        """Обрабатывает забранные события по звонкам. Returns: (событий, создано заявок)."""
+        if not events:
+            return 0, 0
+        created = 0
+        for call_id, call_events in self.group_by_call(events).items():
+            ids = [event.id for event in call_events]
+            try:
+                with transaction.atomic():
+                    # Заявку по звонку проверяем под блокировкой его событий
+                    known_id = self.lock_call(call_id)
+                    status, zayavka_id = self._process_call(call_events, known_id)
+                    MangoWebhookEvent.objects.filter(id__in=ids).update(
+                        status=status, zayavka_id=zayavka_id,
+                        processed_at=timezone.now(), last_error=''
+                    )
+            except MangoEventError as e:
+                self._mark_retry(call_events, str(e), permanent=True)
+                continue
+            except Exception as e:
+                logger.warning(f'Mango events {ids} processing failed: {e}')
+                self._mark_retry(call_events, str(e))
+                continue
+            if zayavka_id and zayavka_id != known_id:
+                created += 1
+        return len(events), created
+
+    def run(self, once=False):
+        """Цикл воркера; с once=True завершается, когда очередь опустела"""
+        while True:
+            claimed, created = self.process_batch()
+            if claimed:
+                logger.info(f'Mango events processed: {claimed}, zayavki created: {created}')
+                continue
+            if once:
+                return
+            time.sleep(self.config['POLL_INTERVAL'])
@@ -58,14 +58,6 @@ class QueryCountDebugMiddleware:
             f'Queries: {query_count}, Time: {duration:.3f}s'
         )
         
-        # Записываем метрики производительности
-        performance_monitor.record_request_time(
-            request.path, 
-            request.method, 
-            duration, 
-            response.status_code
-        )
-        
         # Проверяем критические пороги
         if query_count > 50:  # Слишком много запросов
             alert_manager.log_error(
@@ -134,10 +126,13 @@ class PerformanceMonitoringMiddleware:
             '/api/monitoring/status/'
         ]
         
-        if request.path not in excluded_endpoints:
-            # Записываем метрики только для основных endpoints
+        # Пути API версионированы (/api/v1/...), исключения заданы без версии
+        path = request.path.replace('/api/v1/', '/api/', 1)
+        if path not in excluded_endpoints:
+            # Записываем метрики только для основных endpoints,
+            # ключ — шаблон маршрута, а не фактический путь с id
             performance_monitor.record_request_time(
-                request.path,
+                performance_monitor.get_route(request),
                 request.method,
                 duration,
                 response.status_code
@@ -0,0 +1,27 @@
+# Generated by Django 5.2.1 on 2026-10-18 03:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0003_notificationoutbox'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MailSyncCheckpoint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('mailbox', models.CharField(max_length=255, unique=True, verbose_name='Почтовый ящик')),
+                ('uidvalidity', models.BigIntegerField(blank=True, null=True, verbose_name='UIDVALIDITY')),
+                ('last_uid', models.BigIntegerField(default=0, verbose_name='Последний UID')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Обновлено')),
+            ],
+            options={
+                'verbose_name': 'Позиция синхронизации почты',
+                'verbose_name_plural': 'Позиции синхронизации почты',
+            },
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.2.1 on 2026-10-18 03:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0004_mailsynccheckpoint'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='zayavkafile',
+            name='content_hash',
+            field=models.CharField(blank=True, max_length=64, null=True, unique=True, verbose_name='SHA-256 содержимого'),
+        ),
+        migrations.AddField(
+            model_name='zayavkafile',
+            name='source_id',
+            field=models.CharField(blank=True, max_length=255, null=True, unique=True, verbose_name='Источник'),
+        ),
+        migrations.AddIndex(
+            model_name='zayavki',
+            index=models.Index(fields=['phone_atc'], name='core_zayavk_phone_a_271cc9_idx'),
+        ),
+    ]
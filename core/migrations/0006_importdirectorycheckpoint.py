@@ -0,0 +1,30 @@
+# Generated by Django 5.2.1 on 2026-10-18 03:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0005_zayavkafile_source_id_content_hash'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImportDirectoryCheckpoint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('source', models.CharField(max_length=255, verbose_name='Источник')),
+                ('path', models.CharField(max_length=1024, verbose_name='Каталог')),
+                ('inode', models.BigIntegerField(blank=True, null=True, verbose_name='Inode')),
+                ('mtime_ns', models.BigIntegerField(verbose_name='Время изменения (нс)')),
+                ('files_count', models.PositiveIntegerField(default=0, verbose_name='Файлов')),
+                ('scanned_at', models.DateTimeField(auto_now=True, verbose_name='Просканирован')),
+            ],
+            options={
+                'verbose_name': 'Каталог импорта записей',
+                'verbose_name_plural': 'Каталоги импорта записей',
+                'unique_together': {('source', 'path')},
+            },
+        ),
+    ]
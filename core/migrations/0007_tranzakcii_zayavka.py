@@ -0,0 +1,50 @@
+# Generated by Django 5.2.1 on 2026-10-18 03:32
+
+import re
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+NOTE_PATTERN = re.compile(r'^Приход по Заявке "(\d+)"$')
+
+
+def link_income_to_zayavki(apps, schema_editor):
+    """Привязывает существующие приходы к заявкам по примечанию"""
+    Tranzakcii = apps.get_model('core', 'Tranzakcii')
+    Zayavki = apps.get_model('core', 'Zayavki')
+    rows = Tranzakcii.objects.filter(note__startswith='Приход по Заявке').order_by('id')
+    candidates = {}
+    for tranzakciya in rows.only('id', 'note', 'tip_tranzakcii_id'):
+        match = NOTE_PATTERN.match(tranzakciya.note or '')
+        if match:
+            # Первая транзакция каждого типа по заявке, дубликаты остаются без привязки
+            candidates.setdefault((int(match.group(1)), tranzakciya.tip_tranzakcii_id), tranzakciya)
+    existing = set(Zayavki.objects.filter(
+        id__in={zayavka_id for zayavka_id, _ in candidates}
+    ).values_list('id', flat=True))
+    linked = []
+    for (zayavka_id, _), tranzakciya in candidates.items():
+        if zayavka_id in existing:
+            tranzakciya.zayavka_id = zayavka_id
+            linked.append(tranzakciya)
+    Tranzakcii.objects.bulk_update(linked, ['zayavka'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0006_importdirectorycheckpoint'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='tranzakcii',
+            name='zayavka',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='tranzakcii', to='core.zayavki', verbose_name='Заявка'),
+        ),
+        migrations.RunPython(link_income_to_zayavki, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='tranzakcii',
+            constraint=models.UniqueConstraint(condition=models.Q(('zayavka__isnull', False)), fields=('zayavka', 'tip_tranzakcii'), name='unique_tranzakciya_per_zayavka'),
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.2.1 on 2026-10-18 03:37
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0007_tranzakcii_zayavka'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ZayavkiDailyStat',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(verbose_name='День')),
+                ('status', models.CharField(max_length=50, verbose_name='Статус')),
+                ('count', models.PositiveIntegerField(default=0, verbose_name='Заявок')),
+                ('itog', models.DecimalField(decimal_places=2, default=0, max_digits=14, verbose_name='Итог')),
+                ('rashod', models.DecimalField(decimal_places=2, default=0, max_digits=14, verbose_name='Расход')),
+                ('chistymi', models.DecimalField(decimal_places=2, default=0, max_digits=14, verbose_name='Чистыми')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Обновлено')),
+                ('gorod', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='core.gorod', verbose_name='Город')),
+                ('master', models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='core.master', verbose_name='Мастер')),
+            ],
+            options={
+                'verbose_name': 'Дневная статистика заявок',
+                'verbose_name_plural': 'Дневная статистика заявок',
+                'indexes': [models.Index(fields=['date', 'gorod'], name='core_zayavk_date_af11f3_idx'), models.Index(fields=['master', 'date'], name='core_zayavk_master__677928_idx')],
+                'constraints': [models.UniqueConstraint(condition=models.Q(('master__isnull', False)), fields=('date', 'gorod', 'master', 'status'), name='unique_daily_stat_master'), models.UniqueConstraint(condition=models.Q(('master__isnull', True)), fields=('date', 'gorod', 'status'), name='unique_daily_stat_no_master')],
+            },
+        ),
+    ]
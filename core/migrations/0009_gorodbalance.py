@@ -0,0 +1,66 @@
+# Generated by Django 5.2.1 on 2026-10-18 03:45
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Q, Sum
+
+
+def build_balances(apps, schema_editor):
+    """Начальный баланс городов по всей истории транзакций"""
+    Tranzakcii = apps.get_model('core', 'Tranzakcii')
+    GorodBalance = apps.get_model('core', 'GorodBalance')
+    rows = Tranzakcii.objects.order_by().values('gorod_id').annotate(
+        income=Sum('summa', filter=Q(tip_tranzakcii__name='Приход')),
+        expense=Sum('summa', filter=Q(tip_tranzakcii__name='Расход')),
+    )
+    balances = []
+    for row in rows:
+        income, expense = row['income'] or 0, row['expense'] or 0
+        balances.append(GorodBalance(
+            gorod_id=row['gorod_id'], income=income, expense=expense, balance=income - expense
+        ))
+    GorodBalance.objects.bulk_create(balances, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0008_zayavkidailystat'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GorodBalance',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('income', models.DecimalField(decimal_places=2, default=0, max_digits=14, verbose_name='Приход')),
+                ('expense', models.DecimalField(decimal_places=2, default=0, max_digits=14, verbose_name='Расход')),
+                ('balance', models.DecimalField(decimal_places=2, default=0, max_digits=14, verbose_name='Баланс')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Обновлено')),
+                ('gorod', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='balance', to='core.gorod', verbose_name='Город')),
+            ],
+            options={
+                'verbose_name': 'Баланс города',
+                'verbose_name_plural': 'Балансы городов',
+            },
+        ),
+        migrations.CreateModel(
+            name='GorodBalanceSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(verbose_name='День')),
+                ('income', models.DecimalField(decimal_places=2, default=0, max_digits=14, verbose_name='Приход за день')),
+                ('expense', models.DecimalField(decimal_places=2, default=0, max_digits=14, verbose_name='Расход за день')),
+                ('balance', models.DecimalField(decimal_places=2, default=0, max_digits=14, verbose_name='Баланс на конец дня')),
+                ('created_at', models.DateTimeField(auto_now=True, verbose_name='Создано')),
+                ('gorod', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='balance_snapshots', to='core.gorod', verbose_name='Город')),
+            ],
+            options={
+                'verbose_name': 'Баланс города на конец дня',
+                'verbose_name_plural': 'Балансы городов на конец дня',
+                'ordering': ['-date'],
+                'unique_together': {('gorod', 'date')},
+            },
+        ),
+        migrations.RunPython(build_balances, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.2.1 on 2026-10-18 03:51
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0009_gorodbalance'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MangoWebhookEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('event_type', models.CharField(max_length=32, verbose_name='Тип события')),
+                ('call_id', models.CharField(blank=True, default='', max_length=128, verbose_name='ID звонка')),
+                ('idempotency_key', models.CharField(max_length=64, unique=True, verbose_name='Ключ идемпотентности')),
+                ('payload', models.JSONField(verbose_name='Данные события')),
+                ('status', models.CharField(choices=[('pending', 'Ожидает обработки'), ('processed', 'Обработано'), ('skipped', 'Пропущено'), ('failed', 'Ошибка')], default='pending', max_length=16, verbose_name='Статус')),
+                ('attempts', models.PositiveIntegerField(default=0, verbose_name='Попытки')),
+                ('next_attempt_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Следующая попытка')),
+                ('last_error', models.TextField(blank=True, default='', verbose_name='Последняя ошибка')),
+                ('received_at', models.DateTimeField(auto_now_add=True, verbose_name='Получено')),
+                ('processed_at', models.DateTimeField(blank=True, null=True, verbose_name='Обработано')),
+                ('zayavka', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='mango_events', to='core.zayavki', verbose_name='Заявка')),
+            ],
+            options={
+                'verbose_name': 'Событие Mango Office',
+                'verbose_name_plural': 'События Mango Office',
+                'ordering': ['id'],
+                'indexes': [models.Index(fields=['status', 'next_attempt_at'], name='core_mangow_status_49e784_idx'), models.Index(fields=['call_id'], name='core_mangow_call_id_e2a9b3_idx')],
+            },
+        ),
+    ]
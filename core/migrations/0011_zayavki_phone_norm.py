@@ -0,0 +1,31 @@
+# Generated by Django 5.2.1 on 2026-10-18 03:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0010_mangowebhookevent'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='zayavki',
+            name='phone_atc_norm',
+            field=models.CharField(blank=True, editable=False, max_length=16, null=True, verbose_name='Номер ATC (E.164)'),
+        ),
+        migrations.AddField(
+            model_name='zayavki',
+            name='phone_norm',
+            field=models.CharField(blank=True, editable=False, max_length=16, null=True, verbose_name='Номер клиента (E.164)'),
+        ),
+        migrations.AddIndex(
+            model_name='zayavki',
+            index=models.Index(fields=['phone_norm', 'status'], name='core_zayavk_phone_n_6b9aa2_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='zayavki',
+            index=models.Index(fields=['phone_atc_norm'], name='core_zayavk_phone_a_48172f_idx'),
+        ),
+    ]
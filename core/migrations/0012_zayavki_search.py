@@ -0,0 +1,108 @@
+from django.db import migrations
+
+# Полнотекстовый и trigram-поиск заявок (core.search). Только PostgreSQL:
+# на других СУБД поиск работает через icontains.
+#
+# Миграция не блокирует запись в core_zayavki на время построения:
+# - search_vector — обычная nullable-колонка (ADD COLUMN без DEFAULT меняет
+#   только каталог, ACCESS EXCLUSIVE держится доли секунды), а не GENERATED
+#   STORED, которая переписала бы всю таблицу под блокировкой;
+# - новые и изменённые строки заполняет триггер, существующие — пачками по
+#   BACKFILL_BATCH строк, каждая пачка в своей транзакции;
+# - индексы строятся CREATE INDEX CONCURRENTLY (поэтому atomic = False).
+
+BACKFILL_BATCH = 5000
+
+SEARCH_DOCUMENT = """
+    setweight(to_tsvector('russian', coalesce({p}client_name, '')), 'A') ||
+    setweight(to_tsvector('russian', coalesce({p}address, '')), 'B') ||
+    setweight(to_tsvector('russian', coalesce({p}problema, '')), 'C') ||
+    setweight(to_tsvector('russian', coalesce({p}comment_kc, '') || ' ' || coalesce({p}comment_master, '')), 'D')
+"""
+
+SCHEMA_SQL = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    "ALTER TABLE core_zayavki ADD COLUMN IF NOT EXISTS search_vector tsvector",
+    f"""
+    CREATE OR REPLACE FUNCTION core_zayavki_search_vector_update() RETURNS trigger AS $$
+    BEGIN
+        NEW.search_vector := {SEARCH_DOCUMENT.format(p='NEW.')};
+        RETURN NEW;
+    END
+    $$ LANGUAGE plpgsql
+    """,
+    "DROP TRIGGER IF EXISTS core_zayavki_search_vector ON core_zayavki",
+    """
+    CREATE TRIGGER core_zayavki_search_vector
+    BEFORE INSERT OR UPDATE OF client_name, address, problema, comment_kc, comment_master
+    ON core_zayavki FOR EACH ROW EXECUTE FUNCTION core_zayavki_search_vector_update()
+    """,
+]
+
+BACKFILL_SQL = f"""
+    UPDATE core_zayavki SET search_vector = {SEARCH_DOCUMENT.format(p='')}
+    WHERE id IN (
+        SELECT id FROM core_zayavki
+        WHERE id > %s AND search_vector IS NULL
+        ORDER BY id LIMIT %s
+    )
+    RETURNING id
+"""
+
+INDEX_SQL = [
+    "CREATE INDEX CONCURRENTLY IF NOT EXISTS core_zayavki_search_vector_gin "
+    "ON core_zayavki USING GIN (search_vector)",
+    "CREATE INDEX CONCURRENTLY IF NOT EXISTS core_zayavki_phone_client_trgm "
+    "ON core_zayavki USING GIN (phone_client gin_trgm_ops)",
+    "CREATE INDEX CONCURRENTLY IF NOT EXISTS core_zayavki_address_trgm "
+    "ON core_zayavki USING GIN (address gin_trgm_ops)",
+]
+
+REVERSE_SQL = [
+    "DROP INDEX CONCURRENTLY IF EXISTS core_zayavki_address_trgm",
+    "DROP INDEX CONCURRENTLY IF EXISTS core_zayavki_phone_client_trgm",
+    "DROP INDEX CONCURRENTLY IF EXISTS core_zayavki_search_vector_gin",
+    "DROP TRIGGER IF EXISTS core_zayavki_search_vector ON core_zayavki",
+    "DROP FUNCTION IF EXISTS core_zayavki_search_vector_update()",
+    "ALTER TABLE core_zayavki DROP COLUMN IF EXISTS search_vector",
+]
+
+
+def forwards(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for sql in SCHEMA_SQL:
+        schema_editor.execute(sql)
+    # Миграция не атомарная: каждая пачка коммитится отдельно и держит
+    # блокировку только своих строк
+    last_id = 0
+    with schema_editor.connection.cursor() as cursor:
+        while True:
+            cursor.execute(BACKFILL_SQL, [last_id, BACKFILL_BATCH])
+            ids = [row[0] for row in cursor.fetchall()]
+            if not ids:
+                break
+            last_id = max(ids)
+    for sql in INDEX_SQL:
+        schema_editor.execute(sql)
+
+
+def backwards(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for sql in REVERSE_SQL:
+        schema_editor.execute(sql)
+
+
+class Migration(migrations.Migration):
+
+    # CREATE INDEX CONCURRENTLY нельзя выполнять внутри транзакции
+    atomic = False
+
+    dependencies = [
+        ('core', '0011_zayavki_phone_norm'),
+    ]
+
+    operations = [
+        migrations.RunPython(forwards, backwards),
+    ]
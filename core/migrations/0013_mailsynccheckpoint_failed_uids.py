@@ -0,0 +1,18 @@
+# Generated by Django 5.2.1 on 2026-10-18 04:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0012_zayavki_search'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='mailsynccheckpoint',
+            name='failed_uids',
+            field=models.JSONField(blank=True, default=dict, verbose_name='UID писем для повтора'),
+        ),
+    ]
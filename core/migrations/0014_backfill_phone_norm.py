@@ -0,0 +1,44 @@
+from django.db import migrations, transaction
+from django.db.models import Q
+
+from core.phones import to_e164
+
+BATCH_SIZE = 2000
+
+
+def backfill_phone_norm(apps, schema_editor):
+    """
+    Канонические номера существующих заявок: без них RecordingMatcher и
+    поиск по phone_norm не находят заявки, созданные до 0011. Проход по
+    первичному ключу пачками, каждая пачка — своя транзакция.
+    """
+    Zayavki = apps.get_model('core', 'Zayavki')
+    pending = Zayavki.objects.filter(
+        Q(phone_norm__isnull=True, phone_client__isnull=False)
+        | Q(phone_atc_norm__isnull=True, phone_atc__isnull=False)
+    ).order_by('id').only('id', 'phone_client', 'phone_atc', 'phone_norm', 'phone_atc_norm')
+    last_id = 0
+    while True:
+        batch = list(pending.filter(id__gt=last_id)[:BATCH_SIZE])
+        if not batch:
+            break
+        last_id = batch[-1].id
+        for zayavka in batch:
+            zayavka.phone_norm = to_e164(zayavka.phone_client)
+            zayavka.phone_atc_norm = to_e164(zayavka.phone_atc)
+        with transaction.atomic(using=schema_editor.connection.alias):
+            Zayavki.objects.bulk_update(batch, ['phone_norm', 'phone_atc_norm'])
+
+
+class Migration(migrations.Migration):
+
+    # Пачки коммитятся по отдельности и не держат блокировку всей таблицы
+    atomic = False
+
+    dependencies = [
+        ('core', '0013_mailsynccheckpoint_failed_uids'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_phone_norm, migrations.RunPython.noop),
+    ]
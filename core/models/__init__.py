@@ -6,8 +6,11 @@
 from .base import Gorod, TipZayavki
 from .users import Roli, Polzovateli, Master
 from .business import RK, PhoneGoroda
-from .finance import TipTranzakcii, Tranzakcii, MasterPayout
+from .finance import TipTranzakcii, Tranzakcii, MasterPayout, GorodBalance, GorodBalanceSnapshot
 from .requests import Zayavki, ZayavkaFile
+from .notifications import NotificationOutbox
+from .integrations import MailSyncCheckpoint, ImportDirectoryCheckpoint, MangoWebhookEvent
+from .analytics import ZayavkiDailyStat
 
 # Экспортируем все модели
 __all__ = [
@@ -23,4 +26,11 @@ __all__ = [
     'Zayavki',
     'ZayavkaFile',
     'MasterPayout',
+    'GorodBalance',
+    'GorodBalanceSnapshot',
+    'NotificationOutbox',
+    'MailSyncCheckpoint',
+    'ImportDirectoryCheckpoint',
+    'MangoWebhookEvent',
+    'ZayavkiDailyStat',
 ] 
\ No newline at end of file
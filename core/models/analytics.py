@@ -0,0 +1,50 @@
+"""
+Предагрегированные данные для аналитики
+"""
+
+from django.db import models
+
+
+class ZayavkiDailyStat(models.Model):
+    """
+    Дневной агрегат заявок: день встречи × город × мастер × статус.
+
+    Поддерживается инкрементально (core.rollups) и пересобирается командой
+    rebuild_rollups. Мастер хранится без внешнего ключа в БД: удаление мастера
+    не должно удалять статистику, её исправит пересборка.
+    """
+    date = models.DateField('День')
+    gorod = models.ForeignKey('Gorod', on_delete=models.CASCADE, verbose_name='Город')
+    master = models.ForeignKey(
+        'Master', on_delete=models.DO_NOTHING, db_constraint=False,
+        null=True, blank=True, related_name='+', verbose_name='Мастер'
+    )
+    status = models.CharField('Статус', max_length=50)
+    count = models.PositiveIntegerField('Заявок', default=0)
+    itog = models.DecimalField('Итог', max_digits=14, decimal_places=2, default=0)
+    rashod = models.DecimalField('Расход', max_digits=14, decimal_places=2, default=0)
+    chistymi = models.DecimalField('Чистыми', max_digits=14, decimal_places=2, default=0)
+    updated_at = models.DateTimeField('Обновлено', auto_now=True)
+
+    class Meta:
+        verbose_name = 'Дневная статистика заявок'
+        verbose_name_plural = 'Дневная статистика заявок'
+        indexes = [
+            models.Index(fields=['date', 'gorod']),
+            models.Index(fields=['master', 'date']),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=['date', 'gorod', 'master', 'status'],
+                condition=models.Q(master__isnull=False),
+                name='unique_daily_stat_master',
+            ),
+            models.UniqueConstraint(
+                fields=['date', 'gorod', 'status'],
+                condition=models.Q(master__isnull=True),
+                name='unique_daily_stat_no_master',
+            ),
+        ]
+
+    def __str__(self):
+        return f'{self.date} {self.gorod_id}/{self.master_id} {self.status}: {self.count}'
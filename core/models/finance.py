@@ -2,7 +2,7 @@
 Финансовые модели системы
 """
 
-from django.db import models
+from django.db import models, transaction
 from decimal import Decimal
 
 
@@ -26,6 +26,10 @@ class Tranzakcii(models.Model):
     summa = models.DecimalField('Сумма', max_digits=12, decimal_places=2)
     note = models.TextField('Примечание', blank=True, null=True)
     date = models.DateField('Дата', auto_now_add=True)
+    zayavka = models.ForeignKey(
+        'Zayavki', on_delete=models.SET_NULL, null=True, blank=True,
+        related_name='tranzakcii', verbose_name='Заявка'
+    )
     
     class Meta:
         verbose_name = 'Транзакция'
@@ -35,9 +39,61 @@ class Tranzakcii(models.Model):
             models.Index(fields=['gorod', 'date']),
             models.Index(fields=['tip_tranzakcii']),
         ]
+        constraints = [
+            # Не более одной транзакции каждого типа по заявке (приход при закрытии)
+            models.UniqueConstraint(
+                fields=['zayavka', 'tip_tranzakcii'],
+                condition=models.Q(zayavka__isnull=False),
+                name='unique_tranzakciya_per_zayavka',
+            ),
+        ]
     
     def __str__(self):
         return f"{self.tip_tranzakcii} - {self.summa} ({self.gorod})"
+    
+    def save(self, *args, **kwargs):
+        # Транзакция и баланс города (сигналы core.ledger) меняются атомарно
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+    
+    def delete(self, *args, **kwargs):
+        with transaction.atomic():
+            return super().delete(*args, **kwargs)
+
+
+class GorodBalance(models.Model):
+    """Текущий баланс кассы города (Приход − Расход), ведётся core.ledger"""
+    gorod = models.OneToOneField('Gorod', on_delete=models.CASCADE, related_name='balance', verbose_name='Город')
+    income = models.DecimalField('Приход', max_digits=14, decimal_places=2, default=0)
+    expense = models.DecimalField('Расход', max_digits=14, decimal_places=2, default=0)
+    balance = models.DecimalField('Баланс', max_digits=14, decimal_places=2, default=0)
+    updated_at = models.DateTimeField('Обновлено', auto_now=True)
+    
+    class Meta:
+        verbose_name = 'Баланс города'
+        verbose_name_plural = 'Балансы городов'
+    
+    def __str__(self):
+        return f'{self.gorod_id}: {self.balance}'
+
+
+class GorodBalanceSnapshot(models.Model):
+    """Баланс кассы города на конец дня"""
+    gorod = models.ForeignKey('Gorod', on_delete=models.CASCADE, related_name='balance_snapshots', verbose_name='Город')
+    date = models.DateField('День')
+    income = models.DecimalField('Приход за день', max_digits=14, decimal_places=2, default=0)
+    expense = models.DecimalField('Расход за день', max_digits=14, decimal_places=2, default=0)
+    balance = models.DecimalField('Баланс на конец дня', max_digits=14, decimal_places=2, default=0)
+    created_at = models.DateTimeField('Создано', auto_now=True)
+    
+    class Meta:
+        verbose_name = 'Баланс города на конец дня'
+        verbose_name_plural = 'Балансы городов на конец дня'
+        ordering = ['-date']
+        unique_together = ('gorod', 'date')
+    
+    def __str__(self):
+        return f'{self.gorod_id} {self.date}: {self.balance}'
 
 
 class MasterPayout(models.Model):
@@ -0,0 +1,77 @@
+"""
+Состояние интеграций с внешними системами
+"""
+
+from django.db import models
+from django.utils import timezone
+
+
+class MailSyncCheckpoint(models.Model):
+    """Позиция инкрементальной синхронизации почтового ящика (IMAP UID)"""
+    mailbox = models.CharField('Почтовый ящик', max_length=255, unique=True)
+    uidvalidity = models.BigIntegerField('UIDVALIDITY', null=True, blank=True)
+    last_uid = models.BigIntegerField('Последний UID', default=0)
+    failed_uids = models.JSONField('UID писем для повтора', default=dict, blank=True)
+    updated_at = models.DateTimeField('Обновлено', auto_now=True)
+
+    class Meta:
+        verbose_name = 'Позиция синхронизации почты'
+        verbose_name_plural = 'Позиции синхронизации почты'
+
+    def __str__(self):
+        return f'{self.mailbox}: {self.last_uid}'
+
+
+class ImportDirectoryCheckpoint(models.Model):
+    """Состояние каталога архива записей при последнем импорте (mtime/inode)"""
+    source = models.CharField('Источник', max_length=255)
+    path = models.CharField('Каталог', max_length=1024)
+    inode = models.BigIntegerField('Inode', null=True, blank=True)
+    mtime_ns = models.BigIntegerField('Время изменения (нс)')
+    files_count = models.PositiveIntegerField('Файлов', default=0)
+    scanned_at = models.DateTimeField('Просканирован', auto_now=True)
+
+    class Meta:
+        verbose_name = 'Каталог импорта записей'
+        verbose_name_plural = 'Каталоги импорта записей'
+        unique_together = ('source', 'path')
+
+    def __str__(self):
+        return f'{self.source}:{self.path}'
+
+
+class MangoWebhookEvent(models.Model):
+    """Сырое событие webhook Mango Office, обрабатывается воркером process_mango_events"""
+    STATUS_CHOICES = [
+        ('pending', 'Ожидает обработки'),
+        ('processed', 'Обработано'),
+        ('skipped', 'Пропущено'),
+        ('failed', 'Ошибка'),
+    ]
+
+    event_type = models.CharField('Тип события', max_length=32)
+    call_id = models.CharField('ID звонка', max_length=128, blank=True, default='')
+    idempotency_key = models.CharField('Ключ идемпотентности', max_length=64, unique=True)
+    payload = models.JSONField('Данные события')
+    status = models.CharField('Статус', max_length=16, choices=STATUS_CHOICES, default='pending')
+    attempts = models.PositiveIntegerField('Попытки', default=0)
+    next_attempt_at = models.DateTimeField('Следующая попытка', default=timezone.now)
+    last_error = models.TextField('Последняя ошибка', blank=True, default='')
+    zayavka = models.ForeignKey(
+        'Zayavki', on_delete=models.SET_NULL, null=True, blank=True,
+        related_name='mango_events', verbose_name='Заявка'
+    )
+    received_at = models.DateTimeField('Получено', auto_now_add=True)
+    processed_at = models.DateTimeField('Обработано', null=True, blank=True)
+
+    class Meta:
+        verbose_name = 'Событие Mango Office'
+        verbose_name_plural = 'События Mango Office'
+        ordering = ['id']
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at']),
+            models.Index(fields=['call_id']),
+        ]
+
+    def __str__(self):
+        return f'{self.event_type}:{self.call_id} ({self.get_status_display()})'
@@ -0,0 +1,38 @@
+"""
+Модели исходящих уведомлений
+"""
+
+from django.db import models
+from django.utils import timezone
+
+
+class NotificationOutbox(models.Model):
+    """Исходящее сообщение в Telegram, доставляется воркером send_notifications"""
+    STATUS_CHOICES = [
+        ('pending', 'Ожидает отправки'),
+        ('sent', 'Отправлено'),
+        ('failed', 'Ошибка'),
+    ]
+    
+    bot = models.CharField('Бот', max_length=32, default='alerts')
+    chat_id = models.CharField('ChatID', max_length=64)
+    text = models.TextField('Текст')
+    parse_mode = models.CharField('Режим разметки', max_length=16, blank=True, default='HTML')
+    dedup_key = models.CharField('Ключ дедупликации', max_length=64, unique=True)
+    status = models.CharField('Статус', max_length=16, choices=STATUS_CHOICES, default='pending')
+    attempts = models.PositiveIntegerField('Попытки', default=0)
+    next_attempt_at = models.DateTimeField('Следующая попытка', default=timezone.now)
+    last_error = models.TextField('Последняя ошибка', blank=True, default='')
+    created_at = models.DateTimeField('Создано', auto_now_add=True)
+    sent_at = models.DateTimeField('Отправлено', null=True, blank=True)
+    
+    class Meta:
+        verbose_name = 'Исходящее уведомление'
+        verbose_name_plural = 'Исходящие уведомления'
+        ordering = ['id']
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at']),
+        ]
+    
+    def __str__(self):
+        return f'{self.bot}:{self.chat_id} ({self.get_status_display()})'
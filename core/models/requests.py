@@ -8,6 +8,8 @@ from django.db.models.signals import post_save
 from django.dispatch import receiver
 from decimal import Decimal
 
+from ..phones import to_e164
+
 
 class Zayavki(models.Model):
     """Модель заявки"""
@@ -47,6 +49,9 @@ class Zayavki(models.Model):
             )
         ]
     )
+    # Канонические номера E.164, заполняются при сохранении (core.phones.to_e164)
+    phone_norm = models.CharField('Номер клиента (E.164)', max_length=16, null=True, blank=True, editable=False)
+    phone_atc_norm = models.CharField('Номер ATC (E.164)', max_length=16, null=True, blank=True, editable=False)
     tip_zayavki = models.ForeignKey('TipZayavki', on_delete=models.SET_NULL, null=True, verbose_name='Тип заявки')
     client_name = models.CharField('Имя клиента', max_length=100)
     address = models.CharField('Адрес', max_length=255)
@@ -72,18 +77,33 @@ class Zayavki(models.Model):
             models.Index(fields=['master']),
             models.Index(fields=['meeting_date']),
             models.Index(fields=['phone_client']),
+            models.Index(fields=['phone_atc']),
+            models.Index(fields=['phone_norm', 'status']),
+            models.Index(fields=['phone_atc_norm']),
         ]
     
     def __str__(self):
         tip_name = self.tip_zayavki.name if self.tip_zayavki else "Без типа"
         return f'{self.client_name} - {tip_name} ({self.status})'
     
-    def save(self, *args, **kwargs):
-        # Автоматический расчет чистыми и сдачи мастера
+    def recalculate_totals(self):
+        """Автоматический расчет чистыми и сдачи мастера"""
         if self.itog is not None and self.rashod is not None:
             self.chistymi = self.itog - self.rashod
             if self.chistymi > 0:
                 self.sdacha_mastera = self.chistymi
+    
+    def normalize_phones(self):
+        """Заполняет phone_norm / phone_atc_norm из исходных номеров"""
+        self.phone_norm = to_e164(self.phone_client)
+        self.phone_atc_norm = to_e164(self.phone_atc)
+    
+    def save(self, *args, **kwargs):
+        self.recalculate_totals()
+        self.normalize_phones()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and {'phone_client', 'phone_atc'} & set(update_fields):
+            kwargs['update_fields'] = set(update_fields) | {'phone_norm', 'phone_atc_norm'}
         super().save(*args, **kwargs)
 
 
@@ -99,6 +119,9 @@ class ZayavkaFile(models.Model):
     type = models.CharField(max_length=10, choices=FILE_TYPES)
     uploaded_at = models.DateTimeField(auto_now_add=True)
     uploaded_by = models.ForeignKey('Polzovateli', on_delete=models.SET_NULL, null=True)
+    # Идентификатор записи во внешнем источнике (mango:<id>, atc:<путь>, email:<файл>)
+    source_id = models.CharField('Источник', max_length=255, unique=True, null=True, blank=True)
+    content_hash = models.CharField('SHA-256 содержимого', max_length=64, unique=True, null=True, blank=True)
     
     class Meta:
         verbose_name = 'Файл заявки'
@@ -113,24 +136,7 @@ class ZayavkaFile(models.Model):
 @receiver(post_save, sender=Zayavki)
 def create_master_payout_on_close(sender, instance, created, **kwargs):
     """Создает выплату мастеру при закрытии заявки"""
-    # Проверяем, что это не создание новой записи и статус изменился на завершающий
-    if (
-        not created and 
-        instance.status in ['Готово', 'Модерн'] and 
-        instance.master and 
-        instance.chistymi and 
-        instance.chistymi > 0
-    ):
-        # Проверяем, не была ли уже создана выплата для этой заявки
-        from .finance import MasterPayout
-        payout, created_payout = MasterPayout.objects.get_or_create(
-            zayavka=instance,
-            defaults={
-                'summa': instance.chistymi,
-                'status': 'pending'
-            }
-        )
-        # Если выплата уже существовала, обновляем сумму только если она изменилась
-        if not created_payout and payout.summa != instance.chistymi:
-            payout.summa = instance.chistymi
-            payout.save(update_fields=['summa']) 
\ No newline at end of file
+    # Новая заявка выплаты не порождает; условия закрытия проверяет сервис
+    if not created:
+        from ..closeout import sync_payouts
+        sync_payouts([instance])
@@ -8,6 +8,9 @@ from django.core.cache import cache
 from datetime import datetime, timedelta
 import json
 import os
+import threading
+import time
+from prometheus_client import Counter, Histogram
 
 logger = logging.getLogger(__name__)
 
@@ -167,72 +170,182 @@ class AlertManager:
             logger.error(f'Failed to log alert: {e}')
 
 
+# Фиксированные границы корзин латентности (секунды) для p50/p95/p99
+LATENCY_BUCKETS = (0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, float('inf'))
+
+REQUEST_LATENCY = Histogram(
+    'crm_request_duration_seconds',
+    'Время обработки запроса по шаблону маршрута',
+    ['route', 'method'],
+    buckets=LATENCY_BUCKETS,
+)
+REQUEST_ERRORS = Counter(
+    'crm_request_errors_total',
+    'Ответы с кодом >= 400 по шаблону маршрута',
+    ['route', 'method'],
+)
+
+
+class LocalMetricsStore:
+    """Счётчики в памяти процесса (если Redis не настроен)"""
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._data = {}
+    
+    def increment(self, key, fields):
+        with self._lock:
+            counters = self._data.setdefault(key, {})
+            for field, amount in fields.items():
+                counters[field] = counters.get(field, 0) + amount
+    
+    def read_all(self):
+        with self._lock:
+            return {key: dict(counters) for key, counters in self._data.items()}
+
+
+class RedisMetricsStore:
+    """Общие для всех воркеров счётчики: один HINCRBY-конвейер на запрос"""
+    
+    routes_key = 'crm:perf:routes'
+    key_prefix = 'crm:perf:route:'
+    ttl = 86400  # Храним метрики 24 часа
+    socket_timeout = 0.1  # Запись метрик не должна задерживать ответ
+    retry_seconds = 30  # После ошибки Redis метрики не пишутся это время
+    
+    def __init__(self, redis_url):
+        import redis
+        self.client = redis.Redis.from_url(
+            redis_url,
+            socket_timeout=self.socket_timeout,
+            socket_connect_timeout=self.socket_timeout,
+        )
+        self._errors = redis.RedisError
+        self._skip_until = 0.0
+    
+    def increment(self, key, fields):
+        # Недоступный Redis не ждём на каждом запросе: пропускаем запись до retry_seconds
+        if time.monotonic() < self._skip_until:
+            return
+        redis_key = f'{self.key_prefix}{key}'
+        pipe = self.client.pipeline(transaction=False)
+        for field, amount in fields.items():
+            pipe.hincrby(redis_key, field, amount)
+        pipe.expire(redis_key, self.ttl)
+        pipe.sadd(self.routes_key, key)
+        pipe.expire(self.routes_key, self.ttl)
+        try:
+            pipe.execute()
+        except self._errors as e:
+            self._skip_until = time.monotonic() + self.retry_seconds
+            logger.warning(f'Redis недоступен, метрики не пишутся {self.retry_seconds} с: {e}')
+    
+    def read_all(self):
+        keys = [k.decode('utf-8') for k in self.client.smembers(self.routes_key)]
+        pipe = self.client.pipeline(transaction=False)
+        for key in keys:
+            pipe.hgetall(f'{self.key_prefix}{key}')
+        result = {}
+        for key, counters in zip(keys, pipe.execute()):
+            if counters:
+                result[key] = {f.decode('utf-8'): int(v) for f, v in counters.items()}
+        return result
+
+
 class PerformanceMonitor:
-    """Мониторинг производительности"""
+    """
+    Мониторинг производительности.
+    
+    Метрики ключуются шаблоном маршрута (имя view, а не фактический путь),
+    поэтому их количество ограничено. На каждый запрос выполняются только
+    атомарные инкременты: гистограмма Prometheus в процессе и HINCRBY
+    в Redis (или счётчики в памяти без Redis) — без перезаписи общего словаря.
+    """
     
     def __init__(self):
-        self.metrics_cache_key = 'crm_performance_metrics'
+        self._store = None
+    
+    @property
+    def store(self):
+        if self._store is None:
+            redis_url = getattr(settings, 'REDIS_URL', None)
+            self._store = RedisMetricsStore(redis_url) if redis_url else LocalMetricsStore()
+        return self._store
+    
+    @staticmethod
+    def get_route(request):
+        """Шаблон маршрута запроса: 'zayavki-detail' вместо '/api/v1/zayavki/15/'"""
+        match = getattr(request, 'resolver_match', None)
+        if match is None:
+            return 'unmatched'
+        return match.view_name or match.route or 'unmatched'
     
     def record_request_time(self, endpoint, method, duration, status_code):
         """Запись времени выполнения запроса"""
         try:
-            metrics = cache.get(self.metrics_cache_key, {})
-            
-            key = f"{method}_{endpoint}"
-            if key not in metrics:
-                metrics[key] = {
-                    'count': 0,
-                    'total_time': 0,
-                    'avg_time': 0,
-                    'min_time': float('inf'),
-                    'max_time': 0,
-                    'error_count': 0,
-                    'last_updated': datetime.now().isoformat()
-                }
-            
-            metric = metrics[key]
-            metric['count'] += 1
-            metric['total_time'] += duration
-            metric['avg_time'] = metric['total_time'] / metric['count']
-            metric['min_time'] = min(metric['min_time'], duration)
-            metric['max_time'] = max(metric['max_time'], duration)
-            
+            REQUEST_LATENCY.labels(endpoint, method).observe(duration)
             if status_code >= 400:
-                metric['error_count'] += 1
+                REQUEST_ERRORS.labels(endpoint, method).inc()
             
-            metric['last_updated'] = datetime.now().isoformat()
-            
-            # Храним метрики 24 часа
-            cache.set(self.metrics_cache_key, metrics, 86400)
+            bucket = next(i for i, bound in enumerate(LATENCY_BUCKETS) if duration <= bound)
+            self.store.increment(f"{method} {endpoint}", {
+                'count': 1,
+                'error_count': 1 if status_code >= 400 else 0,
+                'total_us': int(duration * 1_000_000),
+                f'bucket_{bucket}': 1,
+            })
             
         except Exception as e:
             logger.error(f'Failed to record performance metric: {e}')
-            # Если кэш недоступен, продолжаем работу без метрик
+            # Если хранилище недоступно, продолжаем работу без метрик
+    
+    @staticmethod
+    def _percentile(counters, count, quantile):
+        """Оценка перцентиля по корзинам (верхняя граница корзины)"""
+        threshold = quantile * count
+        cumulative = 0
+        for i, bound in enumerate(LATENCY_BUCKETS):
+            cumulative += counters.get(f'bucket_{i}', 0)
+            if cumulative >= threshold:
+                return bound if bound != float('inf') else LATENCY_BUCKETS[-2]
+        return LATENCY_BUCKETS[-2]
     
     def get_performance_metrics(self):
         """Получение метрик производительности"""
         try:
-            metrics = cache.get(self.metrics_cache_key, {})
+            endpoints = {}
+            for key, counters in self.store.read_all().items():
+                count = counters.get('count', 0)
+                if not count:
+                    continue
+                endpoints[key] = {
+                    'count': count,
+                    'error_count': counters.get('error_count', 0),
+                    'avg_time': counters.get('total_us', 0) / count / 1_000_000,
+                    'p50': self._percentile(counters, count, 0.50),
+                    'p95': self._percentile(counters, count, 0.95),
+                    'p99': self._percentile(counters, count, 0.99),
+                }
             
             # Добавляем общую статистику
-            total_requests = sum(m['count'] for m in metrics.values())
-            total_errors = sum(m['error_count'] for m in metrics.values())
-            avg_response_time = sum(m['avg_time'] for m in metrics.values()) / len(metrics) if metrics else 0
+            total_requests = sum(m['count'] for m in endpoints.values())
+            total_errors = sum(m['error_count'] for m in endpoints.values())
+            total_time = sum(m['avg_time'] * m['count'] for m in endpoints.values())
             
             return {
-                'endpoints': metrics,
+                'endpoints': endpoints,
                 'summary': {
                     'total_requests': total_requests,
                     'total_errors': total_errors,
                     'error_rate': (total_errors / total_requests * 100) if total_requests > 0 else 0,
-                    'avg_response_time': avg_response_time,
+                    'avg_response_time': (total_time / total_requests) if total_requests > 0 else 0,
                     'timestamp': datetime.now().isoformat()
                 }
             }
             
         except Exception as e:
             logger.error(f'Failed to get performance metrics: {e}')
-            # Возвращаем пустые метрики если кэш недоступен
+            # Возвращаем пустые метрики если хранилище недоступно
             return {
                 'endpoints': {},
                 'summary': {
@@ -0,0 +1,290 @@
+"""
+Очередь исходящих уведомлений в Telegram (outbox).
+
+Запрос только записывает сообщение в таблицу NotificationOutbox, доставку
+выполняет воркер ``manage.py send_notifications``: пачками, с ограничением
+частоты на чат, повторами с экспоненциальной задержкой и дедупликацией.
+Тот же воркер раз в PURGE_INTERVAL удаляет отправленные и окончательно
+неотправленные сообщения старше срока хранения (вместе с ними истекают
+и их ключи дедупликации).
+"""
+
+import hashlib
+import logging
+import time
+from collections import OrderedDict
+from datetime import timedelta
+
+import requests
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from .models import NotificationOutbox
+
+logger = logging.getLogger(__name__)
+
+TELEGRAM_API_URL = 'https://api.telegram.org/bot{token}/sendMessage'
+# Максимальная длина одного сообщения Telegram
+TELEGRAM_MESSAGE_LIMIT = 4096
+MESSAGE_SEPARATOR = '\n\n'
+
+DEFAULT_OUTBOX_SETTINGS = {
+    'BATCH_SIZE': 50,         # Сообщений за один проход воркера
+    'MAX_ATTEMPTS': 8,        # После стольких ошибок сообщение помечается failed
+    'RETRY_BASE': 5,          # Базовая задержка повтора (секунды), растёт как 2**n
+    'RETRY_MAX': 3600,        # Максимальная задержка повтора
+    'CHAT_INTERVAL': 1.0,     # Не чаще одного сообщения в секунду в один чат
+    'GLOBAL_INTERVAL': 0.05,  # Не более ~20 сообщений в секунду на бота
+    'DEDUP_WINDOW': 300,      # Одинаковые сообщения в этом окне отправляются один раз
+    'LEASE': 60,              # На сколько секунд воркер «забирает» пачку
+    'POLL_INTERVAL': 2,       # Пауза воркера при пустой очереди
+    'TIMEOUT': 10,            # Таймаут HTTP-запроса к Telegram
+    'RETENTION_DAYS': 14,     # Сколько дней хранить отправленные сообщения
+    'FAILED_RETENTION_DAYS': 30,  # ... и сообщения со статусом failed
+    'PURGE_INTERVAL': 3600,   # Как часто воркер чистит outbox (секунды)
+    'PURGE_BATCH': 1000,      # Строк за один DELETE
+}
+
+
+def outbox_settings():
+    return {**DEFAULT_OUTBOX_SETTINGS, **getattr(settings, 'NOTIFICATION_OUTBOX', {})}
+
+
+def get_bot_config(bot):
+    """Токен и чат по умолчанию для бота: alerts — алерты, notify — рабочие уведомления"""
+    bots = {
+        'alerts': (getattr(settings, 'TELEGRAM_BOT_TOKEN', None), getattr(settings, 'TELEGRAM_CHAT_ID', None)),
+        'notify': (getattr(settings, 'TELEGRAM_NOTIFY_BOT_TOKEN', None), getattr(settings, 'TELEGRAM_NOTIFY_CHAT_ID', None)),
+    }
+    return bots.get(bot, (None, None))
+
+
+def make_dedup_key(bot, chat_id, text, dedup_key=None, dedup_window=None):
+    """
+    Ключ дедупликации. Без явного ключа — хеш текста в пределах окна
+    DEDUP_WINDOW; явный ключ (например, id заявки) действует бессрочно.
+    """
+    if dedup_window is None:
+        dedup_window = 0 if dedup_key else outbox_settings()['DEDUP_WINDOW']
+    base = dedup_key or text
+    if dedup_window:
+        base = f'{base}:{int(time.time()) // dedup_window}'
+    return hashlib.sha256(f'{bot}:{chat_id}:{base}'.encode('utf-8')).hexdigest()
+
+
+def enqueue_telegram_message(text, chat_id=None, bot='alerts', parse_mode='HTML',
+                             dedup_key=None, dedup_window=None):
+    """
+    Ставит сообщение в очередь на отправку.
+
+    Returns:
+        bool: True если сообщение добавлено, False для дубликата или ошибки
+    """
+    token, default_chat_id = get_bot_config(bot)
+    if not token:
+        logger.error(f'Telegram token not configured for bot "{bot}", message skipped')
+        return False
+    chat_id = chat_id or default_chat_id
+    if not chat_id:
+        logger.error(f'Telegram chat_id not configured for bot "{bot}"')
+        return False
+
+    key = make_dedup_key(bot, chat_id, text, dedup_key, dedup_window)
+    try:
+        with transaction.atomic():
+            NotificationOutbox.objects.create(
+                bot=bot,
+                chat_id=str(chat_id),
+                text=text,
+                parse_mode=parse_mode or '',
+                dedup_key=key,
+            )
+    except IntegrityError:
+        logger.debug(f'Duplicate notification skipped: {key}')
+        return False
+    except Exception as e:
+        logger.error(f'Failed to enqueue notification: {e}')
+        return False
+    return True
+
+
+class TelegramDeliveryWorker:
+    """Доставка сообщений из outbox с батчингом, лимитами и повторами"""
+
+    def __init__(self, session=None, config=None):
+        self.session = session or requests.Session()
+        self.config = {**outbox_settings(), **(config or {})}
+        self._chat_ready_at = {}
+        self._bot_ready_at = {}
+        self._purged_at = None
+
+    def claim_batch(self):
+        """Забирает пачку готовых к отправке сообщений (аренда на LEASE секунд)"""
+        now = timezone.now()
+        with transaction.atomic():
+            ids = list(
+                NotificationOutbox.objects
+                .select_for_update(skip_locked=True)
+                .filter(status='pending', next_attempt_at__lte=now)
+                .order_by('id')
+                .values_list('id', flat=True)[:self.config['BATCH_SIZE']]
+            )
+            if ids:
+                NotificationOutbox.objects.filter(id__in=ids).update(
+                    next_attempt_at=now + timedelta(seconds=self.config['LEASE'])
+                )
+        return list(NotificationOutbox.objects.filter(id__in=ids).order_by('id'))
+
+    @staticmethod
+    def pack_messages(messages):
+        """
+        Склеивает сообщения одного чата в пачки до лимита длины Telegram.
+        Возвращает список (bot, chat_id, parse_mode, [messages]).
+        """
+        groups = OrderedDict()
+        for message in messages:
+            groups.setdefault((message.bot, message.chat_id, message.parse_mode), []).append(message)
+
+        packs = []
+        for (bot, chat_id, parse_mode), items in groups.items():
+            current, length = [], 0
+            for message in items:
+                extra = len(message.text) + (len(MESSAGE_SEPARATOR) if current else 0)
+                if current and length + extra > TELEGRAM_MESSAGE_LIMIT:
+                    packs.append((bot, chat_id, parse_mode, current))
+                    current, length = [], 0
+                    extra = len(message.text)
+                current.append(message)
+                length += extra
+            if current:
+                packs.append((bot, chat_id, parse_mode, current))
+        return packs
+
+    def _wait_for_slot(self, bot, chat_id):
+        """Ограничение частоты: отдельно на чат и на бота"""
+        ready_at = max(
+            self._chat_ready_at.get((bot, chat_id), 0),
+            self._bot_ready_at.get(bot, 0),
+        )
+        delay = ready_at - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        now = time.monotonic()
+        self._chat_ready_at[(bot, chat_id)] = now + self.config['CHAT_INTERVAL']
+        self._bot_ready_at[bot] = now + self.config['GLOBAL_INTERVAL']
+
+    def _post(self, bot, chat_id, parse_mode, text):
+        """Отправляет сообщение. Возвращает (ok, retry_after, permanent, error)."""
+        token = get_bot_config(bot)[0]
+        if not token:
+            return False, None, True, f'Не настроен токен бота "{bot}"'
+
+        data = {'chat_id': chat_id, 'text': text}
+        if parse_mode:
+            data['parse_mode'] = parse_mode
+
+        self._wait_for_slot(bot, chat_id)
+        try:
+            response = self.session.post(
+                TELEGRAM_API_URL.format(token=token), data=data, timeout=self.config['TIMEOUT']
+            )
+        except requests.exceptions.RequestException as e:
+            return False, None, False, str(e)
+
+        if response.status_code == 200:
+            return True, None, False, ''
+
+        error = f'{response.status_code}: {response.text[:500]}'
+        if response.status_code == 429:
+            try:
+                retry_after = int(response.json().get('parameters', {}).get('retry_after', 1))
+            except ValueError:
+                retry_after = 1
+            # Telegram просит подождать — не шлём в этот чат до окончания паузы
+            self._chat_ready_at[(bot, chat_id)] = time.monotonic() + retry_after
+            return False, retry_after, False, error
+        # 400/403 и т.п. не исправятся повтором
+        permanent = 400 <= response.status_code < 500
+        return False, None, permanent, error
+
+    def _mark_sent(self, messages):
+        NotificationOutbox.objects.filter(id__in=[m.id for m in messages]).update(
+            status='sent', sent_at=timezone.now(), last_error=''
+        )
+
+    def _mark_retry(self, messages, error, retry_after=None, permanent=False):
+        now = timezone.now()
+        for message in messages:
+            message.attempts += 1
+            message.last_error = error
+            if permanent or message.attempts >= self.config['MAX_ATTEMPTS']:
+                message.status = 'failed'
+                logger.error(f'Notification {message.id} failed: {error}')
+            else:
+                delay = retry_after or min(
+                    self.config['RETRY_BASE'] * 2 ** (message.attempts - 1), self.config['RETRY_MAX']
+                )
+                message.next_attempt_at = now + timedelta(seconds=delay)
+        NotificationOutbox.objects.bulk_update(
+            messages, ['attempts', 'last_error', 'status', 'next_attempt_at']
+        )
+
+    def _deliver_pack(self, bot, chat_id, parse_mode, messages):
+        text = MESSAGE_SEPARATOR.join(m.text for m in messages)
+        ok, retry_after, permanent, error = self._post(bot, chat_id, parse_mode, text)
+        if ok:
+            self._mark_sent(messages)
+            return len(messages)
+        if permanent and len(messages) > 1:
+            # Одна ошибочная разметка не должна блокировать всю пачку
+            return sum(self._deliver_pack(bot, chat_id, parse_mode, [m]) for m in messages)
+        logger.warning(f'Telegram delivery failed for {len(messages)} message(s): {error}')
+        self._mark_retry(messages, error, retry_after=retry_after, permanent=permanent)
+        return 0
+
+    def process_batch(self):
+        """Один проход: забрать пачку и отправить. Возвращает (забрано, отправлено)."""
+        messages = self.claim_batch()
+        sent = 0
+        for bot, chat_id, parse_mode, pack in self.pack_messages(messages):
+            sent += self._deliver_pack(bot, chat_id, parse_mode, pack)
+        return len(messages), sent
+
+    def purge(self, now=None):
+        """Удаляет sent/failed сообщения старше срока хранения. Returns: число удалённых."""
+        now = now or timezone.now()
+        deleted = 0
+        for status, days in (('sent', self.config['RETENTION_DAYS']),
+                             ('failed', self.config['FAILED_RETENTION_DAYS'])):
+            expired = NotificationOutbox.objects.filter(status=status, created_at__lt=now - timedelta(days=days))
+            # Пачками по первичному ключу — без долгой блокировки таблицы
+            while True:
+                ids = list(expired.order_by('id').values_list('id', flat=True)[:self.config['PURGE_BATCH']])
+                if not ids:
+                    break
+                deleted += NotificationOutbox.objects.filter(id__in=ids).delete()[0]
+        if deleted:
+            logger.info(f'Notification outbox purged: {deleted}')
+        return deleted
+
+    def _purge_if_due(self):
+        now = time.monotonic()
+        if self._purged_at is None or now - self._purged_at >= self.config['PURGE_INTERVAL']:
+            self._purged_at = now
+            try:
+                self.purge()
+            except Exception as e:
+                logger.error(f'Notification outbox purge failed: {e}')
+
+    def run(self, once=False):
+        """Цикл воркера; с once=True завершается, когда очередь опустела"""
+        while True:
+            self._purge_if_due()
+            claimed, sent = self.process_batch()
+            if claimed:
+                logger.info(f'Notifications delivered: {sent}/{claimed}')
+                continue
+            if once:
+                return
+            time.sleep(self.config['POLL_INTERVAL'])
@@ -3,7 +3,6 @@
 """
 
 from django.db import models
-from django.core.cache import cache
 from django.conf import settings
 import logging
 
@@ -63,28 +62,17 @@ class CacheOptimizer:
     
     @staticmethod
     def cache_queryset_result(cache_key, queryset_func, timeout=None):
-        """Кэширование результата queryset"""
+        """Кэширование результата queryset (с защитой от одновременного пересчёта)"""
+        from .cache import CacheManager
         if timeout is None:
             timeout = CacheOptimizer.CACHE_TIMEOUT
-        
-        # Пытаемся получить из кэша
-        cached_result = cache.get(cache_key)
-        if cached_result is not None:
-            logger.debug(f"Cache hit for key: {cache_key}")
-            return cached_result
-        
-        # Выполняем запрос и кэшируем результат
-        result = queryset_func()
-        cache.set(cache_key, result, timeout)
-        logger.debug(f"Cache miss for key: {cache_key}, cached for {timeout}s")
-        return result
+        return CacheManager.get_or_set(cache_key, queryset_func, timeout, cache_type='query_results')
     
     @staticmethod
     def invalidate_cache_pattern(pattern):
         """Инвалидация кэша по паттерну"""
-        # В Redis можно использовать SCAN для поиска ключей по паттерну
-        # В простом случае просто логируем
-        logger.info(f"Cache invalidation requested for pattern: {pattern}")
+        from .cache import CacheManager
+        return CacheManager.clear_pattern(pattern)
 
 class DatabaseOptimizer:
     """Класс для оптимизации базы данных"""
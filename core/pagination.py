@@ -0,0 +1,163 @@
+"""
+Классы пагинации для API CRM системы
+"""
+
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from collections import OrderedDict
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """
+    Keyset (cursor) пагинация по составному ключу сортировки.
+
+    Вместо OFFSET страница выбирается условием вида
+    ``(meeting_date, id) < (последняя_дата, последний_id)``, поэтому время
+    ответа не зависит от глубины страницы. Общее количество записей
+    (COUNT(*)) не вычисляется. Курсоры next/previous непрозрачны для клиента.
+    """
+
+    page_size = api_settings.PAGE_SIZE or 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Неверный курсор'
+
+    # Последнее поле должно быть уникальным (обычно id) — оно разрешает
+    # совпадения по предыдущим полям и гарантирует стабильный порядок.
+    ordering = ('-id',)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.page_size = self.get_page_size(request)
+
+        reverse, position = self.decode_cursor(request)
+        self.has_cursor = position is not None
+        self.reverse = reverse
+
+        ordering = self._reversed_ordering() if reverse else self.ordering
+        queryset = queryset.order_by(*ordering)
+        if position is not None:
+            queryset = queryset.filter(self._build_keyset_filter(queryset.model, ordering, position))
+
+        results = list(queryset[:self.page_size + 1])
+        self.has_more = len(results) > self.page_size
+        results = results[:self.page_size]
+        if reverse:
+            results.reverse()
+
+        self.first_position = self._get_position(results[0]) if results else None
+        self.last_position = self._get_position(results[-1]) if results else None
+        self.page = results
+        return results
+
+    def get_page_size(self, request):
+        if self.page_size_query_param:
+            try:
+                value = int(request.query_params[self.page_size_query_param])
+                if value > 0:
+                    return min(value, self.max_page_size)
+            except (KeyError, ValueError):
+                pass
+        return self.page_size
+
+    def get_next_link(self):
+        has_next = self.has_more if not self.reverse else self.has_cursor
+        if not has_next or self.last_position is None:
+            return None
+        return self.encode_cursor(False, self.last_position)
+
+    def get_previous_link(self):
+        has_previous = self.has_cursor if not self.reverse else self.has_more
+        if not has_previous or self.first_position is None:
+            return None
+        return self.encode_cursor(True, self.first_position)
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data),
+        ]))
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+    def decode_cursor(self, request):
+        """Возвращает (reverse, position) из параметра курсора."""
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return False, None
+        try:
+            padding = '=' * (-len(encoded) % 4)
+            payload = json.loads(urlsafe_b64decode(encoded + padding).decode('utf-8'))
+            position = payload['p']
+            if not isinstance(position, list) or len(position) != len(self.ordering):
+                raise ValueError('position length mismatch')
+            return bool(payload.get('r')), position
+        except (TypeError, ValueError, KeyError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def encode_cursor(self, reverse, position):
+        payload = {'p': position}
+        if reverse:
+            payload['r'] = 1
+        encoded = urlsafe_b64encode(
+            json.dumps(payload, separators=(',', ':')).encode('utf-8')
+        ).decode('ascii').rstrip('=')
+        url = remove_query_param(self.base_url, self.cursor_query_param)
+        return replace_query_param(url, self.cursor_query_param, encoded)
+
+    def _reversed_ordering(self):
+        return tuple(field[1:] if field.startswith('-') else f'-{field}' for field in self.ordering)
+
+    def _get_position(self, instance):
+        position = []
+        for field in self.ordering:
+            name = field.lstrip('-')
+            value = instance[name] if isinstance(instance, dict) else getattr(instance, name)
+            position.append(value.isoformat() if hasattr(value, 'isoformat') else value)
+        return position
+
+    def _build_keyset_filter(self, model, ordering, position):
+        """
+        Строит условие лексикографического сравнения
+        (a, b, c) > (x, y, z) как a > x OR (a = x AND b > y) OR ...
+        """
+        try:
+            values = [
+                model._meta.get_field(field.lstrip('-')).to_python(value)
+                for field, value in zip(ordering, position)
+            ]
+        except ValidationError:
+            raise NotFound(self.invalid_cursor_message)
+
+        condition = Q()
+        equal_prefix = Q()
+        for field, value in zip(ordering, values):
+            name = field.lstrip('-')
+            lookup = f'{name}__lt' if field.startswith('-') else f'{name}__gt'
+            condition |= equal_prefix & Q(**{lookup: value})
+            equal_prefix &= Q(**{name: value})
+        return condition
+
+
+class ZayavkiKeysetPagination(KeysetPagination):
+    """Keyset пагинация заявок по (meeting_date, id), от новых к старым."""
+    ordering = ('-meeting_date', '-id')
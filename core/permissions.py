@@ -1,5 +1,13 @@
 from rest_framework import permissions
 
+
+def is_same_city(user, obj):
+    """Сравнивает город объекта и пользователя по gorod_id, без запросов к БД"""
+    user_gorod_id = getattr(user, 'gorod_id', None)
+    if user_gorod_id is None:
+        return False
+    return getattr(obj, 'gorod_id', None) == user_gorod_id
+
 class IsDirectorOrAdmin(permissions.BasePermission):
     """
     Разрешает доступ только директорам и администраторам.
@@ -50,19 +58,8 @@ class IsSameCity(permissions.BasePermission):
     def has_object_permission(self, request, view, obj):
         if hasattr(request.user, 'role') and request.user.role == 'admin':
             return True
-        # Для директора проверяем, что объект принадлежит его городу
-        if hasattr(request.user, 'role') and request.user.role == 'director':
-            if hasattr(obj, 'gorod') and hasattr(request.user, 'gorod'):
-                return obj.gorod == request.user.gorod
-            elif hasattr(obj, 'gorod_id') and hasattr(request.user, 'gorod'):
-                return obj.gorod_id == request.user.gorod.id
-            return False
-        # Для остальных ролей проверяем, что объект принадлежит тому же городу
-        if hasattr(obj, 'gorod') and hasattr(request.user, 'gorod'):
-            return obj.gorod == request.user.gorod
-        elif hasattr(obj, 'gorod_id') and hasattr(request.user, 'gorod'):
-            return obj.gorod_id == request.user.gorod.id
-        return False
+        # Директоры и остальные роли имеют доступ только к объектам своего города
+        return is_same_city(request.user, obj)
 
 class IsOwnerOrSameCity(permissions.BasePermission):
     """
@@ -79,21 +76,10 @@ class IsOwnerOrSameCity(permissions.BasePermission):
         if hasattr(request.user, 'role') and request.user.role == 'admin':
             return True
         # Проверяем, является ли пользователь владельцем
-        if hasattr(obj, 'user') and obj.user == request.user:
+        if getattr(obj, 'user_id', None) is not None and obj.user_id == request.user.id:
             return True
-        # Для директора проверяем, что объект принадлежит его городу
-        if hasattr(request.user, 'role') and request.user.role == 'director':
-            if hasattr(obj, 'gorod') and hasattr(request.user, 'gorod'):
-                return obj.gorod == request.user.gorod
-            elif hasattr(obj, 'gorod_id') and hasattr(request.user, 'gorod'):
-                return obj.gorod_id == request.user.gorod.id
-            return False
-        # Для остальных ролей проверяем, что объект принадлежит тому же городу
-        if hasattr(obj, 'gorod') and hasattr(request.user, 'gorod'):
-            return obj.gorod == request.user.gorod
-        elif hasattr(obj, 'gorod_id') and hasattr(request.user, 'gorod'):
-            return obj.gorod_id == request.user.gorod.id
-        return False
+        # Директоры и остальные роли имеют доступ только к объектам своего города
+        return is_same_city(request.user, obj)
 
 class IsReadOnlyForKC(permissions.BasePermission):
     """
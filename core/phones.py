@@ -0,0 +1,55 @@
+"""
+Нормализация телефонных номеров
+"""
+
+import re
+
+_NON_DIGITS = re.compile(r'\D')
+# Российский номер внутри текста (имя файла, тема письма)
+_PHONE_IN_TEXT = re.compile(r'(?<!\d)(\+?[78]?\d{10})(?!\d)')
+
+
+def normalize_phone(value):
+    """
+    Приводит российский номер к виду 7XXXXXXXXXX.
+    Прочие номера возвращаются только цифрами, пустые — как None.
+    """
+    if not value:
+        return None
+    digits = _NON_DIGITS.sub('', str(value))
+    if len(digits) == 11 and digits[0] in '78':
+        return '7' + digits[1:]
+    if len(digits) == 10 and digits[0] == '9':
+        return '7' + digits
+    return digits or None
+
+
+def phone_variants(value):
+    """
+    Варианты записи номера, встречающиеся в phone_client / phone_atc
+    (с «+7», «7», «8» и без кода страны) — для точного поиска по индексу.
+    """
+    phone = normalize_phone(value)
+    if not phone:
+        return []
+    if len(phone) == 11 and phone.startswith('7'):
+        local = phone[1:]
+        return [phone, f'+{phone}', f'8{local}', local]
+    return [phone, f'+{phone}']
+
+
+def to_e164(value):
+    """
+    Канонический номер E.164 (+7XXXXXXXXXX) для колонок phone_norm.
+    Внутренние и слишком короткие номера дают None.
+    """
+    phone = normalize_phone(value)
+    if not phone or not 11 <= len(phone) <= 15:
+        return None
+    return f'+{phone}'
+
+
+def find_phone(text):
+    """Первый российский номер в тексте, в виде 7XXXXXXXXXX, или None"""
+    match = _PHONE_IN_TEXT.search(text or '')
+    return normalize_phone(match.group(1)) if match else None
@@ -0,0 +1,328 @@
+"""
+Сопоставление записей звонков с заявками для импортеров аудио
+(почта Mango, API Mango, файлы АТС).
+
+Дубликаты отсекаются по уникальным source_id / content_hash в ZayavkaFile,
+заявки подбираются пачкой: один запрос ``phone IN (...)`` на пачку,
+выбор по окну времени звонка — в памяти.
+"""
+
+import hashlib
+import logging
+import os
+import re
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from pathlib import Path
+
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import ImportDirectoryCheckpoint, Zayavki, ZayavkaFile
+from .phones import find_phone, normalize_phone, to_e164
+
+logger = logging.getLogger(__name__)
+
+# Окно поиска заявки вокруг времени звонка
+MATCH_WINDOW = timedelta(minutes=30)
+MATCH_BATCH_SIZE = 500
+ATTACH_WORKERS = 4
+
+_CALL_TIME_PATTERNS = [
+    (re.compile(r'(\d{4})\.(\d{2})\.(\d{2})__(\d{2})-(\d{2})-(\d{2})'), ('Y', 'm', 'd', 'H', 'M', 'S')),  # 2025.07.05__17-16-36
+    (re.compile(r'(\d{2})\.(\d{2})\.(\d{4})_(\d{2}):(\d{2}):(\d{2})'), ('d', 'm', 'Y', 'H', 'M', 'S')),   # 05.07.2025_17:16:36
+    (re.compile(r'(\d{4})-(\d{2})-(\d{2})_(\d{2})-(\d{2})-(\d{2})'), ('Y', 'm', 'd', 'H', 'M', 'S')),    # 2025-07-05_17-16-36
+]
+
+
+def phone_from_filename(filename):
+    return find_phone(filename)
+
+
+def call_time_from_filename(filename):
+    """Время звонка из имени файла (в текущем часовом поясе) или None"""
+    for pattern, order in _CALL_TIME_PATTERNS:
+        match = pattern.search(filename)
+        if not match:
+            continue
+        values = dict(zip(order, (int(group) for group in match.groups())))
+        try:
+            return datetime(values['Y'], values['m'], values['d'], values['H'], values['M'], values['S'])
+        except ValueError:
+            continue
+    return None
+
+
+def hash_bytes(content):
+    return hashlib.sha256(content).hexdigest()
+
+
+def hash_file(path, chunk_size=1024 * 1024):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class Recording:
+    """Запись звонка из внешнего источника"""
+
+    def __init__(self, source_id, phone, call_time=None, filename='', content_hash=None, payload=None):
+        self.source_id = source_id
+        self.phone = normalize_phone(phone)
+        if call_time is not None and timezone.is_naive(call_time):
+            call_time = timezone.make_aware(call_time)
+        self.call_time = call_time
+        self.filename = filename
+        self.content_hash = content_hash
+        # Произвольные данные источника (путь к файлу, данные звонка и т.п.)
+        self.payload = payload
+
+    def __repr__(self):
+        return f'Recording({self.source_id!r}, {self.phone!r})'
+
+
+class RecordingMatcher:
+    """
+    Сопоставление записей с заявками.
+
+    Args:
+        window: окно поиска заявки вокруг времени звонка
+        fallback_to_latest: если в окне заявки нет (или время звонка
+            неизвестно) — брать самую свежую заявку с этим номером
+    """
+
+    def __init__(self, window=MATCH_WINDOW, fallback_to_latest=True):
+        self.window = window
+        self.fallback_to_latest = fallback_to_latest
+
+    @staticmethod
+    def existing_keys(recordings):
+        """source_id и content_hash, уже сохранённые в ZayavkaFile (один запрос)"""
+        source_ids = [r.source_id for r in recordings if r.source_id]
+        hashes = [r.content_hash for r in recordings if r.content_hash]
+        if not source_ids and not hashes:
+            return set()
+        rows = ZayavkaFile.objects.filter(
+            Q(source_id__in=source_ids) | Q(content_hash__in=hashes)
+        ).values_list('source_id', 'content_hash')
+        return {key for row in rows for key in row if key}
+
+    def filter_new(self, recordings):
+        """Отбрасывает записи, которые уже прикреплены к заявкам"""
+        known = self.existing_keys(recordings)
+        return [
+            r for r in recordings
+            if r.source_id not in known and (not r.content_hash or r.content_hash not in known)
+        ]
+
+    def _candidates(self, recordings):
+        """Заявки по номерам пачки одним запросом: {номер: [(id, meeting_date)]}"""
+        phones = sorted({to_e164(r.phone) for r in recordings} - {None})
+        candidates = {}
+        if not phones:
+            return candidates
+        rows = Zayavki.objects.filter(
+            Q(phone_norm__in=phones) | Q(phone_atc_norm__in=phones)
+        ).values_list('id', 'phone_norm', 'phone_atc_norm', 'meeting_date')
+        for zayavka_id, phone_norm, phone_atc_norm, meeting_date in rows:
+            for phone in {normalize_phone(phone_norm), normalize_phone(phone_atc_norm)}:
+                if phone:
+                    candidates.setdefault(phone, []).append((zayavka_id, meeting_date))
+        return candidates
+
+    def _resolve(self, recording, candidates):
+        options = candidates.get(recording.phone)
+        if not options:
+            return None
+        if recording.call_time is not None:
+            in_window = [
+                (abs(meeting_date - recording.call_time), zayavka_id)
+                for zayavka_id, meeting_date in options
+                if abs(meeting_date - recording.call_time) <= self.window
+            ]
+            if in_window:
+                return min(in_window)[1]
+            if not self.fallback_to_latest:
+                return None
+        # Самая свежая заявка с этим номером
+        return max(options, key=lambda option: (option[1], option[0]))[0]
+
+    def match(self, recordings):
+        """Возвращает {source_id: zayavka_id} для найденных заявок"""
+        matches = {}
+        for start in range(0, len(recordings), MATCH_BATCH_SIZE):
+            batch = recordings[start:start + MATCH_BATCH_SIZE]
+            candidates = self._candidates(batch)
+            for recording in batch:
+                zayavka_id = self._resolve(recording, candidates)
+                if zayavka_id is not None:
+                    matches[recording.source_id] = zayavka_id
+        return matches
+
+    @staticmethod
+    def attach(recording, zayavka_id, file=None, file_name=None, uploaded_by=None):
+        """
+        Создаёт ZayavkaFile для записи. Возвращает None, если запись уже
+        прикреплена (гонка двух импортеров отсекается уникальным индексом).
+        """
+        zayavka_file = ZayavkaFile(
+            zayavka_id=zayavka_id,
+            type='audio',
+            uploaded_by=uploaded_by,
+            source_id=recording.source_id,
+            content_hash=recording.content_hash,
+        )
+        try:
+            with transaction.atomic():
+                if file is not None:
+                    zayavka_file.file.save(recording.filename, file, save=False)
+                else:
+                    zayavka_file.file.name = file_name or recording.filename
+                zayavka_file.save()
+        except IntegrityError:
+            if file is not None and zayavka_file.file:
+                zayavka_file.file.delete(save=False)
+            logger.info(f'Запись уже прикреплена: {recording.source_id}')
+            return None
+        return zayavka_file
+
+    @staticmethod
+    def _store_file(recording):
+        """Хеширует и копирует файл записи в хранилище (выполняется в потоке пула)"""
+        recording.content_hash = recording.content_hash or hash_file(recording.payload)
+        name = ZayavkaFile._meta.get_field('file').generate_filename(None, recording.filename)
+        with open(recording.payload, 'rb') as f:
+            return default_storage.save(name, File(f))
+
+    @classmethod
+    def _safe_store(cls, recording):
+        try:
+            return cls._store_file(recording)
+        except OSError as e:
+            logger.error(f'Ошибка копирования {recording.payload}: {e}')
+            return None
+
+    def bulk_attach(self, matches, recordings, uploaded_by=None, workers=ATTACH_WORKERS):
+        """
+        Прикрепляет пачку локальных файлов (payload — путь) к заявкам.
+
+        Хеширование и копирование идут в ограниченном пуле потоков, строки
+        ZayavkaFile вставляются одним bulk_create; дубликаты по source_id /
+        content_hash отсекаются уникальными индексами, их копии удаляются.
+        Возвращает число прикреплённых записей.
+        """
+        recordings = [r for r in recordings if r.source_id in matches]
+        if not recordings:
+            return 0
+
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+            stored = list(pool.map(self._safe_store, recordings))
+        prepared = [(r, name) for r, name in zip(recordings, stored) if name]
+
+        ZayavkaFile.objects.bulk_create(
+            [
+                ZayavkaFile(
+                    zayavka_id=matches[r.source_id],
+                    type='audio',
+                    uploaded_by=uploaded_by,
+                    file=name,
+                    source_id=r.source_id,
+                    content_hash=r.content_hash,
+                )
+                for r, name in prepared
+            ],
+            ignore_conflicts=True,
+        )
+
+        saved = dict(
+            ZayavkaFile.objects
+            .filter(source_id__in=[r.source_id for r, _ in prepared])
+            .values_list('source_id', 'file')
+        )
+        attached = 0
+        for recording, name in prepared:
+            if saved.get(recording.source_id) == name:
+                attached += 1
+            else:
+                # Строка не вставлена (уже прикреплено) — копия не нужна
+                default_storage.delete(name)
+                logger.info(f'Запись уже прикреплена: {recording.source_id}')
+        return attached
+
+
+ScannedDirectory = namedtuple('ScannedDirectory', 'path inode mtime_ns entries')
+
+
+class DirectoryManifest:
+    """
+    Манифест каталогов архива записей: inode и mtime каждого каталога на
+    момент последнего импорта (ImportDirectoryCheckpoint).
+
+    mtime каталога меняется при добавлении/удалении файлов в нём, поэтому
+    файлы неизменившихся каталогов не перечитываются и не stat-ятся —
+    обход сводится к чтению списков подкаталогов.
+    """
+
+    def __init__(self, root, source=None):
+        self.root = Path(root)
+        self.source = source or f'atc:{self.root.resolve()}'
+
+    def load(self):
+        return {
+            checkpoint.path: (checkpoint.inode, checkpoint.mtime_ns)
+            for checkpoint in ImportDirectoryCheckpoint.objects.filter(source=self.source)
+        }
+
+    def changed_directories(self, extensions, rescan=False):
+        """
+        Обходит дерево и отдаёт ScannedDirectory для новых и изменившихся
+        каталогов; entries — os.DirEntry файлов с нужными расширениями.
+        """
+        known = {} if rescan else self.load()
+        stack = [self.root]
+        while stack:
+            directory = stack.pop()
+            try:
+                # stat до чтения списка: файл, добавленный во время обхода,
+                # изменит mtime, и каталог будет просмотрен в следующий раз
+                stat = directory.stat()
+                relative = directory.relative_to(self.root).as_posix()
+                changed = known.get(relative) != (stat.st_ino, stat.st_mtime_ns)
+                entries = []
+                with os.scandir(directory) as iterator:
+                    for entry in iterator:
+                        if entry.is_dir(follow_symlinks=False):
+                            stack.append(Path(entry.path))
+                        elif changed and entry.is_file() and os.path.splitext(entry.name)[1].lower() in extensions:
+                            entries.append(entry)
+            except OSError as e:
+                logger.error(f'Ошибка чтения каталога {directory}: {e}')
+                continue
+            if changed:
+                yield ScannedDirectory(relative, stat.st_ino, stat.st_mtime_ns, entries)
+
+    def commit(self, directories):
+        """Запоминает состояние обработанных каталогов (один upsert)"""
+        if not directories:
+            return
+        ImportDirectoryCheckpoint.objects.bulk_create(
+            [
+                ImportDirectoryCheckpoint(
+                    source=self.source,
+                    path=directory.path,
+                    inode=directory.inode,
+                    mtime_ns=directory.mtime_ns,
+                    files_count=len(directory.entries),
+                )
+                for directory in directories
+            ],
+            update_conflicts=True,
+            unique_fields=['source', 'path'],
+            update_fields=['inode', 'mtime_ns', 'files_count', 'scanned_at'],
+        )
@@ -0,0 +1,41 @@
+"""
+Рендереры для потоковых выгрузок и ленты событий.
+
+Тело ответа формирует сама view через StreamingHttpResponse, поэтому
+рендереры нужны только для согласования ?format=csv|ndjson и
+Accept: text/event-stream. Метод render используется лишь для ответов с ошибками:
+они отдаются как JSON с Content-Type application/json, а не под типом выгрузки.
+"""
+
+import json
+
+from rest_framework import renderers
+
+
+class StreamingExportRenderer(renderers.BaseRenderer):
+    """Базовый рендерер для форматов потоковой выгрузки"""
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        response = (renderer_context or {}).get('response')
+        if response is not None:
+            # Response уже выставил Content-Type рендерера — тело ошибки это JSON
+            response['Content-Type'] = f'application/json; charset={self.charset}'
+        if data is None:
+            return b''
+        return json.dumps(data, ensure_ascii=False, default=str).encode(self.charset)
+
+
+class CSVExportRenderer(StreamingExportRenderer):
+    media_type = 'text/csv'
+    format = 'csv'
+
+
+class NDJSONExportRenderer(StreamingExportRenderer):
+    media_type = 'application/x-ndjson'
+    format = 'ndjson'
+
+
+class EventStreamRenderer(StreamingExportRenderer):
+    media_type = 'text/event-stream'
+    format = 'sse'
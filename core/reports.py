@@ -0,0 +1,100 @@
+"""
+Финансовые отчёты по транзакциям.
+
+Группировка и суммы считаются в SQL (Decimal без потерь точности).
+Отчёты за закрытые периоды (до начала текущего месяца) кэшируются надолго
+и сбрасываются только при изменении транзакций соответствующего города.
+"""
+
+from django.db import transaction
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncDay, TruncMonth, TruncWeek
+from django.utils import timezone
+
+from .cache import CacheManager, register_cache_invalidation
+
+REPORT_PERIODS = {
+    'day': TruncDay,
+    'week': TruncWeek,
+    'month': TruncMonth,
+}
+REPORT_CACHE_TYPE = 'finance_report'
+
+
+def is_closed_period(end_date):
+    """Период закрыт, если заканчивается до начала текущего месяца"""
+    return end_date < timezone.localdate().replace(day=1)
+
+
+def report_cache_key(gorod_id, start_date, end_date, period=None, by_city=False):
+    scope = f"gorod:{gorod_id}" if gorod_id else "all"
+    return f"finance:report:{scope}:{start_date.isoformat()}:{end_date.isoformat()}:{period or '-'}:{int(by_city)}"
+
+
+def transaction_report(queryset, period=None, by_city=False):
+    """
+    Сводка транзакций по типам, опционально по периодам (day/week/month)
+    и городам. Один запрос GROUP BY.
+
+    Returns:
+        dict: {'totals': {тип: {'count', 'total'}}, 'rows': [...]}
+    """
+    fields = ['tip_tranzakcii__name']
+    queryset = queryset.select_related(None).order_by()
+    if period:
+        queryset = queryset.annotate(period=REPORT_PERIODS[period]('date'))
+        fields.insert(0, 'period')
+    if by_city:
+        fields += ['gorod_id', 'gorod__name']
+
+    rows = queryset.values(*fields).annotate(count=Count('id'), total=Sum('summa')).order_by(*fields)
+
+    totals = {}
+    result_rows = []
+    for row in rows:
+        tip_name = row['tip_tranzakcii__name']
+        summary = totals.setdefault(tip_name, {'count': 0, 'total': 0})
+        summary['count'] += row['count']
+        summary['total'] += row['total']
+        item = {'tip': tip_name, 'count': row['count'], 'total': row['total']}
+        if period:
+            item['period'] = row['period'].isoformat()
+        if by_city:
+            item['gorod_id'] = row['gorod_id']
+            item['gorod'] = row['gorod__name']
+        result_rows.append(item)
+    return {'totals': totals, 'rows': result_rows}
+
+
+def cached_transaction_report(queryset, gorod_id, start_date, end_date, period=None, by_city=False):
+    """Отчёт за диапазон; закрытые периоды берутся из кэша"""
+    def build():
+        return transaction_report(
+            queryset.filter(date__range=[start_date, end_date]), period=period, by_city=by_city
+        )
+
+    if not is_closed_period(end_date):
+        return build()
+    return CacheManager.get_or_set(
+        report_cache_key(gorod_id, start_date, end_date, period, by_city),
+        build,
+        cache_type=REPORT_CACHE_TYPE,
+    )
+
+
+def invalidate_finance_reports(gorod_ids):
+    """Сбрасывает кэш отчётов городов и общих отчётов"""
+    for gorod_id in gorod_ids:
+        CacheManager.clear_pattern(f"finance:report:gorod:{gorod_id}")
+    CacheManager.clear_pattern("finance:report:all")
+
+
+def schedule_report_invalidation(gorod_ids):
+    gorod_ids = {gorod_id for gorod_id in gorod_ids if gorod_id}
+    if gorod_ids:
+        transaction.on_commit(lambda: invalidate_finance_reports(gorod_ids))
+
+
+def connect_report_invalidation():
+    """Сбрасывает кэш отчётов при изменении транзакций (вызывается из CoreConfig.ready)"""
+    register_cache_invalidation('core.Tranzakcii', invalidate_finance_reports)
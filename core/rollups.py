@@ -0,0 +1,179 @@
+"""
+Дневные агрегаты заявок (ZayavkiDailyStat).
+
+Изменение заявки помечает срез «день × город»; после коммита срез
+пересчитывается из Zayavki одним запросом на город. Аналитика читает
+агрегаты, поэтому её стоимость зависит от числа дней, а не заявок.
+"""
+
+import logging
+from datetime import datetime, time, timedelta
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .models import Zayavki, ZayavkiDailyStat
+
+logger = logging.getLogger(__name__)
+
+# Группы статусов для сводной статистики
+STATUS_GROUPS = {
+    'completed': ('Готово', 'Модерн'),
+    'in_progress': ('Принял', 'В работе'),
+    'pending': ('Звонит', 'Ожидает', 'Ожидает Принятия'),
+    'cancelled': ('Отказ', 'НеЗаказ'),
+}
+SUM_FIELDS = ('itog', 'rashod', 'chistymi')
+# Поля заявки, от которых зависит срез (день, город)
+KEY_FIELDS = ('meeting_date', 'gorod', 'gorod_id')
+
+
+def rollup_key(meeting_date, gorod_id):
+    # До перечитывания из БД поле может содержать строку или дату
+    meeting_date = Zayavki._meta.get_field('meeting_date').to_python(meeting_date)
+    # Наивное время Django сохраняет как локальное
+    if timezone.is_naive(meeting_date):
+        return (meeting_date.date(), gorod_id)
+    return (timezone.localdate(meeting_date), gorod_id)
+
+
+def day_start(day):
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+def _aggregate(queryset, days=None):
+    queryset = queryset.annotate(day=TruncDate('meeting_date'))
+    if days is not None:
+        queryset = queryset.filter(day__in=days)
+    return (
+        queryset
+        .values('day', 'gorod_id', 'master_id', 'status')
+        .annotate(count=Count('id'), **{field: Sum(field) for field in SUM_FIELDS})
+        .order_by()
+    )
+
+
+def _build(rows):
+    return [
+        ZayavkiDailyStat(
+            date=row['day'],
+            gorod_id=row['gorod_id'],
+            master_id=row['master_id'],
+            status=row['status'],
+            count=row['count'],
+            **{field: row[field] or 0 for field in SUM_FIELDS},
+        )
+        for row in rows
+    ]
+
+
+def _refresh_gorod(gorod_id, days):
+    rows = _aggregate(
+        Zayavki.objects.filter(
+            gorod_id=gorod_id,
+            meeting_date__gte=day_start(min(days)),
+            meeting_date__lt=day_start(max(days) + timedelta(days=1)),
+        ),
+        days,
+    )
+    with transaction.atomic():
+        ZayavkiDailyStat.objects.filter(gorod_id=gorod_id, date__in=days).delete()
+        ZayavkiDailyStat.objects.bulk_create(_build(rows))
+
+
+def refresh_daily_stats(keys):
+    """Пересчитывает срезы {(день, gorod_id)} из таблицы заявок"""
+    by_gorod = {}
+    for day, gorod_id in keys:
+        by_gorod.setdefault(gorod_id, set()).add(day)
+    for gorod_id, days in by_gorod.items():
+        try:
+            _refresh_gorod(gorod_id, days)
+        except IntegrityError:
+            # Тот же срез одновременно пересчитал другой процесс — повторяем
+            _refresh_gorod(gorod_id, days)
+
+
+def schedule_refresh(keys):
+    """Пересчёт срезов после коммита текущей транзакции"""
+    keys = {key for key in keys if key[1] is not None}
+    if keys:
+        transaction.on_commit(lambda: refresh_daily_stats(keys), robust=True)
+
+
+def schedule_refresh_for(zayavki):
+    schedule_refresh(rollup_key(z.meeting_date, z.gorod_id) for z in zayavki)
+
+
+def rebuild_daily_stats(date_from=None, date_to=None, gorod_id=None, batch_size=1000):
+    """Полная пересборка агрегатов (за период и/или по городу). Возвращает число строк."""
+    queryset = Zayavki.objects.all()
+    stats = ZayavkiDailyStat.objects.all()
+    if date_from:
+        queryset = queryset.filter(meeting_date__gte=day_start(date_from))
+        stats = stats.filter(date__gte=date_from)
+    if date_to:
+        queryset = queryset.filter(meeting_date__lt=day_start(date_to + timedelta(days=1)))
+        stats = stats.filter(date__lte=date_to)
+    if gorod_id:
+        queryset = queryset.filter(gorod_id=gorod_id)
+        stats = stats.filter(gorod_id=gorod_id)
+
+    with transaction.atomic():
+        stats.delete()
+        created = ZayavkiDailyStat.objects.bulk_create(
+            _build(_aggregate(queryset).iterator(chunk_size=batch_size)), batch_size=batch_size
+        )
+    return len(created)
+
+
+def _remember_old_key(sender, instance, raw=False, update_fields=None, **kwargs):
+    if raw or instance.pk is None:
+        return
+    if update_fields is not None and not set(update_fields) & set(KEY_FIELDS):
+        return
+    old = Zayavki.objects.filter(pk=instance.pk).values_list('meeting_date', 'gorod_id').first()
+    instance._rollup_old_key = rollup_key(*old) if old else None
+
+
+def _zayavka_saved(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    keys = {rollup_key(instance.meeting_date, instance.gorod_id)}
+    old_key = instance.__dict__.pop('_rollup_old_key', None)
+    if old_key:
+        keys.add(old_key)
+    schedule_refresh(keys)
+
+
+def _zayavka_deleted(sender, instance, **kwargs):
+    schedule_refresh({rollup_key(instance.meeting_date, instance.gorod_id)})
+
+
+def connect_rollup_updates():
+    """Обновляет дневные агрегаты при сохранении/удалении заявки"""
+    from django.db.models.signals import pre_save, post_save, post_delete
+    pre_save.connect(_remember_old_key, sender=Zayavki, dispatch_uid='crm_rollup_pre_save')
+    post_save.connect(_zayavka_saved, sender=Zayavki, dispatch_uid='crm_rollup_save')
+    post_delete.connect(_zayavka_deleted, sender=Zayavki, dispatch_uid='crm_rollup_delete')
+
+
+def summarize(queryset):
+    """Сводка по агрегатам: всего, группы статусов и суммы"""
+    totals = {'total': 0, **{group: 0 for group in STATUS_GROUPS}, **{field: 0 for field in SUM_FIELDS}}
+    by_status = {}
+    rows = queryset.values('status').annotate(
+        n=Sum('count'), **{f'{field}_sum': Sum(field) for field in SUM_FIELDS}
+    ).order_by()
+    for row in rows:
+        by_status[row['status']] = row['n']
+        totals['total'] += row['n']
+        for field in SUM_FIELDS:
+            totals[field] += row[f'{field}_sum'] or 0
+        for group, statuses in STATUS_GROUPS.items():
+            if row['status'] in statuses:
+                totals[group] += row['n']
+    totals['by_status'] = by_status
+    return totals
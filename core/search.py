@@ -0,0 +1,99 @@
+"""
+Поиск заявок.
+
+На PostgreSQL используется полнотекстовый индекс: колонка ``search_vector``
+(имя клиента, адрес, проблема, комментарии), которую поддерживает триггер, с
+GIN-индексом и индексы pg_trgm по телефону и адресу для поиска по части
+строки — обе создаются миграцией 0012 только на PostgreSQL. Результаты
+ранжируются ts_rank и сходством адреса.
+
+На других СУБД (SQLite в тестах) — запасной вариант через ORM: icontains
+по тем же полям и ранг по весу совпавшего поля.
+"""
+
+from django.db import connection
+from django.db.models import BooleanField, Case, F, FloatField, Q, Value, When
+from django.db.models.expressions import RawSQL
+
+from .phones import to_e164
+
+SEARCH_CONFIG = 'russian'
+SEARCH_LIMIT = 20
+MAX_SEARCH_LIMIT = 100
+# Минимум цифр в запросе, чтобы искать по части телефона
+MIN_PHONE_DIGITS = 5
+
+# Веса полей запасного поиска (как setweight A/B/C/D в search_vector)
+FALLBACK_WEIGHTS = (
+    ('client_name', 1.0),
+    ('address', 0.4),
+    ('problema', 0.2),
+    ('comment_kc', 0.1),
+    ('comment_master', 0.1),
+)
+
+
+def uses_postgres_search():
+    return connection.vendor == 'postgresql'
+
+
+def _like(value):
+    """Экранирует спецсимволы LIKE"""
+    return '%' + value.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+
+
+def _phone_digits(query):
+    digits = ''.join(ch for ch in query if ch.isdigit())
+    return digits if len(digits) >= MIN_PHONE_DIGITS else ''
+
+
+def _postgres_search(queryset, query, digits):
+    table = queryset.model._meta.db_table
+    tsquery = f"websearch_to_tsquery('{SEARCH_CONFIG}', %s)"
+    conditions = [f'"{table}"."search_vector" @@ {tsquery}', f'"{table}"."address" ILIKE %s']
+    params = [query, _like(query)]
+    if digits:
+        # LIKE по части номера использует trigram-индекс phone_client
+        conditions.append(f'"{table}"."phone_client" LIKE %s')
+        params.append(_like(digits))
+    rank = RawSQL(
+        f'ts_rank("{table}"."search_vector", {tsquery}) + similarity("{table}"."address", %s)',
+        [query, query],
+        output_field=FloatField(),
+    )
+    match = RawSQL(' OR '.join(f'({condition})' for condition in conditions), params, output_field=BooleanField())
+    return queryset.filter(match).annotate(search_rank=rank)
+
+
+def _fallback_search(queryset, query, digits):
+    condition = Q()
+    rank = Value(0.0, output_field=FloatField())
+    for field, weight in FALLBACK_WEIGHTS:
+        lookup = Q(**{f'{field}__icontains': query})
+        condition |= lookup
+        rank = rank + Case(When(lookup, then=Value(weight)), default=Value(0.0), output_field=FloatField())
+    if digits:
+        lookup = Q(phone_client__contains=digits)
+        condition |= lookup
+        rank = rank + Case(When(lookup, then=Value(1.0)), default=Value(0.0), output_field=FloatField())
+    return queryset.filter(condition).annotate(search_rank=rank)
+
+
+def search_zayavki(queryset, query):
+    """
+    Заявки, подходящие под запрос, по убыванию релевантности.
+    Полный номер телефона ищется точным совпадением по phone_norm.
+    """
+    query = ' '.join(query.split())
+    phone = None if any(ch.isalpha() for ch in query) else to_e164(query)
+    if phone:
+        return queryset.filter(phone_norm=phone).annotate(
+            search_rank=Value(1.0, output_field=FloatField())
+        ).order_by('-meeting_date', '-id')
+
+    digits = _phone_digits(query)
+    if uses_postgres_search():
+        queryset = _postgres_search(queryset, query, digits)
+    else:
+        queryset = _fallback_search(queryset, query, digits)
+    return queryset.order_by(F('search_rank').desc(), '-meeting_date', '-id')
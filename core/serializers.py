@@ -1,6 +1,17 @@
 from rest_framework import serializers
 from .models import Gorod, TipZayavki, RK, Master, TipTranzakcii, Tranzakcii, Roli, Polzovateli, PhoneGoroda, Zayavki, ZayavkaFile, MasterPayout
 from django.contrib.auth.hashers import make_password
+from django.db import transaction
+from .closeout import INCOME_STATUS, PAYOUT_STATUSES, lock_zayavki, record_income
+
+class SparseFieldsMixin:
+    """Оставляет только поля из context['fields'] (?fields=id,status)"""
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        fields = self.context.get('fields')
+        if fields:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
 
 class GorodSerializer(serializers.ModelSerializer):
     class Meta:
@@ -17,7 +28,7 @@ class RKSerializer(serializers.ModelSerializer):
         model = RK
         fields = '__all__'
 
-class MasterSerializer(serializers.ModelSerializer):
+class MasterSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     password = serializers.CharField(write_only=True)
     gorod_name = serializers.CharField(source='gorod.name', read_only=True)
     birth_date = serializers.DateField(required=False, allow_null=True)
@@ -60,7 +71,7 @@ class RoliSerializer(serializers.ModelSerializer):
         model = Roli
         fields = '__all__'
 
-class PolzovateliSerializer(serializers.ModelSerializer):
+class PolzovateliSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     gorod_name = serializers.CharField(source='gorod.name', read_only=True)
     rol_name = serializers.CharField(source='rol.name', read_only=True)
 
@@ -91,7 +102,7 @@ class PhoneGorodaSerializer(serializers.ModelSerializer):
         model = PhoneGoroda
         fields = '__all__'
 
-class ZayavkiSerializer(serializers.ModelSerializer):
+class ZayavkiSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     rk_name = serializers.CharField(source='rk.rk_name', read_only=True)
     gorod_name = serializers.CharField(source='gorod.name', read_only=True)
     tip_zayavki_name = serializers.CharField(source='tip_zayavki.name', read_only=True)
@@ -110,31 +121,50 @@ class ZayavkiSerializer(serializers.ModelSerializer):
         extra_fields = ['rk_name', 'gorod_name', 'tip_zayavki_name', 'master_name']
 
     def update(self, instance, validated_data):
-        prev_status = instance.status
-        updated_instance = super().update(instance, validated_data)
-        # Проверяем условия для создания транзакции
-        if (
-            validated_data.get('status') == 'Готово' and
-            updated_instance.master and
-            updated_instance.itog is not None and
-            updated_instance.rashod is not None and
-            updated_instance.chistymi is not None and
-            updated_instance.sdacha_mastera is not None
-        ):
-            note = f'Приход по Заявке "{updated_instance.id}"'
-            if not Tranzakcii.objects.filter(tip_tranzakcii__name='Приход', gorod=updated_instance.gorod, summa=updated_instance.sdacha_mastera).exists():
-                try:
-                    tip_tr = TipTranzakcii.objects.get(name='Приход')
-                    Tranzakcii.objects.create(
-                        gorod=updated_instance.gorod,
-                        tip_tranzakcii=tip_tr,
-                        summa=updated_instance.sdacha_mastera,
-                        note=note
-                    )
-                except TipTranzakcii.DoesNotExist:
-                    pass
+        # Статус, выплата (сигнал post_save) и приход — одной транзакцией
+        with transaction.atomic():
+            # Блокировка заявки, как в close_zayavki: два одновременных PATCH иначе
+            # оба не видят прихода и оба добавляют его в баланс кассы
+            lock_zayavki([instance.pk])
+            updated_instance = super().update(instance, validated_data)
+            if validated_data.get('status') == INCOME_STATUS:
+                record_income([updated_instance])
         return updated_instance
 
+
+class ZayavkiCompactSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    """Краткая заявка для списков (?compact=1): без сумм, комментариев и справочных названий, кроме мастера"""
+    master_name = serializers.CharField(source='master.name', read_only=True)
+
+    class Meta:
+        model = Zayavki
+        fields = [
+            'id', 'status', 'meeting_date', 'gorod', 'client_name', 'phone_client',
+            'address', 'tip_techniki', 'problema', 'master', 'master_name',
+        ]
+        read_only_fields = fields
+
+
+class ZayavkaCloseSerializer(serializers.Serializer):
+    """Элемент пакетного закрытия заявок"""
+    id = serializers.IntegerField()
+    status = serializers.ChoiceField(choices=PAYOUT_STATUSES, default=INCOME_STATUS)
+    itog = serializers.DecimalField(max_digits=12, decimal_places=2, required=False, allow_null=True)
+    rashod = serializers.DecimalField(max_digits=12, decimal_places=2, required=False, allow_null=True)
+    comment_master = serializers.CharField(required=False, allow_null=True, allow_blank=True)
+
+
+class ZayavkaBulkUpdateSerializer(serializers.Serializer):
+    """Элемент пакетной смены статуса/мастера"""
+    id = serializers.IntegerField()
+    status = serializers.ChoiceField(choices=Zayavki.STATUS_CHOICES, required=False)
+    master = serializers.IntegerField(required=False, allow_null=True)
+
+    def validate(self, attrs):
+        if 'status' not in attrs and 'master' not in attrs:
+            raise serializers.ValidationError('Укажите status и/или master')
+        return attrs
+
 class ZayavkaFileSerializer(serializers.ModelSerializer):
     uploaded_by_name = serializers.CharField(source='uploaded_by.name', read_only=True)
     file = serializers.FileField(required=False, allow_null=True)
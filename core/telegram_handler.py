@@ -1,10 +1,15 @@
 import logging
+import threading
 from django.conf import settings
 
 class TelegramLogHandler(logging.Handler):
     """
-    Кастомный лог-хендлер для отправки сообщений в Telegram
+    Кастомный лог-хендлер для отправки сообщений в Telegram.
+    Сообщение только ставится в outbox (доставляет send_notifications),
+    поэтому запрос не ждёт Telegram; одинаковые ошибки из одного места
+    отправляются не чаще раза в окно дедупликации.
     """
+    _local = threading.local()
     
     def __init__(self, level=logging.ERROR):
         super().__init__(level)
@@ -14,9 +19,14 @@ class TelegramLogHandler(logging.Handler):
     def emit(self, record):
         if not self.enabled or not self.error_alerts:
             return
+        # Ошибка внутри постановки в очередь тоже логируется — не уходим в рекурсию
+        if getattr(self._local, 'emitting', False):
+            return
+        self._local.emitting = True
         try:
             # Ленивая загрузка функций, чтобы избежать проблем с инициализацией Django
-            from core.utils import send_telegram_alert, format_error_alert
+            from core.utils import format_error_alert
+            from core.notifications import enqueue_telegram_message, outbox_settings
             # Форматируем сообщение
             message = self.format(record)
             # Если это ошибка, отправляем специально отформатированное сообщение
@@ -37,7 +47,14 @@ class TelegramLogHandler(logging.Handler):
                 )
             else:
                 formatted_message = message
-            send_telegram_alert(formatted_message)
+            exc_type = record.exc_info[0].__name__ if record.exc_info and record.exc_info[0] else ''
+            enqueue_telegram_message(
+                formatted_message,
+                dedup_key=f'log:{record.name}:{record.pathname}:{record.lineno}:{exc_type}',
+                dedup_window=outbox_settings()['DEDUP_WINDOW'],
+            )
         except Exception as e:
             import sys
-            print(f"Failed to send Telegram alert: {e}", file=sys.stderr) 
\ No newline at end of file
+            print(f"Failed to enqueue Telegram alert: {e}", file=sys.stderr)
+        finally:
+            self._local.emitting = False
@@ -0,0 +1,78 @@
+from django.test import TestCase, RequestFactory, override_settings
+from django.core.cache import cache
+from django.conf import settings
+from django.utils import timezone
+from rest_framework.exceptions import AuthenticationFailed
+import jwt
+
+from core.authentication import JWTCookieAuthentication, AuthPrincipal
+from core.cache import local_cache
+from core.models import Gorod, Roli, Polzovateli
+from core.tests.test_cache import LOCMEM_CACHES
+
+
+@override_settings(CACHES=LOCMEM_CACHES, AUTH_PRINCIPAL_CACHE={'ENABLED': True})
+class JWTPrincipalCacheTest(TestCase):
+    """Тесты кэширования субъекта JWT аутентификации"""
+
+    def setUp(self):
+        cache.clear()
+        local_cache.clear()
+        self.gorod = Gorod.objects.create(name='Москва')
+        self.user = Polzovateli.objects.create(
+            name='Директор',
+            login='director',
+            password='testpass123',
+            gorod=self.gorod,
+            rol=Roli.objects.create(name='director')
+        )
+        token = jwt.encode({
+            'user_id': self.user.id,
+            'role': 'director',
+            'iat': timezone.now(),
+            'exp': timezone.now() + timezone.timedelta(days=1),
+        }, settings.SECRET_KEY, algorithm='HS256')
+        self.factory = RequestFactory()
+        self.factory.cookies['jwt'] = token
+        self.auth = JWTCookieAuthentication()
+
+    def _authenticate(self):
+        return self.auth.authenticate(self.factory.get('/api/v1/me/'))
+
+    def test_second_request_does_not_hit_db(self):
+        """Повторная аутентификация берёт субъекта из кэша"""
+        principal, _ = self._authenticate()
+        self.assertIsInstance(principal, AuthPrincipal)
+        self.assertEqual(principal.gorod_id, self.gorod.id)
+        self.assertEqual(principal.role, 'director')
+        with self.assertNumQueries(0):
+            cached, _ = self._authenticate()
+        self.assertEqual(cached, principal)
+
+    def test_principal_is_immutable(self):
+        """Субъект нельзя изменить"""
+        principal, _ = self._authenticate()
+        with self.assertRaises(AttributeError):
+            principal.role = 'admin'
+
+    def test_deactivation_invalidates_principal(self):
+        """Деактивация пользователя сразу сбрасывает кэш"""
+        self._authenticate()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.is_active = False
+            self.user.save()
+        with self.assertRaises(AuthenticationFailed):
+            self._authenticate()
+
+    def test_deleted_user_is_not_found(self):
+        """Валидный токен удалённого пользователя — «Пользователь не найден»"""
+        self.user.delete()
+        with self.assertRaisesMessage(AuthenticationFailed, 'Пользователь не найден'):
+            self._authenticate()
+
+    @override_settings(AUTH_PRINCIPAL_CACHE={'ENABLED': False})
+    def test_without_shared_cache_principal_is_loaded_each_time(self):
+        """Без общего кэша субъект не кэшируется в процессе"""
+        self._authenticate()
+        with self.assertNumQueries(1):
+            self._authenticate()
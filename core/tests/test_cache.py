@@ -0,0 +1,179 @@
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient, APITestCase
+from django.core.cache import cache
+import threading
+import time
+
+from core.cache import CacheManager, ReferenceDataCache, local_cache, _on_invalidation_message
+from core.models import Gorod, Master, Polzovateli, RK, Roli
+
+
+LOCMEM_CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'cache-tests',
+    }
+}
+
+
+@override_settings(CACHES=LOCMEM_CACHES, CACHE_L1={'ENABLED': True, 'TIMEOUT': 30})
+class TwoTierCacheManagerTest(TestCase):
+    """Тесты двухуровневого кэша с версионированными ключами"""
+
+    def setUp(self):
+        cache.clear()
+        local_cache.clear()
+
+    def test_set_and_get(self):
+        """Данные читаются после записи"""
+        CacheManager.set_data('reference:goroda:all', [{'id': 1}])
+        self.assertEqual(CacheManager.get_data('reference:goroda:all'), [{'id': 1}])
+
+    def test_clear_pattern_invalidates_only_prefix(self):
+        """Инвалидация префикса не затрагивает соседние ключи"""
+        CacheManager.set_data(ReferenceDataCache.get_rk_cache_key(1), ['rk1'])
+        CacheManager.set_data(ReferenceDataCache.get_rk_cache_key(2), ['rk2'])
+        CacheManager.set_data(ReferenceDataCache.get_goroda_cache_key(), ['goroda'])
+
+        ReferenceDataCache.invalidate_rk_cache(1)
+
+        self.assertIsNone(CacheManager.get_data(ReferenceDataCache.get_rk_cache_key(1)))
+        self.assertEqual(CacheManager.get_data(ReferenceDataCache.get_rk_cache_key(2)), ['rk2'])
+        self.assertEqual(CacheManager.get_data(ReferenceDataCache.get_goroda_cache_key()), ['goroda'])
+
+    def test_parent_prefix_invalidates_nested_keys(self):
+        """Инвалидация родительского префикса сбрасывает все вложенные ключи"""
+        CacheManager.set_data(ReferenceDataCache.get_rk_cache_key(1), ['rk1'])
+        CacheManager.set_data(ReferenceDataCache.get_rk_cache_key(), ['all'])
+
+        ReferenceDataCache.invalidate_rk_cache()
+
+        self.assertIsNone(CacheManager.get_data(ReferenceDataCache.get_rk_cache_key(1)))
+        self.assertIsNone(CacheManager.get_data(ReferenceDataCache.get_rk_cache_key()))
+
+    def test_l1_serves_until_invalidation_message(self):
+        """L1 отдаёт значение без L2 и сбрасывается сообщением об инвалидации"""
+        CacheManager.set_data('reference:tipzayavki:all', ['local'])
+        cache.clear()
+        self.assertEqual(CacheManager.get_data('reference:tipzayavki:all'), ['local'])
+
+        _on_invalidation_message('reference:tipzayavki')
+        self.assertIsNone(CacheManager.get_data('reference:tipzayavki:all'))
+
+
+@override_settings(CACHES=LOCMEM_CACHES, CACHE_L1={'ENABLED': True, 'TIMEOUT': 30})
+class ReferenceCacheSignalInvalidationTest(TestCase):
+    """Тесты автоматической инвалидации справочников по сигналам"""
+
+    def setUp(self):
+        cache.clear()
+        local_cache.clear()
+        self.moskva = Gorod.objects.create(name='Москва')
+        self.kazan = Gorod.objects.create(name='Казань')
+
+    def _cache_lists(self):
+        for key in (
+            ReferenceDataCache.get_rk_cache_key(self.moskva.id),
+            ReferenceDataCache.get_rk_cache_key(self.kazan.id),
+            ReferenceDataCache.get_rk_cache_key(),
+            ReferenceDataCache.get_goroda_cache_key(),
+        ):
+            CacheManager.set_data(key, ['cached'])
+
+    def test_rk_save_invalidates_only_its_city(self):
+        """Создание РК сбрасывает кэш своего города и общий список"""
+        self._cache_lists()
+        with self.captureOnCommitCallbacks(execute=True):
+            RK.objects.create(rk_name='РК', gorod=self.moskva, phone='+79001234567')
+
+        self.assertIsNone(CacheManager.get_data(ReferenceDataCache.get_rk_cache_key(self.moskva.id)))
+        self.assertIsNone(CacheManager.get_data(ReferenceDataCache.get_rk_cache_key()))
+        self.assertEqual(CacheManager.get_data(ReferenceDataCache.get_rk_cache_key(self.kazan.id)), ['cached'])
+        self.assertEqual(CacheManager.get_data(ReferenceDataCache.get_goroda_cache_key()), ['cached'])
+
+    def test_rk_city_change_invalidates_old_and_new_city(self):
+        """Перенос РК в другой город сбрасывает кэш обоих городов"""
+        rk = RK.objects.create(rk_name='РК', gorod=self.moskva, phone='+79001234567')
+        self._cache_lists()
+        rk.gorod = self.kazan
+        with self.captureOnCommitCallbacks(execute=True):
+            rk.save()
+
+        self.assertIsNone(CacheManager.get_data(ReferenceDataCache.get_rk_cache_key(self.moskva.id)))
+        self.assertIsNone(CacheManager.get_data(ReferenceDataCache.get_rk_cache_key(self.kazan.id)))
+
+    def test_gorod_delete_invalidates_goroda(self):
+        """Удаление города (в т.ч. вне API) сбрасывает кэш городов"""
+        self._cache_lists()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.kazan.delete()
+
+        self.assertIsNone(CacheManager.get_data(ReferenceDataCache.get_goroda_cache_key()))
+
+
+@override_settings(CACHES=LOCMEM_CACHES, CACHE_L1={'ENABLED': True, 'TIMEOUT': 30})
+class CachedReferenceListFilterTest(APITestCase):
+    """Фильтры, поиск и сортировка не смешиваются в кэше списков справочников"""
+
+    def setUp(self):
+        cache.clear()
+        local_cache.clear()
+        self.gorod = Gorod.objects.create(name='Москва')
+        self.user = Polzovateli.objects.create(
+            name='Админ', login='admin', password='testpass123',
+            gorod=self.gorod, rol=Roli.objects.create(name='admin')
+        )
+        self.user.role = 'admin'
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+        Master.objects.create(name='Активный', login='active', password='x', phone='+79001234567', gorod=self.gorod)
+        Master.objects.create(
+            name='Уволенный', login='fired', password='x', phone='+79007654321', gorod=self.gorod, is_active=False
+        )
+
+    def _names(self, query):
+        response = self.client.get(f'/api/v1/master/{query}')
+        self.assertEqual(response.status_code, 200)
+        return [item['name'] for item in response.data['results']]
+
+    def test_filters_get_separate_cache_entries(self):
+        self.assertEqual(self._names('?is_active=true'), ['Активный'])
+        self.assertEqual(self._names('?is_active=false'), ['Уволенный'])
+        self.assertEqual(self._names('?search=Увол'), ['Уволенный'])
+        self.assertEqual(sorted(self._names('')), ['Активный', 'Уволенный'])
+        # Номер страницы не дробит кэш
+        self.assertEqual(sorted(self._names('?page=1')), ['Активный', 'Уволенный'])
+
+
+@override_settings(CACHES=LOCMEM_CACHES, CACHE_L1={'ENABLED': False})
+class CacheStampedeProtectionTest(TestCase):
+    """Тесты single-flight и stale-while-revalidate в get_or_set"""
+
+    def setUp(self):
+        cache.clear()
+
+    @override_settings(CACHE_STAMPEDE={'BACKGROUND_REFRESH': True})
+    def test_stale_value_served_while_refreshing(self):
+        """Устаревшее значение отдаётся сразу, обновление идёт в фоне"""
+        CacheManager.set_data('reference:rk:all', ['old'], timeout=0)
+
+        result = CacheManager.get_or_set('reference:rk:all', lambda: ['new'])
+        self.assertEqual(result, ['old'])
+
+        deadline = time.monotonic() + 2
+        while CacheManager.get_data('reference:rk:all') is None and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(CacheManager.get_data('reference:rk:all'), ['new'])
+
+    def test_miss_waits_for_concurrent_refresh(self):
+        """При пустом кэше и чужой блокировке ждём результат, а не считаем сами"""
+        cache.add(CacheManager._lock_key('reference:goroda:all'), 1, 30)
+        timer = threading.Timer(0.1, CacheManager.set_data, args=('reference:goroda:all', ['computed elsewhere']))
+        timer.start()
+        calls = []
+
+        result = CacheManager.get_or_set('reference:goroda:all', lambda: calls.append(1) or ['local'])
+
+        timer.join()
+        self.assertEqual(result, ['computed elsewhere'])
+        self.assertEqual(calls, [])
@@ -0,0 +1,131 @@
+from decimal import Decimal
+from unittest import mock
+
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APIClient, APITestCase
+
+from core.closeout import close_zayavki, lock_zayavki, record_income
+from core.models import (
+    Gorod, GorodBalance, Master, MasterPayout, Polzovateli, Roli, TipTranzakcii, Tranzakcii, Zayavki
+)
+
+
+class CloseoutTest(APITestCase):
+    """Тесты закрытия заявок: выплата и приход в одной транзакции"""
+
+    def setUp(self):
+        self.gorod = Gorod.objects.create(name='Москва')
+        self.other_gorod = Gorod.objects.create(name='Казань')
+        self.income = TipTranzakcii.objects.create(name='Приход')
+        GorodBalance.objects.create(gorod=self.gorod)
+        self.master = Master.objects.create(
+            name='Мастер', phone='+79001234568', login='master', gorod=self.gorod
+        )
+        self.user = Polzovateli.objects.create(
+            name='Админ', login='admin', password='testpass123',
+            gorod=self.gorod, rol=Roli.objects.create(name='admin')
+        )
+        self.user.role = 'admin'
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+        self.zayavki = [self._zayavka(self.gorod) for _ in range(3)]
+        self.foreign = self._zayavka(self.other_gorod)
+
+    def _zayavka(self, gorod):
+        return Zayavki.objects.create(
+            gorod=gorod, phone_client='+79001234569', client_name='Клиент',
+            address='ул. Тестовая, 1', meeting_date=timezone.now(),
+            tip_techniki='Холодильник', problema='Не работает', kc_name='КЦ',
+            master=self.master, status='В работе'
+        )
+
+    def _items(self, itog='1000.00'):
+        return [{'id': z.id, 'itog': itog, 'rashod': '200.00'} for z in self.zayavki]
+
+    def test_bulk_close_is_atomic_and_idempotent(self):
+        """Повторное закрытие не дублирует выплаты и приходы, а обновляет суммы"""
+        items = [{'id': z.id, 'itog': Decimal('1000'), 'rashod': Decimal('200'), 'status': 'Готово'}
+                 for z in self.zayavki]
+        with self.assertNumQueries(10):
+            result = close_zayavki(items)
+        self.assertEqual(result['closed'], [z.id for z in self.zayavki])
+        self.assertEqual(Tranzakcii.objects.filter(tip_tranzakcii=self.income).count(), 3)
+
+        items[0]['itog'] = Decimal('1500')
+        close_zayavki(items)
+        self.assertEqual(MasterPayout.objects.count(), 3)
+        self.assertEqual(Tranzakcii.objects.count(), 3)
+        self.assertEqual(
+            Tranzakcii.objects.get(zayavka_id=self.zayavki[0].id).summa, Decimal('1300.00')
+        )
+        self.assertEqual(MasterPayout.objects.get(zayavka_id=self.zayavki[0].id).summa, Decimal('1300.00'))
+
+    def test_bulk_close_endpoint_is_limited_to_city(self):
+        """Эндпоинт закрывает только заявки своего города"""
+        items = self._items() + [{'id': self.foreign.id, 'itog': '1000.00', 'rashod': '200.00'}]
+        response = self.client.post('/api/v1/zayavki/bulk-close/', {'items': items}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['not_found'], [self.foreign.id])
+        self.assertEqual(Zayavki.objects.filter(status='Готово').count(), 3)
+        self.foreign.refresh_from_db()
+        self.assertEqual(self.foreign.status, 'В работе')
+
+        response = self.client.post('/api/v1/zayavki/bulk-close/', {'items': []}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_single_update_records_income_once(self):
+        """Обновление заявки через API создаёт один приход, привязанный к заявке"""
+        zayavka = self.zayavki[0]
+        payload = {'status': 'Готово', 'itog': '1000.00', 'rashod': '200.00'}
+        for _ in range(2):
+            response = self.client.patch(f'/api/v1/zayavki/{zayavka.id}/', payload, format='json')
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(list(Tranzakcii.objects.values_list('zayavka_id', flat=True)), [zayavka.id])
+        self.assertEqual(MasterPayout.objects.get(zayavka=zayavka).summa, Decimal('800.00'))
+
+    def test_single_update_locks_zayavka_before_income(self):
+        """PATCH блокирует заявку до проверки существующего прихода"""
+        zayavka = self.zayavki[0]
+        payload = {'status': 'Готово', 'itog': '1000.00', 'rashod': '200.00'}
+        with mock.patch('core.serializers.lock_zayavki', wraps=lock_zayavki) as lock, \
+                mock.patch('core.serializers.record_income', wraps=record_income) as income:
+            manager = mock.Mock()
+            manager.attach_mock(lock, 'lock')
+            manager.attach_mock(income, 'income')
+            response = self.client.patch(f'/api/v1/zayavki/{zayavka.id}/', payload, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([call[0] for call in manager.mock_calls], ['lock', 'income'])
+        lock.assert_called_once_with([zayavka.id])
+        self.assertEqual(GorodBalance.objects.get(gorod=self.gorod).income, Decimal('800.00'))
+
+    def test_bulk_update_status_and_master(self):
+        """Пакетная смена статуса и мастера с проверкой города мастера"""
+        other_master = Master.objects.create(
+            name='Второй', phone='+79001234570', login='master2', gorod=self.gorod
+        )
+        foreign_master = Master.objects.create(
+            name='Чужой', phone='+79001234571', login='master3', gorod=self.other_gorod
+        )
+        first, second, third = self.zayavki
+        items = [
+            {'id': first.id, 'master': other_master.id},
+            {'id': second.id, 'status': 'Принял', 'master': None},
+            {'id': third.id, 'master': foreign_master.id},
+            {'id': self.foreign.id, 'status': 'Отказ'},
+        ]
+        response = self.client.post('/api/v1/zayavki/bulk/', {'items': items}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['updated'], [first.id, second.id])
+        self.assertEqual(response.data['invalid_master'], [third.id])
+        self.assertEqual(response.data['not_found'], [self.foreign.id])
+
+        first.refresh_from_db()
+        second.refresh_from_db()
+        third.refresh_from_db()
+        self.assertEqual(first.master_id, other_master.id)
+        self.assertEqual((second.status, second.master_id), ('Принял', None))
+        self.assertEqual(third.master_id, self.master.id)
+
+        response = self.client.post('/api/v1/zayavki/bulk/', {'items': [{'id': first.id}]}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
@@ -0,0 +1,88 @@
+from decimal import Decimal
+
+from django.core.cache import cache
+from django.test import override_settings
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APIClient, APITestCase
+
+from core.cache import local_cache
+from core.closeout import update_zayavki
+from core.models import Gorod, MasterPayout, Polzovateli, Roli, Zayavki
+from core.tests.test_cache import LOCMEM_CACHES
+
+
+@override_settings(CACHES=LOCMEM_CACHES, API_RESPONSE_CACHE={'ENABLED': True, 'TIMEOUT': 60})
+class ConditionalListTest(APITestCase):
+    """Тесты ETag/304 и кэша ответов по версии данных города"""
+
+    def setUp(self):
+        cache.clear()
+        local_cache.clear()
+        self.gorod = Gorod.objects.create(name='Москва')
+        self.other = Gorod.objects.create(name='Казань')
+        self.user = Polzovateli.objects.create(
+            name='Админ', login='admin', password='testpass123',
+            gorod=self.gorod, rol=Roli.objects.create(name='admin')
+        )
+        self.user.role = 'admin'
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+        self.zayavka = self._zayavka(self.gorod)
+
+    def _zayavka(self, gorod, status='Ожидает'):
+        with self.captureOnCommitCallbacks(execute=True):
+            return Zayavki.objects.create(
+                gorod=gorod, phone_client='89001234567', client_name='Клиент',
+                address='ул. Тестовая, 1', meeting_date=timezone.now(),
+                tip_techniki='Холодильник', problema='Не работает', kc_name='КЦ', status=status
+            )
+
+    def _etag(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response['ETag']
+
+    def test_unchanged_list_returns_304_without_queries(self):
+        for url in ('/api/v1/zayavki/', '/api/v1/vkhodyashchie-zayavki/', '/api/v1/master-payouts/'):
+            etag = self._etag(url)
+            with self.assertNumQueries(0):
+                response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+            self.assertEqual(response['ETag'], etag)
+
+    def test_etag_depends_on_query(self):
+        self.assertNotEqual(self._etag('/api/v1/zayavki/'), self._etag('/api/v1/zayavki/?status=Готово'))
+
+    def test_writes_change_etag_of_own_city_only(self):
+        url = '/api/v1/zayavki/'
+        etag = self._etag(url)
+        self._zayavka(self.other)
+        self.assertEqual(self._etag(url), etag)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.zayavka.client_name = 'Новый клиент'
+            self.zayavka.save()
+        new_etag = self._etag(url)
+        self.assertNotEqual(new_etag, etag)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            MasterPayout.objects.create(zayavka=self.zayavka, summa=Decimal('100.00'))
+        self.assertNotEqual(self._etag('/api/v1/zayavki/'), new_etag)
+
+    def test_bulk_update_changes_etag(self):
+        """bulk_update без сигналов тоже поднимает версию"""
+        url = '/api/v1/vkhodyashchie-zayavki/'
+        etag = self._etag(url)
+        with self.captureOnCommitCallbacks(execute=True):
+            update_zayavki([{'id': self.zayavka.id, 'status': 'Принял'}])
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data, [])
+
+    def test_list_response_is_cached(self):
+        url = '/api/v1/zayavki/'
+        first = self.client.get(url)
+        with self.assertNumQueries(0):
+            second = self.client.get(url)
+        self.assertEqual(second.data, first.data)
@@ -0,0 +1,103 @@
+from rest_framework.test import APITestCase, APIClient
+from rest_framework import status
+from django.utils import timezone
+import json
+from datetime import timedelta
+
+from core.models import Gorod, Roli, Polzovateli, Zayavki
+from core.rollups import day_start
+
+
+class ZayavkiExportTest(APITestCase):
+    """Тесты потоковой выгрузки заявок"""
+
+    def setUp(self):
+        self.gorod = Gorod.objects.create(name='Москва')
+        self.other_gorod = Gorod.objects.create(name='Казань')
+        self.rol = Roli.objects.create(name='director')
+        self.user = Polzovateli.objects.create(
+            name='Директор',
+            login='director',
+            password='testpass123',
+            gorod=self.gorod,
+            rol=self.rol
+        )
+        self.user.role = 'director'
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+        for i, gorod in enumerate([self.gorod, self.gorod, self.other_gorod]):
+            Zayavki.objects.create(
+                gorod=gorod,
+                phone_client=f'+7900123456{i}',
+                client_name=f'Клиент {i}',
+                address='ул. Тестовая, 1',
+                meeting_date=timezone.now(),
+                tip_techniki='Холодильник',
+                problema='Не работает',
+                status='Готово' if i == 0 else 'Ожидает',
+                kc_name='КЦ'
+            )
+
+    def _content(self, response):
+        return b''.join(response.streaming_content).decode('utf-8')
+
+    def test_ndjson_export_is_limited_to_user_city(self):
+        """NDJSON выгрузка отдаёт только заявки города пользователя"""
+        response = self.client.get('/api/v1/zayavki/export/?format=ndjson')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.streaming)
+        rows = [json.loads(line) for line in self._content(response).splitlines()]
+        self.assertEqual(len(rows), 2)
+        self.assertEqual({row['gorod__name'] for row in rows}, {'Москва'})
+
+    def test_csv_export_with_status_filter(self):
+        """CSV выгрузка содержит заголовок и отфильтрованные строки"""
+        response = self.client.get('/api/v1/zayavki/export/?format=csv&status=Готово')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response['Content-Type'].startswith('text/csv'))
+        lines = self._content(response).splitlines()
+        self.assertIn('Дата встречи', lines[0])
+        self.assertEqual(len(lines), 2)
+
+    def test_invalid_date(self):
+        """Неверная дата возвращает 400"""
+        for value in ('bad', '2024-13-45'):
+            response = self.client.get(f'/api/v1/zayavki/export/?format=csv&date_from={value}')
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_invalid_master(self):
+        response = self.client.get('/api/v1/zayavki/export/?format=csv&master=abc')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_error_is_json_for_export_format(self):
+        """Ошибка при ?format=csv отдаётся как JSON, а не под типом text/csv"""
+        response = self.client.get('/api/v1/zayavki/export/?format=csv&date_from=bad')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertTrue(response['Content-Type'].startswith('application/json'))
+        self.assertEqual(json.loads(response.content), {'error': 'Неверный формат даты'})
+
+    def test_default_format_is_csv(self):
+        response = self.client.get('/api/v1/zayavki/export/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response['Content-Type'].startswith('text/csv'))
+        self.assertIn('Дата встречи', self._content(response))
+
+    def test_unsupported_format(self):
+        response = self.client.get('/api/v1/zayavki/export/?format=xml')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_date_range_uses_local_day_bounds(self):
+        """date_to включает весь день, следующий день не попадает"""
+        today = timezone.localdate()
+        late = Zayavki.objects.filter(gorod=self.gorod).first()
+        late.meeting_date = day_start(today + timedelta(days=1)) - timedelta(seconds=1)
+        late.save()
+        Zayavki.objects.filter(gorod=self.gorod).exclude(id=late.id).update(
+            meeting_date=day_start(today + timedelta(days=1))
+        )
+        response = self.client.get(
+            f'/api/v1/zayavki/export/?format=ndjson&date_from={today}&date_to={today}'
+        )
+        rows = [json.loads(line) for line in self._content(response).splitlines()]
+        self.assertEqual([row['id'] for row in rows], [late.id])
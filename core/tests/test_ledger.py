@@ -0,0 +1,112 @@
+from datetime import date, timedelta
+from decimal import Decimal
+
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APIClient, APITestCase
+
+from core.closeout import close_zayavki
+from core.ledger import rebuild_balance, take_snapshots
+from core.models import (
+    Gorod, GorodBalance, GorodBalanceSnapshot, Master, Polzovateli, Roli,
+    TipTranzakcii, Tranzakcii, Zayavki
+)
+
+
+class GorodBalanceTest(APITestCase):
+    """Тесты баланса кассы города и снимков на конец дня"""
+
+    def setUp(self):
+        self.gorod = Gorod.objects.create(name='Москва')
+        self.income = TipTranzakcii.objects.create(name='Приход')
+        self.expense = TipTranzakcii.objects.create(name='Расход')
+        self.other_tip = TipTranzakcii.objects.create(name='Перевод')
+        self.user = Polzovateli.objects.create(
+            name='Админ', login='admin', password='testpass123',
+            gorod=self.gorod, rol=Roli.objects.create(name='admin')
+        )
+        self.user.role = 'admin'
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+    def _tranzakciya(self, tip, summa, gorod=None):
+        return Tranzakcii.objects.create(gorod=gorod or self.gorod, tip_tranzakcii=tip, summa=Decimal(summa))
+
+    def _balance(self, gorod=None):
+        return GorodBalance.objects.get(gorod=gorod or self.gorod)
+
+    def test_balance_follows_writes(self):
+        """Создание, изменение и удаление транзакций сразу меняют баланс"""
+        income = self._tranzakciya(self.income, '1000.00')
+        self._tranzakciya(self.expense, '300.50')
+        self._tranzakciya(self.other_tip, '999.00')
+        self.assertEqual(self._balance().balance, Decimal('699.50'))
+
+        income.summa = Decimal('1200.00')
+        income.save()
+        self.assertEqual(self._balance().income, Decimal('1200.00'))
+
+        income.tip_tranzakcii = self.expense
+        income.save()
+        balance = self._balance()
+        self.assertEqual((balance.income, balance.expense), (Decimal('0.00'), Decimal('1500.50')))
+
+        income.delete()
+        self.assertEqual(self._balance().balance, Decimal('-300.50'))
+
+        rebuild_balance()
+        self.assertEqual(self._balance().balance, Decimal('-300.50'))
+
+    def test_closeout_updates_balance(self):
+        """Пакетное закрытие заявок учитывает приходы в балансе"""
+        master = Master.objects.create(name='Мастер', phone='+79001234568', login='master', gorod=self.gorod)
+        zayavka = Zayavki.objects.create(
+            gorod=self.gorod, phone_client='+79001234569', client_name='Клиент',
+            address='ул. Тестовая, 1', meeting_date=timezone.now(),
+            tip_techniki='Холодильник', problema='Не работает', kc_name='КЦ',
+            master=master, status='В работе'
+        )
+        item = {'id': zayavka.id, 'itog': Decimal('1000'), 'rashod': Decimal('200'), 'status': 'Готово'}
+        close_zayavki([item])
+        self.assertEqual(self._balance().balance, Decimal('800.00'))
+
+        item['itog'] = Decimal('1500')
+        close_zayavki([item])
+        self.assertEqual(self._balance().balance, Decimal('1300.00'))
+
+    def test_snapshots_carry_balance_forward(self):
+        """Снимок дня = предыдущий снимок + движения за день"""
+        first, second = date(2024, 3, 1), date(2024, 3, 2)
+        for day, tip, summa in [(first, self.income, '500.00'), (second, self.expense, '120.00')]:
+            tranzakciya = self._tranzakciya(tip, summa)
+            Tranzakcii.objects.filter(pk=tranzakciya.pk).update(date=day)
+
+        self.assertEqual(take_snapshots(first), 1)
+        take_snapshots(second)
+        take_snapshots(second)
+        snapshots = list(GorodBalanceSnapshot.objects.values_list('date', 'expense', 'balance'))
+        self.assertEqual(snapshots, [
+            (second, Decimal('120.00'), Decimal('380.00')),
+            (first, Decimal('0.00'), Decimal('500.00')),
+        ])
+
+    def test_balance_endpoint(self):
+        """Эндпоинт читает баланс одной строкой и отдаёт недавние снимки"""
+        self._tranzakciya(self.income, '250.00')
+        GorodBalanceSnapshot.objects.create(
+            gorod=self.gorod, date=timezone.localdate() - timedelta(days=1), balance=Decimal('100.00')
+        )
+        response = self.client.get('/api/v1/tranzakcii/balance/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['balance'], Decimal('250.00'))
+        self.assertEqual([row['balance'] for row in response.data['snapshots']], [Decimal('100.00')])
+
+        response = self.client.get('/api/v1/tranzakcii/balance/?days=abc')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_balance_endpoint_builds_missing_row(self):
+        """Для города без строки баланса она строится по истории"""
+        response = self.client.get('/api/v1/tranzakcii/balance/?days=0')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['balance'], Decimal('0'))
+        self.assertTrue(GorodBalance.objects.filter(gorod=self.gorod).exists())
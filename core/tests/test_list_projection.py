@@ -0,0 +1,75 @@
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APIClient, APITestCase
+
+from core.models import Gorod, Master, Polzovateli, Roli, Zayavki
+
+
+class ProjectedListTest(APITestCase):
+    """Тесты keyset-пагинации, ?fields= и ?compact=1 для list-действий"""
+
+    def setUp(self):
+        self.gorod = Gorod.objects.create(name='Москва')
+        self.user = Polzovateli.objects.create(
+            name='Админ', login='admin', password='testpass123',
+            gorod=self.gorod, rol=Roli.objects.create(name='admin')
+        )
+        self.user.role = 'admin'
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+        self.zayavki = [self._zayavka(i) for i in range(5)]
+
+    def _zayavka(self, i):
+        return Zayavki.objects.create(
+            gorod=self.gorod, phone_client=f'8900123456{i}', client_name=f'Клиент {i}',
+            address='ул. Тестовая, 1', meeting_date=timezone.now() - timezone.timedelta(days=i),
+            tip_techniki='Холодильник', problema='Не работает', kc_name='КЦ', status='Готово'
+        )
+
+    def test_by_status_without_params_is_full_list(self):
+        response = self.client.get('/api/v1/zayavki/by_status/?status=Готово')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data), 5)
+        self.assertIn('comment_kc', response.data[0])
+
+    def test_by_status_cursor_pages(self):
+        response = self.client.get('/api/v1/zayavki/by_status/', {
+            'status': 'Готово', 'pagination': 'cursor', 'page_size': 2, 'fields': 'id,status'
+        })
+        ids = []
+        while True:
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            for item in response.data['results']:
+                self.assertEqual(set(item), {'id', 'status'})
+                ids.append(item['id'])
+            if not response.data['next']:
+                break
+            response = self.client.get(response.data['next'])
+        self.assertEqual(ids, [zayavka.id for zayavka in self.zayavki])
+
+    def test_incoming_compact_skips_joins_and_prefetch(self):
+        Zayavki.objects.filter(id=self.zayavki[0].id).update(status='Ожидает')
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/v1/vkhodyashchie-zayavki/?compact=1')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data[0]['id'], self.zayavki[0].id)
+        self.assertNotIn('rk_name', response.data[0])
+
+    def test_unknown_field_is_rejected(self):
+        response = self.client.get('/api/v1/zayavki/by_status/?status=Готово&fields=id,password')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('password', response.data['error'])
+
+    def test_active_masters_and_users(self):
+        for i in range(3):
+            Master.objects.create(name=f'Мастер {i}', login=f'master{i}', password='x', gorod=self.gorod)
+        response = self.client.get('/api/v1/master/active/?fields=id,name')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual({tuple(item) for item in response.data}, {('id', 'name')})
+
+        response = self.client.get('/api/v1/master/active/?pagination=cursor&page_size=2')
+        self.assertEqual(len(response.data['results']), 2)
+        self.assertIsNotNone(response.data['next'])
+
+        response = self.client.get('/api/v1/polzovateli/active/?fields=id,login&pagination=cursor')
+        self.assertIn({'id': self.user.id, 'login': 'admin'}, response.data['results'])
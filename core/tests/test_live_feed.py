@@ -0,0 +1,128 @@
+from unittest.mock import patch
+
+import jwt
+from asgiref.sync import async_to_sync, sync_to_async
+from django.conf import settings
+from django.test import AsyncClient, SimpleTestCase, override_settings
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APIClient, APITestCase
+
+from core.closeout import update_zayavki
+from core.live_feed import MemoryFeedBackend, RedisFeedBackend, stream_key
+from core.models import Gorod, Polzovateli, Roli, Zayavki
+
+FEED_URL = '/api/v1/vkhodyashchie-zayavki/feed/'
+
+
+@override_settings(ZAYAVKI_FEED={'BLOCK_SECONDS': 0.05, 'POLL_INTERVAL': 0.01})
+class ZayavkiFeedTest(APITestCase):
+    """Тесты SSE-ленты изменений заявок"""
+
+    def setUp(self):
+        self.backend = MemoryFeedBackend()
+        patcher = patch('core.live_feed._backend', self.backend)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.gorod = Gorod.objects.create(name='Москва')
+        self.user = Polzovateli.objects.create(
+            name='Оператор', login='kc', password='testpass123',
+            gorod=self.gorod, rol=Roli.objects.create(name='kc')
+        )
+        self.user.role = 'kc'
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+    def _zayavka(self, gorod=None):
+        with self.captureOnCommitCallbacks(execute=True):
+            return Zayavki.objects.create(
+                gorod=gorod or self.gorod, phone_client='89001234567', client_name='Клиент',
+                address='ул. Тестовая, 1', meeting_date=timezone.now(),
+                tip_techniki='Холодильник', problema='Не работает', kc_name='КЦ', status='Ожидает'
+            )
+
+    def _events(self):
+        return [event for _, event, _ in self.backend._after(stream_key(self.gorod.id), '0-0', 100)]
+
+    def _feed(self, **headers):
+        """Ответ ленты через ASGI-обработчик (AsyncClient, JWT в cookie)"""
+        client = AsyncClient()
+        client.cookies['jwt'] = jwt.encode(
+            {'user_id': self.user.id, 'role': 'kc', 'gorod_id': self.gorod.id},
+            settings.SECRET_KEY, algorithm='HS256'
+        )
+        return client.get(FEED_URL, headers={'Accept': 'text/event-stream', **headers})
+
+    async def _open(self, **headers):
+        response = await self._feed(**headers)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        return aiter(response.streaming_content)
+
+    def _read(self, chunks, **headers):
+        async def take():
+            feed = await self._open(**headers)
+            return b''.join([await anext(feed) for _ in range(chunks)]).decode('utf-8')
+        return async_to_sync(take)()
+
+    def test_wsgi_is_not_streamed(self):
+        """Под WSGI поток буферизовался бы и держал воркер — 501"""
+        response = self.client.get(FEED_URL, HTTP_ACCEPT='text/event-stream')
+        self.assertEqual(response.status_code, status.HTTP_501_NOT_IMPLEMENTED)
+        self.assertFalse(response.streaming)
+
+    def test_writes_are_published_to_city_stream(self):
+        zayavka = self._zayavka()
+        self._zayavka(Gorod.objects.create(name='Казань'))
+        with self.captureOnCommitCallbacks(execute=True):
+            update_zayavki([{'id': zayavka.id, 'status': 'Принял'}])
+        with self.captureOnCommitCallbacks(execute=True):
+            zayavka.delete()
+        self.assertEqual(self._events(), ['created', 'updated', 'deleted'])
+
+    def test_snapshot_then_deltas(self):
+        waiting = self._zayavka()
+
+        # Поток живёт в одном цикле событий: запись заявки — из него же
+        async def scenario():
+            feed = await self._open()
+            first = (await anext(feed)).decode('utf-8')
+            created = await sync_to_async(self._zayavka)()
+            return first, created, (await anext(feed)).decode('utf-8')
+        first, created, chunk = async_to_sync(scenario)()
+
+        self.assertIn('event: snapshot', first)
+        self.assertIn(f'"id":{waiting.id}', first.replace(' ', ''))
+        self.assertIn('event: created', chunk)
+        self.assertIn(f'"id":{created.id}', chunk.replace(' ', ''))
+
+    def test_resume_from_last_event_id(self):
+        self._zayavka()
+        last_id = self.backend.last_id(stream_key(self.gorod.id))
+        missed = self._zayavka()
+
+        chunks = self._read(2, **{'Last-Event-ID': last_id})
+        self.assertNotIn('snapshot', chunks)
+        self.assertIn('event: created', chunks)
+        self.assertIn(f'"id":{missed.id}', chunks.replace(' ', ''))
+
+        # Неизвестный (слишком новый) id — клиенту нужен снимок
+        self.assertIn('event: snapshot', self._read(1, **{'Last-Event-ID': '999-0'}))
+
+
+@override_settings(ZAYAVKI_FEED={'BLOCK_SECONDS': 15, 'SOCKET_TIMEOUT': 2})
+class RedisFeedBackendTest(SimpleTestCase):
+    """Тесты таймаутов подключений Redis ленты"""
+
+    def test_client_has_socket_timeouts(self):
+        with patch('redis.Redis.from_url') as from_url:
+            RedisFeedBackend('redis://feed:6379/0')._get_client()
+        self.assertEqual(from_url.call_args.kwargs['socket_timeout'], 2)
+        self.assertEqual(from_url.call_args.kwargs['socket_connect_timeout'], 2)
+
+    def test_reader_timeout_exceeds_block(self):
+        """Ожидание XREAD BLOCK не должно обрываться таймаутом сокета"""
+        with patch('redis.asyncio.Redis.from_url') as from_url:
+            RedisFeedBackend('redis://feed:6379/0').reader()
+        self.assertGreater(from_url.call_args.kwargs['socket_timeout'], 15)
+        self.assertEqual(from_url.call_args.kwargs['socket_connect_timeout'], 2)
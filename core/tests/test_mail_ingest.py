@@ -0,0 +1,103 @@
+from django.test import TestCase
+
+from core.mail_ingest import IMAPMailbox, MailIngestor, MailMessage, parse_fetch_response
+from core.models import MailSyncCheckpoint
+
+
+FETCH_RESPONSE = [
+    (b'1 (UID 42 ENVELOPE ("Mon, 7 Jul 2025 17:16:40 +0300" {28}', b'=?utf-8?b?0JfQsNC/0LjRgdGM?='),
+    b' (("Mango" NIL "noreply" "mango-office.ru")) NIL NIL NIL NIL NIL NIL "<id@x>")'
+    b' BODYSTRUCTURE (("TEXT" "PLAIN" ("CHARSET" "UTF-8") NIL NIL "7BIT" 10 1 NIL NIL NIL)'
+    b'("AUDIO" "MPEG" ("NAME" "rec.mp3") NIL NIL "BASE64" 1000 NIL'
+    b' ("ATTACHMENT" ("FILENAME" "2025.07.05__17-16-36_79001234567.mp3")) NIL) "MIXED" ("BOUNDARY" "x") NIL NIL))',
+]
+
+
+class FakeMailbox(IMAPMailbox):
+    """Ящик без сети: письма задаются словарём uid -> MailMessage"""
+
+    def __init__(self, messages, uidvalidity=1):
+        super().__init__('box@example.com', 'x', 'imap.example.com')
+        self.messages = messages
+        self.uidvalidity = uidvalidity
+        self.fetched_parts = []
+
+    def select(self):
+        return self.uidvalidity
+
+    def search_since(self, since):
+        return sorted(self.messages)
+
+    def search_uids_after(self, last_uid):
+        return [uid for uid in sorted(self.messages) if uid > last_uid]
+
+    def fetch_messages(self, uids):
+        return [self.messages[uid] for uid in uids]
+
+    def fetch_parts(self, message, parts=None):
+        self.fetched_parts.append(message.uid)
+        return [(filename, b'audio') for _, filename, _ in message.audio_parts]
+
+
+class MailIngestTest(TestCase):
+    """Тесты инкрементальной загрузки записей из почты"""
+
+    def _message(self, uid, sender='noreply@mango-office.ru', subject='Запись'):
+        return MailMessage(uid, sender, subject, [('2', f'79001234567_{uid}.mp3', 'base64')])
+
+    def test_parse_envelope_and_bodystructure(self):
+        """Из ENVELOPE и BODYSTRUCTURE извлекаются отправитель, тема и аудиочасти"""
+        [(uid, attributes)] = parse_fetch_response(FETCH_RESPONSE)
+        message = MailMessage.from_fetch(uid, attributes)
+        self.assertEqual(uid, 42)
+        self.assertEqual(message.sender, 'noreply@mango-office.ru')
+        self.assertEqual(message.subject, 'Запись')
+        self.assertEqual(message.audio_parts, [('2', '2025.07.05__17-16-36_79001234567.mp3', 'base64')])
+        self.assertTrue(message.is_mango)
+
+    def test_only_new_uids_are_processed(self):
+        """Повторная синхронизация обрабатывает только новые письма"""
+        handled = []
+        mailbox = FakeMailbox({1: self._message(1), 2: self._message(2, sender='other@example.com', subject='Счёт')})
+        ingestor = MailIngestor(mailbox, lambda filename, content, message: handled.append(filename))
+
+        self.assertEqual(ingestor.sync_once(), 1)
+        self.assertEqual(MailSyncCheckpoint.objects.get().last_uid, 2)
+
+        mailbox.messages[3] = self._message(3)
+        ingestor.sync_once()
+        self.assertEqual(handled, ['79001234567_1.mp3', '79001234567_3.mp3'])
+        # Аудио не-Mango письма не скачивается
+        self.assertEqual(mailbox.fetched_parts, [1, 3])
+
+    def test_uidvalidity_change_resets_checkpoint(self):
+        """Смена UIDVALIDITY сбрасывает позицию синхронизации"""
+        mailbox = FakeMailbox({5: self._message(5)})
+        MailIngestor(mailbox, lambda *args: None).sync_once()
+
+        mailbox.uidvalidity = 2
+        mailbox.messages = {1: self._message(1)}
+        MailIngestor(mailbox, lambda *args: None).sync_once()
+
+        checkpoint = MailSyncCheckpoint.objects.get()
+        self.assertEqual((checkpoint.uidvalidity, checkpoint.last_uid), (2, 1))
+
+    def test_failed_message_is_retried_on_next_sync(self):
+        """Письмо, на котором handler упал, обрабатывается в следующем проходе"""
+        handled = []
+        failures = ['Ошибка БД']
+
+        def handler(filename, content, message):
+            if message.uid == 1 and failures:
+                raise RuntimeError(failures.pop())
+            handled.append(filename)
+
+        mailbox = FakeMailbox({1: self._message(1), 2: self._message(2)})
+        ingestor = MailIngestor(mailbox, handler)
+        self.assertEqual(ingestor.sync_once(), 1)
+        checkpoint = MailSyncCheckpoint.objects.get()
+        self.assertEqual((checkpoint.last_uid, checkpoint.failed_uids), (2, {'1': 1}))
+
+        self.assertEqual(ingestor.sync_once(), 1)
+        self.assertEqual(handled, ['79001234567_2.mp3', '79001234567_1.mp3'])
+        self.assertEqual(MailSyncCheckpoint.objects.get().failed_uids, {})
@@ -0,0 +1,95 @@
+import json
+
+from django.test import TestCase, override_settings
+
+from core.mango_events import MangoEventWorker, make_signature
+from core.models import Gorod, MangoWebhookEvent, NotificationOutbox, PhoneGoroda, Zayavki
+
+
+@override_settings(
+    MANGO_API_KEY='test_key', MANGO_API_SALT='test_salt',
+    TELEGRAM_NOTIFY_BOT_TOKEN='token', TELEGRAM_NOTIFY_CHAT_ID='1'
+)
+class MangoWebhookTest(TestCase):
+    """Тесты приёма событий Mango в inbox и их обработки воркером"""
+
+    def setUp(self):
+        self.gorod = Gorod.objects.create(name='Москва')
+        PhoneGoroda.objects.create(gorod=self.gorod, phone='74950000000')
+
+    def _post(self, event, payload, sign=None):
+        json_text = json.dumps(payload)
+        return self.client.post(f'/api/v1/mango-incoming-call/events/{event}/', {
+            'vpbx_api_key': 'test_key',
+            'sign': sign or make_signature(json_text),
+            'json': json_text,
+        })
+
+    def _call(self, entry_id='E1', seq=1, **extra):
+        return {
+            'entry_id': entry_id, 'call_id': f'{entry_id}-leg', 'seq': seq, 'call_state': 'Appeared',
+            'from': {'number': '89001234567'}, 'to': {'number': '101', 'line_number': '74950000000'},
+            **extra,
+        }
+
+    def test_retries_are_deduplicated(self):
+        """Повтор того же события не создаёт вторую запись в inbox"""
+        for _ in range(3):
+            response = self._post('call', self._call())
+            self.assertEqual(response.status_code, 200)
+        self._post('call', self._call(seq=2))
+        self.assertEqual(MangoWebhookEvent.objects.count(), 2)
+        self.assertFalse(Zayavki.objects.exists())
+
+    def test_invalid_signature_is_rejected(self):
+        response = self._post('call', self._call(), sign='bad')
+        self.assertEqual(response.status_code, 403)
+        self.assertFalse(MangoWebhookEvent.objects.exists())
+
+    def test_worker_creates_one_zayavka_per_call(self):
+        """События call/summary/recording одного звонка дают одну заявку"""
+        self._post('call', self._call(seq=1))
+        self._post('call', self._call(seq=2, call_state='Connected'))
+        self._post('summary', self._call(seq=None))
+        self._post('call', self._call(entry_id='E2', **{'from': {'number': '101', 'extension': '101'}}))
+
+        worker = MangoEventWorker()
+        self.assertEqual(worker.process_batch(), (4, 1))
+        zayavka = Zayavki.objects.get()
+        self.assertEqual((zayavka.phone_client, zayavka.gorod_id), ('79001234567', self.gorod.id))
+        self.assertEqual(NotificationOutbox.objects.count(), 1)
+
+        # Запись приходит позже — привязывается к той же заявке
+        self._post('record/added', {'entry_id': 'E1', 'recording_id': 'R1'})
+        self.assertEqual(worker.process_batch(), (1, 0))
+        self.assertEqual(Zayavki.objects.count(), 1)
+        statuses = dict(MangoWebhookEvent.objects.values_list('call_id', 'status').distinct())
+        self.assertEqual(statuses, {'E1': 'processed', 'E2': 'skipped'})
+        self.assertEqual(
+            set(MangoWebhookEvent.objects.filter(call_id='E1').values_list('zayavka_id', flat=True)),
+            {zayavka.id}
+        )
+
+    def test_unknown_line_fails_without_retry(self):
+        self._post('call', self._call(to={'number': '74990000000'}))
+        MangoEventWorker().process_batch()
+        event = MangoWebhookEvent.objects.get()
+        self.assertEqual((event.status, event.attempts), ('failed', 1))
+        self.assertFalse(Zayavki.objects.exists())
+
+    @override_settings(MANGO_WEBHOOK_INBOX={'BATCH_SIZE': 1})
+    def test_concurrent_workers_share_zayavka_of_call(self):
+        """Пачки разных воркеров с событиями одного звонка дают одну заявку"""
+        self._post('call', self._call(seq=1))
+        self._post('call', self._call(seq=2, call_state='Connected'))
+
+        first, second = MangoEventWorker(), MangoEventWorker()
+        claimed = first.claim_batch()
+        # Второй воркер забирает следующее событие и успевает создать заявку
+        self.assertEqual(second.process_batch(), (1, 1))
+        self.assertEqual(first.process_events(claimed), (1, 0))
+
+        zayavka = Zayavki.objects.get()
+        self.assertEqual(
+            set(MangoWebhookEvent.objects.values_list('zayavka_id', flat=True)), {zayavka.id}
+        )
@@ -0,0 +1,149 @@
+import importlib.util
+import tempfile
+import threading
+import time
+from pathlib import Path
+from unittest import mock
+
+from django.conf import settings
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from core.models import Gorod, Polzovateli, Roli, ZayavkaFile, Zayavki
+
+SCRIPT = Path(settings.BASE_DIR) / 'scripts' / 'mango_api_importer.py'
+
+
+def load_importer_module():
+    """Скрипт не пакет — загружаем модуль по пути"""
+    spec = importlib.util.spec_from_file_location('mango_api_importer', SCRIPT)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+importer_module = load_importer_module()
+
+
+class FakeResponse:
+    """Ответ requests с потоковым телом"""
+
+    def __init__(self, status_code=200, content=b'', payload=None, on_read=None):
+        self.status_code = status_code
+        self.content = content
+        self.payload = payload
+        self.on_read = on_read
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def json(self):
+        return self.payload
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise importer_module.requests.exceptions.HTTPError(f'{self.status_code}')
+
+    def iter_content(self, chunk_size=None):
+        if self.on_read:
+            self.on_read()
+        yield self.content
+
+
+class MangoImporterTest(TestCase):
+    """Тесты импорта записей Mango: пагинация, докачка, хеши и параллельная загрузка"""
+
+    def setUp(self):
+        self.gorod = Gorod.objects.create(name='Москва')
+        Polzovateli.objects.create(
+            name='Админ', login='admin', password='x', gorod=self.gorod, rol=Roli.objects.create(name='admin')
+        )
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.importer = importer_module.MangoAPIImporter('key', 'salt', workers=4, per_host=2)
+        self.importer.download_dir = Path(self.tmp.name)
+        self.importer.session = mock.Mock()
+
+    def _page(self, size, start=0):
+        return FakeResponse(payload={'data': [{'id': start + i} for i in range(size)]})
+
+    def test_calls_history_pages_until_short_page(self):
+        self.importer.session.post.side_effect = [self._page(2), self._page(1, start=2)]
+        calls = self.importer.get_calls_history('2025-07-01', '2025-07-02', limit=2)
+        self.assertEqual([call['id'] for call in calls], [0, 1, 2])
+        offsets = [c.kwargs['data']['offset'] for c in self.importer.session.post.call_args_list]
+        self.assertEqual(offsets, [0, 2])
+
+    def test_calls_history_stops_at_max_pages(self):
+        self.importer.session.post.side_effect = lambda *args, **kwargs: self._page(2)
+        with mock.patch.object(importer_module, 'CALLS_MAX_PAGES', 3):
+            calls = self.importer.get_calls_history('2025-07-01', '2025-07-02', limit=2)
+        self.assertEqual(len(calls), 6)
+        self.assertEqual(self.importer.session.post.call_count, 3)
+
+    def test_download_resumes_part_file(self):
+        part = Path(self.tmp.name) / 'a.mp3.part'
+        part.write_bytes(b'abc')
+        self.importer.session.get.return_value = FakeResponse(206, b'def')
+        path = self.importer.download_audio_file('https://mango/a', 'a.mp3')
+        self.assertEqual(path.read_bytes(), b'abcdef')
+        self.assertFalse(part.exists())
+        self.assertEqual(self.importer.session.get.call_args.kwargs['headers'], {'Range': 'bytes=3-'})
+
+    def test_download_restarts_without_range_support(self):
+        """200 вместо 206 — частичный файл перезаписывается, а не дополняется"""
+        (Path(self.tmp.name) / 'a.mp3.part').write_bytes(b'abc')
+        self.importer.session.get.return_value = FakeResponse(200, b'full')
+        self.assertEqual(self.importer.download_audio_file('https://mango/a', 'a.mp3').read_bytes(), b'full')
+
+    def test_download_complete_part_on_416(self):
+        (Path(self.tmp.name) / 'a.mp3.part').write_bytes(b'done')
+        self.importer.session.get.return_value = FakeResponse(416)
+        self.assertEqual(self.importer.download_audio_file('https://mango/a', 'a.mp3').read_bytes(), b'done')
+
+    def test_same_content_is_attached_once(self):
+        """Одна и та же запись под разными id звонка прикрепляется один раз"""
+        Zayavki.objects.create(
+            gorod=self.gorod, phone_client='89001234567', client_name='Клиент', address='ул. Тестовая, 1',
+            meeting_date=timezone.now(), tip_techniki='Холодильник', problema='Не работает', kc_name='КЦ'
+        )
+        calls = [
+            {'id': call_id, 'from_number': '89001234567', 'record_url': f'https://mango/{call_id}'}
+            for call_id in ('c1', 'c2')
+        ]
+        self.importer.session.post.return_value = FakeResponse(payload={'data': calls})
+        self.importer.session.get.side_effect = lambda *args, **kwargs: FakeResponse(200, b'x' * 2048)
+        with override_settings(MEDIA_ROOT=self.tmp.name):
+            self.importer.process_calls('2025-07-01', '2025-07-02')
+        self.assertEqual(ZayavkaFile.objects.count(), 1)
+
+    def test_downloads_are_bounded_per_host(self):
+        active, peak, lock = {}, {}, threading.Lock()
+
+        def fetch(url, **kwargs):
+            host = url.split('/')[2]
+
+            def read():
+                with lock:
+                    active[host] = active.get(host, 0) + 1
+                    peak[host] = max(peak.get(host, 0), active[host])
+                time.sleep(0.02)
+                with lock:
+                    active[host] -= 1
+            return FakeResponse(200, b'x', on_read=read)
+
+        self.importer.session.get.side_effect = fetch
+        recordings = [
+            importer_module.Recording(
+                f'mango:{i}', '79001234567', filename=f'{i}.mp3',
+                payload={'record_url': f'https://records.mango/{i}'}
+            )
+            for i in range(8)
+        ]
+        downloaded = self.importer.download_recordings(recordings)
+        self.assertEqual(len(downloaded), 8)
+        # Четыре потока, но с одного хоста не больше двух загрузок одновременно
+        self.assertEqual(peak, {'records.mango': 2})
@@ -0,0 +1,78 @@
+from django.test import TestCase, RequestFactory
+from django.urls import resolve
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+
+import redis
+
+from core.monitoring import PerformanceMonitor, LocalMetricsStore, RedisMetricsStore
+
+
+class PerformanceMonitorTest(TestCase):
+    """Тесты атомарного сбора метрик запросов"""
+
+    def setUp(self):
+        self.monitor = PerformanceMonitor()
+        self.monitor._store = LocalMetricsStore()
+
+    def test_route_uses_template_not_path(self):
+        """Метрики ключуются именем маршрута, а не путём с id"""
+        request = RequestFactory().get('/api/v1/zayavki/15/')
+        request.resolver_match = resolve('/api/v1/zayavki/15/')
+        self.assertEqual(self.monitor.get_route(request), 'zayavki-detail')
+
+    def test_concurrent_updates_are_not_lost(self):
+        """Параллельные запросы не теряют инкременты"""
+        def record(i):
+            self.monitor.record_request_time('zayavki-list', 'GET', 0.2, 500 if i % 10 == 0 else 200)
+
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            list(pool.map(record, range(200)))
+
+        metrics = self.monitor.get_performance_metrics()
+        endpoint = metrics['endpoints']['GET zayavki-list']
+        self.assertEqual(endpoint['count'], 200)
+        self.assertEqual(endpoint['error_count'], 20)
+        self.assertEqual(metrics['summary']['total_requests'], 200)
+        self.assertAlmostEqual(endpoint['avg_time'], 0.2, places=3)
+
+    def test_percentiles_from_buckets(self):
+        """p50/p95/p99 оцениваются по фиксированным корзинам"""
+        for _ in range(90):
+            self.monitor.record_request_time('gorod-list', 'GET', 0.04, 200)
+        for _ in range(10):
+            self.monitor.record_request_time('gorod-list', 'GET', 3.0, 200)
+
+        endpoint = self.monitor.get_performance_metrics()['endpoints']['GET gorod-list']
+        self.assertEqual(endpoint['p50'], 0.05)
+        self.assertEqual(endpoint['p95'], 5.0)
+        self.assertEqual(endpoint['p99'], 5.0)
+
+
+class RedisMetricsStoreTest(TestCase):
+    """Тесты записи метрик при недоступном Redis"""
+
+    def setUp(self):
+        with mock.patch('redis.Redis.from_url') as from_url:
+            self.store = RedisMetricsStore('redis://metrics:6379/0')
+        self.from_url = from_url
+        self.pipe = self.store.client.pipeline.return_value
+
+    def test_client_has_socket_timeouts(self):
+        kwargs = self.from_url.call_args.kwargs
+        self.assertEqual(kwargs['socket_timeout'], RedisMetricsStore.socket_timeout)
+        self.assertEqual(kwargs['socket_connect_timeout'], RedisMetricsStore.socket_timeout)
+
+    def test_writes_skipped_after_redis_error(self):
+        self.pipe.execute.side_effect = redis.TimeoutError('Timeout reading from socket')
+        monitor = PerformanceMonitor()
+        monitor._store = self.store
+        with mock.patch('core.monitoring.time.monotonic', return_value=100.0):
+            monitor.record_request_time('zayavki-list', 'GET', 0.1, 200)
+            monitor.record_request_time('zayavki-list', 'GET', 0.1, 200)
+        self.assertEqual(self.pipe.execute.call_count, 1)
+
+        self.pipe.execute.side_effect = None
+        with mock.patch('core.monitoring.time.monotonic', return_value=100.0 + RedisMetricsStore.retry_seconds):
+            monitor.record_request_time('zayavki-list', 'GET', 0.1, 200)
+        self.assertEqual(self.pipe.execute.call_count, 2)
@@ -0,0 +1,125 @@
+import logging
+from datetime import timedelta
+from unittest import mock
+
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from core.models import NotificationOutbox
+from core.notifications import enqueue_telegram_message, TelegramDeliveryWorker
+from core.telegram_handler import TelegramLogHandler
+
+
+def telegram_response(status_code=200, payload=None):
+    response = mock.Mock(status_code=status_code, text='')
+    response.json.return_value = payload or {}
+    return response
+
+
+@override_settings(TELEGRAM_BOT_TOKEN='token', TELEGRAM_CHAT_ID='100')
+class NotificationOutboxTest(TestCase):
+    """Тесты очереди исходящих уведомлений"""
+
+    def setUp(self):
+        self.session = mock.Mock()
+        self.worker = TelegramDeliveryWorker(session=self.session, config={
+            'BATCH_SIZE': 50, 'MAX_ATTEMPTS': 2, 'RETRY_BASE': 5, 'RETRY_MAX': 60,
+            'CHAT_INTERVAL': 0, 'GLOBAL_INTERVAL': 0, 'LEASE': 60, 'TIMEOUT': 1,
+        })
+
+    def test_duplicates_are_skipped(self):
+        """Повторное сообщение с тем же ключом не ставится в очередь"""
+        self.assertTrue(enqueue_telegram_message('Заявка 1', dedup_key='call:1'))
+        self.assertFalse(enqueue_telegram_message('Заявка 1', dedup_key='call:1'))
+        self.assertEqual(NotificationOutbox.objects.count(), 1)
+
+    def test_messages_to_one_chat_are_batched(self):
+        """Сообщения одного чата отправляются одним запросом"""
+        for i in range(3):
+            enqueue_telegram_message(f'Сообщение {i}')
+        self.session.post.return_value = telegram_response()
+
+        self.worker.run(once=True)
+
+        self.assertEqual(self.session.post.call_count, 1)
+        text = self.session.post.call_args.kwargs['data']['text']
+        self.assertIn('Сообщение 0', text)
+        self.assertIn('Сообщение 2', text)
+        self.assertEqual(NotificationOutbox.objects.filter(status='sent').count(), 3)
+
+    def test_rate_limited_message_is_rescheduled(self):
+        """При 429 сообщение откладывается на retry_after и затем помечается failed"""
+        enqueue_telegram_message('Алерт')
+        self.session.post.return_value = telegram_response(429, {'parameters': {'retry_after': 1}})
+
+        self.worker.process_batch()
+
+        message = NotificationOutbox.objects.get()
+        self.assertEqual(message.status, 'pending')
+        self.assertEqual(message.attempts, 1)
+        self.assertGreater(message.next_attempt_at, message.created_at)
+
+        NotificationOutbox.objects.update(next_attempt_at=message.created_at)
+        self.worker.process_batch()
+        self.assertEqual(NotificationOutbox.objects.get().status, 'failed')
+
+    def test_purge_keeps_pending_and_recent(self):
+        """Старые sent/failed удаляются, ожидающие и свежие остаются"""
+        for i, status in enumerate(('sent', 'failed', 'pending', 'sent')):
+            enqueue_telegram_message(f'Сообщение {i}')
+            NotificationOutbox.objects.filter(text=f'Сообщение {i}').update(status=status)
+        old = timezone.now() - timedelta(days=31)
+        NotificationOutbox.objects.exclude(text='Сообщение 3').update(created_at=old)
+
+        self.worker.config['PURGE_BATCH'] = 1
+        self.assertEqual(self.worker.purge(), 2)
+        self.assertEqual(
+            sorted(NotificationOutbox.objects.values_list('status', flat=True)), ['pending', 'sent']
+        )
+        # Ключ дедупликации удалённого сообщения снова свободен
+        self.assertTrue(enqueue_telegram_message('Сообщение 0'))
+
+
+@override_settings(TELEGRAM_BOT_TOKEN='token', TELEGRAM_CHAT_ID='100', TELEGRAM_ALERTS_ENABLED=True)
+class TelegramLogHandlerTest(TestCase):
+    """Ошибки из логов ставятся в outbox, а не отправляются в потоке запроса"""
+
+    def test_error_is_enqueued_once_per_window(self):
+        handler = TelegramLogHandler()
+        logger = logging.getLogger('core.tests.telegram')
+        logger.addHandler(handler)
+        self.addCleanup(logger.removeHandler, handler)
+        with mock.patch('core.utils.requests.post') as post:
+            for _ in range(3):
+                try:
+                    raise ValueError('boom')
+                except ValueError:
+                    logger.exception('Ошибка запроса')
+        post.assert_not_called()
+        self.assertEqual(NotificationOutbox.objects.count(), 1)
+
+    @override_settings(TELEGRAM_NOTIFY_BOT_TOKEN=None, TELEGRAM_NOTIFY_CHAT_ID=None)
+    def test_unconfigured_bot_is_skipped(self):
+        self.assertFalse(enqueue_telegram_message('Новая заявка', bot='notify'))
+        self.assertFalse(NotificationOutbox.objects.exists())
+
+
+class MasterFeedbackTest(TestCase):
+    """Обратная связь мастеров уходит в outbox бота notify"""
+
+    @override_settings(TELEGRAM_NOTIFY_BOT_TOKEN='token', TELEGRAM_NOTIFY_CHAT_ID='1')
+    def test_feedback_is_queued(self):
+        response = self.client.post(
+            '/api/v1/master-feedback/', {'master_name': 'Иван', 'message': 'Спасибо'}, content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.json()['success'])
+        self.assertEqual(NotificationOutbox.objects.get().bot, 'notify')
+
+    @override_settings(TELEGRAM_NOTIFY_BOT_TOKEN=None, TELEGRAM_NOTIFY_CHAT_ID=None)
+    def test_not_queued_feedback_is_an_error(self):
+        response = self.client.post(
+            '/api/v1/master-feedback/', {'master_name': 'Иван', 'message': 'Спасибо'}, content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 503)
+        self.assertFalse(response.json()['success'])
@@ -0,0 +1,79 @@
+from rest_framework.test import APITestCase, APIClient
+from rest_framework import status
+from datetime import timedelta
+from django.utils import timezone
+
+from core.models import Gorod, Roli, Polzovateli, Zayavki
+
+
+class ZayavkiKeysetPaginationTest(APITestCase):
+    """Тесты keyset пагинации заявок"""
+
+    def setUp(self):
+        self.gorod = Gorod.objects.create(name='Москва')
+        self.rol = Roli.objects.create(name='admin')
+        self.user = Polzovateli.objects.create(
+            name='Тестовый Админ',
+            login='admin',
+            password='testpass123',
+            gorod=self.gorod,
+            rol=self.rol
+        )
+        self.user.role = 'admin'
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+        base = timezone.now()
+        # Две заявки на одно и то же время проверяют разрешение совпадений по id
+        dates = [base - timedelta(days=i) for i in range(5)] + [base - timedelta(days=2)]
+        for i, meeting_date in enumerate(dates):
+            Zayavki.objects.create(
+                gorod=self.gorod,
+                phone_client=f'+7900123456{i}',
+                client_name=f'Клиент {i}',
+                address='ул. Тестовая, 1',
+                meeting_date=meeting_date,
+                tip_techniki='Холодильник',
+                problema='Не работает',
+                kc_name='КЦ'
+            )
+        self.expected = list(
+            Zayavki.objects.order_by('-meeting_date', '-id').values_list('id', flat=True)
+        )
+
+    def _collect(self, url):
+        ids = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertNotIn('count', response.data)
+            ids.extend(item['id'] for item in response.data['results'])
+            url = response.data['next']
+        return ids
+
+    def test_forward_pages_cover_all_rows_in_order(self):
+        """Проход по next-курсорам возвращает все заявки без пропусков и дублей"""
+        ids = self._collect('/api/v1/zayavki/?pagination=cursor&page_size=2')
+        self.assertEqual(ids, self.expected)
+
+    def test_previous_cursor_returns_previous_page(self):
+        """Курсор previous возвращает предыдущую страницу"""
+        first = self.client.get('/api/v1/zayavki/?pagination=cursor&page_size=2')
+        self.assertIsNone(first.data['previous'])
+        second = self.client.get(first.data['next'])
+        back = self.client.get(second.data['previous'])
+        self.assertEqual(
+            [item['id'] for item in back.data['results']],
+            [item['id'] for item in first.data['results']]
+        )
+
+    def test_invalid_cursor(self):
+        """Невалидный курсор возвращает 404"""
+        response = self.client.get('/api/v1/zayavki/?cursor=not-a-cursor')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_default_pagination_unchanged(self):
+        """Без параметра используется постраничная пагинация с count"""
+        response = self.client.get('/api/v1/zayavki/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['count'], len(self.expected))
@@ -0,0 +1,84 @@
+from importlib import import_module
+from io import StringIO
+from types import SimpleNamespace
+from unittest.mock import patch
+
+from django.apps import apps
+from django.core.management import call_command
+from django.db import connection
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APIClient, APITestCase
+
+from core.models import Gorod, Polzovateli, Roli, Zayavki
+from core.phones import find_phone, to_e164
+
+
+class PhoneNormTest(APITestCase):
+    """Тесты канонического номера phone_norm и поиска по нему"""
+
+    def setUp(self):
+        self.gorod = Gorod.objects.create(name='Москва')
+        self.user = Polzovateli.objects.create(
+            name='Админ', login='admin', password='testpass123',
+            gorod=self.gorod, rol=Roli.objects.create(name='admin')
+        )
+        self.user.role = 'admin'
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+    def _zayavka(self, phone, status='Ожидает', phone_atc=None):
+        return Zayavki.objects.create(
+            gorod=self.gorod, phone_client=phone, phone_atc=phone_atc, client_name='Клиент',
+            address='ул. Тестовая, 1', meeting_date=timezone.now(),
+            tip_techniki='Холодильник', problema='Не работает', kc_name='КЦ', status=status
+        )
+
+    def test_to_e164(self):
+        for value in ('89001234567', '+7 (900) 123-45-67', '9001234567', 79001234567):
+            self.assertEqual(to_e164(value), '+79001234567')
+        for value in (None, '', '101', '12345'):
+            self.assertIsNone(to_e164(value))
+        self.assertEqual(find_phone('in_89001234567_2025-07-05.mp3'), '79001234567')
+
+    def test_norm_is_filled_on_save(self):
+        zayavka = self._zayavka('89001234567', phone_atc='+74950000000')
+        self.assertEqual((zayavka.phone_norm, zayavka.phone_atc_norm), ('+79001234567', '+74950000000'))
+
+        zayavka.phone_client = '+79007654321'
+        zayavka.save(update_fields=['phone_client'])
+        zayavka.refresh_from_db()
+        self.assertEqual(zayavka.phone_norm, '+79007654321')
+
+    def test_backfill_command(self):
+        zayavka = self._zayavka('89001234567')
+        Zayavki.objects.filter(pk=zayavka.pk).update(phone_norm=None)
+        call_command('backfill_phone_norm', batch_size=1, stdout=StringIO())
+        zayavka.refresh_from_db()
+        self.assertEqual(zayavka.phone_norm, '+79001234567')
+
+    def test_backfill_migration(self):
+        """Заявки, созданные до 0011, получают phone_norm миграцией 0014"""
+        zayavki = [self._zayavka('89001234567'), self._zayavka('79007654321', phone_atc='84950000000')]
+        Zayavki.objects.update(phone_norm=None, phone_atc_norm=None)
+        migration = import_module('core.migrations.0014_backfill_phone_norm')
+        with patch.object(migration, 'BATCH_SIZE', 1):
+            migration.backfill_phone_norm(apps, SimpleNamespace(connection=connection))
+        self.assertEqual(
+            list(Zayavki.objects.filter(id__in=[z.id for z in zayavki]).order_by('id')
+                 .values_list('phone_norm', 'phone_atc_norm')),
+            [('+79001234567', None), ('+79007654321', '+74950000000')]
+        )
+
+    def test_open_zayavki_by_phone(self):
+        """Поиск открытых заявок клиента по номеру в любом формате"""
+        waiting = self._zayavka('89001234567')
+        self._zayavka('+79001234567', status='Готово')
+        self._zayavka('79007654321')
+
+        response = self.client.get('/api/v1/zayavki/by_phone/?phone=8 900 123-45-67&open=1')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([item['id'] for item in response.data], [waiting.id])
+
+        response = self.client.get('/api/v1/zayavki/by_phone/?phone=101')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
@@ -0,0 +1,132 @@
+import os
+import tempfile
+from pathlib import Path
+
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from datetime import timedelta
+
+from core.models import Gorod, Zayavki, ZayavkaFile
+from core.recordings import (
+    DirectoryManifest, Recording, RecordingMatcher, call_time_from_filename, phone_from_filename
+)
+
+
+class RecordingMatcherTest(TestCase):
+    """Тесты сопоставления записей звонков с заявками"""
+
+    def setUp(self):
+        self.gorod = Gorod.objects.create(name='Москва')
+        self.now = timezone.now().replace(microsecond=0)
+        self.old = self._zayavka('+79001234567', self.now - timedelta(days=3))
+        self.recent = self._zayavka('89001234567', self.now)
+        self.other = self._zayavka('79007654321', self.now, phone_atc='+79005550000')
+        self.matcher = RecordingMatcher()
+
+    def _zayavka(self, phone, meeting_date, phone_atc=None):
+        return Zayavki.objects.create(
+            gorod=self.gorod,
+            phone_client=phone,
+            phone_atc=phone_atc,
+            client_name='Клиент',
+            address='ул. Тестовая, 1',
+            meeting_date=meeting_date,
+            tip_techniki='Холодильник',
+            problema='Не работает',
+            kc_name='КЦ'
+        )
+
+    def test_filename_parsing(self):
+        """Номер и время звонка извлекаются из имени файла"""
+        filename = '2025.07.05__17-16-36_+79001234567.mp3'
+        self.assertEqual(phone_from_filename(filename), '79001234567')
+        self.assertEqual(call_time_from_filename(filename).hour, 17)
+
+    def test_batch_match_uses_single_query_and_time_window(self):
+        """Пачка сопоставляется одним запросом, заявка выбирается по окну времени"""
+        recordings = [
+            Recording('a', '9001234567', call_time=self.now - timedelta(days=3, minutes=10)),
+            Recording('b', '+7 900 123-45-67', call_time=self.now + timedelta(minutes=5)),
+            Recording('c', '89005550000'),
+            Recording('d', '79000000000'),
+        ]
+        with self.assertNumQueries(1):
+            matches = self.matcher.match(recordings)
+        self.assertEqual(matches, {'a': self.old.id, 'b': self.recent.id, 'c': self.other.id})
+
+    def test_no_fallback_outside_window(self):
+        """Без fallback запись вне окна не сопоставляется"""
+        matcher = RecordingMatcher(fallback_to_latest=False)
+        recording = Recording('a', '79001234567', call_time=self.now - timedelta(days=1))
+        self.assertEqual(matcher.match([recording]), {})
+
+    def test_duplicates_are_filtered_and_rejected(self):
+        """Уже прикреплённая запись отсекается по source_id и по хешу содержимого"""
+        first = Recording('mango:1', '79001234567', filename='a.mp3', content_hash='h1')
+        self.assertIsNotNone(self.matcher.attach(first, self.recent.id))
+
+        same_id = Recording('mango:1', '79001234567', filename='a.mp3')
+        same_content = Recording('atc:a.mp3', '79001234567', filename='a.mp3', content_hash='h1')
+        fresh = Recording('mango:2', '79001234567', filename='b.mp3', content_hash='h2')
+        self.assertEqual(self.matcher.filter_new([same_id, same_content, fresh]), [fresh])
+
+        self.assertIsNone(self.matcher.attach(same_content, self.recent.id))
+        self.assertEqual(ZayavkaFile.objects.count(), 1)
+
+
+class DirectoryImportTest(TestCase):
+    """Тесты инкрементального импорта каталога записей"""
+
+    def setUp(self):
+        self.archive = tempfile.TemporaryDirectory()
+        self.media = tempfile.TemporaryDirectory()
+        self.addCleanup(self.archive.cleanup)
+        self.addCleanup(self.media.cleanup)
+        self.root = Path(self.archive.name)
+        gorod = Gorod.objects.create(name='Москва')
+        self.zayavka = Zayavki.objects.create(
+            gorod=gorod, phone_client='79001234567', client_name='Клиент',
+            address='ул. Тестовая, 1', meeting_date=timezone.now(),
+            tip_techniki='Холодильник', problema='Не работает', kc_name='КЦ'
+        )
+
+    def _write(self, relative, content=b'x' * 2048):
+        path = self.root / relative
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(content)
+        return path
+
+    def test_only_changed_directories_are_rescanned(self):
+        """После commit неизменившиеся каталоги не возвращаются"""
+        self._write('2025/07/01/a_79001234567.mp3')
+        self._write('2025/07/02/b_79001234567.wav')
+        manifest = DirectoryManifest(self.root)
+
+        scanned = list(manifest.changed_directories({'.mp3', '.wav'}))
+        self.assertEqual(sum(len(d.entries) for d in scanned), 2)
+        manifest.commit(scanned)
+        self.assertEqual(list(manifest.changed_directories({'.mp3', '.wav'})), [])
+
+        new_file = self._write('2025/07/02/c_79001234567.mp3')
+        os.utime(new_file.parent, ns=(0, new_file.parent.stat().st_mtime_ns + 1))
+        changed = list(manifest.changed_directories({'.mp3', '.wav'}))
+        self.assertEqual([d.path for d in changed], ['2025/07/02'])
+        self.assertEqual(len(list(manifest.changed_directories({'.mp3'}, rescan=True))), 5)
+
+    def test_bulk_attach_skips_duplicate_content(self):
+        """Файлы прикрепляются одной вставкой, одинаковое содержимое — один раз"""
+        paths = [
+            self._write('a_79001234567.mp3', b'a' * 2048),
+            self._write('b_79001234567.mp3', b'a' * 2048),
+            self._write('c_79001234567.mp3', b'c' * 2048),
+        ]
+        recordings = [
+            Recording(f'atc:{p.name}', '79001234567', filename=p.name, payload=p) for p in paths
+        ]
+        matcher = RecordingMatcher()
+        matches = matcher.match(recordings)
+        with override_settings(MEDIA_ROOT=self.media.name):
+            self.assertEqual(matcher.bulk_attach(matches, recordings, workers=2), 2)
+            stored = list(Path(self.media.name).rglob('*.mp3'))
+        self.assertEqual(ZayavkaFile.objects.filter(zayavka=self.zayavka).count(), 2)
+        self.assertEqual(len(stored), 2)
@@ -0,0 +1,76 @@
+from datetime import date
+from decimal import Decimal
+
+from django.core.cache import cache
+from django.test import override_settings
+from rest_framework import status
+from rest_framework.test import APIClient, APITestCase
+
+from core.cache import local_cache
+from core.models import Gorod, Polzovateli, Roli, TipTranzakcii, Tranzakcii
+from core.tests.test_cache import LOCMEM_CACHES
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class TransactionReportTest(APITestCase):
+    """Тесты отчёта по транзакциям за период"""
+
+    def setUp(self):
+        cache.clear()
+        local_cache.clear()
+        self.gorod = Gorod.objects.create(name='Москва')
+        self.income = TipTranzakcii.objects.create(name='Приход')
+        self.expense = TipTranzakcii.objects.create(name='Расход')
+        self.user = Polzovateli.objects.create(
+            name='Админ', login='admin', password='testpass123',
+            gorod=self.gorod, rol=Roli.objects.create(name='admin')
+        )
+        self.user.role = 'admin'
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+        for day, tip, summa in [
+            (date(2024, 1, 10), self.income, '0.10'),
+            (date(2024, 1, 20), self.income, '0.20'),
+            (date(2024, 2, 5), self.income, '100.01'),
+            (date(2024, 2, 6), self.expense, '50.00'),
+        ]:
+            self._tranzakciya(day, tip, summa)
+        other = Gorod.objects.create(name='Казань')
+        self._tranzakciya(date(2024, 1, 10), self.income, '999.00', gorod=other)
+
+    def _tranzakciya(self, day, tip, summa, gorod=None):
+        tranzakciya = Tranzakcii.objects.create(gorod=gorod or self.gorod, tip_tranzakcii=tip, summa=Decimal(summa))
+        # date заполняется auto_now_add — переносим в нужный день
+        Tranzakcii.objects.filter(pk=tranzakciya.pk).update(date=day)
+        return tranzakciya
+
+    def test_totals_are_exact_and_grouped_by_type(self):
+        """Итоги по типам считаются в SQL без потери точности"""
+        response = self.client.get('/api/v1/tranzakcii/by_date_range/?start_date=2024-01-01&end_date=2024-02-29')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['Приход'], {'count': 3, 'total': Decimal('100.31')})
+        self.assertEqual(response.data['Расход'], {'count': 1, 'total': Decimal('50.00')})
+
+    def test_monthly_rows_and_closed_period_cache(self):
+        """Группировка по месяцам; закрытый период кэшируется до изменения транзакций"""
+        url = '/api/v1/tranzakcii/by_date_range/?start_date=2024-01-01&end_date=2024-02-29&period=month'
+        response = self.client.get(url)
+        self.assertEqual(
+            [(row['period'], row['tip'], row['total']) for row in response.data['rows']],
+            [('2024-01-01', 'Приход', Decimal('0.30')),
+             ('2024-02-01', 'Приход', Decimal('100.01')),
+             ('2024-02-01', 'Расход', Decimal('50.00'))]
+        )
+
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get(url).data, response.data)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            tranzakciya = Tranzakcii.objects.filter(tip_tranzakcii=self.expense).get()
+            tranzakciya.summa = Decimal('70.00')
+            tranzakciya.save()
+        self.assertEqual(self.client.get(url).data['totals']['Расход']['total'], Decimal('70.00'))
+
+    def test_invalid_period(self):
+        response = self.client.get('/api/v1/tranzakcii/by_date_range/?start_date=2024-01-01&end_date=2024-02-29&period=year')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
@@ -0,0 +1,72 @@
+from datetime import timedelta
+from io import StringIO
+from decimal import Decimal
+
+from django.core.management import call_command
+from django.test import TestCase
+from django.utils import timezone
+
+from core.closeout import update_zayavki
+from core.models import Gorod, Master, Zayavki, ZayavkiDailyStat
+from core.rollups import rebuild_daily_stats
+from services.zayavki_service import ZayavkiAnalyticsService, ZayavkiService
+
+
+class DailyRollupTest(TestCase):
+    """Тесты дневных агрегатов заявок"""
+
+    def setUp(self):
+        self.gorod = Gorod.objects.create(name='Москва')
+        self.master = Master.objects.create(
+            name='Мастер', phone='+79001234568', login='master', gorod=self.gorod
+        )
+        self.today = timezone.now()
+
+    def _zayavka(self, meeting_date, status='Ожидает', itog=None, rashod=None):
+        return Zayavki.objects.create(
+            gorod=self.gorod, phone_client='+79001234569', client_name='Клиент',
+            address='ул. Тестовая, 1', meeting_date=meeting_date,
+            tip_techniki='Холодильник', problema='Не работает', kc_name='КЦ',
+            master=self.master, status=status, itog=itog, rashod=rashod
+        )
+
+    def test_saves_refresh_rollups_after_commit(self):
+        """Создание, перенос и пакетное изменение заявки обновляют агрегаты"""
+        with self.captureOnCommitCallbacks(execute=True):
+            zayavka = self._zayavka(self.today, 'Готово', Decimal('1000'), Decimal('200'))
+            self._zayavka(self.today)
+        stats = ZayavkiService.get_zayavki_statistics(master_id=self.master.id)
+        self.assertEqual((stats['total'], stats['completed'], stats['pending']), (2, 1, 1))
+        self.assertEqual(stats['chistymi'], Decimal('800.00'))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            zayavka.meeting_date = self.today - timedelta(days=3)
+            zayavka.save()
+        self.assertEqual(
+            sorted(ZayavkiDailyStat.objects.values_list('date', 'status', 'count')),
+            [(timezone.localdate(zayavka.meeting_date), 'Готово', 1),
+             (timezone.localdate(self.today), 'Ожидает', 1)]
+        )
+
+        with self.captureOnCommitCallbacks(execute=True):
+            update_zayavki([{'id': zayavka.id, 'status': 'Отказ'}])
+        performance = ZayavkiAnalyticsService.get_master_performance(self.master.id)
+        self.assertEqual((performance['total_zayavki'], performance['completed_zayavki']), (2, 0))
+
+    def test_rebuild_matches_raw_table(self):
+        """Пересборка восстанавливает агрегаты из таблицы заявок"""
+        for days in (0, 0, 1, 40):
+            self._zayavka(self.today - timedelta(days=days), 'Готово', Decimal('500'), Decimal('100'))
+        self.assertEqual(ZayavkiDailyStat.objects.count(), 0)
+
+        call_command('rebuild_rollups', stdout=StringIO())
+        self.assertEqual(ZayavkiDailyStat.objects.count(), 3)
+        cities = ZayavkiAnalyticsService.get_city_statistics(period_days=30)
+        self.assertEqual(cities, [{
+            'gorod__name': 'Москва', 'total': 3, 'completed': 3, 'in_progress': 0,
+            'itog': Decimal('1500.00'), 'chistymi': Decimal('1200.00'),
+        }])
+
+        since = timezone.localdate() - timedelta(days=1)
+        self.assertEqual(rebuild_daily_stats(date_from=since), 2)
+        self.assertEqual(ZayavkiDailyStat.objects.count(), 3)
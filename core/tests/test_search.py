@@ -0,0 +1,84 @@
+from unittest import skipUnless
+
+from django.db import connection
+from django.test import TestCase
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APIClient, APITestCase
+
+from core.models import Gorod, Polzovateli, Roli, Zayavki
+from core.search import search_zayavki
+
+
+class ZayavkiSearchTest(APITestCase):
+    """Тесты поиска заявок (на SQLite — запасной вариант через ORM)"""
+
+    def setUp(self):
+        self.gorod = Gorod.objects.create(name='Москва')
+        self.user = Polzovateli.objects.create(
+            name='Админ', login='admin', password='testpass123',
+            gorod=self.gorod, rol=Roli.objects.create(name='admin')
+        )
+        self.user.role = 'admin'
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+        self.by_name = self._zayavka('Иван Холодов', 'ул. Ленина, 1', '79001234567')
+        self.by_problem = self._zayavka('Пётр', 'ул. Мира, 5', '79007654321', problema='Холодильник не морозит')
+        self._zayavka('Иван', 'ул. Холодная, 3', '79001111111', gorod=Gorod.objects.create(name='Казань'))
+
+    def _zayavka(self, name, address, phone, problema='Не работает', gorod=None):
+        return Zayavki.objects.create(
+            gorod=gorod or self.gorod, phone_client=phone, client_name=name, address=address,
+            meeting_date=timezone.now(), tip_techniki='Холодильник', problema=problema, kc_name='КЦ'
+        )
+
+    def _search(self, query):
+        return self.client.get('/api/v1/zayavki/search/', {'q': query})
+
+    def test_ranked_by_field_weight(self):
+        """Совпадение в имени клиента выше совпадения в описании; чужой город не виден"""
+        response = self._search('Холод')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([item['id'] for item in response.data['results']], [self.by_name.id, self.by_problem.id])
+        self.assertGreater(response.data['results'][0]['rank'], response.data['results'][1]['rank'])
+
+    def test_phone_search(self):
+        """Полный номер в любом формате — точный поиск, часть номера — по вхождению"""
+        response = self._search('8 (900) 123-45-67')
+        self.assertEqual([item['id'] for item in response.data['results']], [self.by_name.id])
+        response = self._search('765432')
+        self.assertEqual([item['id'] for item in response.data['results']], [self.by_problem.id])
+
+    def test_short_query_is_rejected(self):
+        self.assertEqual(self._search('x').status_code, status.HTTP_400_BAD_REQUEST)
+
+
+
+@skipUnless(connection.vendor == 'postgresql', 'Полнотекстовый поиск только на PostgreSQL')
+class PostgresSearchTest(TestCase):
+    """Поиск через search_vector (триггер миграции 0012) и индексы pg_trgm"""
+
+    def setUp(self):
+        self.gorod = Gorod.objects.create(name='Москва')
+        self.by_name = self._zayavka('Компрессор Иван', 'ул. Ленина, 1', '79001234567')
+        self.by_comment = self._zayavka('Пётр', 'ул. Мира, 5', '79007654321')
+
+    def _zayavka(self, name, address, phone):
+        return Zayavki.objects.create(
+            gorod=self.gorod, phone_client=phone, client_name=name, address=address,
+            meeting_date=timezone.now(), tip_techniki='Холодильник', problema='Не работает', kc_name='КЦ'
+        )
+
+    def _ids(self, query):
+        return [zayavka.id for zayavka in search_zayavki(Zayavki.objects.all(), query)]
+
+    def test_updates_are_indexed_and_ranked_by_weight(self):
+        """Триггер пересчитывает search_vector; имя клиента (A) выше комментария (D)"""
+        Zayavki.objects.filter(id=self.by_comment.id).update(comment_master='Заменён компрессор')
+        results = list(search_zayavki(Zayavki.objects.all(), 'компрессоры'))
+        self.assertEqual([zayavka.id for zayavka in results], [self.by_name.id, self.by_comment.id])
+        self.assertGreater(results[0].search_rank, results[1].search_rank)
+
+    def test_address_and_partial_phone(self):
+        self.assertEqual(self._ids('Ленин'), [self.by_name.id])
+        self.assertEqual(self._ids('765432'), [self.by_comment.id])
@@ -4,7 +4,7 @@ from .views import (
     TranzakciiViewSet, RoliViewSet, PolzovateliViewSet, PhoneGorodaViewSet, ZayavkiViewSet,
     MangoIncomingCallView, LoginView, LogoutView, ClearCookiesView, MeView, HealthCheckView, DetailedHealthCheckView, 
     MetricsView, PerformanceMetricsView, AlertHistoryView, SystemStatusView, ZayavkaFileViewSet, mango_audio_files,
-    MangoEmailProcessingView, MasterPayoutViewSet, MasterFeedbackView
+    MangoEmailProcessingView, MasterPayoutViewSet, MasterFeedbackView, mango_webhook
 )
 from .views.system import test_telegram_alert, trigger_test_error
 from django.urls import path, include
@@ -32,11 +32,12 @@ urlpatterns = [
 
 urlpatterns += router.urls + [
     path('mango-incoming-call/', MangoIncomingCallView.as_view(), name='mango_incoming_call'),
-    path('mango-incoming-call/events/call/', MangoIncomingCallView.as_view(), name='mango_incoming_call_event_call'),
-    path('mango-incoming-call/events/summary/', MangoIncomingCallView.as_view(), name='mango_incoming_call_event_summary'),
-    path('mango-incoming-call/events/recording/', MangoIncomingCallView.as_view(), name='mango_incoming_call_event_recording'),
-    path('mango-incoming-call/events/record/added/', MangoIncomingCallView.as_view(), name='mango_incoming_call_event_record_added'),
+    path('mango-incoming-call/events/call/', mango_webhook, {'event_type': 'call'}, name='mango_incoming_call_event_call'),
+    path('mango-incoming-call/events/summary/', mango_webhook, {'event_type': 'summary'}, name='mango_incoming_call_event_summary'),
+    path('mango-incoming-call/events/recording/', mango_webhook, {'event_type': 'recording'}, name='mango_incoming_call_event_recording'),
+    path('mango-incoming-call/events/record/added/', mango_webhook, {'event_type': 'record_added'}, name='mango_incoming_call_event_record_added'),
     path('vkhodyashchie-zayavki/', ZayavkiViewSet.as_view({'get': 'incoming'}), name='vkhodyashchie_zayavki'),
+    path('vkhodyashchie-zayavki/feed/', ZayavkiViewSet.as_view({'get': 'feed'}, **ZayavkiViewSet.feed.kwargs), name='vkhodyashchie_zayavki_feed'),
     path('login/', LoginView.as_view(), name='login'),
     path('logout/', LogoutView.as_view(), name='logout'),
     path('clear-cookies/', ClearCookiesView.as_view(), name='clear_cookies'),
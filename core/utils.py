@@ -42,196 +42,81 @@ def custom_exception_handler(exc, context):
 
 def download_audio_for_zayavka(zayavka_id, phone_number):
     """
-    Простой и надежный скрипт для скачивания аудио из почты
+    Скачивает из почты аудиозапись звонка для заявки.
+
+    Использует общее для процесса IMAP-соединение (без входа на каждый
+    запрос) и скачивает только аудиочасть нужного письма.
     """
     import os
-    import email
     import imaplib
     import logging
     import re
     from datetime import datetime, timedelta
-    from email.header import decode_header
     from django.conf import settings
     from core.models import Zayavki, ZayavkaFile
+    from core.mail_ingest import get_shared_mailbox
     from pathlib import Path
     
     logger = logging.getLogger(__name__)
     
     try:
-        # Получаем настройки почты
-        email_settings = getattr(settings, 'MANGO_EMAIL_SETTINGS', {})
-        email_address = email_settings.get('email')
-        password = email_settings.get('password')
-        imap_server = email_settings.get('imap_server', 'imap.gmail.com')
-        imap_port = email_settings.get('imap_port', 993)
-        download_dir = email_settings.get('download_dir', 'media/audio')
-        
-        logger.info(f'Начинаем скачивание аудио для заявки {zayavka_id}')
-        logger.info(f'Email: {email_address}')
-        logger.info(f'IMAP: {imap_server}:{imap_port}')
-        logger.info(f'Папка: {download_dir}')
-        
-        if not email_address or not password:
-            logger.error('Не настроены параметры почты')
-            return False
-            
-        # Создаем папку
-        Path(download_dir).mkdir(parents=True, exist_ok=True)
-        
-        # Подключаемся к почте
-        logger.info('Подключаемся к почтовому серверу...')
-        mail = imaplib.IMAP4_SSL(imap_server, imap_port)
-        mail.login(email_address, password)
-        mail.select('INBOX')
-        logger.info('Подключение успешно')
-        
-        # Ищем письма за последние 30 минут
-        thirty_minutes_ago = datetime.now() - timedelta(minutes=30)
-        date_str = thirty_minutes_ago.strftime('%d-%b-%Y')
-        
-        logger.info(f'Ищем письма с {date_str}')
-        
-        # Простой поиск - все письма за последние 30 минут
-        try:
-            _, messages = mail.search(None, f'SINCE "{date_str}"')
-            if not messages[0]:
-                logger.info('Писем не найдено')
-                mail.close()
-                mail.logout()
-                return False
-                
-            email_ids = messages[0].split()
-            logger.info(f'Найдено писем: {len(email_ids)}')
-            
-        except Exception as e:
-            logger.error(f'Ошибка поиска писем: {e}')
-            mail.close()
-            mail.logout()
-            return False
-        
-        # Обрабатываем каждое письмо
-        audio_found = False
-        for email_id in email_ids:
-            try:
-                logger.info(f'Обрабатываем письмо {email_id}')
-                
-                # Получаем письмо
-                _, msg_data = mail.fetch(email_id, '(RFC822)')
-                if not msg_data or not msg_data[0] or len(msg_data[0]) < 2:
-                    continue
-                    
-                email_body = msg_data[0][1]
-                if not isinstance(email_body, bytes):
+        zayavka = Zayavki.objects.get(id=zayavka_id)
+    except Zayavki.DoesNotExist:
+        logger.error(f'Заявка {zayavka_id} не найдена')
+        return False
+    
+    mailbox = get_shared_mailbox()
+    if mailbox is None:
+        logger.error('Не настроены параметры почты')
+        return False
+    
+    download_dir = getattr(settings, 'MANGO_EMAIL_SETTINGS', {}).get('download_dir', 'media/audio')
+    Path(download_dir).mkdir(parents=True, exist_ok=True)
+    logger.info(f'Начинаем скачивание аудио для заявки {zayavka_id}')
+    
+    try:
+        with mailbox.lock:
+            mailbox.select()
+            # Письма за последние 30 минут, сначала самые новые
+            uids = mailbox.search_since(datetime.now() - timedelta(minutes=30))
+            for message in reversed(mailbox.fetch_messages(uids)):
+                if not message.is_mango:
                     continue
-                    
-                email_message = email.message_from_bytes(email_body)
-                
-                # Получаем тему и отправителя
-                subject = email_message.get('Subject', '')
-                from_email = email_message.get('From', '')
                 
-                logger.info(f'Тема: {subject}')
-                logger.info(f'От: {from_email}')
-                
-                # Проверяем, что это от Mango Office
-                if 'mango' not in from_email.lower() and 'recording' not in subject.lower():
-                    logger.info('Пропускаем - не от Mango Office')
+                parts = [part for part in message.audio_parts if phone_number and phone_number in part[1]]
+                if not parts:
                     continue
                 
-                # Ищем вложения
-                attachments = []
-                for part in email_message.walk():
-                    if part.get_content_maintype() == 'multipart':
-                        continue
-                        
-                    if part.get('Content-Disposition') is None:
-                        continue
-                        
-                    filename = part.get_filename()
-                    if filename:
-                        # Декодируем имя файла
-                        decoded_filename = decode_header(filename)
-                        filename_parts = []
-                        for part_name, encoding in decoded_filename:
-                            if isinstance(part_name, bytes):
-                                if encoding:
-                                    filename_parts.append(part_name.decode(encoding))
-                                else:
-                                    filename_parts.append(part_name.decode('utf-8', errors='ignore'))
-                            else:
-                                filename_parts.append(part_name)
-                        filename = ''.join(filename_parts)
-                        
-                        content = part.get_payload(decode=True)
-                        attachments.append({
-                            'filename': filename,
-                            'content': content
-                        })
-                
-                logger.info(f'Найдено вложений: {len(attachments)}')
-                
-                # Обрабатываем вложения
-                for attachment in attachments:
-                    filename = attachment['filename']
-                    content = attachment['content']
+                for filename, content in mailbox.fetch_parts(message, parts[:1]):
+                    # Сохраняем файл
+                    safe_filename = re.sub(r'[<>:"/\\|?*]', '_', filename)
+                    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+                    name, ext = os.path.splitext(safe_filename)
+                    file_path = os.path.join(download_dir, f"{name}_{timestamp}{ext}")
                     
-                    # Проверяем, что это аудиофайл
-                    if not filename.lower().endswith(('.wav', '.mp3', '.ogg', '.m4a', '.aac')):
-                        logger.info(f'Пропускаем файл: {filename}')
-                        continue
+                    with open(file_path, 'wb') as f:
+                        f.write(content)
                     
-                    logger.info(f'Найден аудиофайл: {filename}')
+                    logger.info(f'Файл сохранен: {file_path}')
                     
-                    # Проверяем номер телефона в имени файла
-                    if phone_number and phone_number in filename:
-                        logger.info(f'Номер телефона найден в файле: {phone_number}')
-                        
-                        # Сохраняем файл
-                        safe_filename = re.sub(r'[<>:"/\\|?*]', '_', filename)
-                        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-                        name, ext = os.path.splitext(safe_filename)
-                        safe_filename = f"{name}_{timestamp}{ext}"
-                        
-                        file_path = os.path.join(download_dir, safe_filename)
-                        
-                        with open(file_path, 'wb') as f:
-                            f.write(content)
-                        
-                        logger.info(f'Файл сохранен: {file_path}')
-                        
-                        # Создаем запись в базе
-                        relative_path = file_path.replace('media/', '')
-                        zayavka = Zayavki.objects.get(id=zayavka_id)
-                        
-                        ZayavkaFile.objects.create(
-                            zayavka=zayavka,
-                            file=relative_path,
-                            type='audio'
-                        )
-                        
-                        logger.info(f'Аудиофайл привязан к заявке {zayavka_id}')
-                        audio_found = True
-                        break
-                    else:
-                        logger.info(f'Номер телефона {phone_number} не найден в файле {filename}')
-                
-                if audio_found:
-                    break
+                    # Создаем запись в базе
+                    ZayavkaFile.objects.create(
+                        zayavka=zayavka,
+                        file=file_path.replace('media/', ''),
+                        type='audio'
+                    )
                     
-            except Exception as e:
-                logger.error(f'Ошибка при обработке письма {email_id}: {e}')
-                continue
+                    logger.info(f'Аудиофайл привязан к заявке {zayavka_id}')
+                    return True
         
-        mail.close()
-        mail.logout()
-        
-        if audio_found:
-            logger.info(f'Аудиофайл успешно скачан для заявки {zayavka_id}')
-        else:
-            logger.info(f'Аудиофайл для заявки {zayavka_id} не найден')
-        
-        return audio_found
+        logger.info(f'Аудиофайл для заявки {zayavka_id} не найден')
+        return False
         
+    except (imaplib.IMAP4.error, OSError) as e:
+        # Соединение могло оборваться — следующий вызов переподключится
+        logger.error(f'Ошибка IMAP при скачивании аудио: {e}')
+        mailbox.reset()
+        return False
     except Exception as e:
         logger.error(f'Ошибка при скачивании аудио: {e}')
         return False
@@ -399,10 +284,13 @@ def send_error_alert(
         additional_info: Дополнительная информация
     
     Returns:
-        bool: True если сообщение отправлено успешно
+        bool: True если сообщение поставлено в очередь отправки
     """
+    from .notifications import enqueue_telegram_message, outbox_settings
     message = format_error_alert(error, request_path, user_info, additional_info)
-    return send_telegram_alert(message)
+    # Одинаковые ошибки на одном пути в пределах окна дедупликации шлём один раз
+    dedup_key = f"error:{type(error).__name__}:{error}:{request_path}"
+    return enqueue_telegram_message(message, dedup_key=dedup_key, dedup_window=outbox_settings()['DEDUP_WINDOW'])
 
 def send_business_alert(
     event_type: str,
@@ -420,7 +308,8 @@ def send_business_alert(
         additional_data: Дополнительные данные
     
     Returns:
-        bool: True если сообщение отправлено успешно
+        bool: True если сообщение поставлено в очередь отправки
     """
+    from .notifications import enqueue_telegram_message
     message = format_business_alert(event_type, description, user_info, additional_data)
-    return send_telegram_alert(message) 
\ No newline at end of file
+    return enqueue_telegram_message(message) 
\ No newline at end of file
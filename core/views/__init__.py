@@ -1,6 +1,6 @@
 from .base import GorodViewSet, TipZayavkiViewSet, RKViewSet, PhoneGorodaViewSet
 from .users import MasterViewSet, RoliViewSet, PolzovateliViewSet, LoginView, LogoutView, MeView, ClearCookiesView
-from .zayavki import ZayavkiViewSet, ZayavkaFileViewSet, MangoIncomingCallView, MangoEmailProcessingView, mango_audio_files
+from .zayavki import ZayavkiViewSet, ZayavkaFileViewSet, MangoIncomingCallView, MangoEmailProcessingView, mango_audio_files, mango_webhook
 from .finance import TipTranzakciiViewSet, TranzakciiViewSet, MasterPayoutViewSet
 from .system import HealthCheckView, DetailedHealthCheckView, MetricsView, PerformanceMetricsView, AlertHistoryView, SystemStatusView
 from .feedback import MasterFeedbackView
@@ -8,7 +8,7 @@ from .feedback import MasterFeedbackView
 __all__ = [
     'GorodViewSet', 'TipZayavkiViewSet', 'RKViewSet', 'PhoneGorodaViewSet',
     'MasterViewSet', 'RoliViewSet', 'PolzovateliViewSet', 'LoginView', 'LogoutView', 'MeView', 'ClearCookiesView',
-    'ZayavkiViewSet', 'ZayavkaFileViewSet', 'MangoIncomingCallView', 'MangoEmailProcessingView', 'mango_audio_files',
+    'ZayavkiViewSet', 'ZayavkaFileViewSet', 'MangoIncomingCallView', 'MangoEmailProcessingView', 'mango_audio_files', 'mango_webhook',
     'TipTranzakciiViewSet', 'TranzakciiViewSet', 'MasterPayoutViewSet',
     'HealthCheckView', 'DetailedHealthCheckView', 'MetricsView', 'PerformanceMetricsView', 'AlertHistoryView', 'SystemStatusView',
     'MasterFeedbackView',
@@ -1,12 +1,20 @@
-from rest_framework import viewsets, status
+from rest_framework import filters, viewsets, status
+from django_filters.rest_framework import DjangoFilterBackend
 from drf_spectacular.utils import extend_schema_view, extend_schema
 from rest_framework.response import Response
+from rest_framework.settings import api_settings
 from django.core.exceptions import ValidationError
+from django.conf import settings
 from django.db import transaction
+from django.utils.cache import patch_cache_control, patch_vary_headers
 from ..models import Gorod, TipZayavki, RK, PhoneGoroda
 from ..serializers import GorodSerializer, TipZayavkiSerializer, RKSerializer, PhoneGorodaSerializer
 from ..permissions import IsCallCentreOrAbove, IsDirectorOrAdmin
+from ..pagination import KeysetPagination
 from ..cache import ReferenceDataCache, CacheManager
+from ..data_versions import data_scope_key, data_version
+from urllib.parse import urlencode
+import hashlib
 import logging
 
 logger = logging.getLogger(__name__)
@@ -40,6 +48,150 @@ class BaseViewSet(viewsets.ModelViewSet):
             logger.error(f"Error deleting {self.__class__.__name__}: {e}")
             return Response({'error': 'Ошибка при удалении'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
+class CachedReferenceListMixin:
+    """
+    Отдаёт list() из кэша справочников. Инвалидация выполняется
+    автоматически сигналами post_save/post_delete (см. core.cache).
+    Параметры фильтрации, поиска и сортировки входят в ключ кэша,
+    пагинация применяется к уже закэшированному списку.
+    """
+    filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
+    paginate_cached_list = False
+    def get_list_cache_key(self):
+        raise NotImplementedError
+    def get_list_query_key(self):
+        """Ключ кэша с учётом ?фильтров (без параметров страницы и формата)"""
+        paginator = self.paginator
+        ignored = {
+            getattr(paginator, 'page_query_param', None),
+            getattr(paginator, 'page_size_query_param', None),
+            api_settings.URL_FORMAT_OVERRIDE,
+        }
+        params = sorted(
+            (name, value) for name, values in self.request.query_params.lists()
+            if name not in ignored for value in values
+        )
+        key = self.get_list_cache_key()
+        if not params:
+            return key
+        return f"{key}:q:{hashlib.sha1(urlencode(params).encode()).hexdigest()[:16]}"
+    def get_list_queryset(self):
+        return self.filter_queryset(self.get_queryset())
+    def get_list_data(self):
+        serializer = self.get_serializer(self.get_list_queryset(), many=True)
+        return list(serializer.data)
+    def list(self, request, *args, **kwargs):
+        data = CacheManager.get_or_set(self.get_list_query_key(), self.get_list_data)
+        if self.paginate_cached_list:
+            page = self.paginate_queryset(data)
+            if page is not None:
+                return self.get_paginated_response(page)
+        return Response(data)
+    def get_gorod_filter(self):
+        gorod_filter = self.request.query_params.get('gorod')
+        return int(gorod_filter) if gorod_filter and gorod_filter.isdigit() else None
+
+class ProjectedListMixin:
+    """
+    Пагинация и проекция для list-действий, отдававших всю выборку:
+    ?pagination=cursor (или ?cursor=) — keyset-страницы {next, previous, results},
+    ?fields=id,status — только перечисленные поля,
+    ?compact=1 — compact_serializer_class без лишних JOIN и prefetch.
+    Без параметров ответ прежний — полный список.
+    """
+    keyset_pagination_class = KeysetPagination
+    compact_serializer_class = None
+    compact_select_related = ()
+    def wants_keyset_page(self):
+        params = self.request.query_params
+        return params.get('pagination') == 'cursor' or bool(params.get('cursor'))
+    def is_compact(self):
+        return self.compact_serializer_class is not None and self.request.query_params.get('compact') in ('1', 'true')
+    def get_projected_serializer_class(self):
+        return self.compact_serializer_class if self.is_compact() else self.get_serializer_class()
+    def get_requested_fields(self):
+        """Поля из ?fields= (None — все); неизвестные поля — ValidationError"""
+        value = self.request.query_params.get('fields')
+        if not value:
+            return None
+        fields = [name.strip() for name in value.split(',') if name.strip()]
+        serializer = self.get_projected_serializer_class()(context=self.get_serializer_context())
+        unknown = set(fields) - {name for name, field in serializer.fields.items() if not field.write_only}
+        if unknown:
+            raise ValidationError(f"Неизвестные поля: {', '.join(sorted(unknown))}")
+        return fields
+    def project_queryset(self, queryset):
+        if self.is_compact():
+            return queryset.select_related(None).prefetch_related(None).select_related(*self.compact_select_related)
+        return queryset
+    def serialize_projected(self, instances, fields):
+        serializer_class = self.get_projected_serializer_class()
+        context = {**self.get_serializer_context(), 'fields': fields}
+        return serializer_class(instances, many=True, context=context).data
+    def projected_list_response(self, queryset):
+        try:
+            fields = self.get_requested_fields()
+        except ValidationError as e:
+            return Response({'error': e.message}, status=status.HTTP_400_BAD_REQUEST)
+        queryset = self.project_queryset(queryset)
+        if self.wants_keyset_page():
+            paginator = self.keyset_pagination_class()
+            page = paginator.paginate_queryset(queryset, self.request, view=self)
+            return paginator.get_paginated_response(self.serialize_projected(page, fields))
+        return Response(self.serialize_projected(queryset, fields))
+
+class ConditionalListMixin:
+    """
+    ETag для списков по версии данных города (core.data_versions).
+    Если данные не менялись, на If-None-Match отдаётся 304 до запросов к БД
+    и сериализации. При cache_list_responses и API_RESPONSE_CACHE['ENABLED']
+    тело list() берётся из общего кэша (ключ: маршрут, запрос, город, роль).
+    """
+    cache_list_responses = False
+    def get_data_gorod_id(self):
+        return getattr(self.request.user, 'gorod_id', None)
+    def get_list_etag(self, request):
+        gorod_id = self.get_data_gorod_id()
+        parts = (
+            request.get_host(), request.path, sorted(request.query_params.lists()),
+            gorod_id, getattr(request.user, 'role', ''), getattr(request, 'accepted_media_type', ''),
+            data_version(gorod_id),
+        )
+        return 'W/"%s"' % hashlib.sha1(repr(parts).encode()).hexdigest()
+    @staticmethod
+    def etag_matches(header, etag):
+        """Слабое сравнение ETag из If-None-Match"""
+        if header.strip() == '*':
+            return True
+        tags = {tag.strip().removeprefix('W/') for tag in header.split(',')}
+        return etag.removeprefix('W/') in tags
+    def conditional_list(self, request, build_response, cache_response=False):
+        etag = self.get_list_etag(request)
+        if self.etag_matches(request.headers.get('If-None-Match', ''), etag):
+            response = Response(status=status.HTTP_304_NOT_MODIFIED)
+        else:
+            config = getattr(settings, 'API_RESPONSE_CACHE', {})
+            if cache_response and config.get('ENABLED'):
+                # Версия входит в ETag, поэтому после записи ключ меняется
+                key = f"{data_scope_key(self.get_data_gorod_id())}:response:{etag[3:-1]}"
+                response = Response(CacheManager.get_or_set(
+                    key, lambda: build_response().data, timeout=config.get('TIMEOUT'), cache_type='query_results'
+                ))
+            else:
+                response = build_response()
+            if response.status_code != status.HTTP_200_OK:
+                return response
+        response['ETag'] = etag
+        patch_cache_control(response, private=True, no_cache=True)
+        patch_vary_headers(response, ('Authorization', 'Cookie'))
+        return response
+    def list(self, request, *args, **kwargs):
+        return self.conditional_list(
+            request,
+            lambda: super(ConditionalListMixin, self).list(request, *args, **kwargs),
+            cache_response=self.cache_list_responses,
+        )
+
 @extend_schema_view(
     list=extend_schema(
         summary="Получить список городов",
@@ -62,99 +214,51 @@ class BaseViewSet(viewsets.ModelViewSet):
         tags=['gorod']
     )
 )
-class GorodViewSet(BaseViewSet):
+class GorodViewSet(CachedReferenceListMixin, BaseViewSet):
     queryset = Gorod.objects.all()
     serializer_class = GorodSerializer
     permission_classes = [IsCallCentreOrAbove]
     filterset_fields = ['name']
     search_fields = ['name']
     ordering_fields = ['name']
-    def list(self, request, *args, **kwargs):
-        cache_key = ReferenceDataCache.get_goroda_cache_key()
-        def get_goroda_data():
-            queryset = self.filter_queryset(self.get_queryset())
-            serializer = self.get_serializer(queryset, many=True)
-            return serializer.data
-        data = CacheManager.get_or_set(cache_key, get_goroda_data)
-        return Response(data)
-    def create(self, request, *args, **kwargs):
-        response = super().create(request, *args, **kwargs)
-        ReferenceDataCache.invalidate_goroda_cache()
-        return response
-    def update(self, request, *args, **kwargs):
-        response = super().update(request, *args, **kwargs)
-        ReferenceDataCache.invalidate_goroda_cache()
-        return response
-    def destroy(self, request, *args, **kwargs):
-        response = super().destroy(request, *args, **kwargs)
-        ReferenceDataCache.invalidate_goroda_cache()
-        return response
+    def get_list_cache_key(self):
+        return ReferenceDataCache.get_goroda_cache_key()
 
-class TipZayavkiViewSet(BaseViewSet):
+class TipZayavkiViewSet(CachedReferenceListMixin, BaseViewSet):
     queryset = TipZayavki.objects.all()
     serializer_class = TipZayavkiSerializer
     permission_classes = [IsCallCentreOrAbove]
     filterset_fields = ['name']
     search_fields = ['name']
     ordering_fields = ['name']
-    def list(self, request, *args, **kwargs):
-        cache_key = ReferenceDataCache.get_tipzayavki_cache_key()
-        def get_tipzayavki_data():
-            queryset = self.filter_queryset(self.get_queryset())
-            serializer = self.get_serializer(queryset, many=True)
-            return serializer.data
-        data = CacheManager.get_or_set(cache_key, get_tipzayavki_data)
-        return Response(data)
-    def create(self, request, *args, **kwargs):
-        response = super().create(request, *args, **kwargs)
-        ReferenceDataCache.invalidate_tipzayavki_cache()
-        return response
-    def update(self, request, *args, **kwargs):
-        response = super().update(request, *args, **kwargs)
-        ReferenceDataCache.invalidate_tipzayavki_cache()
-        return response
-    def destroy(self, request, *args, **kwargs):
-        response = super().destroy(request, *args, **kwargs)
-        ReferenceDataCache.invalidate_tipzayavki_cache()
-        return response
+    def get_list_cache_key(self):
+        return ReferenceDataCache.get_tipzayavki_cache_key()
 
-class RKViewSet(BaseViewSet):
+class RKViewSet(CachedReferenceListMixin, BaseViewSet):
     queryset = RK.objects.all()
     serializer_class = RKSerializer
     permission_classes = [IsCallCentreOrAbove]
     filterset_fields = ['rk_name', 'gorod', 'phone']
     search_fields = ['rk_name', 'phone']
     ordering_fields = ['rk_name', 'gorod']
-    def list(self, request, *args, **kwargs):
-        gorod_filter = request.query_params.get('gorod')
-        cache_key = ReferenceDataCache.get_rk_cache_key(gorod_filter)
-        def get_rk_data():
-            queryset = self.filter_queryset(self.get_queryset())
-            serializer = self.get_serializer(queryset, many=True)
-            return serializer.data
-        data = CacheManager.get_or_set(cache_key, get_rk_data)
-        return Response(data)
-    def create(self, request, *args, **kwargs):
-        response = super().create(request, *args, **kwargs)
-        gorod_id = request.data.get('gorod')
-        ReferenceDataCache.invalidate_rk_cache(gorod_id)
-        return response
-    def update(self, request, *args, **kwargs):
-        response = super().update(request, *args, **kwargs)
-        instance = self.get_object()
-        ReferenceDataCache.invalidate_rk_cache(instance.gorod.id)
-        return response
-    def destroy(self, request, *args, **kwargs):
-        instance = self.get_object()
-        gorod_id = instance.gorod.id
-        response = super().destroy(request, *args, **kwargs)
-        ReferenceDataCache.invalidate_rk_cache(gorod_id)
-        return response
+    def get_list_cache_key(self):
+        return ReferenceDataCache.get_rk_cache_key(self.get_gorod_filter())
+    def get_list_queryset(self):
+        queryset = super().get_list_queryset()
+        gorod_id = self.get_gorod_filter()
+        return queryset.filter(gorod_id=gorod_id) if gorod_id else queryset
 
-class PhoneGorodaViewSet(BaseViewSet):
+class PhoneGorodaViewSet(CachedReferenceListMixin, BaseViewSet):
     queryset = PhoneGoroda.objects.all()
     serializer_class = PhoneGorodaSerializer
     permission_classes = [IsDirectorOrAdmin]
     filterset_fields = ['gorod', 'phone']
     search_fields = ['phone']
-    ordering_fields = ['gorod', 'phone'] 
\ No newline at end of file
+    ordering_fields = ['gorod', 'phone']
+    paginate_cached_list = True
+    def get_list_cache_key(self):
+        return ReferenceDataCache.get_phonegoroda_cache_key(self.get_gorod_filter())
+    def get_list_queryset(self):
+        queryset = super().get_list_queryset()
+        gorod_id = self.get_gorod_filter()
+        return queryset.filter(gorod_id=gorod_id) if gorod_id else queryset
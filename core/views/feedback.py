@@ -2,14 +2,11 @@ from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
 import logging
-import requests
 from django.utils import timezone
+from ..notifications import enqueue_telegram_message
 
 logger = logging.getLogger(__name__)
 
-TELEGRAM_BOT_TOKEN = '8032155601:AAG9myXmM3tO12LRFsX9T64wVIEdi6pexi8'
-TELEGRAM_CHAT_ID = 1802367546
-
 # MasterFeedbackView
 # (перенести соответствующий класс из views.py) 
 
@@ -39,37 +36,19 @@ class MasterFeedbackView(APIView):
 ⏰ Время: {timezone.now().strftime('%Y-%m-%d %H:%M:%S')}
             """.strip()
             
-            # Отправляем в Telegram
-            try:
-                response = requests.post(
-                    f"https://api.telegram.org/bot{TELEGRAM_BOT_TOKEN}/sendMessage",
-                    data={
-                        'chat_id': TELEGRAM_CHAT_ID,
-                        'text': telegram_message,
-                        'parse_mode': 'HTML'
-                    },
-                    timeout=10
-                )
-                
-                if response.status_code == 200:
-                    logger.info("Feedback sent to Telegram successfully")
-                    return Response({
-                        'success': True,
-                        'message': 'Обратная связь отправлена успешно'
-                    })
-                else:
-                    logger.error(f"Telegram API error: {response.status_code} - {response.text}")
-                    return Response({
-                        'success': False,
-                        'message': 'Ошибка отправки в Telegram'
-                    }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
-                    
-            except requests.exceptions.RequestException as e:
-                logger.error(f"Telegram request failed: {e}")
+            # Ставим в очередь, отправит воркер send_notifications
+            if not enqueue_telegram_message(telegram_message, bot='notify'):
+                # Бот не настроен или очередь недоступна — сообщение потеряно бы молча
+                logger.error("Master feedback was not queued")
                 return Response({
                     'success': False,
-                    'message': 'Ошибка подключения к Telegram'
-                }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+                    'message': 'Не удалось отправить обратную связь, попробуйте позже'
+                }, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+            
+            return Response({
+                'success': True,
+                'message': 'Обратная связь отправлена успешно'
+            })
             
         except Exception as e:
             logger.error(f"Error processing master feedback: {e}")
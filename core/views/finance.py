@@ -2,21 +2,29 @@ from rest_framework import viewsets, status
 from rest_framework.response import Response
 from rest_framework.decorators import action
 from rest_framework.parsers import MultiPartParser, FormParser, JSONParser
-from ..models import TipTranzakcii, Tranzakcii, MasterPayout
+from ..models import TipTranzakcii, Tranzakcii, MasterPayout, GorodBalance, GorodBalanceSnapshot
 from ..serializers import TipTranzakciiSerializer, TranzakciiSerializer, MasterPayoutSerializer
 from ..permissions import IsDirectorOrAdmin, IsSameCity, IsMasterOrAbove
+from ..cache import ReferenceDataCache
+from ..reports import REPORT_PERIODS, cached_transaction_report
+from ..ledger import rebuild_balance
+from .base import CachedReferenceListMixin, ConditionalListMixin
 from datetime import datetime, timedelta
+from django.utils import timezone
 import logging
 
 logger = logging.getLogger(__name__)
 
-class TipTranzakciiViewSet(viewsets.ModelViewSet):
+class TipTranzakciiViewSet(CachedReferenceListMixin, viewsets.ModelViewSet):
     queryset = TipTranzakcii.objects.all()
     serializer_class = TipTranzakciiSerializer
     permission_classes = [IsDirectorOrAdmin]
     filterset_fields = ['name']
     search_fields = ['name']
     ordering_fields = ['name']
+    paginate_cached_list = True
+    def get_list_cache_key(self):
+        return ReferenceDataCache.get_tiptranzakcii_cache_key()
 
 class TranzakciiViewSet(viewsets.ModelViewSet):
     queryset = Tranzakcii.objects.select_related('gorod', 'tip_tranzakcii')
@@ -36,7 +44,13 @@ class TranzakciiViewSet(viewsets.ModelViewSet):
     
     @action(detail=False, methods=['get'])
     def by_date_range(self, request):
-        """Получение транзакций по диапазону дат с группировкой"""
+        """
+        Сводка транзакций за диапазон дат с группировкой по типу.
+        
+        Параметры: start_date, end_date (YYYY-MM-DD), period=day|week|month,
+        by_city=1. Без period и by_city возвращает {тип: {count, total}},
+        иначе {"totals": {...}, "rows": [...]}. Суммы — точные Decimal.
+        """
         try:
             start_date = request.query_params.get('start_date')
             end_date = request.query_params.get('end_date')
@@ -47,31 +61,79 @@ class TranzakciiViewSet(viewsets.ModelViewSet):
             # Парсим даты
             start = datetime.strptime(start_date, '%Y-%m-%d').date()
             end = datetime.strptime(end_date, '%Y-%m-%d').date()
+            if start > end:
+                return Response({'error': 'start_date не может быть позже end_date'}, status=400)
             
-            # Фильтруем по диапазону дат с оптимизацией
-            queryset = self.get_queryset().filter(date__range=[start, end])
+            period = request.query_params.get('period')
+            if period and period not in REPORT_PERIODS:
+                return Response({'error': 'period должен быть одним из: day, week, month'}, status=400)
+            by_city = request.query_params.get('by_city') in ('1', 'true')
             
-            # Группируем по типу транзакции
-            result = {}
-            for tranzakciya in queryset:
-                tip_name = tranzakciya.tip_tranzakcii.name
-                if tip_name not in result:
-                    result[tip_name] = {
-                        'count': 0,
-                        'total': 0
-                    }
-                result[tip_name]['count'] += 1
-                result[tip_name]['total'] += float(tranzakciya.summa)
-            
-            return Response(result)
+            report = cached_transaction_report(
+                self.get_queryset(),
+                getattr(request.user, 'gorod_id', None),
+                start, end, period=period, by_city=by_city
+            )
+            if not period and not by_city:
+                return Response(report['totals'])
+            return Response(report)
             
         except ValueError as e:
             return Response({'error': 'Неверный формат даты'}, status=400)
         except Exception as e:
             logger.error(f"Error in by_date_range: {e}")
             return Response({'error': 'Ошибка при обработке запроса'}, status=500)
+    
+    @action(detail=False, methods=['get'])
+    def balance(self, request):
+        """
+        Текущий баланс кассы (Приход − Расход) из таблицы GorodBalance
+        и снимки на конец дня за последние days дней (по умолчанию 30).
+        Пользователь без города получает балансы всех городов.
+        """
+        try:
+            days = int(request.query_params.get('days', 30))
+        except ValueError:
+            return Response({'error': 'days должен быть числом'}, status=400)
+        if not 0 <= days <= 366:
+            return Response({'error': 'days должен быть от 0 до 366'}, status=400)
+        
+        gorod_id = getattr(request.user, 'gorod_id', None)
+        queryset = GorodBalance.objects.select_related('gorod').order_by('gorod__name')
+        if gorod_id:
+            queryset = queryset.filter(gorod_id=gorod_id)
+        balances = list(queryset)
+        if gorod_id and not balances:
+            # Баланс ещё не построен (город без транзакций)
+            rebuild_balance(gorod_id)
+            balances = list(queryset.all())
+        
+        snapshots = {}
+        if days:
+            since = timezone.localdate() - timedelta(days=days)
+            queryset = GorodBalanceSnapshot.objects.filter(date__gte=since).order_by('date')
+            if gorod_id:
+                queryset = queryset.filter(gorod_id=gorod_id)
+            for row in queryset.values('gorod_id', 'date', 'income', 'expense', 'balance'):
+                snapshots.setdefault(row.pop('gorod_id'), []).append(row)
+        
+        result = [
+            {
+                'gorod_id': item.gorod_id,
+                'gorod': item.gorod.name,
+                'income': item.income,
+                'expense': item.expense,
+                'balance': item.balance,
+                'updated_at': item.updated_at,
+                'snapshots': snapshots.get(item.gorod_id, []),
+            }
+            for item in balances
+        ]
+        if gorod_id:
+            return Response(result[0])
+        return Response(result)
 
-class MasterPayoutViewSet(viewsets.ModelViewSet):
+class MasterPayoutViewSet(ConditionalListMixin, viewsets.ModelViewSet):
     queryset = MasterPayout.objects.select_related('zayavka', 'zayavka__master', 'zayavka__gorod')
     serializer_class = MasterPayoutSerializer
     permission_classes = [IsMasterOrAbove]
@@ -12,6 +12,7 @@ from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import IsAuthenticated
 from rest_framework import status
 from ..utils import send_telegram_alert, send_error_alert, send_business_alert
+from ..monitoring import performance_monitor
 
 # HealthCheckView, DetailedHealthCheckView, MetricsView, PerformanceMetricsView, AlertHistoryView, SystemStatusView
 # (перенести соответствующие классы из views.py) 
@@ -180,7 +181,8 @@ class PerformanceMetricsView(APIView):
                 'application_metrics': {
                     'django_version': django.get_version(),
                     'python_version': platform.python_version()
-                }
+                },
+                'request_metrics': performance_monitor.get_performance_metrics()
             }
             
             return Response(performance_metrics)
@@ -12,16 +12,20 @@ from django.conf import settings
 import jwt
 import logging
 from ..utils import send_business_alert
+from ..cache import CacheManager, ReferenceDataCache
+from .base import CachedReferenceListMixin, ProjectedListMixin
+from django.core.exceptions import ValidationError
 
 logger = logging.getLogger(__name__)
 
-class MasterViewSet(viewsets.ModelViewSet):
+class MasterViewSet(ProjectedListMixin, CachedReferenceListMixin, viewsets.ModelViewSet):
     queryset = Master.objects.select_related('gorod')
     serializer_class = MasterSerializer
     permission_classes = [IsCallCentreOrAbove, IsSameCity]
     filterset_fields = ['name', 'gorod', 'is_active', 'phone']
     search_fields = ['name', 'phone', 'login']
     ordering_fields = ['name', 'created_at']
+    paginate_cached_list = True
     def get_queryset(self):
         queryset = super().get_queryset()
         user = self.request.user
@@ -30,13 +34,34 @@ class MasterViewSet(viewsets.ModelViewSet):
         if hasattr(user, 'gorod_id'):
             return queryset.filter(gorod_id=user.gorod_id)
         return queryset
+    def get_scope_gorod_id(self):
+        """Город, которым ограничен get_queryset (None — все города)"""
+        user = self.request.user
+        if hasattr(user, 'role') and user.role == 'admin':
+            return None
+        return getattr(user, 'gorod_id', None)
+    def get_list_cache_key(self):
+        return ReferenceDataCache.get_master_cache_key(self.get_scope_gorod_id())
     @action(detail=False, methods=['get'])
     def active(self, request):
+        """
+        Активные мастера (из кэша справочников). ?fields= — проекция,
+        ?pagination=cursor — keyset-страницы прямо из БД.
+        """
         queryset = self.get_queryset().filter(is_active=True)
-        serializer = self.get_serializer(queryset, many=True)
-        return Response(serializer.data)
-    def list(self, request, *args, **kwargs):
-        return super().list(request, *args, **kwargs)
+        if self.wants_keyset_page():
+            return self.projected_list_response(queryset)
+        try:
+            fields = self.get_requested_fields()
+        except ValidationError as e:
+            return Response({'error': e.message}, status=status.HTTP_400_BAD_REQUEST)
+        def get_active_data():
+            return list(self.get_serializer(queryset, many=True).data)
+        cache_key = ReferenceDataCache.get_master_cache_key(self.get_scope_gorod_id(), active_only=True)
+        data = CacheManager.get_or_set(cache_key, get_active_data)
+        if fields:
+            data = [{name: row[name] for name in fields if name in row} for row in data]
+        return Response(data)
 
 class RoliViewSet(viewsets.ModelViewSet):
     queryset = Roli.objects.all()
@@ -46,7 +71,7 @@ class RoliViewSet(viewsets.ModelViewSet):
     search_fields = ['name']
     ordering_fields = ['name']
 
-class PolzovateliViewSet(viewsets.ModelViewSet):
+class PolzovateliViewSet(ProjectedListMixin, viewsets.ModelViewSet):
     queryset = Polzovateli.objects.select_related('gorod', 'rol')
     serializer_class = PolzovateliSerializer
     permission_classes = [IsDirectorOrAdmin]
@@ -55,9 +80,8 @@ class PolzovateliViewSet(viewsets.ModelViewSet):
     ordering_fields = ['name', 'created_at']
     @action(detail=False, methods=['get'])
     def active(self, request):
-        queryset = self.get_queryset().filter(is_active=True)
-        serializer = self.get_serializer(queryset, many=True)
-        return Response(serializer.data)
+        """Активные пользователи; ?pagination=cursor и ?fields= (см. ProjectedListMixin)"""
+        return self.projected_list_response(self.get_queryset().filter(is_active=True))
 
 @extend_schema(
     summary="Аутентификация пользователя",
@@ -107,6 +131,7 @@ class LoginView(APIView):
                     'login': user.login,
                     'role': user.rol.name,
                     'gorod_id': user.gorod.id,
+                    'iat': timezone.now(),
                     'exp': timezone.now() + timezone.timedelta(days=1)
                 }
                 token = jwt.encode(payload, settings.SECRET_KEY, algorithm='HS256')
@@ -152,6 +177,7 @@ class LoginView(APIView):
                     'login': master.login,
                     'role': 'master',
                     'gorod_id': master.gorod.id,
+                    'iat': timezone.now(),
                     'exp': timezone.now() + timezone.timedelta(days=1)
                 }
                 token = jwt.encode(payload, settings.SECRET_KEY, algorithm='HS256')
@@ -250,17 +276,17 @@ class MeView(APIView):
                 'name': user.name,
                 'role': user.rol.name,
                 'login': user.login,
-                'gorod_id': user.gorod.id,
+                'gorod_id': user.gorod_id,
                 'is_active': user.is_active
             })
         elif hasattr(user, 'id') and hasattr(user, 'role'):
-            # Это мастер (Master)
+            # Субъект из JWT (AuthPrincipal) или мастер
             return Response({
                 'id': user.id,
                 'name': user.name,
                 'role': user.role,
                 'login': user.login,
-                'gorod_id': user.gorod.id,
+                'gorod_id': user.gorod_id,
                 'is_active': user.is_active
             })
         else:
@@ -5,31 +5,64 @@ from rest_framework.decorators import action
 from rest_framework.parsers import MultiPartParser, FormParser, JSONParser
 from rest_framework.permissions import IsAuthenticated
 from ..models import Zayavki, ZayavkaFile
-from ..serializers import ZayavkiSerializer, ZayavkaFileSerializer
+from ..serializers import (
+    ZayavkiSerializer, ZayavkiCompactSerializer, ZayavkaFileSerializer, ZayavkaCloseSerializer,
+    ZayavkaBulkUpdateSerializer
+)
+from ..closeout import close_zayavki, update_zayavki, MAX_BULK_CLOSE, MAX_BULK_UPDATE
 from ..permissions import IsKCUserOrAbove, IsSameCity
+from .base import ConditionalListMixin, ProjectedListMixin
+from ..pagination import ZayavkiKeysetPagination
+from ..renderers import CSVExportRenderer, EventStreamRenderer, NDJSONExportRenderer
+from ..export import EXPORT_FORMATS, streaming_export_response, ZAYAVKI_EXPORT_FIELDS
+from ..notifications import enqueue_telegram_message
+from ..phones import normalize_phone, to_e164
+from ..rollups import STATUS_GROUPS, day_start
+from ..search import MAX_SEARCH_LIMIT, SEARCH_LIMIT, search_zayavki
+from ..mango_events import EVENT_TYPES, build_event, inbox_settings, store_event, verify_signature
+from ..live_feed import dump_payload, event_stream, format_event, get_backend, resume_id, stream_key
+from rest_framework.renderers import JSONRenderer
 from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_POST
 from django.utils.decorators import method_decorator
-from django.http import JsonResponse
+from django.http import JsonResponse, StreamingHttpResponse
+from django.core.handlers.asgi import ASGIRequest
 from pathlib import Path
 import os
 import traceback
 import logging
 import json
-import requests
 from django.utils import timezone
+from django.utils.dateparse import parse_date
+from datetime import timedelta
 
 logger = logging.getLogger(__name__)
 
-TELEGRAM_BOT_TOKEN = '8032155601:AAG9myXmM3tO12LRFsX9T64wVIEdi6pexi8'
-TELEGRAM_CHAT_ID = 1802367546
 
-class ZayavkiViewSet(viewsets.ModelViewSet):
+class ZayavkiViewSet(ProjectedListMixin, ConditionalListMixin, viewsets.ModelViewSet):
     queryset = Zayavki.objects.select_related('gorod', 'master', 'rk', 'tip_zayavki').prefetch_related('files')
     serializer_class = ZayavkiSerializer
     permission_classes = [IsKCUserOrAbove, IsSameCity]
     filterset_fields = ['status', 'gorod', 'master', 'rk', 'tip_zayavki']
     search_fields = ['client_name', 'phone_client', 'address']
     ordering_fields = ['created_at', 'meeting_date', 'status']
+    keyset_pagination_class = ZayavkiKeysetPagination
+    compact_serializer_class = ZayavkiCompactSerializer
+    compact_select_related = ('master',)
+    cache_list_responses = True
+    @property
+    def paginator(self):
+        """
+        Keyset пагинация включается параметром ?pagination=cursor
+        (или при наличии ?cursor=...), иначе используется стандартная.
+        """
+        if not hasattr(self, '_paginator'):
+            params = self.request.query_params if self.request is not None else {}
+            if params.get('pagination') == 'cursor' or params.get('cursor'):
+                self._paginator = self.keyset_pagination_class()
+            else:
+                return super().paginator
+        return self._paginator
     def get_queryset(self):
         queryset = super().get_queryset()
         user = self.request.user
@@ -38,15 +71,152 @@ class ZayavkiViewSet(viewsets.ModelViewSet):
         return queryset
     @action(detail=False, methods=['get'])
     def by_status(self, request):
+        """
+        Заявки со статусом ?status=. Поддерживает ?pagination=cursor,
+        ?fields= и ?compact=1 (см. ProjectedListMixin).
+        """
         status_param = request.query_params.get('status')
-        queryset = self.get_queryset().filter(status=status_param)
+        return self.projected_list_response(self.get_queryset().filter(status=status_param))
+    @action(detail=False, methods=['get'])
+    def by_phone(self, request):
+        """
+        Заявки клиента по номеру в любом формате (?phone=), поиск по phone_norm.
+        ?open=1 — только незакрытые заявки.
+        """
+        phone = to_e164(request.query_params.get('phone'))
+        if not phone:
+            return Response({'error': 'Неверный номер телефона'}, status=status.HTTP_400_BAD_REQUEST)
+        queryset = self.get_queryset().filter(phone_norm=phone)
+        if request.query_params.get('open') in ('1', 'true'):
+            queryset = queryset.exclude(
+                status__in=STATUS_GROUPS['completed'] + STATUS_GROUPS['cancelled']
+            )
         serializer = self.get_serializer(queryset, many=True)
         return Response(serializer.data)
     @action(detail=False, methods=['get'])
+    def search(self, request):
+        """
+        Поиск заявок по имени клиента, адресу, проблеме, комментариям и
+        телефону (?q=), по убыванию релевантности. ?limit= — до 100 результатов.
+        """
+        query = request.query_params.get('q', '').strip()
+        if len(query) < 2:
+            return Response({'error': 'Запрос должен содержать не менее 2 символов'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            limit = min(int(request.query_params.get('limit', SEARCH_LIMIT)), MAX_SEARCH_LIMIT)
+        except ValueError:
+            return Response({'error': 'limit должен быть числом'}, status=status.HTTP_400_BAD_REQUEST)
+        zayavki = list(search_zayavki(self.filter_queryset(self.get_queryset()), query)[:max(limit, 1)])
+        results = self.get_serializer(zayavki, many=True).data
+        for item, zayavka in zip(results, zayavki):
+            item['rank'] = round(zayavka.search_rank, 4)
+        return Response({'count': len(results), 'results': results})
+    @action(detail=False, methods=['get'])
     def incoming(self, request):
-        queryset = self.get_queryset().filter(status='Ожидает')
-        serializer = self.get_serializer(queryset, many=True)
-        return Response(serializer.data)
+        """Ожидающие заявки города; параметры как у by_status"""
+        return self.conditional_list(request, lambda: self.projected_list_response(self.get_incoming_queryset()))
+    def get_incoming_queryset(self):
+        return self.get_queryset().filter(status='Ожидает')
+    @action(detail=False, methods=['get'], renderer_classes=[JSONRenderer, EventStreamRenderer])
+    def feed(self, request):
+        """
+        Лента изменений заявок города (text/event-stream, только ASGI):
+        события created/updated/deleted вместо опроса vkhodyashchie-zayavki.
+        Без Last-Event-ID (или если он устарел) первым приходит snapshot —
+        текущие входящие заявки.
+
+        Под WSGI бесконечный асинхронный поток буферизуется целиком и занимает
+        воркер, поэтому там лента отвечает 501 и клиент остаётся на опросе.
+        """
+        if not isinstance(request._request, ASGIRequest):
+            return Response(
+                {'error': 'Лента доступна только при запуске через ASGI, используйте опрос'},
+                status=status.HTTP_501_NOT_IMPLEMENTED
+            )
+        gorod_id = getattr(request.user, 'gorod_id', None)
+        if not gorod_id:
+            return Response({'error': 'Пользователь не привязан к городу'}, status=status.HTTP_400_BAD_REQUEST)
+        last_event_id = request.headers.get('Last-Event-ID') or request.query_params.get('last_event_id')
+        after = resume_id(gorod_id, last_event_id)
+        initial = b''
+        if after is None:
+            # Позицию берём до выборки: событие, пришедшее во время неё, повторится, а не потеряется
+            after = get_backend().last_id(stream_key(gorod_id))
+            serializer = self.get_serializer(self.get_incoming_queryset(), many=True)
+            initial = format_event(after, 'snapshot', dump_payload(serializer.data))
+        response = StreamingHttpResponse(event_stream(gorod_id, after, initial), content_type='text/event-stream')
+        response['Cache-Control'] = 'no-cache'
+        # nginx не должен буферизовать поток
+        response['X-Accel-Buffering'] = 'no'
+        return response
+    def _bulk_items(self, request, limit):
+        """Список items из тела пакетного запроса или Response с ошибкой"""
+        items = request.data.get('items') if isinstance(request.data, dict) else None
+        if not isinstance(items, list) or not items:
+            return None, Response({'error': 'Передайте непустой список items'}, status=status.HTTP_400_BAD_REQUEST)
+        if len(items) > limit:
+            return None, Response(
+                {'error': f'Не более {limit} заявок за один запрос'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        return items, None
+    @action(detail=False, methods=['post'], url_path='bulk-close')
+    def bulk_close(self, request):
+        """
+        Пакетное закрытие заявок: {"items": [{"id", "status", "itog", "rashod", "comment_master"}]}.
+        Статус, выплаты мастерам и приход записываются одной транзакцией.
+        """
+        items, error = self._bulk_items(request, MAX_BULK_CLOSE)
+        if error:
+            return error
+        serializer = ZayavkaCloseSerializer(data=items, many=True)
+        serializer.is_valid(raise_exception=True)
+        result = close_zayavki(serializer.validated_data, queryset=self.get_queryset())
+        return Response(result)
+    @action(detail=False, methods=['post'], url_path='bulk')
+    def bulk_update(self, request):
+        """
+        Пакетная смена статуса и мастера: {"items": [{"id", "status", "master"}]}.
+        Заявки чужого города возвращаются в not_found, мастер другого города — в invalid_master.
+        """
+        items, error = self._bulk_items(request, MAX_BULK_UPDATE)
+        if error:
+            return error
+        serializer = ZayavkaBulkUpdateSerializer(data=items, many=True)
+        serializer.is_valid(raise_exception=True)
+        result = update_zayavki(serializer.validated_data, queryset=self.get_queryset())
+        return Response(result)
+    @action(detail=False, methods=['get'], renderer_classes=[JSONRenderer, CSVExportRenderer, NDJSONExportRenderer])
+    def export(self, request):
+        """
+        Потоковая выгрузка заявок: ?format=csv|ndjson (по умолчанию csv).
+        Фильтры: status, master, date_from, date_to (YYYY-MM-DD, по дате встречи).
+        """
+        # ?format разбирает согласование DRF (неизвестный формат — 404); JSON — только для ошибок
+        export_format = request.accepted_renderer.format
+        if export_format not in EXPORT_FORMATS:
+            export_format = 'csv'
+        queryset = self.get_queryset().prefetch_related(None).order_by('-meeting_date', '-id')
+        params = request.query_params
+        if params.get('status'):
+            queryset = queryset.filter(status=params['status'])
+        if params.get('master'):
+            try:
+                queryset = queryset.filter(master_id=int(params['master']))
+            except ValueError:
+                return Response({'error': 'master должен быть числом'}, status=status.HTTP_400_BAD_REQUEST)
+        # Границы дня в часовом поясе проекта — диапазон по индексу meeting_date, как в rollups
+        for param, lookup, shift in (('date_from', 'meeting_date__gte', 0), ('date_to', 'meeting_date__lt', 1)):
+            if params.get(param):
+                try:
+                    value = parse_date(params[param])
+                except ValueError:
+                    value = None
+                if value is None:
+                    return Response({'error': 'Неверный формат даты'}, status=status.HTTP_400_BAD_REQUEST)
+                queryset = queryset.filter(**{lookup: day_start(value + timedelta(days=shift))})
+        filename = f"zayavki_{timezone.localdate().isoformat()}"
+        return streaming_export_response(queryset, ZAYAVKI_EXPORT_FIELDS, export_format, filename)
 
 class ZayavkaFileViewSet(viewsets.ModelViewSet):
     queryset = ZayavkaFile.objects.all()
@@ -56,7 +226,8 @@ class ZayavkaFileViewSet(viewsets.ModelViewSet):
     def get_queryset(self):
         return super().get_queryset()
     def perform_create(self, serializer):
-        serializer.save(uploaded_by=self.request.user)
+        user = self.request.user
+        serializer.save(uploaded_by_id=None if getattr(user, 'is_master', False) else user.id)
     def create(self, request, *args, **kwargs):
         return super().create(request, *args, **kwargs)
 
@@ -86,14 +257,7 @@ def mango_audio_files(request):
 class MangoIncomingCallView(APIView):
     permission_classes = []
     def normalize_phone(self, phone):
-        # Убираем все символы кроме цифр
-        phone = ''.join(filter(str.isdigit, str(phone)))
-        # Добавляем 7 если номер начинается с 8 или 9
-        if phone.startswith('8'):
-            phone = '7' + phone[1:]
-        elif phone.startswith('9') and len(phone) == 10:
-            phone = '7' + phone
-        return phone
+        return normalize_phone(phone) or ''
     def post(self, request):
         try:
             # Получаем данные от Mango
@@ -120,18 +284,14 @@ class MangoIncomingCallView(APIView):
                 kc_name='Mango'
             )
             
-            # Отправляем уведомление в Telegram
+            # Ставим уведомление в очередь, отправит воркер send_notifications
             message = f"📞 Новый входящий звонок\nНомер: {normalized_phone}\nЗаявка: {zayavka.id}"
-            try:
-                requests.post(
-                    f"https://api.telegram.org/bot{TELEGRAM_BOT_TOKEN}/sendMessage",
-                    data={
-                        'chat_id': TELEGRAM_CHAT_ID,
-                        'text': message
-                    }
-                )
-            except Exception as e:
-                logger.error(f"Error sending Telegram notification: {e}")
+            enqueue_telegram_message(
+                message,
+                bot='notify',
+                parse_mode='',
+                dedup_key=f'incoming_call:{zayavka.id}'
+            )
             
             return Response({'success': True, 'zayavka_id': zayavka.id})
             
@@ -139,6 +299,34 @@ class MangoIncomingCallView(APIView):
             logger.error(f"Error processing Mango incoming call: {e}")
             return Response({'error': 'Ошибка обработки звонка'}, status=500)
 
+@csrf_exempt
+@require_POST
+async def mango_webhook(request, event_type):
+    """
+    Приём событий Mango Office (form: vpbx_api_key, sign, json).
+    Проверяет подпись, сохраняет событие в inbox и сразу отвечает;
+    заявки создаёт воркер process_mango_events.
+    """
+    if event_type not in EVENT_TYPES:
+        return JsonResponse({'error': 'Неизвестный тип события'}, status=404)
+    json_text = request.POST.get('json', '')
+    if inbox_settings()['VERIFY_SIGNATURE'] and not verify_signature(
+        request.POST.get('vpbx_api_key'), request.POST.get('sign'), json_text
+    ):
+        logger.warning(f"Mango webhook with invalid signature: {event_type}")
+        return JsonResponse({'error': 'Неверная подпись'}, status=403)
+    try:
+        event = build_event(event_type, json_text)
+    except ValueError:
+        return JsonResponse({'error': 'Некорректные данные события'}, status=400)
+    try:
+        await store_event(event)
+    except Exception as e:
+        # Mango повторит запрос, если не получит 200
+        logger.error(f"Error storing Mango event: {e}")
+        return JsonResponse({'error': 'Ошибка сохранения события'}, status=500)
+    return JsonResponse({'success': True})
+
 class MangoEmailProcessingView(APIView):
     permission_classes = [IsAuthenticated]
     def post(self, request):
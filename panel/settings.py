@@ -287,12 +287,54 @@ JWT_AUTH = {
 }
 
 # Cache settings
-CACHES = {
-    'default': {
-        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
-        'LOCATION': 'unique-snowflake',
-        'TIMEOUT': 300,
+# При заданном REDIS_URL используется общий Redis-кэш (L2) для всех воркеров
+REDIS_URL = os.environ.get('REDIS_URL')
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+            'TIMEOUT': 300,
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'unique-snowflake',
+            'TIMEOUT': 300,
+        }
     }
+
+# Локальный in-process кэш первого уровня (L1) перед CACHES['default']
+CACHE_L1 = {
+    'ENABLED': os.environ.get('CACHE_L1_ENABLED', 'True').lower() == 'true',
+    'MAX_ENTRIES': int(os.environ.get('CACHE_L1_MAX_ENTRIES', '1000')),
+    'TIMEOUT': int(os.environ.get('CACHE_L1_TIMEOUT', '30')),  # seconds
+}
+
+# Кэш субъектов аутентификации: только с общим Redis-кэшем, иначе инвалидация
+# при деактивации пользователя не дойдёт до других воркеров
+AUTH_PRINCIPAL_CACHE = {
+    'ENABLED': bool(REDIS_URL),
+}
+
+# Защита от одновременного пересчёта ключей (single-flight + stale-while-revalidate)
+CACHE_STAMPEDE = {
+    'STALE_TTL': int(os.environ.get('CACHE_STALE_TTL', '300')),  # seconds
+    'LOCK_TIMEOUT': 30,
+    'LOCK_WAIT': 5,
+    'BACKGROUND_REFRESH': True,
+}
+# Общий кэш ответов списка заявок (ключ: маршрут, запрос, город, роль и версия данных)
+API_RESPONSE_CACHE = {
+    'ENABLED': os.environ.get('API_RESPONSE_CACHE_ENABLED', 'False').lower() == 'true',
+    'TIMEOUT': int(os.environ.get('API_RESPONSE_CACHE_TIMEOUT', '60')),  # seconds
+}
+# Лента изменений заявок (SSE): Redis Streams при REDIS_URL, иначе память процесса
+ZAYAVKI_FEED = {
+    'MAXLEN': int(os.environ.get('ZAYAVKI_FEED_MAXLEN', '1000')),
+    'BLOCK_SECONDS': 15,
 }
 SESSION_ENGINE = 'django.contrib.sessions.backends.db'
 
@@ -383,6 +425,19 @@ if TELEGRAM_ALERTS_ENABLED:
     if not TELEGRAM_CHAT_ID:
         raise ValueError("TELEGRAM_CHAT_ID environment variable is required when TELEGRAM_ALERTS_ENABLED=True")
 
+# Бот рабочих уведомлений (входящие звонки, обратная связь мастеров).
+# Без токена и чата уведомления не ставятся в очередь (ошибка в логе)
+TELEGRAM_NOTIFY_BOT_TOKEN = os.environ.get('TELEGRAM_NOTIFY_BOT_TOKEN')
+TELEGRAM_NOTIFY_CHAT_ID = os.environ.get('TELEGRAM_NOTIFY_CHAT_ID')
+
+# Очередь исходящих уведомлений (доставляет manage.py send_notifications)
+NOTIFICATION_OUTBOX = {
+    'BATCH_SIZE': int(os.environ.get('NOTIFICATION_BATCH_SIZE', '50')),
+    'MAX_ATTEMPTS': int(os.environ.get('NOTIFICATION_MAX_ATTEMPTS', '8')),
+    'CHAT_INTERVAL': float(os.environ.get('NOTIFICATION_CHAT_INTERVAL', '1.0')),
+    'DEDUP_WINDOW': int(os.environ.get('NOTIFICATION_DEDUP_WINDOW', '300')),
+}
+
 # Email settings for alerts
 SMTP_HOST = os.environ.get('SMTP_HOST', 'localhost')
 SMTP_PORT = int(os.environ.get('SMTP_PORT', '587'))
@@ -17,6 +17,9 @@ CACHES = {
         'BACKEND': 'django.core.cache.backends.dummy.DummyCache',
     }
 }
+REDIS_URL = None
+CACHE_L1 = {'ENABLED': False}
+CACHE_STAMPEDE = {'BACKGROUND_REFRESH': False}
 
 # Ускоряем тесты
 PASSWORD_HASHERS = [
@@ -5,9 +5,9 @@
 
 import os
 import sys
-import re
 import logging
 import argparse
+import time
 from datetime import datetime, timedelta
 from pathlib import Path
 import django
@@ -17,10 +17,12 @@ os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'panel.settings')
 django.setup()
 
 from django.core.files import File
-from django.core.files.temp import NamedTemporaryFile
-from django.db import transaction
-from core.models import Zayavki, ZayavkaFile, Polzovateli
-from core.permissions import IsAdminOnly
+from core.models import Polzovateli
+from core.phones import find_phone, to_e164
+from core.recordings import (
+    ATTACH_WORKERS, MATCH_BATCH_SIZE, DirectoryManifest, Recording, RecordingMatcher,
+    call_time_from_filename, hash_file
+)
 
 # Настройка логирования
 logging.basicConfig(
@@ -33,6 +35,12 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+AUDIO_EXTENSIONS = {'.mp3', '.wav', '.ogg', '.m4a', '.aac', '.flac'}
+MIN_FILE_SIZE = 1024
+# Сколько дней повторять файлы без заявки: звонки, по которым заявку так и
+# не создали, не должны вечно держать каталог «изменившимся»
+RETRY_DAYS = 3
+
 class ATCAudioImporter:
     def __init__(self, audio_dir, system_user_login='admin'):
         """
@@ -44,6 +52,7 @@ class ATCAudioImporter:
         """
         self.audio_dir = Path(audio_dir)
         self.system_user = self._get_system_user(system_user_login)
+        self.matcher = RecordingMatcher()
         self.processed_files = set()
         self.load_processed_files()
         
@@ -75,58 +84,21 @@ class ATCAudioImporter:
         Извлечение номера телефона из имени файла
         Поддерживает различные форматы имен файлов АТС
         """
-        # Убираем расширение
-        name = Path(filename).stem
-        
-        # Паттерны для поиска номеров телефонов
-        patterns = [
-            r'(\+?[78]?\d{10,11})',  # +7XXXXXXXXXX или 8XXXXXXXXXX
-            r'(\d{10,11})',          # XXXXXXXXXX
-            r'(\+?\d{10,15})',       # Любой номер с + или без
-        ]
-        
-        for pattern in patterns:
-            match = re.search(pattern, name)
-            if match:
-                phone = match.group(1)
-                # Нормализация номера
-                if phone.startswith('8') and len(phone) == 11:
-                    phone = '+7' + phone[1:]
-                elif phone.startswith('7') and len(phone) == 11:
-                    phone = '+' + phone
-                elif len(phone) == 10:
-                    phone = '+7' + phone
-                return phone
-        
-        return None
+        return to_e164(find_phone(Path(filename).stem))
     
-    def find_zayavka_by_phone(self, phone):
-        """
-        Поиск заявки по номеру телефона
-        Ищет в phone_client и phone_atc
-        """
-        # Нормализация номера для поиска
-        search_phone = phone
-        if phone.startswith('+7'):
-            search_phone = phone[2:]  # Убираем +7 для поиска
-        
-        # Поиск по номеру клиента
-        zayavka = Zayavki.objects.filter(
-            phone_client__icontains=search_phone
-        ).first()
-        
-        if not zayavka:
-            # Поиск по номеру АТС
-            zayavka = Zayavki.objects.filter(
-                phone_atc__icontains=search_phone
-            ).first()
-        
-        return zayavka
+    def build_recording(self, file_path, phone):
+        """Описание записи для общего сопоставителя"""
+        return Recording(
+            source_id=f"atc:{file_path.relative_to(self.audio_dir).as_posix()}",
+            phone=phone,
+            call_time=call_time_from_filename(file_path.name),
+            filename=file_path.name,
+            payload=file_path,
+        )
     
     def is_audio_file(self, file_path):
         """Проверка, является ли файл аудио"""
-        audio_extensions = {'.mp3', '.wav', '.ogg', '.m4a', '.aac', '.flac'}
-        return file_path.suffix.lower() in audio_extensions
+        return file_path.suffix.lower() in AUDIO_EXTENSIONS
     
     def should_process_file(self, file_path):
         """Проверка, нужно ли обрабатывать файл"""
@@ -139,53 +111,28 @@ class ATCAudioImporter:
             return False
         
         # Проверяем размер файла (не менее 1KB)
-        if file_path.stat().st_size < 1024:
+        if file_path.stat().st_size < MIN_FILE_SIZE:
             logger.warning(f"Файл слишком маленький: {file_path}")
             return False
         
         return True
     
-    def attach_audio_to_zayavka(self, file_path, zayavka):
+    def attach_audio_to_zayavka(self, recording, zayavka_id):
         """Прикрепление аудиофайла к заявке"""
+        file_path = recording.payload
         try:
-            with transaction.atomic():
-                # Проверяем, нет ли уже такого файла
-                existing_file = ZayavkaFile.objects.filter(
-                    zayavka=zayavka,
-                    type='audio',
-                    file__endswith=file_path.name
-                ).first()
-                
-                if existing_file:
-                    logger.info(f"Файл уже прикреплен: {file_path.name} к заявке {zayavka.id}")
-                    return True
-                
-                # Создаем временный файл для Django
-                with NamedTemporaryFile(delete=False) as temp_file:
-                    # Копируем содержимое
-                    with open(file_path, 'rb') as source_file:
-                        temp_file.write(source_file.read())
-                    temp_file.flush()
-                    
-                    # Создаем запись в БД
-                    zayavka_file = ZayavkaFile.objects.create(
-                        zayavka=zayavka,
-                        type='audio',
-                        uploaded_by=self.system_user
-                    )
-                    
-                    # Прикрепляем файл
-                    zayavka_file.file.save(
-                        file_path.name,
-                        File(open(temp_file.name, 'rb')),
-                        save=True
-                    )
-                    
-                    # Удаляем временный файл
-                    os.unlink(temp_file.name)
-                
-                logger.info(f"Аудио прикреплено: {file_path.name} к заявке {zayavka.id} ({zayavka.client_name})")
-                return True
+            # Хеш содержимого: тот же файл под другим именем не прикрепится повторно
+            recording.content_hash = hash_file(file_path)
+            with open(file_path, 'rb') as source_file:
+                zayavka_file = self.matcher.attach(
+                    recording, zayavka_id, file=File(source_file), uploaded_by=self.system_user
+                )
+            
+            if zayavka_file is None:
+                logger.info(f"Файл уже прикреплен: {file_path.name}")
+            else:
+                logger.info(f"Аудио прикреплено: {file_path.name} к заявке {zayavka_id}")
+            return True
                 
         except Exception as e:
             logger.error(f"Ошибка прикрепления файла {file_path}: {e}")
@@ -204,47 +151,50 @@ class ATCAudioImporter:
         error_count = 0
         
         # Рекурсивно обходим все файлы
-        for file_path in self.audio_dir.rglob('*'):
-            if not file_path.is_file():
-                continue
-            
-            if not self.should_process_file(file_path):
-                continue
-            
-            processed_count += 1
-            
-            try:
+        files = [
+            file_path for file_path in self.audio_dir.rglob('*')
+            if file_path.is_file() and self.should_process_file(file_path)
+        ]
+        
+        # Пачками: одна проверка дубликатов и один поиск заявок на пачку
+        for start in range(0, len(files), MATCH_BATCH_SIZE):
+            recordings = []
+            for file_path in files[start:start + MATCH_BATCH_SIZE]:
+                processed_count += 1
                 # Извлекаем номер телефона из имени файла
                 phone = self.extract_phone_from_filename(file_path.name)
-                
                 if not phone:
                     logger.warning(f"Не удалось извлечь номер телефона из: {file_path.name}")
                     error_count += 1
                     continue
+                recordings.append(self.build_recording(file_path, phone))
+            
+            new_recordings = self.matcher.filter_new(recordings)
+            if not dry_run:
+                new_ids = {recording.source_id for recording in new_recordings}
+                for recording in recordings:
+                    if recording.source_id not in new_ids:
+                        self.processed_files.add(str(recording.payload))
+            
+            matches = self.matcher.match(new_recordings)
+            for recording in new_recordings:
+                file_path = recording.payload
+                zayavka_id = matches.get(recording.source_id)
                 
-                # Ищем заявку
-                zayavka = self.find_zayavka_by_phone(phone)
-                
-                if not zayavka:
-                    logger.warning(f"Заявка не найдена для номера {phone} (файл: {file_path.name})")
+                if not zayavka_id:
+                    logger.warning(f"Заявка не найдена для номера {recording.phone} (файл: {file_path.name})")
                     error_count += 1
                     continue
                 
                 if dry_run:
-                    logger.info(f"[DRY RUN] Найдена заявка {zayavka.id} для {phone} - {file_path.name}")
+                    logger.info(f"[DRY RUN] Найдена заявка {zayavka_id} для {recording.phone} - {file_path.name}")
                     attached_count += 1
+                elif self.attach_audio_to_zayavka(recording, zayavka_id):
+                    attached_count += 1
+                    # Добавляем в список обработанных
+                    self.processed_files.add(str(file_path))
                 else:
-                    # Прикрепляем аудио к заявке
-                    if self.attach_audio_to_zayavka(file_path, zayavka):
-                        attached_count += 1
-                        # Добавляем в список обработанных
-                        self.processed_files.add(str(file_path))
-                    else:
-                        error_count += 1
-                
-            except Exception as e:
-                logger.error(f"Ошибка обработки файла {file_path}: {e}")
-                error_count += 1
+                    error_count += 1
         
         # Сохраняем список обработанных файлов
         if not dry_run:
@@ -255,6 +205,118 @@ class ATCAudioImporter:
         logger.info(f"  Прикреплено к заявкам: {attached_count}")
         logger.info(f"  Ошибок: {error_count}")
     
+    def _process_incremental_batch(self, entries, stats, workers, dry_run, retry_days=RETRY_DAYS):
+        """
+        Пачка файлов из изменившихся каталогов: фильтр, поиск заявок, bulk-прикрепление.
+        Возвращает пути файлов, которые нужно повторить (заявка ещё не найдена,
+        ошибка чтения или копирования) — только не старше retry_days дней.
+        """
+        recordings, retry, mtimes = [], set(), {}
+        for entry in entries:
+            stats['processed'] += 1
+            try:
+                stat = entry.stat()
+                mtimes[entry.path] = stat.st_mtime
+                if stat.st_size < MIN_FILE_SIZE:
+                    logger.warning(f"Файл слишком маленький: {entry.path}")
+                    continue
+            except OSError as e:
+                logger.error(f"Ошибка чтения файла {entry.path}: {e}")
+                stats['errors'] += 1
+                retry.add(entry.path)
+                continue
+            phone = self.extract_phone_from_filename(entry.name)
+            if not phone:
+                logger.warning(f"Не удалось извлечь номер телефона из: {entry.name}")
+                stats['errors'] += 1
+                continue
+            recordings.append(self.build_recording(Path(entry.path), phone))
+
+        new_recordings = self.matcher.filter_new(recordings)
+        matches = self.matcher.match(new_recordings)
+        # Файлы старше RETRY_DAYS больше не повторяем — их каталог будет сохранён
+        retry_since = time.time() - retry_days * 86400
+        for recording in new_recordings:
+            if recording.source_id not in matches:
+                logger.warning(f"Заявка не найдена для номера {recording.phone} (файл: {recording.filename})")
+                stats['errors'] += 1
+                # Заявка может появиться позже — свежий файл повторим при следующем запуске
+                if mtimes[str(recording.payload)] >= retry_since:
+                    retry.add(str(recording.payload))
+
+        if dry_run:
+            stats['attached'] += len(matches)
+            return retry
+        attached = self.matcher.bulk_attach(
+            matches, new_recordings, uploaded_by=self.system_user, workers=workers
+        )
+        stats['attached'] += attached
+        stats['errors'] += len(matches) - attached
+        if attached < len(matches):
+            # Не прикреплённые и не оказавшиеся дубликатами — ошибка копирования
+            matched = [recording for recording in new_recordings if recording.source_id in matches]
+            retry.update(
+                str(recording.payload) for recording in self.matcher.filter_new(matched)
+                if mtimes[str(recording.payload)] >= retry_since
+            )
+        return retry
+
+    def _commit_directories(self, manifest, directories, retry):
+        """Запоминает каталоги, все файлы которых обработаны; остальные просмотрим снова"""
+        done = [
+            directory for directory in directories
+            if not any(entry.path in retry for entry in directory.entries)
+        ]
+        manifest.commit(done)
+        return len(directories) - len(done)
+
+    def process_incremental(self, workers=ATTACH_WORKERS, rescan=False, dry_run=False, retry_days=RETRY_DAYS):
+        """
+        Инкрементальный импорт по манифесту каталогов: просматриваются только
+        каталоги, изменившиеся с прошлого запуска, файлы прикрепляются пачками
+        (копирование в пуле из workers потоков, вставка одним bulk_create).
+        Состояние каталога сохраняется, только когда все его файлы прикреплены
+        или не требуют повтора, поэтому прерванный импорт и файлы без заявки
+        (или с ошибкой копирования) будут обработаны при следующем запуске.
+        Файлы старше retry_days дней не повторяются: каталог сохраняется,
+        даже если заявка для них так и не появилась.
+        """
+        if not self.audio_dir.exists():
+            logger.error(f"Папка с аудиозаписями не найдена: {self.audio_dir}")
+            return
+
+        logger.info(f"Инкрементальная обработка папки: {self.audio_dir} (потоков: {workers})")
+        started = time.monotonic()
+        manifest = DirectoryManifest(self.audio_dir)
+        stats = {'directories': 0, 'processed': 0, 'attached': 0, 'errors': 0, 'deferred': 0}
+
+        pending_directories, entries = [], []
+        for directory in manifest.changed_directories(AUDIO_EXTENSIONS, rescan=rescan):
+            stats['directories'] += 1
+            pending_directories.append(directory)
+            entries.extend(directory.entries)
+            if len(entries) < MATCH_BATCH_SIZE:
+                continue
+            retry = self._process_incremental_batch(entries, stats, workers, dry_run, retry_days)
+            if not dry_run:
+                stats['deferred'] += self._commit_directories(manifest, pending_directories, retry)
+            pending_directories, entries = [], []
+
+        if pending_directories:
+            retry = self._process_incremental_batch(entries, stats, workers, dry_run, retry_days)
+            if not dry_run:
+                stats['deferred'] += self._commit_directories(manifest, pending_directories, retry)
+
+        elapsed = max(time.monotonic() - started, 1e-6)
+        logger.info(f"Обработка завершена за {elapsed:.1f} с:")
+        logger.info(f"  Изменившихся каталогов: {stats['directories']}")
+        logger.info(f"  Отложено до следующего запуска: {stats['deferred']}")
+        logger.info(f"  Обработано файлов: {stats['processed']}")
+        logger.info(f"  Прикреплено к заявкам: {stats['attached']}")
+        logger.info(f"  Ошибок: {stats['errors']}")
+        logger.info(f"  Скорость: {stats['processed'] / elapsed:.1f} файлов/с")
+        return stats
+
     def cleanup_old_files(self, days=30):
         """Очистка старых обработанных файлов из списка"""
         cutoff_date = datetime.now() - timedelta(days=days)
@@ -285,6 +347,14 @@ def main():
     parser.add_argument('--dry-run', action='store_true', help='Только показать, что будет сделано')
     parser.add_argument('--cleanup', action='store_true', help='Очистить старые записи')
     parser.add_argument('--cleanup-days', type=int, default=30, help='Количество дней для очистки')
+    parser.add_argument('--incremental', action='store_true',
+                        help='Просматривать только каталоги, изменившиеся с прошлого запуска')
+    parser.add_argument('--rescan', action='store_true',
+                        help='Вместе с --incremental: игнорировать сохранённый манифест')
+    parser.add_argument('--workers', type=int, default=ATTACH_WORKERS,
+                        help='Число потоков копирования файлов')
+    parser.add_argument('--retry-days', type=int, default=RETRY_DAYS,
+                        help='Вместе с --incremental: сколько дней повторять файлы без заявки')
     
     args = parser.parse_args()
     
@@ -297,6 +367,12 @@ def main():
         importer.cleanup_old_files(args.cleanup_days)
         return
     
+    if args.incremental:
+        importer.process_incremental(
+            workers=args.workers, rescan=args.rescan, dry_run=args.dry_run, retry_days=args.retry_days
+        )
+        return
+    
     importer.process_audio_files(dry_run=args.dry_run)
 
 if __name__ == '__main__':
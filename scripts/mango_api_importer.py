@@ -11,16 +11,23 @@ import hmac
 import time
 import json
 import logging
-from datetime import datetime, timedelta
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timedelta, timezone as dt_timezone
 from pathlib import Path
+from urllib.parse import urlsplit
 import django
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 # Настройка Django
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'panel.settings')
 django.setup()
 
 from django.conf import settings
-from core.models import Zayavki, ZayavkaFile, Polzovateli
+from core.models import Polzovateli
+from core.phones import to_e164
+from core.recordings import MATCH_BATCH_SIZE, Recording, RecordingMatcher, hash_file
 
 # Настройка логирования
 logging.basicConfig(
@@ -33,8 +40,16 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Размер страницы истории звонков и защита от бесконечной пагинации
+CALLS_PAGE_SIZE = 500
+CALLS_MAX_PAGES = 1000
+DOWNLOAD_WORKERS = 8
+DOWNLOADS_PER_HOST = 4
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+
 class MangoAPIImporter:
-    def __init__(self, api_key, api_salt, system_user_login='admin'):
+    def __init__(self, api_key, api_salt, system_user_login='admin',
+                 workers=DOWNLOAD_WORKERS, per_host=DOWNLOADS_PER_HOST):
         """
         Инициализация импортера Mango Office API
         
@@ -42,13 +57,44 @@ class MangoAPIImporter:
             api_key (str): API ключ от Mango Office
             api_salt (str): API соль от Mango Office
             system_user_login (str): Логин системного пользователя для прикрепления файлов
+            workers (int): Число параллельных загрузок
+            per_host (int): Максимум одновременных загрузок с одного хоста
         """
         self.api_key = api_key
         self.api_salt = api_salt
         self.base_url = "https://app.mango-office.ru/vpbx"
         self.system_user = self._get_system_user(system_user_login)
+        self.matcher = RecordingMatcher()
         self.download_dir = Path('downloads/mango_audio')
         self.download_dir.mkdir(parents=True, exist_ok=True)
+        self.workers = max(1, workers)
+        self.per_host = max(1, per_host)
+        self.session = self._build_session()
+        self._host_slots = {}
+        self._host_slots_lock = threading.Lock()
+    
+    def _build_session(self):
+        """Общая сессия с пулом соединений и повторами при временных ошибках"""
+        session = requests.Session()
+        retry = Retry(
+            total=3,
+            backoff_factor=1,
+            status_forcelist=(429, 500, 502, 503, 504),
+            allowed_methods=None,
+            respect_retry_after_header=True,
+        )
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=self.workers, max_retries=retry)
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        return session
+    
+    def _host_slot(self, url):
+        """Семафор, ограничивающий число одновременных загрузок с хоста"""
+        host = urlsplit(url).netloc
+        with self._host_slots_lock:
+            if host not in self._host_slots:
+                self._host_slots[host] = threading.BoundedSemaphore(self.per_host)
+            return self._host_slots[host]
         
     def _get_system_user(self, login):
         """Получение системного пользователя"""
@@ -101,7 +147,7 @@ class MangoAPIImporter:
         
         try:
             url = f"{self.base_url}/{method}"
-            response = requests.post(url, data=params, timeout=30)
+            response = self.session.post(url, data=params, timeout=30)
             response.raise_for_status()
             
             result = response.json()
@@ -119,14 +165,14 @@ class MangoAPIImporter:
             logger.error(f"Ошибка парсинга JSON ответа: {e}")
             return None
     
-    def get_calls_history(self, date_from=None, date_to=None, limit=100):
+    def get_calls_history(self, date_from=None, date_to=None, limit=CALLS_PAGE_SIZE):
         """
-        Получение истории звонков
+        Получение истории звонков (все страницы)
         
         Args:
             date_from (str): Дата начала в формате YYYY-MM-DD
             date_to (str): Дата окончания в формате YYYY-MM-DD
-            limit (int): Количество записей
+            limit (int): Размер страницы
             
         Returns:
             list: Список звонков
@@ -136,21 +182,29 @@ class MangoAPIImporter:
         if date_to is None:
             date_to = datetime.now().strftime('%Y-%m-%d')
         
-        params = {
-            'date_from': date_from,
-            'date_to': date_to,
-            'limit': limit
-        }
-        
         logger.info(f"Получение истории звонков с {date_from} по {date_to}")
-        result = self._make_api_request('stats/request', params)
-        
-        if result and 'data' in result:
-            calls = result['data']
-            logger.info(f"Получено {len(calls)} звонков")
-            return calls
-        
-        return []
+        calls = []
+        for page in range(CALLS_MAX_PAGES):
+            params = {
+                'date_from': date_from,
+                'date_to': date_to,
+                'limit': limit,
+                'offset': page * limit,
+            }
+            result = self._make_api_request('stats/request', params)
+            if not result or 'data' not in result:
+                break
+            
+            page_calls = result['data']
+            calls.extend(page_calls)
+            # Неполная страница — последняя
+            if len(page_calls) < limit:
+                break
+        else:
+            logger.warning(f"Достигнут предел в {CALLS_MAX_PAGES} страниц истории звонков")
+        
+        logger.info(f"Получено {len(calls)} звонков")
+        return calls
     
     def get_call_records(self, call_id):
         """
@@ -175,7 +229,10 @@ class MangoAPIImporter:
     
     def download_audio_file(self, url, filename):
         """
-        Загрузка аудиофайла
+        Загрузка аудиофайла с докачкой
+        
+        Файл пишется во временный .part; при повторном запуске загрузка
+        продолжается с места обрыва (Range), если сервер это поддерживает.
         
         Args:
             url (str): URL для загрузки файла
@@ -184,29 +241,73 @@ class MangoAPIImporter:
         Returns:
             Path: Путь к загруженному файлу или None при ошибке
         """
+        file_path = self.download_dir / filename
+        part_path = file_path.with_name(file_path.name + '.part')
+        
+        # Проверяем, не загружен ли уже файл
+        if file_path.exists():
+            logger.info(f"Файл уже существует: {filename}")
+            return file_path
+        
         try:
-            file_path = self.download_dir / filename
+            offset = part_path.stat().st_size if part_path.exists() else 0
+            headers = {'Range': f'bytes={offset}-'} if offset else {}
             
-            # Проверяем, не загружен ли уже файл
-            if file_path.exists():
-                logger.info(f"Файл уже существует: {filename}")
-                return file_path
-            
-            # Загружаем файл
-            response = requests.get(url, stream=True, timeout=60)
-            response.raise_for_status()
-            
-            with open(file_path, 'wb') as f:
-                for chunk in response.iter_content(chunk_size=8192):
-                    f.write(chunk)
+            with self._host_slot(url):
+                with self.session.get(url, headers=headers, stream=True, timeout=60) as response:
+                    if response.status_code == 416:
+                        # Частичный файл уже полный
+                        part_path.replace(file_path)
+                        return file_path
+                    response.raise_for_status()
+                    
+                    # 200 вместо 206 — сервер не поддерживает докачку, качаем заново
+                    mode = 'ab' if offset and response.status_code == 206 else 'wb'
+                    with open(part_path, mode) as f:
+                        for chunk in response.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
+                            f.write(chunk)
             
+            part_path.replace(file_path)
             logger.info(f"Файл загружен: {filename}")
             return file_path
             
-        except requests.exceptions.RequestException as e:
+        except (requests.exceptions.RequestException, OSError) as e:
             logger.error(f"Ошибка загрузки файла {filename}: {e}")
             return None
     
+    def _download_recording(self, recording):
+        """Загрузка и хеширование одной записи (выполняется в пуле потоков)"""
+        call = recording.payload
+        file_path = self.download_audio_file(call['record_url'], recording.filename)
+        if file_path is None:
+            return None
+        return Recording(
+            source_id=recording.source_id,
+            phone=recording.phone,
+            call_time=recording.call_time,
+            filename=recording.filename,
+            content_hash=hash_file(file_path),
+            payload=file_path,
+        )
+    
+    def download_recordings(self, recordings):
+        """
+        Параллельная загрузка записей (не более workers потоков и per_host
+        соединений на хост). Возвращает записи с payload — путём к файлу.
+        """
+        downloaded = []
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            futures = [pool.submit(self._download_recording, recording) for recording in recordings]
+            for future in as_completed(futures):
+                try:
+                    result = future.result()
+                except Exception as e:
+                    logger.error(f"Ошибка загрузки записи: {e}")
+                    continue
+                if result is not None:
+                    downloaded.append(result)
+        return downloaded
+    
     def extract_phone_from_call(self, call_data):
         """
         Извлечение номера телефона из данных звонка
@@ -221,107 +322,62 @@ class MangoAPIImporter:
         phone_fields = ['from_extension', 'to_extension', 'from_number', 'to_number']
         
         for field in phone_fields:
-            if field in call_data and call_data[field]:
-                phone = str(call_data[field])
-                # Очищаем номер от лишних символов
-                phone = ''.join(filter(str.isdigit, phone))
-                
-                # Нормализуем номер
-                if len(phone) == 11 and phone.startswith('8'):
-                    phone = '+7' + phone[1:]
-                elif len(phone) == 11 and phone.startswith('7'):
-                    phone = '+' + phone
-                elif len(phone) == 10:
-                    phone = '+7' + phone
-                
-                if len(phone) >= 10:
-                    return phone
+            phone = to_e164(call_data.get(field))
+            if phone:
+                return phone
         
         return None
     
-    def find_zayavka_by_phone(self, phone):
-        """
-        Поиск заявки по номеру телефона
-        
-        Args:
-            phone (str): Номер телефона
-            
-        Returns:
-            Zayavki: Заявка или None
-        """
-        # Нормализация номера для поиска
-        search_phone = phone
-        if phone.startswith('+7'):
-            search_phone = phone[2:]  # Убираем +7 для поиска
-        
-        # Поиск по номеру клиента
-        zayavka = Zayavki.objects.filter(
-            phone_client__icontains=search_phone
-        ).first()
-        
-        if not zayavka:
-            # Поиск по номеру АТС
-            zayavka = Zayavki.objects.filter(
-                phone_atc__icontains=search_phone
-            ).first()
-        
-        return zayavka
+    @staticmethod
+    def parse_call_time(value):
+        """Время начала звонка: unix timestamp или ISO-строка"""
+        if not value:
+            return None
+        try:
+            if str(value).isdigit():
+                return datetime.fromtimestamp(int(value), tz=dt_timezone.utc)
+            return datetime.fromisoformat(str(value))
+        except (ValueError, OverflowError):
+            return None
     
-    def attach_audio_to_zayavka(self, file_path, zayavka, call_data):
+    def build_recording(self, call, phone):
+        """Описание записи звонка для общего сопоставителя"""
+        call_id = call.get('id', 'unknown')
+        timestamp = call.get('start', '')
+        return Recording(
+            source_id=f"mango:{call_id}",
+            phone=phone,
+            call_time=self.parse_call_time(timestamp),
+            filename=f"mango_{call_id}_{timestamp}_{phone}.mp3",
+            payload=call,
+        )
+    
+    def attach_audio_to_zayavka(self, file_path, recording, zayavka_id):
         """
         Прикрепление аудиофайла к заявке
         
         Args:
             file_path (Path): Путь к аудиофайлу
-            zayavka (Zayavki): Заявка
-            call_data (dict): Данные звонка
+            recording (Recording): Запись звонка
+            zayavka_id (int): ID заявки
             
         Returns:
             bool: Успех операции
         """
         try:
             from django.core.files import File
-            from django.core.files.temp import NamedTemporaryFile
-            from django.db import transaction
             
-            with transaction.atomic():
-                # Проверяем, нет ли уже такого файла
-                existing_file = ZayavkaFile.objects.filter(
-                    zayavka=zayavka,
-                    type='audio',
-                    file__endswith=file_path.name
-                ).first()
-                
-                if existing_file:
-                    logger.info(f"Файл уже прикреплен: {file_path.name} к заявке {zayavka.id}")
-                    return True
-                
-                # Создаем временный файл для Django
-                with NamedTemporaryFile(delete=False) as temp_file:
-                    # Копируем содержимое
-                    with open(file_path, 'rb') as source_file:
-                        temp_file.write(source_file.read())
-                    temp_file.flush()
-                    
-                    # Создаем запись в БД
-                    zayavka_file = ZayavkaFile.objects.create(
-                        zayavka=zayavka,
-                        type='audio',
-                        uploaded_by=self.system_user
-                    )
-                    
-                    # Прикрепляем файл
-                    zayavka_file.file.save(
-                        file_path.name,
-                        File(open(temp_file.name, 'rb')),
-                        save=True
-                    )
-                    
-                    # Удаляем временный файл
-                    os.unlink(temp_file.name)
-                
-                logger.info(f"Аудио прикреплено: {file_path.name} к заявке {zayavka.id} ({zayavka.client_name})")
-                return True
+            recording.content_hash = hash_file(file_path)
+            with open(file_path, 'rb') as source_file:
+                zayavka_file = self.matcher.attach(
+                    recording, zayavka_id, file=File(source_file), uploaded_by=self.system_user
+                )
+            
+            if zayavka_file is None:
+                logger.info(f"Файл уже прикреплен: {file_path.name}")
+            else:
+                logger.info(f"Аудио прикреплено: {file_path.name} к заявке {zayavka_id}")
+            return True
                 
         except Exception as e:
             logger.error(f"Ошибка прикрепления файла {file_path}: {e}")
@@ -350,58 +406,62 @@ class MangoAPIImporter:
         attached_count = 0
         error_count = 0
         
+        recordings = []
         for call in calls:
             processed_count += 1
             
-            try:
-                # Извлекаем номер телефона
-                phone = self.extract_phone_from_call(call)
-                
-                if not phone:
-                    logger.warning(f"Не удалось извлечь номер из звонка {call.get('id', 'unknown')}")
-                    error_count += 1
-                    continue
-                
-                # Ищем заявку
-                zayavka = self.find_zayavka_by_phone(phone)
-                
-                if not zayavka:
-                    logger.warning(f"Заявка не найдена для номера {phone} (звонок: {call.get('id', 'unknown')})")
+            # Извлекаем номер телефона
+            phone = self.extract_phone_from_call(call)
+            if not phone:
+                logger.warning(f"Не удалось извлечь номер из звонка {call.get('id', 'unknown')}")
+                error_count += 1
+                continue
+            
+            # Проверяем, есть ли запись разговора
+            if not call.get('record_url'):
+                logger.info(f"Запись разговора отсутствует для звонка {call.get('id', 'unknown')}")
+                continue
+            
+            recordings.append(self.build_recording(call, phone))
+        
+        # Уже прикреплённые звонки отсекаем до скачивания, заявки ищем пачкой
+        for start in range(0, len(recordings), MATCH_BATCH_SIZE):
+            batch = self.matcher.filter_new(recordings[start:start + MATCH_BATCH_SIZE])
+            matches = self.matcher.match(batch)
+            
+            to_download = []
+            for recording in batch:
+                zayavka_id = matches.get(recording.source_id)
+                if not zayavka_id:
+                    logger.warning(f"Заявка не найдена для номера {recording.phone} (звонок: {recording.payload.get('id', 'unknown')})")
                     error_count += 1
-                    continue
-                
-                # Проверяем, есть ли запись разговора
-                if not call.get('record_url'):
-                    logger.info(f"Запись разговора отсутствует для звонка {call.get('id', 'unknown')}")
-                    continue
-                
-                # Формируем имя файла
-                call_id = call.get('id', 'unknown')
-                timestamp = call.get('start', '')
-                filename = f"mango_{call_id}_{timestamp}_{phone}.mp3"
-                
-                if dry_run:
-                    logger.info(f"[DRY RUN] Найдена заявка {zayavka.id} для {phone} - {filename}")
+                elif dry_run:
+                    logger.info(f"[DRY RUN] Найдена заявка {zayavka_id} для {recording.phone} - {recording.filename}")
                     downloaded_count += 1
                     attached_count += 1
                 else:
-                    # Загружаем аудиофайл
-                    file_path = self.download_audio_file(call['record_url'], filename)
-                    
-                    if file_path:
-                        downloaded_count += 1
-                        
-                        # Прикрепляем к заявке
-                        if self.attach_audio_to_zayavka(file_path, zayavka, call):
-                            attached_count += 1
-                        else:
-                            error_count += 1
-                    else:
-                        error_count += 1
-                
+                    to_download.append(recording)
+            
+            if not to_download:
+                continue
+            
+            downloaded = self.download_recordings(to_download)
+            downloaded_count += len(downloaded)
+            error_count += len(to_download) - len(downloaded)
+            
+            # Та же запись под другим id звонка отсекается по хешу содержимого
+            fresh = self.matcher.filter_new(downloaded)
+            skipped = len(downloaded) - len(fresh)
+            if skipped:
+                logger.info(f"Пропущено записей с известным хешем: {skipped}")
+            
+            try:
+                attached_count += self.matcher.bulk_attach(
+                    matches, fresh, uploaded_by=self.system_user, workers=self.workers
+                )
             except Exception as e:
-                logger.error(f"Ошибка обработки звонка {call.get('id', 'unknown')}: {e}")
-                error_count += 1
+                logger.error(f"Ошибка прикрепления пачки записей: {e}")
+                error_count += len(fresh)
         
         logger.info(f"Обработка завершена:")
         logger.info(f"  Обработано звонков: {processed_count}")
@@ -420,13 +480,18 @@ def main():
     parser.add_argument('--date-from', help='Дата начала (YYYY-MM-DD)')
     parser.add_argument('--date-to', help='Дата окончания (YYYY-MM-DD)')
     parser.add_argument('--dry-run', action='store_true', help='Режим тестирования')
+    parser.add_argument('--workers', type=int, default=DOWNLOAD_WORKERS, help='Число параллельных загрузок')
+    parser.add_argument('--per-host', type=int, default=DOWNLOADS_PER_HOST,
+                        help='Максимум одновременных загрузок с одного хоста')
     
     args = parser.parse_args()
     
     # Создаем папку для логов
     Path('logs').mkdir(exist_ok=True)
     
-    importer = MangoAPIImporter(args.api_key, args.api_salt, args.system_user)
+    importer = MangoAPIImporter(
+        args.api_key, args.api_salt, args.system_user, workers=args.workers, per_host=args.per_host
+    )
     
     if args.dry_run:
         logger.info("Запуск в режиме DRY RUN - изменения не будут сохранены")
@@ -4,10 +4,11 @@
 """
 
 import logging
-from django.db.models import Q, Count, Sum
+from django.db.models import Q, Sum
 from django.utils import timezone
 from datetime import datetime, timedelta
-from core.models import Zayavki, ZayavkaFile, Master, Gorod
+from core.models import Zayavki, ZayavkaFile, Master, Gorod, ZayavkiDailyStat
+from core.rollups import STATUS_GROUPS, summarize
 from core.serializers import ZayavkiSerializer, ZayavkaFileSerializer
 
 logger = logging.getLogger(__name__)
@@ -25,13 +26,13 @@ class ZayavkiService:
                 if filters.get('status'):
                     queryset = queryset.filter(status=filters['status'])
                 if filters.get('date_from'):
-                    queryset = queryset.filter(data_zayavki__gte=filters['date_from'])
+                    queryset = queryset.filter(meeting_date__date__gte=filters['date_from'])
                 if filters.get('date_to'):
-                    queryset = queryset.filter(data_zayavki__lte=filters['date_to'])
+                    queryset = queryset.filter(meeting_date__date__lte=filters['date_to'])
                 if filters.get('tip_zayavki'):
                     queryset = queryset.filter(tip_zayavki=filters['tip_zayavki'])
             
-            return queryset.order_by('-data_zayavki')
+            return queryset.order_by('-meeting_date')
             
         except Exception as e:
             logger.error(f"Ошибка получения заявок для мастера {master_id}: {e}")
@@ -39,28 +40,20 @@ class ZayavkiService:
     
     @staticmethod
     def get_zayavki_statistics(master_id=None, date_from=None, date_to=None):
-        """Получение статистики по заявкам"""
+        """Получение статистики по заявкам (из дневных агрегатов)"""
         try:
-            queryset = Zayavki.objects.all()
+            queryset = ZayavkiDailyStat.objects.all()
             
             if master_id:
                 queryset = queryset.filter(master_id=master_id)
             
             if date_from:
-                queryset = queryset.filter(data_zayavki__gte=date_from)
+                queryset = queryset.filter(date__gte=date_from)
             
             if date_to:
-                queryset = queryset.filter(data_zayavki__lte=date_to)
+                queryset = queryset.filter(date__lte=date_to)
             
-            stats = queryset.aggregate(
-                total=Count('id'),
-                completed=Count('id', filter=Q(status='completed')),
-                in_progress=Count('id', filter=Q(status='in_progress')),
-                pending=Count('id', filter=Q(status='pending')),
-                cancelled=Count('id', filter=Q(status='cancelled'))
-            )
-            
-            return stats
+            return summarize(queryset)
             
         except Exception as e:
             logger.error(f"Ошибка получения статистики заявок: {e}")
@@ -121,33 +114,30 @@ class ZayavkiService:
             return None, {'error': str(e)}
 
 class ZayavkiAnalyticsService:
-    """Сервис аналитики заявок"""
+    """Сервис аналитики заявок (читает дневные агрегаты ZayavkiDailyStat)"""
     
     @staticmethod
     def get_master_performance(master_id, period_days=30):
         """Получение производительности мастера"""
         try:
-            date_from = timezone.now() - timedelta(days=period_days)
+            date_from = timezone.localdate() - timedelta(days=period_days)
             
-            stats = Zayavki.objects.filter(
+            stats = summarize(ZayavkiDailyStat.objects.filter(
                 master_id=master_id,
-                data_zayavki__gte=date_from
-            ).aggregate(
-                total_zayavki=Count('id'),
-                completed_zayavki=Count('id', filter=Q(status='completed')),
-                avg_completion_time=Sum('completion_time') / Count('id', filter=Q(status='completed'))
-            )
-            
-            if stats['total_zayavki'] > 0:
-                completion_rate = (stats['completed_zayavki'] / stats['total_zayavki']) * 100
+                date__gte=date_from
+            ))
+            
+            if stats['total'] > 0:
+                completion_rate = (stats['completed'] / stats['total']) * 100
             else:
                 completion_rate = 0
             
             return {
-                'total_zayavki': stats['total_zayavki'],
-                'completed_zayavki': stats['completed_zayavki'],
+                'total_zayavki': stats['total'],
+                'completed_zayavki': stats['completed'],
                 'completion_rate': round(completion_rate, 2),
-                'avg_completion_time': stats['avg_completion_time'] or 0
+                'itog': stats['itog'],
+                'chistymi': stats['chistymi'],
             }
             
         except Exception as e:
@@ -158,21 +148,26 @@ class ZayavkiAnalyticsService:
     def get_city_statistics(city_id=None, period_days=30):
         """Получение статистики по городам"""
         try:
-            date_from = timezone.now() - timedelta(days=period_days)
+            date_from = timezone.localdate() - timedelta(days=period_days)
             
-            queryset = Zayavki.objects.filter(data_zayavki__gte=date_from)
+            queryset = ZayavkiDailyStat.objects.filter(date__gte=date_from)
             
             if city_id:
                 queryset = queryset.filter(gorod_id=city_id)
             
             stats = queryset.values('gorod__name').annotate(
-                total=Count('id'),
-                completed=Count('id', filter=Q(status='completed')),
-                in_progress=Count('id', filter=Q(status='in_progress'))
+                total=Sum('count'),
+                completed=Sum('count', filter=Q(status__in=STATUS_GROUPS['completed'])),
+                in_progress=Sum('count', filter=Q(status__in=STATUS_GROUPS['in_progress'])),
+                itog=Sum('itog'),
+                chistymi=Sum('chistymi'),
             ).order_by('-total')
             
-            return list(stats)
+            return [
+                {**row, 'completed': row['completed'] or 0, 'in_progress': row['in_progress'] or 0}
+                for row in stats
+            ]
             
         except Exception as e:
             logger.error(f"Ошибка получения статистики по городам: {e}")
-            return [] 
\ No newline at end of file
+            return []